@@ -14,7 +14,6 @@ from collections import Counter
 import pickle
 from scipy import stats
 import re
-import socket
 from tqdm import tqdm
 import jiwer
 import json
@@ -22,12 +21,7 @@ import sys
 
 sys.path.append("../helper_scripts")
 from evaluation import *
-
-
-def find_free_port():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(("", 0))
-        return s.getsockname()[1]
+from fold_scheduler import run_folds
 
 
 TOT_EPOCHS = 120
@@ -135,20 +129,19 @@ if __name__ == "__main__":
         BASE_MODEL = f"/home/mkperez/speechbrain/AphasiaBank/ISresults/full_FT_MTL_proto/S2S-hubert-Transformer-500"
         EXP_DIR = f"/home/mkperez/speechbrain/AphasiaBank/ISresults/full_FT_MTL_Scripts/Target-decoder/asr_weight-{MTL_ASR_WEIGHT}_S2S-hubert-Transformer-500"
 
+    # CUDA_VISIBLE_DEVICES of each concurrent fold ("" for cpu)
+    SLOTS = ["0"]
+
     if TRAIN_FLAG:
         yaml_src = "/home/mkperez/speechbrain/AphasiaBank/hparams/dev/MTL_target_base.yml"
-        yaml_target = "/home/mkperez/speechbrain/AphasiaBank/hparams/dev/MTL_target_fold.yml"
-        start = time.time()
-
-        i = 1
-        count = 0
-        while i <= 12:
-            data_fold_dir = f"{DATA_ROOT}/Fold_{i}"
 
+        def prepare_fold(i):
+            # one yaml per fold, concurrent folds must not share it
+            yaml_target = f"/home/mkperez/speechbrain/AphasiaBank/hparams/dev/MTL_target_fold-{i}.yml"
             change_yaml(
                 yaml_src,
                 yaml_target,
-                data_fold_dir,
+                f"{DATA_ROOT}/Fold_{i}",
                 i,
                 OUTPUT_NEURONS,
                 EXP_DIR,
@@ -156,14 +149,10 @@ if __name__ == "__main__":
                 FREEZE_ARCH,
                 MTL_ASR_WEIGHT,
             )
+            return yaml_target
 
-            # # launch experiment
-            # multi-gpu
-            env = os.environ.copy()
-            env["CUDA_VISIBLE_DEVICES"] = "0"
-            port = find_free_port()  # Get a free port.
-            print(f"free port: {port}")
-            cmd = [
+        def fold_cmd(yaml_target, port):
+            return [
                 "python",
                 "-m",
                 "torch.distributed.launch",
@@ -172,23 +161,15 @@ if __name__ == "__main__":
                 f"{yaml_target}",
             ]
 
-            p = subprocess.run(cmd, env=env)
-
-            # p = subprocess.run(cmd)
-            count += 1
-            print(f"p.returncode: {p.returncode} | retry: {count}")
-            exit()
-
-            if p.returncode == 0:
-                i += 1
-                count -= 1
-            if count >= 5:
-                print("too many fails")
-                exit()
-
-        end = time.time()
-        elapsed = end - start
-        print(f"Total Train runtime: {datetime.timedelta(seconds=elapsed)}")
+        run_folds(
+            range(1, 13),
+            prepare_fold,
+            fold_cmd,
+            slots=SLOTS,
+            log_dir=f"{EXP_DIR}/logs",
+            done_marker=lambda i: f"{EXP_DIR}/Fold-{i}/fold_done",
+            on_fold_end=running_fold_metrics(EXP_DIR, "mtl"),
+        )
 
     ##  Stat computation
     if EVAL_FLAG:
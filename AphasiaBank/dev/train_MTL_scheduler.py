@@ -55,6 +55,9 @@ from torch.utils.tensorboard import SummaryWriter
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+sys.path.append("..")
+from helper_scripts.label_alignment import get_label_aligner
+
 logger = logging.getLogger(__name__)
 
 torch.autograd.set_detect_anomaly(True)
@@ -96,34 +99,10 @@ def find_majority_element(lst):
 
 
 def combine_AWER(hyps_para, hyps_asr, predicted_words, tokenizer, ptokenizer):
-    tokenized_out = [tokenizer.IdToPiece(h) for h in hyps_asr]
-    assert len(tokenized_out) == len(
-        hyps_para
-    ), f"Error arrs are of same size:\tokenized_out: {tokenized_out}\hyps_para: {hyps_para}"
-    # print(f"tokenized_out: {tokenized_out}")
-    p_result = []
-    multitoken_result = []
-    for t, p in zip(tokenized_out, hyps_para):
-        if t == "▁":
-            # start of multi-token word
-            if len(multitoken_result) > 0:
-                # p_result.append(int(sum(multitoken_result) > 1))
-                p_result.append(max(multitoken_result))
-
-            multitoken_result = []
-        elif t.startswith("▁"):
-            if len(multitoken_result) > 0:
-                # p_result.append(int(sum(multitoken_result) > 2))
-                p_result.append(max(multitoken_result))
-            multitoken_result = [p]
-
-        else:
-            multitoken_result.append(p)
-
-    # add final multitoken result
-    if len(multitoken_result) > 0:
-        # p_result.append(int(sum(multitoken_result) > 1))
-        p_result.append(max(multitoken_result))
+    # token labels of a word are reduced to their max label
+    p_result = get_label_aligner(tokenizer, unk_as_boundary=False).word_labels(
+        [hyps_asr], [hyps_para], reduce="max"
+    )[0]
 
     assert len(predicted_words) == len(
         p_result
@@ -182,6 +161,8 @@ class ASR(sb.Brain):
 
         # Add augmentation if specified
         if stage == sb.Stage.TRAIN:
+            if self.hparams.speed_perturb:
+                wavs, wav_lens = self.speed_perturb(wavs, wav_lens)
             if hasattr(self.hparams, "augmentation"):
                 wavs = self.hparams.augmentation(wavs, wav_lens)
 
@@ -513,7 +494,9 @@ class ASR(sb.Brain):
         # if stage == sb.Stage.TRAIN:
         #     loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
         if stage == sb.Stage.TRAIN or stage == sb.Stage.TEST:
-            loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
+            loader_kwargs = self._train_loader_specifics(
+                dataset, loader_kwargs, stage
+            )
         # loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
 
         dataloader = sb.dataio.dataloader.make_dataloader(
@@ -557,7 +540,7 @@ class ASR(sb.Brain):
         avg_test_loss = 0.0
         with torch.no_grad():
             for batch in tqdm(
-                test_set,
+                self._prefetch(test_set),
                 dynamic_ncols=True,
                 disable=not progressbar,
                 colour=self.tqdm_barcolor["test"],
@@ -690,7 +673,7 @@ class ASR(sb.Brain):
             avg_valid_loss = 0.0
             with torch.no_grad():
                 for batch in tqdm(
-                    valid_set,
+                    self._prefetch(valid_set),
                     dynamic_ncols=True,
                     disable=not enable,
                     colour=self.tqdm_barcolor["valid"],
@@ -735,7 +718,7 @@ class ASR(sb.Brain):
         # Time since last intra-epoch checkpoint
         last_ckpt_time = time.time()
         with tqdm(
-            train_set,
+            self._prefetch(train_set),
             initial=self.step,
             dynamic_ncols=True,
             disable=not enable,
@@ -786,23 +769,9 @@ class ASR(sb.Brain):
 
 
 def align_labels_to_tokenized_input(wrd, labels, tokenizer, paraphasia_dict):
-    words = wrd.split()
-    labels = labels.split()
-    assert len(words) == len(
-        labels
-    ), "Sentences and labels lists should be of same size."
-
-    return_labels = []
-    return_tokens = []
-    for w, l in zip(words, labels):
-        # print(f"w: {w} | l: {l}")
-        tokenized_word = tokenizer.sp.encode(w, out_type=str)
-        tokenized_label = [paraphasia_dict[l]] * len(tokenized_word)
-
-        return_labels.extend(tokenized_label)
-        return_tokens.extend(tokenized_word)
-
-    return return_tokens, return_labels
+    return get_label_aligner(tokenizer.sp).token_labels(
+        wrd.split(), labels.split(), paraphasia_dict
+    )
 
 
 def dataio_prepare(hparams, tokenizer, ptoknizer):
@@ -870,18 +839,9 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     @sb.utils.data_pipeline.takes("wav")
     @sb.utils.data_pipeline.provides("sig")
     def audio_pipeline_train(wav):
-        # Speed Perturb is done here so it is multi-threaded with the
-        # workers of the dataloader (faster).
-        if hparams["speed_perturb"]:
-            sig = sb.dataio.dataio.read_audio(wav)
-            # factor = np.random.uniform(0.95, 1.05)
-            # sig = resample(sig.numpy(), 16000, int(16000*factor))
-            speed = sb.processing.speech_augmentation.SpeedPerturb(
-                16000, [x for x in range(95, 105)]
-            )
-            sig = speed(sig.unsqueeze(0)).squeeze(0)  # torch.from_numpy(sig)
-        else:
-            sig = sb.dataio.dataio.read_audio(wav)
+        # Speed Perturb is done on the padded batch in compute_forward, the
+        # workers of the dataloader only read the audio.
+        sig = sb.dataio.dataio.read_audio(wav)
         return sig
 
     sb.dataio.dataset.add_dynamic_item([train_data], audio_pipeline_train)
@@ -1019,6 +979,11 @@ if __name__ == "__main__":
     train_dataloader_opts = hparams["train_dataloader_opts"]
     valid_dataloader_opts = hparams["valid_dataloader_opts"]
     asr_brain.tokenizer = tokenizer.sp
+    # one speed per utterance (95-104%), applied to the batch
+    speech_augmentation = sb.processing.speech_augmentation
+    asr_brain.speed_perturb = speech_augmentation.BatchSpeedPerturb(
+        16000, [x for x in range(95, 105)]
+    )
     asr_brain.ptokenizer = reverse_ptokenizer
     tokens = {
         i: asr_brain.tokenizer.id_to_piece(i)
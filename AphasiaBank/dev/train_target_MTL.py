@@ -128,6 +128,8 @@ class ASR(sb.Brain):
 
         # Add augmentation if specified
         if stage == sb.Stage.TRAIN:
+            if self.hparams.speed_perturb:
+                wavs, wav_lens = self.speed_perturb(wavs, wav_lens)
             if hasattr(self.hparams, "augmentation"):
                 wavs = self.hparams.augmentation(wavs, wav_lens)
 
@@ -472,7 +474,9 @@ class ASR(sb.Brain):
         # if stage == sb.Stage.TRAIN:
         #     loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
         if stage == sb.Stage.TRAIN or stage == sb.Stage.TEST:
-            loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
+            loader_kwargs = self._train_loader_specifics(
+                dataset, loader_kwargs, stage
+            )
         # loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
 
         dataloader = sb.dataio.dataloader.make_dataloader(
@@ -516,7 +520,7 @@ class ASR(sb.Brain):
         avg_test_loss = 0.0
         with torch.no_grad():
             for batch in tqdm(
-                test_set,
+                self._prefetch(test_set),
                 dynamic_ncols=True,
                 disable=not progressbar,
                 colour=self.tqdm_barcolor["test"],
@@ -649,7 +653,7 @@ class ASR(sb.Brain):
             avg_valid_loss = 0.0
             with torch.no_grad():
                 for batch in tqdm(
-                    valid_set,
+                    self._prefetch(valid_set),
                     dynamic_ncols=True,
                     disable=not enable,
                     colour=self.tqdm_barcolor["valid"],
@@ -694,7 +698,7 @@ class ASR(sb.Brain):
         # Time since last intra-epoch checkpoint
         last_ckpt_time = time.time()
         with tqdm(
-            train_set,
+            self._prefetch(train_set),
             initial=self.step,
             dynamic_ncols=True,
             disable=not enable,
@@ -829,18 +833,9 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     @sb.utils.data_pipeline.takes("wav")
     @sb.utils.data_pipeline.provides("sig")
     def audio_pipeline_train(wav):
-        # Speed Perturb is done here so it is multi-threaded with the
-        # workers of the dataloader (faster).
-        if hparams["speed_perturb"]:
-            sig = sb.dataio.dataio.read_audio(wav)
-            # factor = np.random.uniform(0.95, 1.05)
-            # sig = resample(sig.numpy(), 16000, int(16000*factor))
-            speed = sb.processing.speech_augmentation.SpeedPerturb(
-                16000, [x for x in range(95, 105)]
-            )
-            sig = speed(sig.unsqueeze(0)).squeeze(0)  # torch.from_numpy(sig)
-        else:
-            sig = sb.dataio.dataio.read_audio(wav)
+        # Speed Perturb is done on the padded batch in compute_forward, the
+        # workers of the dataloader only read the audio.
+        sig = sb.dataio.dataio.read_audio(wav)
         return sig
 
     sb.dataio.dataset.add_dynamic_item([train_data], audio_pipeline_train)
@@ -989,6 +984,11 @@ if __name__ == "__main__":
     train_dataloader_opts = hparams["train_dataloader_opts"]
     valid_dataloader_opts = hparams["valid_dataloader_opts"]
     asr_brain.tokenizer = tokenizer.sp
+    # one speed per utterance (95-104%), applied to the batch
+    speech_augmentation = sb.processing.speech_augmentation
+    asr_brain.speed_perturb = speech_augmentation.BatchSpeedPerturb(
+        16000, [x for x in range(95, 105)]
+    )
     asr_brain.ptokenizer = reverse_ptokenizer
     tokens = {
         i: asr_brain.tokenizer.id_to_piece(i)
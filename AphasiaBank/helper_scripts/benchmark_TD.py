@@ -0,0 +1,179 @@
+"""
+Benchmark of the TD engine (compute_temporal_distances) against the
+per-utterance TD_helper loops, on synthetic 12-fold data.
+
+Both must give exactly the same TDs, the script reports the time of each.
+
+Usage:
+python benchmark_TD.py --num_folds 12 --utts_per_fold 300
+"""
+import argparse
+import random
+import time
+from evaluation import compute_temporal_distances
+
+PARA_CLASSES = ["p", "n", "s"]
+
+
+# per-utterance TD loops, the reference of compute_temporal_distances
+def TD_helper_all(true_labels, predicted_labels):
+    TTC = 0
+    for i in range(len(true_labels)):
+        # for paraphasia label
+        if true_labels[i] != "c":
+            min_distance_for_label = max(i - 0, len(true_labels))
+            for j in range(len(predicted_labels)):
+                if true_labels[i] == predicted_labels[j]:
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            TTC += min_distance_for_label
+
+    CTT = 0
+    for j in range(len(predicted_labels)):
+        if predicted_labels[j] != "c":
+            min_distance_for_label = max(j - 0, len(predicted_labels))
+            for i in range(len(true_labels)):
+                if true_labels[i] == predicted_labels[j]:
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            CTT += min_distance_for_label
+    tot_d = (TTC + CTT) / len(true_labels)
+    return tot_d
+
+
+def TD_helper_binary(true_labels, predicted_labels):
+    # detect any paraphasia
+    TTC = 0
+    for i in range(len(true_labels)):
+        # for paraphasia label
+        if true_labels[i] != "c":
+            min_distance_for_label = max(i - 0, len(true_labels))
+            for j in range(len(predicted_labels)):
+                if predicted_labels[j] != "c":
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            TTC += min_distance_for_label
+
+    CTT = 0
+    for j in range(len(predicted_labels)):
+        if predicted_labels[j] != "c":
+            min_distance_for_label = max(j - 0, len(predicted_labels))
+            for i in range(len(true_labels)):
+                if true_labels[i] != "c":
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            CTT += min_distance_for_label
+    tot_d = (TTC + CTT) / len(true_labels)
+    return tot_d
+
+
+def TD_helper_para_sp(true_labels, predicted_labels, pclass):
+    # print(f"true_labels: {true_labels}")
+    # print(f"predicted_labels: {predicted_labels}")
+    # print(f"pclass: {pclass}")
+
+    TTC = 0
+    for i in range(len(true_labels)):
+        # for paraphasia label
+        if true_labels[i] == pclass:
+            min_distance_for_label = max(i - 0, len(true_labels))
+            for j in range(len(predicted_labels)):
+                if true_labels[i] == predicted_labels[j]:
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            TTC += min_distance_for_label
+
+    CTT = 0
+    for j in range(len(predicted_labels)):
+        if predicted_labels[j] == pclass:
+            min_distance_for_label = max(j - 0, len(predicted_labels))
+            for i in range(len(true_labels)):
+                if true_labels[i] == predicted_labels[j]:
+                    # check for min distance
+                    if abs(i - j) < min_distance_for_label:
+                        min_distance_for_label = abs(i - j)
+
+            CTT += min_distance_for_label
+    tot_d = (TTC + CTT) / len(true_labels)
+    return tot_d
+
+
+def synthetic_fold(num_utts, max_words, para_rate, rng):
+    """
+    Random word-level label lists, predictions of slightly different length
+    """
+    y_true, y_pred = [], []
+    for _ in range(num_utts):
+        n_words = rng.randint(1, max_words)
+        n_pred = max(1, n_words + rng.randint(-2, 2))
+        for n, labels in [(n_words, y_true), (n_pred, y_pred)]:
+            labels.append(
+                [
+                    rng.choice(PARA_CLASSES)
+                    if rng.random() < para_rate
+                    else "c"
+                    for _ in range(n)
+                ]
+            )
+    return y_true, y_pred
+
+
+def loop_TDs(y_true, y_pred):
+    """
+    TDs computed with the TD_helper loops, as done before for every fold
+    """
+    TDs = {
+        "TD_bin": [TD_helper_binary(t, p) for t, p in zip(y_true, y_pred)],
+        "TD_multi": [TD_helper_all(t, p) for t, p in zip(y_true, y_pred)],
+    }
+    for para_class in PARA_CLASSES:
+        TDs[f"TD_{para_class}"] = [
+            TD_helper_para_sp(t, p, para_class) for t, p in zip(y_true, y_pred)
+        ]
+    return {k: (sum(v) / len(v), v) for k, v in TDs.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num_folds", type=int, default=12)
+    parser.add_argument("--utts_per_fold", type=int, default=300)
+    parser.add_argument("--max_words", type=int, default=60)
+    parser.add_argument("--para_rate", type=float, default=0.15)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    folds = [
+        synthetic_fold(args.utts_per_fold, args.max_words, args.para_rate, rng)
+        for _ in range(args.num_folds)
+    ]
+
+    start = time.perf_counter()
+    loop_results = [loop_TDs(y_true, y_pred) for y_true, y_pred in folds]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine_results = [
+        compute_temporal_distances(y_true, y_pred) for y_true, y_pred in folds
+    ]
+    engine_time = time.perf_counter() - start
+
+    identical = loop_results == engine_results
+    print(f"folds: {args.num_folds} | utts per fold: {args.utts_per_fold}")
+    print(f"TD_helper loops: {loop_time:.3f}s")
+    print(f"TD engine: {engine_time:.3f}s")
+    print(f"speed-up: {loop_time / engine_time:.1f}x | identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark of the label alignment (label_alignment.LabelAligner) against the
+per-token loops of combine_AWER / align_labels_to_tokenized_input, on
+synthetic hypotheses and a small BPE tokenizer trained on synthetic words.
+
+Both must give exactly the same labels, the script reports the time of each.
+
+Usage:
+python benchmark_label_alignment.py --num_utts 5000 --batch_size 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import sentencepiece as spm
+from label_alignment import LabelAligner
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def find_majority_element(lst):
+    counts = {}
+    for num in lst:
+        counts[num] = counts.get(num, 0) + 1
+    return max(counts, key=counts.get)
+
+
+def loop_word_labels(hyps_para, hyps_asr, sp, reduce):
+    """
+    Word labels of one hypothesis, grouped piece by piece as done before
+    """
+    reduce_fn = find_majority_element if reduce == "majority" else max
+    tokenized_out = [sp.IdToPiece(h) for h in hyps_asr]
+    tokenized_out = [t if t != "<unk>" else "▁" for t in tokenized_out]
+    p_result = []
+    multitoken_result = []
+    for t, p in zip(tokenized_out, hyps_para):
+        if t == "▁":
+            if len(multitoken_result) > 0:
+                p_result.append(reduce_fn(multitoken_result))
+            multitoken_result = []
+        elif t.startswith("▁"):
+            if len(multitoken_result) > 0:
+                p_result.append(reduce_fn(multitoken_result))
+            multitoken_result = [p]
+        else:
+            multitoken_result.append(p)
+    if len(multitoken_result) > 0:
+        p_result.append(reduce_fn(multitoken_result))
+    return p_result
+
+
+def loop_token_labels(words, labels, sp, paraphasia_dict):
+    return_labels = []
+    return_tokens = []
+    for w, l in zip(words, labels):
+        tokenized_word = sp.encode(w, out_type=str)
+        return_labels.extend([paraphasia_dict[l]] * len(tokenized_word))
+        return_tokens.extend(tokenized_word)
+    return return_tokens, return_labels
+
+
+def train_tokenizer(vocab, vocab_size, tmpdir, rng):
+    text_file = os.path.join(tmpdir, "text.txt")
+    with open(text_file, "w") as f:
+        for _ in range(2000):
+            f.write(" ".join(rng.choices(vocab, k=12)) + "\n")
+    spm.SentencePieceTrainer.train(
+        input=text_file,
+        model_prefix=os.path.join(tmpdir, "bpe"),
+        vocab_size=vocab_size,
+        model_type="bpe",
+        character_coverage=1.0,
+        minloglevel=2,
+    )
+    return spm.SentencePieceProcessor(
+        model_file=os.path.join(tmpdir, "bpe.model")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num_utts", type=int, default=5000)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--max_tokens", type=int, default=40)
+    parser.add_argument("--vocab_size", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = [
+        "".join(rng.choices(LETTERS, k=rng.randint(2, 9))) for _ in range(800)
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sp = train_tokenizer(vocab, args.vocab_size, tmpdir, rng)
+
+    # hypotheses: random token ids (incl. bare '▁', <unk> and leading
+    # continuation pieces) with random labels
+    hyps_asr = [
+        [
+            rng.randrange(sp.GetPieceSize())
+            for _ in range(rng.randint(0, args.max_tokens))
+        ]
+        for _ in range(args.num_utts)
+    ]
+    hyps_para = [[rng.choice([0, 0, 0, 1, 2, 3]) for _ in h] for h in hyps_asr]
+    batches = [
+        (hyps_asr[i : i + args.batch_size], hyps_para[i : i + args.batch_size])
+        for i in range(0, args.num_utts, args.batch_size)
+    ]
+    paraphasia_dict = {"c": 0, "p": 1, "n": 2, "s": 3}
+    sentences = [
+        (rng.choices(vocab, k=12), rng.choices("cpns", k=12))
+        for _ in range(args.num_utts)
+    ]
+
+    print(f"utts: {args.num_utts} | batch size: {args.batch_size}")
+    aligner = LabelAligner(sp)
+    for reduce in ["majority", "max"]:
+        start = time.perf_counter()
+        loop_results = [
+            loop_word_labels(p, h, sp, reduce)
+            for h, p in zip(hyps_asr, hyps_para)
+        ]
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        aligner_results = []
+        for h, p in batches:
+            aligner_results.extend(aligner.word_labels(h, p, reduce=reduce))
+        aligner_time = time.perf_counter() - start
+
+        identical = loop_results == aligner_results
+        print(
+            f"token->word ({reduce}): loop {loop_time:.3f}s | "
+            f"aligner {aligner_time:.3f}s | "
+            f"speed-up: {loop_time / aligner_time:.1f}x | identical: {identical}"
+        )
+
+    start = time.perf_counter()
+    loop_results = [
+        loop_token_labels(w, l, sp, paraphasia_dict) for w, l in sentences
+    ]
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    aligner_results = [
+        aligner.token_labels(w, l, paraphasia_dict) for w, l in sentences
+    ]
+    aligner_time = time.perf_counter() - start
+    identical = loop_results == aligner_results
+    print(
+        f"word->token: loop {loop_time:.3f}s | aligner {aligner_time:.3f}s | "
+        f"speed-up: {loop_time / aligner_time:.1f}x | identical: {identical}"
+    )
+
+
+if __name__ == "__main__":
+    main()
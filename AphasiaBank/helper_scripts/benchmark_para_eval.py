@@ -0,0 +1,168 @@
+"""
+Benchmark of the parallel fold evaluation (para_eval_many) against the
+serial para_eval loop, on synthetic result files of a sweep of models
+(12 folds each).
+
+Both must give exactly the same DataFrames, the script reports the time of
+each.
+
+Usage:
+python benchmark_para_eval.py --num_models 8 --utts_per_fold 300 --model mtl
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import pandas as pd
+from evaluation import (
+    compute_temporal_distances,
+    mtl_get_metrics,
+    para_eval_many,
+    ss_get_metrics,
+    utt_level_statistics,
+)
+
+TAGS = ["C", "C", "C", "C", "P", "N", "S"]
+WORDS = [f"w{i}" for i in range(200)]
+
+
+def synthetic_words(n_words, model_name, rng):
+    """
+    Words with their paraphasia tags, one list of tokens per word
+    (word/TAG for mtl, word [tag] for single_seq)
+    """
+    words = []
+    for _ in range(n_words):
+        word, tag = rng.choice(WORDS), rng.choice(TAGS)
+        if model_name == "mtl":
+            words.append([f"{word}/{tag}"])
+        elif tag == "C":
+            words.append([word])
+        else:
+            words.append([word, f"[{tag.lower()}]"])
+    return words
+
+
+def write_result_file(path, fold, num_utts, max_words, model_name, rng):
+    """
+    Result file in the format of the speechbrain wer/awer files
+    (alignment of each utterance: header, ref, ops, hyp)
+    """
+    lines = ["%WER 10.00 [ 10 / 100, 2 ins, 3 del, 5 sub ]", ""]
+    for k in range(num_utts):
+        n_words = rng.randint(1, max_words)
+        ref = synthetic_words(n_words, model_name, rng)
+        n_hyp = max(1, n_words + rng.randint(-2, 2))
+        # about half of the words of the reference are recognized
+        hyp = [
+            ref[i] if i < n_words and rng.random() < 0.5 else word
+            for i, word in enumerate(synthetic_words(n_hyp, model_name, rng))
+        ]
+        ref = [token for word in ref for token in word]
+        hyp = [token for word in hyp for token in word]
+        lines += [
+            "=" * 80,
+            f"P{fold}_{k}, %WER 10.00 [ 1 / 10, 0 ins, 0 del, 1 sub ]",
+            " ; ".join(ref),
+            " ; ".join("=" for _ in ref),
+            " ; ".join(hyp),
+        ]
+    with open(path, "w") as w:
+        w.write("\n".join(lines) + "\n")
+
+
+def serial_para_eval(eval_dir, model_name):
+    """
+    The fold loop of para_eval, one fold after the other
+    """
+    get_metrics = mtl_get_metrics if model_name == "mtl" else ss_get_metrics
+    y_true, y_pred = [], []
+    utt_stats, fold_stats, stat_sig_utt_df_list = [], [], []
+    for i in range(1, 13):
+        (
+            utt_stats_df,
+            fold_stats_df,
+            df_awer_stat_sig,
+            list_list_ytrue,
+            list_list_ypred,
+        ) = get_metrics(f"{eval_dir}/Fold-{i}", i)
+        y_true.extend(list_list_ytrue)
+        y_pred.extend(list_list_ypred)
+        stat_sig_utt_df_list.append(df_awer_stat_sig)
+        utt_stats.append(utt_stats_df)
+        fold_stats.append(fold_stats_df)
+
+    utt_df = pd.concat(utt_stats)
+    fold_df = pd.concat(fold_stats)
+    df_utt_stat_sig = pd.concat(stat_sig_utt_df_list)
+    TDs = compute_temporal_distances(y_true, y_pred)
+    for TD_met in ["TD_bin", "TD_multi", "TD_p", "TD_n", "TD_s"]:
+        df_utt_stat_sig[TD_met] = TDs[TD_met][1]
+    utt_stats_df = utt_level_statistics(y_true, y_pred)
+    return utt_df, fold_df, utt_stats_df, df_utt_stat_sig
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num_models", type=int, default=8)
+    parser.add_argument("--utts_per_fold", type=int, default=300)
+    parser.add_argument("--max_words", type=int, default=30)
+    parser.add_argument("--model", default="mtl", choices=["mtl", "single_seq"])
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--chunk_size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    result_name = "awer_para.txt" if args.model == "mtl" else "wer.txt"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        eval_dirs = []
+        for m in range(args.num_models):
+            eval_dir = f"{tmpdir}/model-{m}"
+            for fold in range(1, 13):
+                fold_dir = f"{eval_dir}/Fold-{fold}"
+                os.makedirs(fold_dir)
+                write_result_file(
+                    f"{fold_dir}/{result_name}",
+                    fold,
+                    args.utts_per_fold,
+                    args.max_words,
+                    args.model,
+                    rng,
+                )
+            eval_dirs.append(eval_dir)
+
+        # both parse the result files (cached tables are not reused)
+        start = time.perf_counter()
+        serial = [serial_para_eval(d, args.model) for d in eval_dirs]
+        serial_time = time.perf_counter() - start
+        for d in eval_dirs:
+            for fold in range(1, 13):
+                for ext in ["pkl", "parquet"]:
+                    cache = f"{d}/Fold-{fold}/{result_name}.{ext}"
+                    if os.path.exists(cache):
+                        os.remove(cache)
+
+        start = time.perf_counter()
+        parallel = para_eval_many(
+            eval_dirs, args.model, args.num_workers, args.chunk_size
+        )
+        parallel_time = time.perf_counter() - start
+
+    same = all(
+        a.equals(b)
+        for d, frames in zip(eval_dirs, serial)
+        for a, b in zip(frames, parallel[d])
+    )
+    num_utts = args.num_models * 12 * args.utts_per_fold
+    print(f"{args.num_models} models x 12 folds, {num_utts} utterances")
+    print(f"serial:   {serial_time:.2f}s")
+    print(
+        f"parallel: {parallel_time:.2f}s ({serial_time / parallel_time:.1f}x)"
+    )
+    print(f"same DataFrames: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -63,8 +63,10 @@ if __name__ == "__main__":
     #         p = subprocess.run(cmd, env=env)
     #         exit()
 
+    EXP_DIRS = []
     for w in [0.3, 0.4, 0.5, 0.6, 0.7]:
         EXP_DIR = f"{BASE}/reduce-w_asr_w-{w}_S2S-hubert-Transformer-500"
+        EXP_DIRS.append(EXP_DIR)
         for fold in range(1, 13):
             print(f"weight: {w} | fold: {fold}")
             FOLD_DIR = f"{EXP_DIR}/Fold-{fold}"
@@ -79,4 +81,5 @@ if __name__ == "__main__":
                 f"{FOLD_DIR}/awer_para_test.txt", f"{FOLD_DIR}/awer_para.txt"
             )
 
-        para_eval(EXP_DIR, "mtl")
+    # all the weights and folds scored by one process pool
+    para_eval_many(EXP_DIRS, "mtl")
@@ -2,132 +2,214 @@
 Evaluation functions
 """
 
-import jiwer
 from sklearn.metrics import f1_score, recall_score, precision_score
+import numpy as np
 import pandas as pd
 import os
 import Levenshtein as lev
 import json
+import concurrent.futures
 
 ## TD
-def TD_helper_all(true_labels, predicted_labels):
-    TTC = 0
-    for i in range(len(true_labels)):
-        # for paraphasia label
-        if true_labels[i] != "c":
-            min_distance_for_label = max(i - 0, len(true_labels))
-            for j in range(len(predicted_labels)):
-                if true_labels[i] == predicted_labels[j]:
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            TTC += min_distance_for_label
-
-    CTT = 0
-    for j in range(len(predicted_labels)):
-        if predicted_labels[j] != "c":
-            min_distance_for_label = max(j - 0, len(predicted_labels))
-            for i in range(len(true_labels)):
-                if true_labels[i] == predicted_labels[j]:
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            CTT += min_distance_for_label
-    tot_d = (TTC + CTT) / len(true_labels)
-    return tot_d
-
-
-def TD_helper_binary(true_labels, predicted_labels):
-    # detect any paraphasia
-    TTC = 0
-    for i in range(len(true_labels)):
-        # for paraphasia label
-        if true_labels[i] != "c":
-            min_distance_for_label = max(i - 0, len(true_labels))
-            for j in range(len(predicted_labels)):
-                if predicted_labels[j] != "c":
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            TTC += min_distance_for_label
-
-    CTT = 0
-    for j in range(len(predicted_labels)):
-        if predicted_labels[j] != "c":
-            min_distance_for_label = max(j - 0, len(predicted_labels))
-            for i in range(len(true_labels)):
-                if true_labels[i] != "c":
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            CTT += min_distance_for_label
-    tot_d = (TTC + CTT) / len(true_labels)
-    return tot_d
-
-
-def TD_helper_para_sp(true_labels, predicted_labels, pclass):
-    # print(f"true_labels: {true_labels}")
-    # print(f"predicted_labels: {predicted_labels}")
-    # print(f"pclass: {pclass}")
-
-    TTC = 0
-    for i in range(len(true_labels)):
-        # for paraphasia label
-        if true_labels[i] == pclass:
-            min_distance_for_label = max(i - 0, len(true_labels))
-            for j in range(len(predicted_labels)):
-                if true_labels[i] == predicted_labels[j]:
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            TTC += min_distance_for_label
-
-    CTT = 0
-    for j in range(len(predicted_labels)):
-        if predicted_labels[j] == pclass:
-            min_distance_for_label = max(j - 0, len(predicted_labels))
-            for i in range(len(true_labels)):
-                if true_labels[i] == predicted_labels[j]:
-                    # check for min distance
-                    if abs(i - j) < min_distance_for_label:
-                        min_distance_for_label = abs(i - j)
-
-            CTT += min_distance_for_label
-    tot_d = (TTC + CTT) / len(true_labels)
-    return tot_d
-
-
 def compute_temporal_distance(true_labels, predicted_labels, binary_PD):
     # Return list of TDs for each utterance
-    TD_per_utt = []
-    for true_label, pred_label in zip(true_labels, predicted_labels):
-        # Binary PD
-        if binary_PD:
-            TD_utt = TD_helper_binary(true_label, pred_label)
-        # Multiclass
-        else:
-            TD_utt = TD_helper_all(true_label, pred_label)
-        TD_per_utt.append(TD_utt)
-
-    return sum(TD_per_utt) / len(TD_per_utt), TD_per_utt
+    TDs = compute_temporal_distances(true_labels, predicted_labels)
+    # Binary PD or Multiclass
+    return TDs["TD_bin"] if binary_PD else TDs["TD_multi"]
 
 
 def compute_temporal_distance_para_sp(
     true_labels, predicted_labels, para_class
 ):
     # Return list of TDs for each utterance
-    TD_per_utt = []
-    for true_label, pred_label in zip(true_labels, predicted_labels):
-        # para class
-        TD_utt = TD_helper_para_sp(true_label, pred_label, para_class)
-        TD_per_utt.append(TD_utt)
+    TDs = compute_temporal_distances(
+        true_labels, predicted_labels, para_classes=(para_class,)
+    )
+    return TDs[f"TD_{para_class}"]
+
+
+def _nearest_distance(query, targets, cap):
+    """
+    Distance from each query position to the closest target position
+    (both sorted), capped at cap
+    """
+    if len(targets) == 0:
+        return cap
+    pos = np.searchsorted(targets, query)
+    left = targets[np.maximum(pos - 1, 0)]
+    right = targets[np.minimum(pos, len(targets) - 1)]
+    dist = np.minimum(np.abs(query - left), np.abs(right - query))
+    return np.minimum(dist, cap)
+
+
+def compute_temporal_distances(
+    true_labels, predicted_labels, para_classes=("p", "n", "s")
+):
+    """
+    Binary, multiclass and paraphasia-specific TD of every utterance at once.
+    Same values as the per-utterance loops of benchmark_TD.py.
+
+    All the utterances are laid out on one axis, far enough apart that no
+    distance across utterances is below the cap, so the closest label of
+    every word is found with a single searchsorted per label.
+
+    Returns dict of TD_bin, TD_multi and TD_<para_class> -> (mean, TD list)
+    """
+    true_lens = np.array([len(t) for t in true_labels], dtype=np.int64)
+    pred_lens = np.array([len(p) for p in predicted_labels], dtype=np.int64)
+    num_utts = len(true_lens)
+    stride = 2 * int(np.concatenate([true_lens, pred_lens, [0]]).max()) + 1
+    offsets = np.arange(num_utts, dtype=np.int64) * stride
+
+    def _flatten(label_lists, lens):
+        utt = np.repeat(np.arange(num_utts), lens)
+        pos = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+        labels = np.array(
+            [label for labels in label_lists for label in labels], dtype=object
+        )
+        return labels, utt, pos + offsets[utt]
+
+    true_flat, true_utt, true_pos = _flatten(true_labels, true_lens)
+    pred_flat, pred_utt, pred_pos = _flatten(predicted_labels, pred_lens)
+
+    def _sum_distances(true_mask, pred_mask):
+        # true -> closest pred (TTC) + pred -> closest true (CTT)
+        ttc = _nearest_distance(
+            true_pos[true_mask],
+            pred_pos[pred_mask],
+            true_lens[true_utt[true_mask]],
+        )
+        ctt = _nearest_distance(
+            pred_pos[pred_mask],
+            true_pos[true_mask],
+            pred_lens[pred_utt[pred_mask]],
+        )
+        return np.bincount(
+            true_utt[true_mask], weights=ttc, minlength=num_utts
+        ) + np.bincount(pred_utt[pred_mask], weights=ctt, minlength=num_utts)
+
+    # binary: any paraphasia matches any paraphasia
+    TD_sums = {"TD_bin": _sum_distances(true_flat != "c", pred_flat != "c")}
+
+    # multiclass is the sum of the distances of each paraphasia class
+    TD_sums["TD_multi"] = np.zeros(num_utts)
+    labels = set(true_flat.tolist()) | set(pred_flat.tolist())
+    for label in sorted(labels - {"c"}):
+        label_sums = _sum_distances(true_flat == label, pred_flat == label)
+        TD_sums["TD_multi"] += label_sums
+        if label in para_classes:
+            TD_sums[f"TD_{label}"] = label_sums
+    for para_class in para_classes:
+        TD_sums.setdefault(f"TD_{para_class}", np.zeros(num_utts))
+
+    TDs = {}
+    for TD_met, sums in TD_sums.items():
+        TD_per_utt = [
+            float(tot_d) / len(t) for tot_d, t in zip(sums, true_labels)
+        ]
+        TDs[TD_met] = (sum(TD_per_utt) / len(TD_per_utt), TD_per_utt)
+    return TDs
+
+
+## AWER scoring
+# Each utterance is parsed once into words and paraphasia labels, the
+# WER/AWER/AWER-disj/AWER-PD views are built from these and each view is
+# aligned with one Levenshtein call on integer tokens (same counts as
+# jiwer.compute_measures on the joined strings).
+PARAPHASIA_KEY = {
+    "non-paraphasic": "c",
+    "phonemic": "p",
+    "semantic": "s",
+    "neologistic": "n",
+}
+AWER_VIEWS = ["wer", "awer", "awer_disj", "awer_PD"]
+
+
+def _tokens(items):
+    # same whitespace tokenization as jiwer
+    return " ".join(items).split()
+
+
+def edit_counts(y_true, y_pred, vocab=None):
+    """
+    Align two token lists
+    return number of errors (S+D+I) and insertions
+    """
+    vocab = {} if vocab is None else vocab
+    ref = [vocab.setdefault(w, len(vocab)) for w in y_true]
+    hyp = [vocab.setdefault(w, len(vocab)) for w in y_pred]
+    ops = lev.editops(ref, hyp)
+    insertions = sum(1 for op in ops if op[0] == "insert")
+    return len(ops), insertions
+
+
+def utterance_views(result_dict, label_aug_para):
+    """
+    Build the (ref, hyp) token lists of each view for one utterance
+    result_dict = json prediction {<idx>_<word>: paraphasia}
+    label_aug_para = list of <word>/<paraphasia>
+    """
+    pred = [
+        (k.split("_")[1], PARAPHASIA_KEY[v], "<eps>" in k)
+        for k, v in result_dict.items()
+    ]
+    label = [(p, p.split("/")) for p in label_aug_para]
+
+    pred_PD = [l if l in ["p", "n"] else f"{w} {l}" for w, l, eps in pred]
+    label_PD = [
+        s[1] if s[1] in ["p", "n"] else f"{s[0]} {s[1]}" for _, s in label
+    ]
+    return {
+        "wer": (
+            _tokens([s[0] for _, s in label]),
+            _tokens([w for w, l, eps in pred if not eps]),
+        ),
+        "awer": (
+            _tokens([p for p, _ in label]),
+            _tokens([f"{w}/{l}" for w, l, eps in pred if not eps]),
+        ),
+        "awer_disj": (
+            _tokens([f"{s[0]} {s[1]}" for _, s in label]),
+            _tokens([f"{w} {l}" for w, l, eps in pred if not eps]),
+        ),
+        "awer_PD": (
+            _tokens([x for x in label_PD if "<eps>" not in x]),
+            _tokens([x for x in pred_PD if "<eps>" not in x]),
+        ),
+    }
 
-    return sum(TD_per_utt) / len(TD_per_utt), TD_per_utt
+
+def score_awer_views(results_dict, labels_dict, remove_label_eps=False):
+    """
+    Score the utterances of labels_dict found in results_dict
+    remove_label_eps: drop <eps> labels before scoring
+
+    return uids and dict of per-utterance count arrays, for each view:
+    <view>-err (S+D+I), <view>-ref (reference words), <view>-ins (I)
+    """
+    uids = []
+    counts = {
+        f"{view}-{count}": []
+        for view in AWER_VIEWS
+        for count in ["err", "ref", "ins"]
+    }
+    vocab = {}
+    for utt_id, label_aug_para in labels_dict.items():
+        if utt_id not in results_dict:
+            continue
+        if remove_label_eps:
+            label_aug_para = [l for l in label_aug_para if "<eps>" not in l]
+
+        uids.append(utt_id)
+        views = utterance_views(results_dict[utt_id], label_aug_para)
+        for view, (y_true, y_pred) in views.items():
+            err, ins = edit_counts(y_true, y_pred, vocab)
+            counts[f"{view}-err"].append(err)
+            counts[f"{view}-ref"].append(len(y_true))
+            counts[f"{view}-ins"].append(ins)
+
+    counts = {k: np.array(v, dtype=np.int64) for k, v in counts.items()}
+    return uids, counts
 
 
 # AWER (need list preprocessing first)
@@ -137,17 +219,12 @@ def compute_AWER_lists(list_ytrue, list_ypred):
     return dictionary of number of errors and total words
     """
     wer_details = {"err": [], "tot": []}
-    count = 0
+    vocab = {}
     for y_true, y_pred in zip(list_ytrue, list_ypred):
-        ytrue_str = " ".join(y_true)
-        ypred_str = " ".join(y_pred)
-
-        measures = jiwer.compute_measures(ytrue_str, ypred_str)
-        wer_details["err"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
+        err, _ = edit_counts(
+            " ".join(y_true).split(), " ".join(y_pred).split(), vocab
         )
+        wer_details["err"].append(err)
         wer_details["tot"].append(len(y_true))
 
     return wer_details
@@ -296,97 +373,151 @@ def display_and_save_dfs(
         #     _print_and_log(log_str,w)
 
 
+## Result ingestion
+# A wer.txt/awer_para.txt file is parsed once into a table (uids, aligned
+# ref/hyp words incl. <eps> and word/TAG pairs) that is cached next to the
+# file (Parquet if pyarrow is installed, pickle otherwise). The cache stores
+# the mtime and size of the result file and is only used when they match.
+try:
+    import pyarrow
+    import pyarrow.parquet
+
+    TABLE_FORMAT = "parquet"
+except ImportError:
+    TABLE_FORMAT = "pkl"
+
+_alignment_tables = {}
+
+
+def parse_alignment_file(result_file):
+    """
+    Parse the utterance alignments of a speechbrain wer/awer file
+    return df with uids, ref and hyp (aligned words, <eps> included)
+    """
+    with open(result_file, "r") as r:
+        lines = [line.strip() for line in r.read().splitlines()]
+
+    # each utterance: <uid>, %WER ... header (14 fields), ref, ops, hyp
+    headers = []
+    for i, line in enumerate(lines[:-3]):
+        if (
+            line.startswith("P")
+            and (not headers or i > headers[-1] + 3)
+            and len(line.split()) == 14
+        ):
+            headers.append(i)
+
+    def _words(offset):
+        return [
+            [w.strip() for w in lines[i + offset].split(";")] for i in headers
+        ]
+
+    return pd.DataFrame(
+        {
+            "uids": [lines[i].split()[0][:-1] for i in headers],
+            "ref": _words(1),
+            "hyp": _words(3),
+        }
+    )
+
+
+def _read_table_cache(cache_file):
+    # (source, table) of a cache written by _write_table_cache
+    if TABLE_FORMAT == "parquet":
+        arrow_table = pyarrow.parquet.read_table(cache_file)
+        source = (arrow_table.schema.metadata or {}).get(b"source")
+        if source is None:
+            return None, None
+        table = arrow_table.to_pandas()
+        for col in ["ref", "hyp"]:
+            table[col] = table[col].map(list)
+        return json.loads(source), table
+    cache = pd.read_pickle(cache_file)
+    if not isinstance(cache, dict):
+        return None, None
+    return cache["source"], cache["table"]
+
+
+def _write_table_cache(cache_file, source, table):
+    if TABLE_FORMAT == "parquet":
+        arrow_table = pyarrow.Table.from_pandas(table, preserve_index=False)
+        metadata = dict(arrow_table.schema.metadata or {})
+        metadata[b"source"] = json.dumps(source).encode()
+        arrow_table = arrow_table.replace_schema_metadata(metadata)
+        pyarrow.parquet.write_table(arrow_table, cache_file)
+    else:
+        pd.to_pickle({"source": source, "table": table}, cache_file)
+
+
+def load_alignment_table(result_file):
+    """
+    Cached parse_alignment_file (in memory and on disk next to result_file),
+    used while the mtime and size of result_file are those it was parsed at
+    """
+    stat = os.stat(result_file)
+    source = [stat.st_mtime_ns, stat.st_size]
+    if result_file in _alignment_tables:
+        table_source, table = _alignment_tables[result_file]
+        if table_source == source:
+            return table
+
+    cache_file = f"{result_file}.{TABLE_FORMAT}"
+    table = None
+    if os.path.exists(cache_file):
+        table_source, table = _read_table_cache(cache_file)
+        if table_source != source:
+            table = None
+    if table is None:
+        table = parse_alignment_file(result_file)
+        try:
+            _write_table_cache(cache_file, source, table)
+        except OSError:
+            # read-only result dir: keep the in-memory table only
+            pass
+
+    _alignment_tables[result_file] = (source, table)
+    return table
+
+
+def _split_tags(words):
+    # [<word0>, [<para0>], <word1>, [<para1>], ...] without <eps>
+    new_extended_words = []
+    for word in words:
+        if "<eps>" in word:
+            continue
+        word_para = word.split("/")
+        new_extended_words.extend([word_para[0], f"[{word_para[1].lower()}]"])
+    return new_extended_words
+
+
 ## specific ##
-def mtl_extract_asr_para(awer_file):
+def mtl_extract_asr_para(awer_file, start=0, stop=None):
     """
     return lists of [<word0>, <para0>, <word1>, <para1>, ...]
     para are enveloped with [] like [p], [n], [s]
     preserve <eps> for alignment of paraphasia-only evaluation metrics
     return uids
+    start, stop: utterances (rows) to extract
     """
 
-    pred_words = []
-    gt_words = []
-    uids = []
-    with open(awer_file, "r") as r:
-        lines = r.readlines()
-        switch = 0
-        for line in lines:
-            line = line.strip()
-            if line.startswith("P") and len(line.split()) == 14 and switch == 0:
-                utt_id = line.split()[0][:-1]
-                uids.append(utt_id)
-                switch = 1
-            elif switch == 1:
-                # ground truth
-                words = [w.strip() for w in line.split(";")]
-                new_extended_words = []
-                for word in words:
-                    if "<eps>" in word:
-                        continue
-                    else:
-                        new_para_arr = [
-                            word.split("/")[0],
-                            f'[{word.split("/")[1].lower()}]',
-                        ]
-                        new_extended_words.extend(new_para_arr)
-                gt_words.append(new_extended_words)
-                switch = 2
-
-            elif switch == 2:
-                switch = 3
-            elif switch == 3:
-                # pred
-                words = [w.strip() for w in line.split(";")]
-                new_extended_words = []
-                for word in words:
-                    if "<eps>" in word:
-                        continue
-                    else:
-                        new_para_arr = [
-                            word.split("/")[0],
-                            f'[{word.split("/")[1].lower()}]',
-                        ]
-                        new_extended_words.extend(new_para_arr)
-
-                pred_words.append(new_extended_words)
-                switch = 0
+    table = load_alignment_table(awer_file).iloc[start:stop]
+    gt_words = [_split_tags(words) for words in table["ref"]]
+    pred_words = [_split_tags(words) for words in table["hyp"]]
+    uids = table["uids"].tolist()
 
     return gt_words, pred_words, uids
 
 
-def ss_extract_asr_para(wer_file):
+def ss_extract_asr_para(wer_file, start=0, stop=None):
     # Extract word-level paraphasias from transcription WER file
     # Words (no tag -> C)
+    # start, stop: utterances (rows) to extract
 
     # AWER
-    y_true = []
-    y_pred = []
-    uid_list = []
-    with open(wer_file, "r") as r:
-        lines = r.readlines()
-        switch = 0
-        for line in lines:
-            line = line.strip()
-            if line.startswith("P") and len(line.split()) == 14 and switch == 0:
-                utt_id = line.split()[0][:-1]
-                uid_list.append(utt_id)
-                switch = 1
-            elif switch == 1:
-                # ground truth
-                words = [w.strip() for w in line.split(";")]
-                words_no_eps = [w for w in words if w != "<eps>"]
-                y_true.append(words_no_eps)
-                switch = 2
-
-            elif switch == 2:
-                switch = 3
-            elif switch == 3:
-                # pred
-                words = [w.strip() for w in line.split(";")]
-                words_no_eps = [w for w in words if w != "<eps>"]
-                y_pred.append(words_no_eps)
-                switch = 0
+    table = load_alignment_table(wer_file).iloc[start:stop]
+    y_true = [[w for w in words if w != "<eps>"] for words in table["ref"]]
+    y_pred = [[w for w in words if w != "<eps>"] for words in table["hyp"]]
+    uid_list = table["uids"].tolist()
 
     return y_true, y_pred, uid_list
 
@@ -536,58 +667,82 @@ def ss_reinsert_paraphasia_tags(word_list, tag_list):
 
 
 # get_metrics() EVAL
-def mtl_get_metrics(fold_dir, fold_num):
+# The metrics of an utterance only depend on its own alignment: a fold is
+# scored in chunks of utterances (rows of its result table) whose
+# per-utterance columns are concatenated, see para_eval_many.
+def mtl_fold_sequences(fold_dir, start=0, stop=None):
     """
-    Compute WER metric for a given fold dir
-    Compile list of lists y_true and y_pred for paraphasia analysis
+    <word> [<para>] sequences (<eps> preserved) and uids of the utterances
+    start:stop of a fold
     """
-    awer_file = f"{fold_dir}/awer_para.txt"
+    return mtl_extract_asr_para(f"{fold_dir}/awer_para.txt", start, stop)
 
-    # list of <word> <para> for every word (preserved paraphasias)
-    y_true, y_pred, uids = mtl_extract_asr_para(awer_file)
 
+def ss_fold_sequences(fold_dir, start=0, stop=None):
+    """
+    <word> [<para>] sequences (aligned words) and uids of the utterances
+    start:stop of a fold
+    """
+    # remove eps
+    noalign_ytrue, noalign_ypred, uids = ss_extract_asr_para(
+        f"{fold_dir}/wer.txt", start, stop
+    )
+
+    # remove paraphasia tags
+    (
+        noalign_ytrue,
+        noalign_ypred,
+        true_tag_list,
+        pred_tag_list,
+    ) = ss_remove_paraphasia_tags(noalign_ytrue, noalign_ypred)
+
+    # align non_words
+    align_ytrue, align_ypred = ss_get_alignment(noalign_ytrue, noalign_ypred)
+
+    # re-insert paraphasia tags
+    y_true = ss_reinsert_paraphasia_tags(align_ytrue, true_tag_list)
+    y_pred = ss_reinsert_paraphasia_tags(align_ypred, pred_tag_list)
+    return y_true, y_pred, uids
+
+
+UTT_STATS_COLUMNS = [
+    f"{k}-{count}" for k in AWER_VIEWS for count in ["err", "tot"]
+] + ["TD_bin", "TD_multi", "TD_p", "TD_n", "TD_s"]
+
+
+def utterance_metrics(y_true, y_pred, check_lengths=False):
+    """
+    WER/AWER counts and TDs of each utterance (<word> [<para>] sequences)
+    check_lengths: assert that the paraphasia label lists are aligned
+    return utt_stats_df and the paraphasia label lists
+    """
     # AWER
-    y_true_awer = prepare_AWER_seq(y_true)
-    y_pred_awer = prepare_AWER_seq(y_pred)
-    awer = compute_AWER_lists(y_true_awer, y_pred_awer)
+    awer = compute_AWER_lists(
+        prepare_AWER_seq(y_true), prepare_AWER_seq(y_pred)
+    )
 
     # AWERdisj (remove <eps> )
-    ytrue_disj = prepare_AWER_disj(y_true)
-    ypred_disj = prepare_AWER_disj(y_pred)
-    awer_disj = compute_AWER_lists(ytrue_disj, ypred_disj)
+    awer_disj = compute_AWER_lists(
+        prepare_AWER_disj(y_true), prepare_AWER_disj(y_pred)
+    )
 
     # AWER-PD (remove paraphasia words and remove <eps> )
-    ytrue_PD = prepare_AWER_PD(y_true)
-    ypred_PD = prepare_AWER_PD(y_pred)
-    awer_PD = compute_AWER_lists(ytrue_PD, ypred_PD)
+    awer_PD = compute_AWER_lists(
+        prepare_AWER_PD(y_true), prepare_AWER_PD(y_pred)
+    )
 
     # prepare for wer (remove paraphasia labels and <eps>)
-    ytrue_wer = prepare_WER(y_true)
-    ypred_wer = prepare_WER(y_pred)
-    wer = compute_AWER_lists(ytrue_wer, ypred_wer)
+    wer = compute_AWER_lists(prepare_WER(y_true), prepare_WER(y_pred))
 
-    # Extract paraphasia sequence from wer.txt
+    # Extract paraphasia sequence
     list_list_ytrue = extract_paraphasia_class_labels(y_true)
     list_list_ypred = extract_paraphasia_class_labels(y_pred)
+    if check_lengths:
+        for y, p in zip(list_list_ytrue, list_list_ypred):
+            assert len(y) == len(p)
 
     # TD computation
-    TD_per_utt_bin, TD_list_bin = compute_temporal_distance(
-        list_list_ytrue, list_list_ypred, True
-    )
-
-    TD_per_utt_multi, TD_list_multi = compute_temporal_distance(
-        list_list_ytrue, list_list_ypred, False
-    )
-
-    TD_per_utt_p, TD_list_p = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "p"
-    )
-    TD_per_utt_n, TD_list_n = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "n"
-    )
-    TD_per_utt_s, TD_list_s = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "s"
-    )
+    TDs = compute_temporal_distances(list_list_ytrue, list_list_ypred)
 
     # Combine all utterances (single metric)
     utt_stats_df = pd.DataFrame(
@@ -600,24 +755,41 @@ def mtl_get_metrics(fold_dir, fold_num):
             "awer_disj-tot": awer_disj["tot"],
             "awer_PD-err": awer_PD["err"],
             "awer_PD-tot": awer_PD["tot"],
-            "TD_bin": TD_list_bin,
-            "TD_multi": TD_list_multi,
-            "TD_p": TD_list_p,
-            "TD_n": TD_list_n,
-            "TD_s": TD_list_s,
-        }
+            "TD_bin": TDs["TD_bin"][1],
+            "TD_multi": TDs["TD_multi"][1],
+            "TD_p": TDs["TD_p"][1],
+            "TD_n": TDs["TD_n"][1],
+            "TD_s": TDs["TD_s"][1],
+        },
+        columns=UTT_STATS_COLUMNS,
     )
+    return utt_stats_df, list_list_ytrue, list_list_ypred
+
+
+def fold_statistics(utt_stats_df, uids, fold_num):
+    """
+    Fold-level metrics and utt-level significance testing df of a fold
+    (sums of the counts of its utterances)
+    """
+
+    def _rate(k):
+        return sum(utt_stats_df[f"{k}-err"].tolist()) / sum(
+            utt_stats_df[f"{k}-tot"].tolist()
+        )
+
+    def _mean(TD_met):
+        return sum(utt_stats_df[TD_met].tolist()) / len(utt_stats_df)
 
     # Compute mean and std across all folds
     fold_stats_df = pd.DataFrame(
         {
             "fold": [fold_num],
-            "TD_bin": [TD_per_utt_bin],
-            "TD_multi": [TD_per_utt_multi],
-            "wer": [sum(wer["err"]) / sum(wer["tot"])],
-            "awer": [sum(awer["err"]) / sum(awer["tot"])],
-            "awer_disj": [sum(awer_disj["err"]) / sum(awer_disj["tot"])],
-            "awer_PD": [sum(awer_PD["err"]) / sum(awer_PD["tot"])],
+            "TD_bin": [_mean("TD_bin")],
+            "TD_multi": [_mean("TD_multi")],
+            "wer": [_rate("wer")],
+            "awer": [_rate("awer")],
+            "awer_disj": [_rate("awer_disj")],
+            "awer_PD": [_rate("awer_PD")],
         }
     )
 
@@ -625,15 +797,31 @@ def mtl_get_metrics(fold_dir, fold_num):
     df_awer_stat_sig = pd.DataFrame(
         {
             "uids": uids,
-            "wer-err": wer["err"],
-            "wer-tot": wer["tot"],
-            "awer-disj-err": awer_disj["err"],
-            "awer-disj-tot": awer_disj["tot"],
-            "awer-PD-err": awer_PD["err"],
-            "awer-PD-tot": awer_PD["tot"],
-            "fold": [fold_num for _ in range(len(wer["err"]))],
+            "wer-err": utt_stats_df["wer-err"].values,
+            "wer-tot": utt_stats_df["wer-tot"].values,
+            "awer-disj-err": utt_stats_df["awer_disj-err"].values,
+            "awer-disj-tot": utt_stats_df["awer_disj-tot"].values,
+            "awer-PD-err": utt_stats_df["awer_PD-err"].values,
+            "awer-PD-tot": utt_stats_df["awer_PD-tot"].values,
+            "fold": [fold_num for _ in range(len(uids))],
         }
     )
+    return fold_stats_df, df_awer_stat_sig
+
+
+def mtl_get_metrics(fold_dir, fold_num):
+    """
+    Compute WER metric for a given fold dir
+    Compile list of lists y_true and y_pred for paraphasia analysis
+    """
+    # list of <word> <para> for every word (preserved paraphasias)
+    y_true, y_pred, uids = mtl_fold_sequences(fold_dir)
+    utt_stats_df, list_list_ytrue, list_list_ypred = utterance_metrics(
+        y_true, y_pred
+    )
+    fold_stats_df, df_awer_stat_sig = fold_statistics(
+        utt_stats_df, uids, fold_num
+    )
 
     return (
         utt_stats_df,
@@ -649,192 +837,180 @@ def ss_get_metrics(fold_dir, fold_num):
     Compute WER metric for a given fold dir
     Compile list of lists y_true and y_pred for paraphasia analysis
     """
-    wer_file = f"{fold_dir}/wer.txt"
-
-    # Extract paraphasia sequence from wer.txt
-    # list_list_unaligned_words, list_list_unaligned_words = extract_word_level_paraphasias(wer_file, paraphasia)
-
-    # remove eps
-    noalign_ytrue, noalign_ypred, uids = ss_extract_asr_para(wer_file)
-
-    # remove paraphasia tags
-    (
-        noalign_ytrue,
-        noalign_ypred,
-        true_tag_list,
-        pred_tag_list,
-    ) = ss_remove_paraphasia_tags(noalign_ytrue, noalign_ypred)
-
-    # align non_words
-    align_ytrue, align_ypred = ss_get_alignment(noalign_ytrue, noalign_ypred)
-
-    # re-insert paraphasia tags
-    y_true = ss_reinsert_paraphasia_tags(align_ytrue, true_tag_list)
-    y_pred = ss_reinsert_paraphasia_tags(align_ypred, pred_tag_list)
+    y_true, y_pred, uids = ss_fold_sequences(fold_dir)
+    utt_stats_df, list_list_ytrue, list_list_ypred = utterance_metrics(
+        y_true, y_pred, check_lengths=True
+    )
+    fold_stats_df, df_awer_stat_sig = fold_statistics(
+        utt_stats_df, uids, fold_num
+    )
 
-    # remove paraphasia labels for WER
-    y_true_wer = prepare_WER(y_true)
-    y_pred_wer = prepare_WER(y_pred)
-    wer = compute_AWER_lists(y_true_wer, y_pred_wer)
+    return (
+        utt_stats_df,
+        fold_stats_df,
+        df_awer_stat_sig,
+        list_list_ytrue,
+        list_list_ypred,
+    )
 
-    # process of AWER-PD (remove recognized words for paraphasias)
-    y_true_awerPD = prepare_AWER_PD(y_true)
-    y_pred_awerPD = prepare_AWER_PD(y_pred)
-    awer_PD = compute_AWER_lists(y_true_awerPD, y_pred_awerPD)
 
-    # AWER
-    y_pred_awer = prepare_AWER_seq(y_pred)
-    y_true_awer = prepare_AWER_seq(y_true)
-    awer = compute_AWER_lists(y_true_awer, y_pred_awer)
+## Parallel evaluation
+# The result tables of the folds are parsed (and cached next to the result
+# files) by a pool of processes, then the utterances of each fold are
+# scored in chunks of chunk_size by the pool. The chunks of a fold are
+# merged in order, so the DataFrames are those of the serial evaluation.
+def _fold_result_file(fold_dir, model_name):
+    if model_name == "mtl":
+        return f"{fold_dir}/awer_para.txt"
+    return f"{fold_dir}/wer.txt"
 
-    # awer disj
-    y_pred_awer_disj = prepare_AWER_disj(y_pred)
-    y_true_awer_disj = prepare_AWER_disj(y_true)
-    awer_disj = compute_AWER_lists(y_true_awer_disj, y_pred_awer_disj)
 
-    # extract word-level paraphasia lists
-    list_list_ytrue = extract_paraphasia_class_labels(y_true)
-    list_list_ypred = extract_paraphasia_class_labels(y_pred)
+def _num_utterances(result_file):
+    return len(load_alignment_table(result_file))
 
-    # check assertion
-    for y, p in zip(list_list_ytrue, list_list_ypred):
-        assert len(y) == len(p)
 
-    # TD computation
-    TD_per_utt_bin, TD_list_bin = compute_temporal_distance(
-        list_list_ytrue, list_list_ypred, True
+def fold_chunk_metrics(fold_dir, model_name, start, stop):
+    """
+    Metrics of the utterances start:stop of a fold
+    return utt_stats_df, uids and the paraphasia label lists
+    """
+    if model_name == "mtl":
+        y_true, y_pred, uids = mtl_fold_sequences(fold_dir, start, stop)
+    else:
+        y_true, y_pred, uids = ss_fold_sequences(fold_dir, start, stop)
+    utt_stats_df, list_list_ytrue, list_list_ypred = utterance_metrics(
+        y_true, y_pred, check_lengths=model_name == "single_seq"
     )
+    return utt_stats_df, uids, list_list_ytrue, list_list_ypred
 
-    TD_per_utt_multi, TD_list_multi = compute_temporal_distance(
-        list_list_ytrue, list_list_ypred, False
-    )
 
-    TD_per_utt_p, TD_list_p = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "p"
-    )
-    TD_per_utt_n, TD_list_n = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "n"
-    )
-    TD_per_utt_s, TD_list_s = compute_temporal_distance_para_sp(
-        list_list_ytrue, list_list_ypred, "s"
-    )
-    # exit()
+def _map(pool, func, *iterables):
+    if pool is None:
+        return list(map(func, *iterables))
+    return list(pool.map(func, *iterables))
 
-    # Combine all utterances (single metric)
-    utt_stats_df = pd.DataFrame(
-        {
-            "wer-err": wer["err"],
-            "wer-tot": wer["tot"],
-            "awer-err": awer["err"],
-            "awer-tot": awer["tot"],
-            "awer_disj-err": awer_disj["err"],
-            "awer_disj-tot": awer_disj["tot"],
-            "awer_PD-err": awer_PD["err"],
-            "awer_PD-tot": awer_PD["tot"],
-            "TD_bin": TD_list_bin,
-            "TD_multi": TD_list_multi,
-            "TD_p": TD_list_p,
-            "TD_n": TD_list_n,
-            "TD_s": TD_list_s,
-        }
-    )
 
-    # Compute mean and std across all folds
-    fold_stats_df = pd.DataFrame(
-        {
-            "fold": [fold_num],
-            "TD_bin": [TD_per_utt_bin],
-            "TD_multi": [TD_per_utt_multi],
-            "wer": [sum(wer["err"]) / sum(wer["tot"])],
-            "awer": [sum(awer["err"]) / sum(awer["tot"])],
-            "awer_disj": [sum(awer_disj["err"]) / sum(awer_disj["tot"])],
-            "awer_PD": [sum(awer_PD["err"]) / sum(awer_PD["tot"])],
-        }
-    )
+def para_eval_many(
+    eval_dirs, model_name, num_workers=None, chunk_size=200, num_folds=12
+):
+    """
+    para_eval of several eval dirs (e.g. a sweep of models), their folds and
+    chunks of utterances scored by one pool of num_workers processes
+    (default: all cpus, 1: no pool)
+    return dict eval_dir -> (utt_df, fold_df, utt_stats_df, df_utt_stat_sig)
+    """
+    assert model_name in ["single_seq", "mtl"]
+    folds = [
+        (eval_dir, i, f"{eval_dir}/Fold-{i}")
+        for eval_dir in eval_dirs
+        for i in range(1, num_folds + 1)
+    ]
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    pool = None
+    if num_workers > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(num_workers)
+    try:
+        # parse the result files (the chunks read the cached tables)
+        num_utts = _map(
+            pool,
+            _num_utterances,
+            [
+                _fold_result_file(fold_dir, model_name)
+                for _, _, fold_dir in folds
+            ],
+        )
+        chunks = [
+            (fold_dir, start, min(start + chunk_size, n))
+            for (_, _, fold_dir), n in zip(folds, num_utts)
+            for start in range(0, max(n, 1), chunk_size)
+        ]
+        chunk_metrics = _map(
+            pool,
+            fold_chunk_metrics,
+            [fold_dir for fold_dir, _, _ in chunks],
+            [model_name] * len(chunks),
+            [start for _, start, _ in chunks],
+            [stop for _, _, stop in chunks],
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # merge the chunks of each fold, in order
+    fold_chunks = {}
+    for (fold_dir, _, _), metrics in zip(chunks, chunk_metrics):
+        fold_chunks.setdefault(fold_dir, []).append(metrics)
+
+    results = {}
+    for eval_dir in eval_dirs:
+        y_true = []  # aggregate list of y_true(list)
+        y_pred = []
+        utt_stats = []
+        fold_stats = []
+        stat_sig_utt_df_list = []
+        for _, i, fold_dir in [f for f in folds if f[0] == eval_dir]:
+            metrics = fold_chunks[fold_dir]
+            utt_stats_df = pd.concat([m[0] for m in metrics], ignore_index=True)
+            uids = [uid for m in metrics for uid in m[1]]
+            fold_stats_df, df_awer_stat_sig = fold_statistics(
+                utt_stats_df, uids, i
+            )
+            for m in metrics:
+                y_true.extend(m[2])
+                y_pred.extend(m[3])
+
+            # aggregate dfs
+            stat_sig_utt_df_list.append(df_awer_stat_sig)
+            utt_stats.append(utt_stats_df)
+            fold_stats.append(fold_stats_df)
+
+        utt_df = pd.concat(utt_stats)
+        fold_df = pd.concat(fold_stats)
+        df_utt_stat_sig = pd.concat(stat_sig_utt_df_list)
+        # TDs of each utterance (the same as over all folds at once)
+        for TD_met in ["TD_bin", "TD_multi", "TD_p", "TD_n", "TD_s"]:
+            df_utt_stat_sig[TD_met] = utt_df[TD_met].values
 
-    # statistical significance testing (utt-level)
-    df_awer_stat_sig = pd.DataFrame(
-        {
-            "uids": uids,
-            "wer-err": wer["err"],
-            "wer-tot": wer["tot"],
-            "awer-disj-err": awer_disj["err"],
-            "awer-disj-tot": awer_disj["tot"],
-            "awer-PD-err": awer_PD["err"],
-            "awer-PD-tot": awer_PD["tot"],
-            "fold": [fold_num for _ in range(len(wer["err"]))],
-        }
-    )
+        # utt-level F1-score
+        utt_stats_df = utt_level_statistics(y_true, y_pred)
 
-    return (
-        utt_stats_df,
-        fold_stats_df,
-        df_awer_stat_sig,
-        list_list_ytrue,
-        list_list_ypred,
-    )
+        display_and_save_dfs(
+            eval_dir, utt_df, fold_df, utt_stats_df, df_utt_stat_sig
+        )
+        results[eval_dir] = (utt_df, fold_df, utt_stats_df, df_utt_stat_sig)
+    return results
 
 
-def para_eval(eval_dir, model_name):
-    assert model_name in ["single_seq", "mtl"]
-    results_dir = f"{eval_dir}/results"
-    os.makedirs(results_dir, exist_ok=True)
+def para_eval(eval_dir, model_name, num_workers=None):
+    """
+    Metrics of the 12 folds of eval_dir, saved to <eval_dir>/results
+    (see para_eval_many for num_workers)
+    """
+    para_eval_many([eval_dir], model_name, num_workers)
 
-    y_true = []  # aggregate list of y_true(list)
-    y_pred = []
 
-    utt_stats = []
+def running_fold_metrics(eval_dir, model_name):
+    """
+    Return on_fold_end(fold) callback for fold_scheduler.run_folds
+    Compute the metrics of each fold as soon as it finishes and print the
+    running mean over the finished folds (para_eval still gives the final stats)
+    """
+    assert model_name in ["single_seq", "mtl"]
+    get_metrics = mtl_get_metrics if model_name == "mtl" else ss_get_metrics
     fold_stats = []
-    stat_sig_utt_df_list = []
-    for i in range(1, 13):
-        Fold_dir = f"{eval_dir}/Fold-{i}"
-        if model_name == "mtl":
-            (
-                utt_stats_df,
-                fold_stats_df,
-                df_awer_stat_sig,
-                list_list_ytrue,
-                list_list_ypred,
-            ) = mtl_get_metrics(Fold_dir, i)
-        elif model_name == "single_seq":
-            (
-                utt_stats_df,
-                fold_stats_df,
-                df_awer_stat_sig,
-                list_list_ytrue,
-                list_list_ypred,
-            ) = ss_get_metrics(Fold_dir, i)
-        # Combine over all folds
-        y_true.extend(list_list_ytrue)
-        y_pred.extend(list_list_ypred)
-
-        # aggregate dfs
-        stat_sig_utt_df_list.append(df_awer_stat_sig)
-        utt_stats.append(utt_stats_df)
+
+    def on_fold_end(fold):
+        fold_stats_df = get_metrics(f"{eval_dir}/Fold-{fold}", fold)[1]
         fold_stats.append(fold_stats_df)
+        fold_df = pd.concat(fold_stats)
+        print(f"Fold {fold}:\n{fold_stats_df.to_string(index=False)}")
+        print(
+            f"Running mean over {len(fold_stats)} folds:\n"
+            f"{fold_df.drop(columns='fold').mean().to_string()}"
+        )
 
-    utt_df = pd.concat(utt_stats)
-    fold_df = pd.concat(fold_stats)
-    df_utt_stat_sig = pd.concat(stat_sig_utt_df_list)
-    _, TD_list_multi = compute_temporal_distance(y_true, y_pred, False)
-    _, TD_list_bin = compute_temporal_distance(y_true, y_pred, True)
-    _, TD_list_p = compute_temporal_distance_para_sp(y_true, y_pred, "p")
-    _, TD_list_n = compute_temporal_distance_para_sp(y_true, y_pred, "n")
-    _, TD_list_s = compute_temporal_distance_para_sp(y_true, y_pred, "s")
-    df_utt_stat_sig["TD_bin"] = TD_list_bin
-    df_utt_stat_sig["TD_multi"] = TD_list_multi
-    df_utt_stat_sig["TD_p"] = TD_list_p
-    df_utt_stat_sig["TD_n"] = TD_list_n
-    df_utt_stat_sig["TD_s"] = TD_list_s
-
-    # print(fold_df)
-
-    # utt-level F1-score
-    utt_stats_df = utt_level_statistics(y_true, y_pred)
-
-    display_and_save_dfs(
-        eval_dir, utt_df, fold_df, utt_stats_df, df_utt_stat_sig
-    )
+    return on_fold_end
 
 
 ## GPT
@@ -842,27 +1018,9 @@ def extract_transcript(wer_path):
     """
     Return dict of transcripts
     """
-    transcripts = {}
-    gt_transcripts = {}
-    switch = 0
-    with open(wer_path, "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            if line.startswith("P") and len(line.split()) == 14 and switch == 0:
-                utt_id = line.split()[0][:-1]
-                switch = 1
-            elif switch == 1:
-                switch = 2
-                words = [w.strip() for w in line.split(";")]
-                gt_transcripts[utt_id] = " ".join(words)
-            elif switch == 2:
-                switch = 3
-            elif switch == 3:
-                # pred
-                words = [w.strip() for w in line.split(";")]
-                transcripts[utt_id] = " ".join(words)
-                switch = 0
+    table = load_alignment_table(wer_path)
+    transcripts = dict(zip(table["uids"], table["hyp"].str.join(" ")))
+    gt_transcripts = dict(zip(table["uids"], table["ref"].str.join(" ")))
     return transcripts, gt_transcripts
 
 
@@ -871,137 +1029,20 @@ def compile_predictions_labels_awer(results_dict, labels_dict):
     compile predictions and labels
     results_dict = json predictions
     """
-
-    PARAPHASIA_KEY = {
-        "non-paraphasic": "c",
-        "phonemic": "p",
-        "semantic": "s",
-        "neologistic": "n",
-    }
     y_true_list = []
     y_pred_list = []
-    # for utt_id, result_dict in results_dict.items():
-
-    AWER_dict = {
-        "wer-err": [],
-        "wer-tot": [],
-        "awer-err": [],
-        "awer-tot": [],
-        "awer_disj-err": [],
-        "awer_disj-tot": [],
-        "awer_PD-err": [],
-        "awer_PD-tot": [],
-    }
+
+    # wer, awer, awer_disj and awer_PD counts
+    _, counts = score_awer_views(results_dict, labels_dict)
+    AWER_dict = {}
+    for view in AWER_VIEWS:
+        AWER_dict[f"{view}-err"] = counts[f"{view}-err"]
+        AWER_dict[f"{view}-tot"] = counts[f"{view}-ref"] + counts[f"{view}-ins"]
 
     for utt_id, label_aug_para in labels_dict.items():
         if utt_id not in results_dict:
             continue
 
-        # WER
-        result_dict = results_dict[utt_id]
-        pred_WER = [
-            f"{k.split('_')[1]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        pred_WER_str = " ".join(pred_WER)
-        word_recognition_labels = [l.split("/")[0] for l in label_aug_para]
-        word_recognition_labels_str = " ".join(word_recognition_labels)
-
-        measures = jiwer.compute_measures(
-            word_recognition_labels_str, pred_WER_str
-        )
-        AWER_dict["wer-err"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-        )
-        AWER_dict["wer-tot"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-            + measures["hits"]
-        )
-
-        # AWER
-        result_dict = results_dict[utt_id]
-        pred_AWER = [
-            f"{k.split('_')[1]}/{PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        pred_AWER_str = " ".join(pred_AWER)
-        label_aug_para_str = " ".join(label_aug_para)
-        measures = jiwer.compute_measures(label_aug_para_str, pred_AWER_str)
-        AWER_dict["awer-err"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-        )
-        AWER_dict["awer-tot"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-            + measures["hits"]
-        )
-
-        # AWER_disj
-        pred_AWER_disj = [
-            f"{k.split('_')[1]} {PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        pred_AWER_disj_str = " ".join(pred_AWER_disj)
-        label_aug_para_disj = [
-            f"{p.split('/')[0]} {p.split('/')[1]}" for p in label_aug_para
-        ]
-        label_aug_para_disj_str = " ".join(label_aug_para_disj)
-        measures = jiwer.compute_measures(
-            label_aug_para_disj_str, pred_AWER_disj_str
-        )
-        AWER_dict["awer_disj-err"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-        )
-        AWER_dict["awer_disj-tot"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-            + measures["hits"]
-        )
-
-        # AWER PD
-        pred_AWER_PD = [
-            f"{PARAPHASIA_KEY[v]}"
-            if PARAPHASIA_KEY[v] in ["p", "n"]
-            else f"{k.split('_')[1]} {PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-        ]
-        pred_AWER_PD = [x for x in pred_AWER_PD if "<eps>" not in x]
-        pred_AWER_PD_str = " ".join(pred_AWER_PD)
-
-        label_aug_para_PD = [
-            f"{p.split('/')[1]}"
-            if p.split("/")[1] in ["p", "n"]
-            else f"{p.split('/')[0]} {p.split('/')[1]}"
-            for p in label_aug_para
-        ]
-        label_aug_para_PD = [x for x in label_aug_para_PD if "<eps>" not in x]
-        label_aug_PD_str = " ".join(label_aug_para_PD)
-        measures = jiwer.compute_measures(label_aug_PD_str, pred_AWER_PD_str)
-        AWER_dict["awer_PD-err"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-        )
-        AWER_dict["awer_PD-tot"].append(
-            measures["substitutions"]
-            + measures["deletions"]
-            + measures["insertions"]
-            + measures["hits"]
-        )
-
         # label_aug_para +
         result_dict = results_dict[utt_id]
         labels_list = [w.split("/")[-1] for w in label_aug_para]
@@ -1022,28 +1063,16 @@ def compile_predictions_labels_awer(results_dict, labels_dict):
 
 def extract_labels(label_csv_path, gt_transcript_dict):
     # map label_csv -> gt_transcript alignment (from wer files)
-    df = pd.read_csv(label_csv_path)
+    df = pd.read_csv(label_csv_path, usecols=["ID", "aug_para"])
+    df = df[df["ID"].isin(gt_transcript_dict)]
     labels = {}
-    for i, row in df.iterrows():
-        if row["ID"] not in gt_transcript_dict:
-            continue
-        gt_transcript = gt_transcript_dict[row["ID"]]
-
-        # print(row)
-        gt_para_labels = []
-        aug_para_arr = row["aug_para"].split()
-
-        # go through gt_transcript
-        # print(f"gt_transcript: {gt_transcript}")
-        for word in gt_transcript.split():
-            if word == "<eps>":
-                gt_para_labels.append("<eps>/c")
-            else:
-                # # pop
-                next_valid_word = aug_para_arr.pop(0)
-                gt_para_labels.append(next_valid_word)
-
-        labels[row["ID"]] = gt_para_labels
+    for utt_id, aug_para in zip(df["ID"], df["aug_para"]):
+        # <eps> of the alignment get label c, other words take the next label
+        aug_para_arr = iter(aug_para.split())
+        labels[utt_id] = [
+            "<eps>/c" if word == "<eps>" else next(aug_para_arr)
+            for word in gt_transcript_dict[utt_id].split()
+        ]
 
     return labels
 
@@ -1051,10 +1080,8 @@ def extract_labels(label_csv_path, gt_transcript_dict):
 def extract_labels_oracle(label_csv_path):
     # extract labels from asr wer.txt
 
-    df = pd.read_csv(label_csv_path)
-    labels = {}
-    for i, row in df.iterrows():
-        labels[row["ID"]] = row["aug_para"].split()
+    df = pd.read_csv(label_csv_path, usecols=["ID", "aug_para"])
+    labels = dict(zip(df["ID"], df["aug_para"].str.split()))
 
     return labels
 
@@ -1092,22 +1119,12 @@ def GPT_eval(gpt_dir, model_name):
         )
 
         # TD
-        TD_per_utt_bin, TD_list_bin = compute_temporal_distance(
-            y_true_fold, y_pred_fold, True
-        )
-        TD_per_utt_multi, TD_list_multi = compute_temporal_distance(
-            y_true_fold, y_pred_fold, False
-        )
-
-        TD_per_utt_p, TD_list_p = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "p"
-        )
-        TD_per_utt_n, TD_list_n = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "n"
-        )
-        TD_per_utt_s, TD_list_s = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "s"
-        )
+        TDs = compute_temporal_distances(y_true_fold, y_pred_fold)
+        TD_per_utt_bin, TD_list_bin = TDs["TD_bin"]
+        TD_per_utt_multi, TD_list_multi = TDs["TD_multi"]
+        TD_per_utt_p, TD_list_p = TDs["TD_p"]
+        TD_per_utt_n, TD_list_n = TDs["TD_n"]
+        TD_per_utt_s, TD_list_s = TDs["TD_s"]
 
         y_true_aggregate.extend(y_true_fold)
         y_pred_aggregate.extend(y_pred_fold)
@@ -0,0 +1,159 @@
+"""
+Run the LOSO folds concurrently, one per device slot
+"""
+import os
+import socket
+import subprocess
+import threading
+import time
+import traceback
+import datetime
+from collections import deque
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def _stream_log(proc, log_path, prefix):
+    # copy the fold output to its log file and to the console
+    with open(log_path, "a") as log:
+        for line in proc.stdout:
+            log.write(line)
+            log.flush()
+            print(f"{prefix} {line}", end="", flush=True)
+
+
+def _stop_folds(running, timeout=30):
+    # terminate the running folds and wait for them (killed after timeout)
+    for fold, (proc, _, _) in running.items():
+        print(f"Fold {fold}: terminating")
+        proc.terminate()
+    for fold, (proc, _, thread) in running.items():
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        thread.join()
+
+
+def run_folds(
+    folds,
+    prepare_fold,
+    fold_cmd,
+    slots=("0",),
+    log_dir="logs",
+    done_marker=None,
+    on_fold_end=None,
+    max_retries=5,
+    poll_interval=5,
+):
+    """
+    Run every fold not already done, at most one fold per slot at a time
+
+    folds = fold numbers
+    prepare_fold(fold) -> yaml of the fold (run before launching the fold)
+    fold_cmd(yaml, port) -> command of the fold
+    slots = CUDA_VISIBLE_DEVICES of each slot ("" for cpu), repeat a
+        device to run several folds on it
+    done_marker(fold) -> file written when the fold succeeds, folds with
+        an existing marker are skipped (results copied from the base model
+        are not mistaken for a finished fold)
+    on_fold_end(fold) called as soon as a fold succeeds (e.g. fold metrics),
+        its failures are logged and do not stop the other folds
+    max_retries = relaunches of a failing fold
+
+    The folds still running when run_folds exits early (exception,
+    KeyboardInterrupt) are terminated.
+
+    return dict of fold -> returncode of its last run
+    raise RuntimeError once every fold has run if some folds still failed
+        after max_retries (their results must not be aggregated)
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    start = time.time()
+    pending = deque()
+    for fold in folds:
+        if done_marker is not None and os.path.exists(done_marker(fold)):
+            print(f"Fold {fold}: done, skipping")
+        else:
+            pending.append(fold)
+
+    free_slots = deque(slots)
+    running = {}  # fold -> (proc, slot, log thread)
+    retries = {fold: 0 for fold in pending}
+    returncodes = {}
+    failed = []
+    try:
+        while pending or running:
+            # launch folds on the free slots
+            while pending and free_slots:
+                fold = pending.popleft()
+                slot = free_slots.popleft()
+                yaml_target = prepare_fold(fold)
+                env = os.environ.copy()
+                env["CUDA_VISIBLE_DEVICES"] = slot
+                port = find_free_port()  # Get a free port.
+                log_path = f"{log_dir}/Fold-{fold}.log"
+                print(
+                    f"Fold {fold}: slot '{slot}' | port {port} | log {log_path}"
+                )
+                proc = subprocess.Popen(
+                    fold_cmd(yaml_target, port),
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    bufsize=1,
+                )
+                thread = threading.Thread(
+                    target=_stream_log,
+                    args=(proc, log_path, f"[Fold {fold}]"),
+                    daemon=True,
+                )
+                thread.start()
+                running[fold] = (proc, slot, thread)
+
+            time.sleep(poll_interval)
+
+            # collect finished folds
+            for fold, (proc, slot, thread) in list(running.items()):
+                if proc.poll() is None:
+                    continue
+                thread.join()
+                del running[fold]
+                free_slots.append(slot)
+                returncodes[fold] = proc.returncode
+                print(f"Fold {fold}: returncode {proc.returncode}")
+
+                if proc.returncode == 0:
+                    if done_marker is not None:
+                        open(done_marker(fold), "w").close()
+                    if on_fold_end is not None:
+                        try:
+                            on_fold_end(fold)
+                        except Exception:
+                            print(f"Fold {fold}: on_fold_end failed")
+                            traceback.print_exc()
+                elif retries[fold] < max_retries:
+                    retries[fold] += 1
+                    print(f"Fold {fold}: retry {retries[fold]}/{max_retries}")
+                    pending.append(fold)
+                else:
+                    print(f"Fold {fold}: too many retries")
+                    failed.append(fold)
+    finally:
+        # do not leave folds running (e.g. on KeyboardInterrupt)
+        _stop_folds(running)
+
+    elapsed = time.time() - start
+    print(f"Total Train runtime: {datetime.timedelta(seconds=elapsed)}")
+    if failed:
+        raise RuntimeError(
+            f"Folds {sorted(failed)} failed after {max_retries} retries, "
+            f"see their logs in {log_dir}"
+        )
+    return returncodes
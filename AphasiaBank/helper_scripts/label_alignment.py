@@ -0,0 +1,176 @@
+"""
+Token <-> word alignment of the paraphasia labels
+
+Word -> token: each word is tokenized on its own and its label is repeated
+for each of its pieces (align_labels_to_tokenized_input).
+Token -> word: the pieces of a hypothesis are grouped into words and the
+labels of a word are reduced to one (combine_AWER):
+- a piece starting with '▁' starts a word
+- a bare '▁' (and <unk>, decoded as '▁') ends the word, without a label
+- other pieces continue the current word
+Words without a labelled piece are dropped.
+
+The piece type of every id of the vocabulary is looked up once, a batch of
+hypotheses is then grouped and reduced with array segment operations.
+"""
+import numpy as np
+
+WORD_START = "▁"
+# below this many tokens the batch is grouped token by token
+SMALL_BATCH_TOKENS = 64
+
+
+class LabelAligner:
+    """
+    sp = sentencepiece.SentencePieceProcessor (tokenizer.sp)
+    unk_as_boundary = treat <unk> as a bare '▁'
+    """
+
+    def __init__(self, sp, unk_as_boundary=True):
+        self.sp = sp
+        pieces = [sp.IdToPiece(i) for i in range(sp.GetPieceSize())]
+        self.is_bare = np.array([p == WORD_START for p in pieces])
+        self.is_start = np.array([p.startswith(WORD_START) for p in pieces])
+        if unk_as_boundary and sp.unk_id() >= 0:
+            self.is_bare[sp.unk_id()] = True
+            self.is_start[sp.unk_id()] = True
+        self.word_pieces = {}
+        # lists for the per-token path of small batches
+        self.piece_type = [
+            "bare" if b else "start" if st else "cont"
+            for b, st in zip(self.is_bare, self.is_start)
+        ]
+
+    def token_labels(self, words, labels, paraphasia_dict):
+        """
+        Word-level labels -> one label per piece of each word
+        return pieces, token labels
+        """
+        assert len(words) == len(
+            labels
+        ), "Sentences and labels lists should be of same size."
+
+        new_words = [w for w in set(words) if w not in self.word_pieces]
+        if new_words:
+            # one call for the words not seen yet
+            for w, w_pieces in zip(
+                new_words, self.sp.encode(new_words, out_type=str)
+            ):
+                self.word_pieces[w] = w_pieces
+
+        return_tokens = []
+        return_labels = []
+        for w, l in zip(words, labels):
+            w_pieces = self.word_pieces[w]
+            return_tokens.extend(w_pieces)
+            return_labels.extend([paraphasia_dict[l]] * len(w_pieces))
+        return return_tokens, return_labels
+
+    def word_labels(self, hyps_asr, hyps_para, reduce="majority"):
+        """
+        Token-level labels of a batch of hypotheses -> word-level labels
+        hyps_asr = list of token id lists
+        hyps_para = list of label lists (same lengths)
+        reduce = "majority" (ties: label seen first) or "max"
+        return list of word label lists
+        """
+        num_tokens = np.array([len(h) for h in hyps_asr])
+        assert num_tokens.tolist() == [
+            len(p) for p in hyps_para
+        ], f"Error arrs are of same size:\thyps_asr: {hyps_asr}\thyps_para: {hyps_para}"
+        if num_tokens.sum() < SMALL_BATCH_TOKENS:
+            # array setup costs more than it saves on a few tokens
+            return [
+                self._word_labels_loop(h, p, reduce)
+                for h, p in zip(hyps_asr, hyps_para)
+            ]
+
+        ids = np.fromiter(
+            (i for h in hyps_asr for i in h), np.int64, num_tokens.sum()
+        )
+        labels = np.fromiter(
+            (l for p in hyps_para for l in p), np.int64, num_tokens.sum()
+        )
+
+        # a segment starts at each word start and at each utterance start
+        seg_start = self.is_start[ids]
+        offsets = np.cumsum(num_tokens) - num_tokens
+        seg_start[offsets[num_tokens > 0]] = True
+        seg = np.cumsum(seg_start)
+
+        # bare boundaries do not carry a label, empty segments are dropped
+        member = ~self.is_bare[ids]
+        seg, labels = seg[member], labels[member]
+        if len(seg) == 0:
+            return [[] for _ in hyps_asr]
+        # segments are sorted: number the words in order
+        new_word = np.empty(len(seg), dtype=bool)
+        new_word[0] = True
+        np.not_equal(seg[1:], seg[:-1], out=new_word[1:])
+        word_starts = np.flatnonzero(new_word)
+        word_idx = np.cumsum(new_word) - 1
+        num_words = len(word_starts)
+
+        if reduce == "max":
+            word_labels = np.maximum.reduceat(labels, word_starts)
+        elif reduce == "majority":
+            num_classes = labels.max() + 1
+            keys = word_idx * num_classes + labels
+            counts = np.bincount(keys, minlength=num_words * num_classes)
+            # position of the first occurrence of each (word, label)
+            first = np.full(num_words * num_classes, len(keys))
+            np.minimum.at(first, keys, np.arange(len(keys)))
+            score = counts * (len(keys) + 1) - first
+            word_labels = score.reshape(num_words, num_classes).argmax(1)
+        else:
+            raise ValueError(f"Unknown reduce: {reduce}")
+
+        # utterance of each word (from the position of its first piece)
+        word_utt = np.searchsorted(
+            np.cumsum(num_tokens), np.flatnonzero(member)[word_starts], "right"
+        )
+        splits = np.cumsum(np.bincount(word_utt, minlength=len(hyps_asr)))
+        return [w.tolist() for w in np.split(word_labels, splits[:-1])]
+
+    def _word_labels_loop(self, hyp_asr, hyp_para, reduce):
+        # same grouping, token by token, with the cached piece types
+        if reduce == "max":
+            reduce_fn = max
+        elif reduce == "majority":
+            reduce_fn = _first_majority
+        else:
+            raise ValueError(f"Unknown reduce: {reduce}")
+        word_labels = []
+        word = []
+        for i, p in zip(hyp_asr, hyp_para):
+            piece_type = self.piece_type[i]
+            if piece_type != "cont":
+                if word:
+                    word_labels.append(reduce_fn(word))
+                word = [] if piece_type == "bare" else [p]
+            else:
+                word.append(p)
+        if word:
+            word_labels.append(reduce_fn(word))
+        return word_labels
+
+
+def _first_majority(labels):
+    # most frequent label, ties go to the label seen first
+    counts = {}
+    for l in labels:
+        counts[l] = counts.get(l, 0) + 1
+    return max(counts, key=counts.get)
+
+
+_aligners = {}
+
+
+def get_label_aligner(sp, unk_as_boundary=True):
+    """
+    LabelAligner of a tokenizer, built once per tokenizer
+    """
+    key = (id(sp), unk_as_boundary)
+    if key not in _aligners:
+        _aligners[key] = LabelAligner(sp, unk_as_boundary)
+    return _aligners[key]
@@ -1,10 +1,20 @@
 '''
 Create Speechbrain CSV files
 Input: Kaldi dir
+
+1. read every fold/partition once into one utterance table
+2. segment: each source recording is opened once and all of its segments
+   are sliced in-process, recordings are spread over a process pool.
+   A manifest (source, start, end, source mtime) skips unchanged segments
+3. write the per-fold CSVs from the utterance table
 '''
 import os
+import json
+import wave
 import pandas as pd
 import subprocess
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 KALDI_ROOT = "/z/mkperez/AphasiaBank/kd_updated_para/Scripts"
 SB_OUTDIR = "/z/mkperez/speechbrain/AphasiaBank/data/Fridriksson_para_best_Word"
@@ -13,6 +23,9 @@ KALDI_CV_DIR = f"{KALDI_ROOT}/CV"
 PARA_FILENAME = f"{KALDI_ROOT}/wrd_labels"
 SB_OUTWAV_PATH=f"{SB_OUTDIR}/wavs"
 OG_WAV_PATH = f"{KALDI_ROOT}/owav.scp"
+MANIFEST_PATH = f"{SB_OUTWAV_PATH}/segments_manifest.json"
+NUM_WORKERS = os.cpu_count()
+PARTITIONS = ['test','dev','train']
 
 def read_dict(filename):
     return_dict = {}
@@ -32,7 +45,7 @@ def read_dict(filename):
 def prepare_utt2paraphasia():
     utt2para = read_dict(PARA_FILENAME)
     for k,v in utt2para.items():
-        
+
         para_list = []
         for para in v.split():
             if para.startswith("n:"):
@@ -50,79 +63,167 @@ def prepare_utt2paraphasia():
     return utt2para
 
 
-def create_csv(rdir, wfilename):
-    text_file = f"{rdir}/text"
-    UTT2TEXT = read_dict(text_file)
-    dur_file = f"{rdir}/durations"
-    UTT2DUR = read_dict(dur_file)
-    seg_file = f"{rdir}/segments"
-    UTT2SEG = read_dict(seg_file)
+def build_utt_table():
+    '''
+    Read all folds and partitions once
+    return utterance table (one row per utt, indexed by ID)
+    and dict of (fold_dir, partition) -> list of utt_ids (kaldi order)
+    '''
     UTT2PARA = prepare_utt2paraphasia()
     SPK2WAV = read_dict(OG_WAV_PATH)
-    
-
-    df_list = []
-    for utt_id in UTT2TEXT.keys():
-        spk_id = utt_id.split("-")[0]
-        wrd = UTT2TEXT[utt_id].lower()
-        dur = round(float(UTT2DUR[utt_id]),2)
-        paraphasia = UTT2PARA[utt_id]
-        if len(wrd.split()) != len(paraphasia.split()):
+
+    rows = {}
+    fold_utts = {}
+    for fold_dir in sorted(os.listdir(KALDI_CV_DIR)):
+        for partition in PARTITIONS:
+            rdir = f"{KALDI_CV_DIR}/{fold_dir}/{partition}"
+            UTT2TEXT = read_dict(f"{rdir}/text")
+            UTT2DUR = read_dict(f"{rdir}/durations")
+            UTT2SEG = read_dict(f"{rdir}/segments")
+
+            utt_ids = []
+            for utt_id in UTT2TEXT.keys():
+                if utt_id not in rows:
+                    spk_id = utt_id.split("-")[0]
+                    wrd = UTT2TEXT[utt_id].lower()
+                    paraphasia = UTT2PARA[utt_id]
+                    if len(wrd.split()) != len(paraphasia.split()):
+                        continue
+                    aug_para = " ".join([f"{w}/{p}" for w,p in zip(wrd.split(),paraphasia.split())])
+                    seg_info = UTT2SEG[utt_id].split()
+                    rows[utt_id] = {
+                        'wrd':wrd,
+                        'spk_id':spk_id,
+                        'ID':utt_id,
+                        'wav':f"{SB_OUTWAV_PATH}/{utt_id}.wav",
+                        'duration':round(float(UTT2DUR[utt_id]),2),
+                        'paraphasia':paraphasia,
+                        'aug_para':aug_para,
+                        'og_wav':SPK2WAV[spk_id],
+                        'start':float(seg_info[1]),
+                        'end':float(seg_info[2]),
+                    }
+                utt_ids.append(utt_id)
+            fold_utts[(fold_dir, partition)] = utt_ids
+
+    utt_df = pd.DataFrame(list(rows.values())).set_index('ID', drop=False)
+    return utt_df, fold_utts
+
+
+def slice_recording(og_wav_loc, segments):
+    '''
+    Open og_wav_loc once and write every (out_wav, start, end) segment
+    '''
+    try:
+        with wave.open(og_wav_loc, 'rb') as r:
+            params = r.getparams()
+            for out_wav_filename, start, end in segments:
+                start_frame = int(round(start * params.framerate))
+                end_frame = min(int(round(end * params.framerate)), params.nframes)
+                r.setpos(start_frame)
+                frames = r.readframes(end_frame - start_frame)
+                with wave.open(out_wav_filename, 'wb') as w:
+                    w.setparams(params)
+                    w.writeframes(frames)
+    except wave.Error:
+        # not PCM wav, let sox decode it
+        for out_wav_filename, start, end in segments:
+            command = [
+                'sox', og_wav_loc, out_wav_filename,
+                'trim', str(start), f"={end}"
+            ]
+            subprocess.run(command, check=True)
+    return og_wav_loc
+
+
+def segment_bounds(row):
+    '''
+    (start, end) in seconds of the segment cut from the source recording,
+    as given by the kaldi segments file
+    '''
+    return row['start'], row['end']
+
+
+def segment_key(row):
+    '''
+    manifest entry of a segment, None if its source recording is missing
+    '''
+    try:
+        mtime = os.path.getmtime(row['og_wav'])
+    except OSError:
+        return None
+    return [row['og_wav'], *segment_bounds(row), mtime]
+
+
+def create_segments(utt_df):
+    '''
+    Slice the segments missing or changed since the last run (manifest)
+    return utt_ids of the segments skipped (source recording missing)
+    '''
+    os.makedirs(SB_OUTWAV_PATH, exist_ok=True)
+    manifest = {}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as r:
+            manifest = json.load(r)
+
+    # group the segments to (re)create by source recording
+    todo = defaultdict(list)
+    keys = {}
+    missing = defaultdict(list)
+    for row in utt_df.to_dict('records'):
+        key = segment_key(row)
+        if key is None:
+            missing[row['og_wav']].append(row['ID'])
+            continue
+        if manifest.get(row['ID']) == key and os.path.exists(row['wav']):
             continue
-        aug_para = " ".join([f"{w}/{p}" for w,p in zip(wrd.split(),paraphasia.split())])
-
-        # check wav file creation
-        seg_info = UTT2SEG[utt_id]
-        og_wav_loc = SPK2WAV[spk_id]
-        check_wav_file_exists(utt_id,seg_info,og_wav_loc)
-
-
-        df_loc = pd.DataFrame({
-            'wrd':[wrd],
-            'spk_id':[spk_id],
-            'ID':[utt_id],
-            'wav':[f"{SB_OUTWAV_PATH}/{utt_id}.wav"],
-            'duration':[dur],
-            'paraphasia':[paraphasia],
-            'aug_para':[aug_para],
-        })
-        df_list.append(df_loc)
-
-    df = pd.concat(df_list)
+        keys[row['ID']] = key
+        todo[row['og_wav']].append((row['ID'], row['wav'], *segment_bounds(row)))
+
+    for og_wav_loc, utt_ids in missing.items():
+        print(f"WARNING: {og_wav_loc} not found, skipping its {len(utt_ids)} segments")
+    skipped = [utt_id for utt_ids in missing.values() for utt_id in utt_ids]
+    print(f"segments: {len(keys)} to create, {len(utt_df) - len(keys) - len(skipped)} unchanged")
+    try:
+        with ProcessPoolExecutor(max_workers=NUM_WORKERS) as pool:
+            futures = [
+                pool.submit(slice_recording, og_wav_loc, [s[1:] for s in segments])
+                for og_wav_loc, segments in todo.items()
+            ]
+            for future in as_completed(futures):
+                og_wav_loc = future.result()
+                # only record the segments that were written
+                for utt_id, _, _, _ in todo[og_wav_loc]:
+                    manifest[utt_id] = keys[utt_id]
+    finally:
+        # keep the finished recordings if a worker fails
+        with open(MANIFEST_PATH, 'w') as w:
+            json.dump(manifest, w)
+    return skipped
+
+
+def create_csv(utt_df, utt_ids, wfilename):
+    utt_ids = [utt_id for utt_id in utt_ids if utt_id in utt_df.index]
+    df = utt_df.loc[utt_ids, ['wrd','spk_id','ID','wav','duration','paraphasia','aug_para']]
     df = df.reset_index(drop=True)
     df = df.reset_index()
     df = df.rename(columns={"index":"Unnamed: 0"})
-    # print(df)
-    # exit()
     df.to_csv(wfilename)
     # print(f"output: {wfilename}")
 
-def check_wav_file_exists(utt_id,seg_info,og_wav_loc):
-    
-    out_wav_filename = f"{SB_OUTWAV_PATH}/{utt_id}.wav"
-
-    # create if doesnt exist
-    if not os.path.exists(out_wav_filename):
-        start = float(seg_info.split()[1])
-        end = float(seg_info.split()[2])
-
-        # sox
-        command = [
-            'sox', og_wav_loc, out_wav_filename,
-            'trim', str(start), str(end)
-        ]
-        subprocess.run(command, check=True)
-
 
 
 if __name__ == "__main__":
-    for partition in ['test','dev','train']:
+    utt_df, fold_utts = build_utt_table()
+    skipped = create_segments(utt_df)
+    # no wav for the utterances of missing recordings
+    utt_df = utt_df.drop(skipped)
+
+    for partition in PARTITIONS:
         for fold_dir in sorted(os.listdir(KALDI_CV_DIR)):
             # make file
             wfilename = f"{SB_OUTDIR}/{fold_dir}/{partition}_multi.csv"
             os.makedirs(f"{SB_OUTDIR}/{fold_dir}", exist_ok=True)
 
-            rdir = f"{KALDI_CV_DIR}/{fold_dir}/{partition}"
-
-            create_csv(rdir, wfilename)
+            create_csv(utt_df, fold_utts[(fold_dir, partition)], wfilename)
 
@@ -533,7 +533,9 @@ class ASR(sb.Brain):
         # if stage == sb.Stage.TRAIN:
         #     loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
         if stage == sb.Stage.TRAIN or stage == sb.Stage.TEST:
-            loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
+            loader_kwargs = self._train_loader_specifics(
+                dataset, loader_kwargs, stage
+            )
         # loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
 
         dataloader = sb.dataio.dataloader.make_dataloader(
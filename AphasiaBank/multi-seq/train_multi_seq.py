@@ -31,9 +31,13 @@ import librosa
 import pandas as pd
 import math
 import os
+import hashlib
+import json
+import functools
 import sys
 import torch
 import logging
+import yaml
 import speechbrain as sb
 
 # import speechbrain.speechbrain as sb
@@ -48,12 +52,28 @@ from speechbrain.tokenizers.SentencePiece import SentencePiece
 # multi-gpu
 from speechbrain.dataio.dataloader import LoopedLoader
 from speechbrain.dataio.dataloader import SaveableDataLoader
+from speechbrain.dataio.batch import PaddedBatch
+from speechbrain.dataio.sampler import DynamicBatchSampler
+from speechbrain.dataio.sampler import BatchCostModel, CostBatchSampler
+from speechbrain.dataio.feature_store import (
+    FeatureStore,
+    model_hash,
+    precompute_features,
+)
+from speechbrain.dataio.audio_archive import create_audio_archive
+from speechbrain.dataio.streaming import StreamingDataset, write_shards
+from speechbrain.dataio.streaming import SHARD_LIST
+from speechbrain.dataio.item_cache import ItemCache
+from speechbrain.utils.metric_stats import LazyAverage
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+sys.path.append("..")
+from helper_scripts.label_alignment import get_label_aligner
+
 logger = logging.getLogger(__name__)
 
 torch.autograd.set_detect_anomaly(True)
@@ -67,84 +87,63 @@ def count_parameters(model):
     return sum(p.numel() for p in model.parameters() if p.requires_grad)
 
 
-def find_majority_element(lst):
-    counts = {}
-    for num in lst:
-        counts[num] = counts.get(num, 0) + 1
-    return max(counts, key=counts.get)
-
-
-def combine_AWER(hyps_para, hyps_asr, predicted_words, tokenizer, ptokenizer):
-    predicted_words = [p for p in predicted_words if p != '⁇']
-    tokenized_out = [tokenizer.IdToPiece(h) for h in hyps_asr]
-
-    if '<unk>' in tokenized_out:
-        print(f"UNK in tokenized_out: {tokenized_out}")
-        tokenized_out = [t if t != '<unk>' else '▁' for t in tokenized_out]
-
-    assert len(tokenized_out) == len(
-        hyps_para
-    ), f"Error arrs are of same size:\ttokenized_out: {tokenized_out}\hyps_para: {hyps_para}"
-
-    p_result = []
-    multitoken_result = []
-    for t, p in zip(tokenized_out, hyps_para):
-        # end of multiword token
-        if t == "▁":
-            # start of multi-token word
-            if len(multitoken_result) > 0:
-                if max(multitoken_result) == 0:
-                    p_result.append(0)
-                else:
-                    p_result.append(find_majority_element(multitoken_result))
-
-            multitoken_result = []
-
-        elif t.startswith("▁"):
-            if len(multitoken_result) > 0:
-                if max(multitoken_result) == 0:
-                    p_result.append(0)
-                else:
-                    p_result.append(find_majority_element(multitoken_result))
-            multitoken_result = [p]
-
-        else:
-            multitoken_result.append(p)
-
-    # add final multitoken result
-    if len(multitoken_result) > 0:
-        if max(multitoken_result) == 0:
-            p_result.append(0)
-        else:
-            p_result.append(find_majority_element(multitoken_result))
-
-    assert len(predicted_words) == len(
-        p_result
-    ), f"Error arrs are of same size:\npredicted_words: {predicted_words}\np_result: {p_result}"
-    pred_AWER_list = []
+def combine_AWER(
+    hyps_para, hyps_asr, predicted_words, label_aligner, ptokenizer
+):
+    """
+    Word-level paraphasia predictions (<word>/<LABEL>) of a batch of hypotheses
+    token labels of a word are reduced to their majority label
+    """
+    word_labels = label_aligner.word_labels(hyps_asr, hyps_para)
     ptokenizer = [c.upper() for c in ptokenizer]
-    for w, p in zip(predicted_words, p_result):
-        pred_AWER_list.append(f"{w}/{ptokenizer[p]}")
 
-    return [pred_AWER_list]
+    pred_AWER = []
+    for utt_words, p_result in zip(predicted_words, word_labels):
+        utt_words = [p for p in utt_words if p != '⁇']
+        assert len(utt_words) == len(
+            p_result
+        ), f"Error arrs are of same size:\npredicted_words: {utt_words}\np_result: {p_result}"
+        pred_AWER.append(
+            [f"{w}/{ptokenizer[p]}" for w, p in zip(utt_words, p_result)]
+        )
+    return pred_AWER
 
 # Define training procedure
+@sb.utils.checkpoints.register_checkpoint_hooks
 class ASR(sb.Brain):
     def compute_forward(self, batch, stage):
         """Forward computations from the waveform batches to the output probabilities."""
         batch = batch.to(self.device)
-        wavs, wav_lens = batch.sig
         tokens_bos, _ = batch.tokens_bos
         ptokens_bos, _ = batch.ptokens_bos
-        wavs, wav_lens = wavs.to(self.device), wav_lens.to(self.device)
 
-        # Add augmentation if specified
-        if stage == sb.Stage.TRAIN:
-            if hasattr(self.hparams, "augmentation"):
-                wavs = self.hparams.augmentation(wavs, wav_lens)
-
-        # forward modules
-        w2v_out = self.modules.SSL_enc(wavs)
+        if hasattr(batch, "w2v_feats"):
+            # frozen encoder: outputs read from the feature cache
+            w2v_out, wav_lens = batch.w2v_feats
+        else:
+            wavs, wav_lens = batch.sig
+            wavs, wav_lens = wavs.to(self.device), wav_lens.to(self.device)
+
+            # Add augmentation if specified
+            if stage == sb.Stage.TRAIN:
+                if self.hparams.speed_perturb:
+                    wavs, wav_lens = self.speed_perturb(wavs, wav_lens)
+                if hasattr(self.hparams, "augmentation"):
+                    wavs = self.hparams.augmentation(wavs, wav_lens)
+
+            # forward modules
+            if stage != sb.Stage.TRAIN and wavs.shape[0] > 1:
+                # padded decoding batch: mask the padding in the encoder and
+                # use the exact number of frames of each utterance afterwards
+                w2v_out = self.modules.SSL_enc(wavs, wav_lens)
+                ssl_enc = getattr(
+                    self.modules.SSL_enc, "module", self.modules.SSL_enc
+                )
+                wav_lens = ssl_enc.relative_output_lens(
+                    wavs, wav_lens, w2v_out.shape[1]
+                )
+            else:
+                w2v_out = self.modules.SSL_enc(wavs)
 
         ## ASR head ##
         out_ASR, _ = self.modules.Transformer(
@@ -232,12 +231,13 @@ class ASR(sb.Brain):
                 stage == sb.Stage.TEST
             ):
                 predicted_words = [
-                    self.tokenizer.decode_ids(utt_seq).split(" ")
+                    [
+                        p
+                        for p in self.tokenizer.decode_ids(utt_seq).split(" ")
+                        if p != ""
+                    ]  # ensure padding gets trimmed
                     for utt_seq in hyps_asr
                 ]
-                predicted_words = [
-                    [p for p in predicted_words[0] if p != ""]
-                ]  # ensure padding gets trimmed
 
                 target_words = [wrd.split(" ") for wrd in batch.wrd]
                 self.asr_wer_metric.append(ids, predicted_words, target_words)
@@ -245,10 +245,10 @@ class ASR(sb.Brain):
 
                 # combine token-level paraphasia for AWER
                 pred_AWER = combine_AWER(
-                    hyps_para[0],
-                    hyps_asr[0],
-                    predicted_words[0],
-                    self.tokenizer,
+                    hyps_para,
+                    hyps_asr,
+                    predicted_words,
+                    self.label_aligner,
                     self.ptokenizer,
                 )
                 target_AWER = [wrd.split(" ") for wrd in batch.aug_para]
@@ -256,7 +256,7 @@ class ASR(sb.Brain):
 
                 # Baseline AWER
                 baseline_AWER = [
-                    [f"{p}/C" for p_utt in predicted_words for p in p_utt]
+                    [f"{p}/C" for p in p_utt] for p_utt in predicted_words
                 ]
                 self.baseline_awer_metric.append(
                     ids, baseline_AWER, target_AWER
@@ -426,11 +426,11 @@ class ASR(sb.Brain):
                 # self.hparams.noam_annealing(self.optimizer)
 
         self.on_fit_batch_end(batch, outputs, loss, should_step)
-        return (
-            loss.detach().cpu(),
-            loss_asr.detach().cpu(),
-            loss_para.detach().cpu(),
-        )
+        losses = (loss.detach(), loss_asr.detach(), loss_para.detach())
+        if self.lazy_metrics_interval > 0:
+            # read on the host every lazy_metrics_interval steps
+            return losses
+        return tuple(l.cpu() for l in losses)
 
     def on_fit_start(self):
         """Gets called at the beginning of ``fit()``, on multiple processes
@@ -449,6 +449,10 @@ class ASR(sb.Brain):
         # Initialize optimizers after parameters are configured
         self.init_optimizers()
 
+        # running asr/para losses, restored with avg_train_loss (see _save)
+        self.avg_train_loss_asr = 0.0
+        self.avg_train_loss_para = 0.0
+
         # Load latest checkpoint to resume training if interrupted
         if self.checkpointer is not None:
             self.checkpointer.recover_if_possible(
@@ -466,7 +470,9 @@ class ASR(sb.Brain):
         self, dataset, stage, ckpt_prefix="dataloader-", **loader_kwargs
     ):
         if stage == sb.Stage.TRAIN or stage == sb.Stage.TEST:
-            loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
+            loader_kwargs = self._train_loader_specifics(
+                dataset, loader_kwargs, stage
+            )
 
         dataloader = sb.dataio.dataloader.make_dataloader(
             dataset, **loader_kwargs
@@ -511,7 +517,7 @@ class ASR(sb.Brain):
         avg_test_loss_para = 0.0
         with torch.no_grad():
             for batch in tqdm(
-                test_set,
+                self._prefetch(test_set),
                 dynamic_ncols=True,
                 disable=not progressbar,
                 colour=self.tqdm_barcolor["test"],
@@ -677,7 +683,7 @@ class ASR(sb.Brain):
             avg_valid_loss_para = 0.0
             with torch.no_grad():
                 for batch in tqdm(
-                    valid_set,
+                    self._prefetch(valid_set),
                     dynamic_ncols=True,
                     disable=not enable,
                     colour=self.tqdm_barcolor["valid"],
@@ -719,6 +725,11 @@ class ASR(sb.Brain):
                     args=[sb.Stage.VALID, avg_valid_loss, epoch],
                 )
 
+    def _read_lazy_metrics(self):
+        super()._read_lazy_metrics()
+        self.avg_train_loss_asr = self.train_loss_asr_average.summarize()
+        self.avg_train_loss_para = self.train_loss_para_average.summarize()
+
     def _fit_train(self, train_set, epoch, enable):
         # Training stage
         self.on_stage_start(sb.Stage.TRAIN, epoch)
@@ -728,8 +739,15 @@ class ASR(sb.Brain):
         # Reset nonfinite count to 0 each epoch
         self.nonfinite_count = 0
 
-        self.avg_train_loss_asr = 0.0
-        self.avg_train_loss_para = 0.0
+        # the losses averaged before an intra-epoch checkpoint are kept
+        self.train_loss_average.restart(self.avg_train_loss, self.step)
+        self.train_loss_asr_average = LazyAverage()
+        self.train_loss_asr_average.restart(self.avg_train_loss_asr, self.step)
+        self.train_loss_para_average = LazyAverage()
+        self.train_loss_para_average.restart(
+            self.avg_train_loss_para, self.step
+        )
+        self.nonfinite_losses.clear()
 
         if self.train_sampler is not None and hasattr(
             self.train_sampler, "set_epoch"
@@ -739,7 +757,7 @@ class ASR(sb.Brain):
         # Time since last intra-epoch checkpoint
         last_ckpt_time = time.time()
         with tqdm(
-            train_set,
+            self._prefetch(train_set),
             initial=self.step,
             dynamic_ncols=True,
             disable=not enable,
@@ -751,17 +769,25 @@ class ASR(sb.Brain):
                     break
                 self.step += 1
                 loss, loss_asr, loss_para = self.fit_batch(batch)
-                self.avg_train_loss = self.update_average(
-                    loss, self.avg_train_loss
-                )
-                self.avg_train_loss_asr = self.update_average(
-                    loss_asr, self.avg_train_loss_asr
-                )
-                self.avg_train_loss_para = self.update_average(
-                    loss_para, self.avg_train_loss_para
-                )
+                if self.lazy_metrics_interval > 0:
+                    self.train_loss_average.update(loss)
+                    self.train_loss_asr_average.update(loss_asr)
+                    self.train_loss_para_average.update(loss_para)
+                    if self.step % self.lazy_metrics_interval == 0:
+                        self._read_lazy_metrics()
+                        t.set_postfix(train_loss=self.avg_train_loss)
+                else:
+                    self.avg_train_loss = self.update_average(
+                        loss, self.avg_train_loss
+                    )
+                    self.avg_train_loss_asr = self.update_average(
+                        loss_asr, self.avg_train_loss_asr
+                    )
+                    self.avg_train_loss_para = self.update_average(
+                        loss_para, self.avg_train_loss_para
+                    )
 
-                t.set_postfix(train_loss=self.avg_train_loss)
+                    t.set_postfix(train_loss=self.avg_train_loss)
 
                 # Profile only if desired (steps allow the profiler to know when all is warmed up)
                 if self.profiler is not None:
@@ -785,35 +811,50 @@ class ASR(sb.Brain):
                     # processes enter this block while others don't,
                     # missing the barrier.
                     if sb.utils.distributed.if_main_process():
+                        if self.lazy_metrics_interval > 0:
+                            # save the averages of all the steps so far
+                            self._read_lazy_metrics()
                         self._save_intra_epoch_ckpt()
                     last_ckpt_time = time.time()
 
+        if self.lazy_metrics_interval > 0:
+            self._read_lazy_metrics()
+
         self.tb_avg_train_loss = self.avg_train_loss
         # Run train "on_stage_end" on all processes
         self.zero_grad(set_to_none=True)  # flush gradients
         self.on_stage_end(sb.Stage.TRAIN, self.avg_train_loss, epoch)
         self.avg_train_loss = 0.0
+        self.avg_train_loss_asr = 0.0
+        self.avg_train_loss_para = 0.0
         self.step = 0
 
+    @sb.utils.checkpoints.mark_as_saver
+    def _save(self, path):
+        save_dict = {
+            "step": self.step,
+            "avg_train_loss": self.avg_train_loss,
+            "avg_train_loss_asr": self.avg_train_loss_asr,
+            "avg_train_loss_para": self.avg_train_loss_para,
+            "optimizer_step": self.optimizer_step,
+        }
+        with open(path, "w") as w:
+            w.write(yaml.dump(save_dict))
+
+    @sb.utils.checkpoints.mark_as_loader
+    def _recover(self, path, end_of_epoch, device):
+        super()._recover(path, end_of_epoch, device)
+        with open(path) as f:
+            save_dict = yaml.safe_load(f)
+        # checkpoints from before the asr/para losses were saved
+        self.avg_train_loss_asr = save_dict.get("avg_train_loss_asr", 0.0)
+        self.avg_train_loss_para = save_dict.get("avg_train_loss_para", 0.0)
 
-def align_labels_to_tokenized_input(wrd, labels, tokenizer, paraphasia_dict):
-    words = wrd.split()
-    labels = labels.split()
-    assert len(words) == len(
-        labels
-    ), "Sentences and labels lists should be of same size."
-
-    return_labels = []
-    return_tokens = []
-    for w, l in zip(words, labels):
-        # print(f"w: {w} | l: {l}")
-        tokenized_word = tokenizer.sp.encode(w, out_type=str)
-        tokenized_label = [paraphasia_dict[l]] * len(tokenized_word)
 
-        return_labels.extend(tokenized_label)
-        return_tokens.extend(tokenized_word)
-
-    return return_tokens, return_labels
+def align_labels_to_tokenized_input(wrd, labels, tokenizer, paraphasia_dict):
+    return get_label_aligner(tokenizer.sp).token_labels(
+        wrd.split(), labels.split(), paraphasia_dict
+    )
 
 
 def dataio_prepare(hparams, tokenizer, ptoknizer):
@@ -821,8 +862,21 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     It also defines the data processing pipeline through user-defined functions."""
     data_folder = hparams["data_folder"]
 
+    # packed audio: one archive (shards + index) shared by the folds
+    audio_archive = None
+    if hparams.get("audio_archive", False):
+        audio_archive = hparams["audio_archive_dir"]
+        csv_files = [hparams[f"{k}_csv"] for k in ["train", "valid", "test"]]
+        run_on_main(
+            create_audio_archive,
+            args=[csv_files, audio_archive],
+            kwargs={"replacements": {"data_root": data_folder}},
+        )
+
     train_data = sb.dataio.dataset.DynamicItemDataset.from_csv(
-        csv_path=hparams["train_csv"], replacements={"data_root": data_folder},
+        csv_path=hparams["train_csv"],
+        replacements={"data_root": data_folder},
+        audio_archive=audio_archive,
     )
 
     if hparams["sorting"] == "ascending":
@@ -846,8 +900,14 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
         # when sorting do not shuffle in dataloader ! otherwise is pointless
         hparams["train_dataloader_opts"]["shuffle"] = False
 
+    # streaming: the (filtered) training set is read from tar shards
+    if hparams.get("streaming", False):
+        train_data = prepare_streaming(hparams, train_data)
+
     valid_data = sb.dataio.dataset.DynamicItemDataset.from_csv(
-        csv_path=hparams["valid_csv"], replacements={"data_root": data_folder}
+        csv_path=hparams["valid_csv"],
+        replacements={"data_root": data_folder},
+        audio_archive=audio_archive,
     )
     valid_data = valid_data.filtered_sorted(
         sort_key="duration",
@@ -858,7 +918,9 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     )
 
     test_data = sb.dataio.dataset.DynamicItemDataset.from_csv(
-        csv_path=hparams["test_csv"], replacements={"data_root": data_folder}
+        csv_path=hparams["test_csv"],
+        replacements={"data_root": data_folder},
+        audio_archive=audio_archive,
     )
     test_data = test_data.filtered_sorted(
         sort_key="duration",
@@ -881,18 +943,9 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     @sb.utils.data_pipeline.takes("wav")
     @sb.utils.data_pipeline.provides("sig")
     def audio_pipeline_train(wav):
-        # Speed Perturb is done here so it is multi-threaded with the
-        # workers of the dataloader (faster).
-        if hparams["speed_perturb"]:
-            sig = sb.dataio.dataio.read_audio(wav)
-            # factor = np.random.uniform(0.95, 1.05)
-            # sig = resample(sig.numpy(), 16000, int(16000*factor))
-            speed = sb.processing.speech_augmentation.SpeedPerturb(
-                16000, [x for x in range(95, 105)]
-            )
-            sig = speed(sig.unsqueeze(0)).squeeze(0)  # torch.from_numpy(sig)
-        else:
-            sig = sb.dataio.dataio.read_audio(wav)
+        # Speed Perturb is done on the padded batch in compute_forward, the
+        # workers of the dataloader only read the audio.
+        sig = sb.dataio.dataio.read_audio(wav)
         return sig
 
     sb.dataio.dataset.add_dynamic_item([train_data], audio_pipeline_train)
@@ -937,6 +990,15 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
         ptokens = torch.LongTensor(ptokens_list)
         yield ptokens
 
+    if hparams.get("item_cache", False):
+        # deterministic given the tokenizer: outputs kept across epochs
+        special_ids = f"{hparams['bos_index']},{hparams['eos_index']}"
+        version = hashlib.sha1(tokenizer.sp.serialized_model_proto())
+        version.update(special_ids.encode())
+        text_pipeline = sb.utils.data_pipeline.cached(
+            ItemCache(hparams["item_cache_dir"], version.hexdigest())
+        )(text_pipeline)
+
     sb.dataio.dataset.add_dynamic_item(datasets, text_pipeline)
 
     # 4. Set output:
@@ -964,6 +1026,172 @@ def dataio_prepare(hparams, tokenizer, ptoknizer):
     )
 
 
+SHARD_HASH = "shards.sha1"
+
+
+def write_train_shards(train_data, shard_dir, maxcount, seed):
+    """
+    Write the training data points (with their audio) to tar shards, unless
+    a previous run wrote the same ones: the hash of the data ids and
+    metadata (with maxcount and seed) is kept next to the shard list and
+    the shards are rewritten when it changes
+    """
+    data = {i: train_data.data[i] for i in train_data.data_ids}
+    content = json.dumps(
+        [list(data.items()), maxcount, seed], sort_keys=True, default=str
+    )
+    data_hash = hashlib.sha1(content.encode()).hexdigest()
+    shard_list = os.path.join(shard_dir, SHARD_LIST)
+    hash_file = os.path.join(shard_dir, SHARD_HASH)
+    if os.path.exists(shard_list):
+        if os.path.exists(hash_file):
+            with open(hash_file) as fin:
+                if fin.read().strip() == data_hash:
+                    return
+        logger.info(f"Training data changed, rewriting {shard_dir}")
+        with open(shard_list) as fin:
+            old_shards = json.load(fin)
+        # the list goes first: an interrupted rewrite is not taken as done
+        os.remove(shard_list)
+        for shard in old_shards:
+            shard = os.path.join(shard_dir, os.path.basename(shard))
+            if os.path.exists(shard):
+                os.remove(shard)
+    write_shards(data, shard_dir, maxcount=maxcount, seed=seed)
+    with open(hash_file, "w") as fout:
+        fout.write(data_hash + "\n")
+
+
+def prepare_streaming(hparams, train_data):
+    """
+    Training set read sequentially from tar shards (written once on main),
+    shuffled in a buffer and batched by duration on the fly; the
+    StreamingDataLoader resumes an interrupted epoch at the next batch
+    """
+    for option in ["cost_batching", "feature_cache"]:
+        if hparams.get(option, False):
+            raise ValueError(f"streaming does not support {option}")
+    stream_hparams = hparams["streaming_dataset"]
+    run_on_main(
+        write_train_shards,
+        args=[
+            train_data,
+            stream_hparams["shard_dir"],
+            stream_hparams["maxcount"],
+            hparams["seed"],
+        ],
+    )
+    collate_fn = PaddedBatch
+    if hparams.get("packed_collation", False):
+        collate_fn = functools.partial(PaddedBatch, packed_padding=True)
+    # the dataset makes the batches: only the workers are loader options
+    hparams["train_dataloader_opts"] = {
+        "num_workers": hparams["num_workers"]
+    }
+    return StreamingDataset(
+        stream_hparams["shard_dir"],
+        max_batch_length=stream_hparams["max_batch_length"],
+        num_buckets=stream_hparams["num_buckets"],
+        shuffle_buffer=stream_hparams["shuffle_buffer"],
+        collate_fn=collate_fn,
+        seed=hparams["seed"],
+    )
+
+
+def prepare_feature_cache(asr_brain, hparams, datasets):
+    """
+    Encode every utterance once with the frozen SSL_enc and serve the stored
+    outputs (w2v_feats) instead of the audio (sig)
+    """
+    ssl_enc = asr_brain.modules.SSL_enc
+    if not ssl_enc.freeze:
+        raise ValueError("feature_cache needs a frozen SSL_enc (freeze: True)")
+
+    # the pretrained weights are loaded from the checkpoint before hashing
+    if asr_brain.checkpointer is not None:
+        asr_brain.checkpointer.recover_if_possible(
+            device=torch.device(asr_brain.device)
+        )
+    key = model_hash(
+        ssl_enc,
+        extra=f"{hparams['w2v_model']}-output_norm={ssl_enc.output_norm}",
+    )
+    feature_store = FeatureStore(hparams["feature_cache_dir"], key)
+    for dataset in datasets:
+        run_on_main(
+            precompute_features,
+            args=[feature_store, ssl_enc, dataset, asr_brain.device],
+        )
+    feature_store.load()
+    print(f"feature cache: {feature_store.path} ({len(feature_store)} utts)")
+
+    @sb.utils.data_pipeline.takes("id")
+    @sb.utils.data_pipeline.provides("w2v_feats")
+    def feats_pipeline(id):
+        return feature_store[id]
+
+    sb.dataio.dataset.add_dynamic_item(datasets, feats_pipeline)
+    for dataset in datasets:
+        output_keys = list(dataset.pipeline.output_mapping)
+        output_keys[output_keys.index("sig")] = "w2v_feats"
+        dataset.set_output_keys(output_keys)
+
+
+def prepare_cost_batching(asr_brain, hparams, train_data):
+    """
+    Train loader options with a CostBatchSampler: the cost model is fitted
+    on the first run (main process) and loaded from its file afterwards, so
+    that a restarted run resumes with the same batches
+    """
+    cost_hparams = hparams["cost_batch_sampler"]
+    cost_model_file = cost_hparams["cost_model_file"]
+    loader_opts = hparams["train_dataloader_opts"]
+    shuffle = loader_opts.get("shuffle", False)
+
+    def make_sampler(cost_model):
+        return CostBatchSampler(
+            train_data,
+            cost_model,
+            reference_batch_size=loader_opts["batch_size"],
+            length_func=lambda x: (
+                float(x["duration"]),
+                len(x["wrd"].split()),
+            ),
+            shuffle=shuffle,
+            sort_window=cost_hparams["sort_window"],
+            batch_ordering="random" if shuffle else hparams["sorting"],
+        )
+
+    def calibrate():
+        if os.path.exists(cost_model_file):
+            return
+        sampler = make_sampler(BatchCostModel(cost_hparams["terms"]))
+
+        def step(batch):
+            # forward and backward, the parameters are not updated
+            stage = sb.Stage.TRAIN
+            predictions = asr_brain.compute_forward(batch, stage)
+            loss = asr_brain.compute_objectives(predictions, batch, stage)[0]
+            loss.backward()
+            asr_brain.modules.zero_grad(set_to_none=True)
+
+        sampler.calibrate(
+            step, cost_hparams["batch_sizes"], cost_hparams["quantiles"]
+        )
+        os.makedirs(os.path.dirname(cost_model_file), exist_ok=True)
+        sampler.cost_model.save(cost_model_file)
+
+    run_on_main(calibrate)
+    sampler = make_sampler(BatchCostModel.load(cost_model_file))
+    train_loader_opts = {
+        k: v
+        for k, v in loader_opts.items()
+        if k not in ["batch_size", "shuffle"]
+    }
+    train_loader_opts["batch_sampler"] = sampler
+    return train_loader_opts
+
+
 def prep_exp_dir(hparams):
     save_folder = hparams["save_folder"]
     # Saving folder
@@ -1029,7 +1257,22 @@ if __name__ == "__main__":
     train_dataloader_opts = hparams["train_dataloader_opts"]
     valid_dataloader_opts = hparams["valid_dataloader_opts"]
     asr_brain.tokenizer = tokenizer.sp
+    # one speed per utterance (95-104%), applied to the batch
+    speech_augmentation = sb.processing.speech_augmentation
+    asr_brain.speed_perturb = speech_augmentation.BatchSpeedPerturb(
+        16000, [x for x in range(95, 105)]
+    )
     asr_brain.ptokenizer = reverse_ptokenizer
+    asr_brain.label_aligner = get_label_aligner(tokenizer.sp)
+    # token keys of the same length (tokens_bos/tokens_eos, ...) padded
+    # together into one buffer
+    if hparams.get("packed_collation", False):
+        collate_fn = functools.partial(PaddedBatch, packed_padding=True)
+        for stage in ["train", "valid", "test"]:
+            # a StreamingDataset collates its batches itself
+            if stage == "train" and hparams.get("streaming", False):
+                continue
+            hparams[f"{stage}_dataloader_opts"]["collate_fn"] = collate_fn
     tokens = {
         i: asr_brain.tokenizer.id_to_piece(i)
         for i in range(asr_brain.tokenizer.get_piece_size())
@@ -1040,21 +1283,34 @@ if __name__ == "__main__":
 
     asr_brain.tb = SummaryWriter(hparams["tb_logs"])
 
+    # frozen encoder: train the decoder heads on stored encoder outputs
+    if hparams.get("feature_cache", False):
+        prepare_feature_cache(
+            asr_brain, hparams, [train_data, valid_data, test_data]
+        )
+
     # Initialize inverse paraphasia class count
-    asr_brain.train_para_class_count = [0 for i in range(4)]
-    for t in train_data:
-        for p in t["paraphasia_word_level"]:
-            asr_brain.train_para_class_count[p] += 1
-    asr_brain.train_para_class_count = 1.0 / torch.tensor(
-        asr_brain.train_para_class_count, dtype=torch.float
-    )
-    asr_brain.train_para_class_count = asr_brain.train_para_class_count / min(
-        asr_brain.train_para_class_count
-    )
-    print(asr_brain.train_para_class_count)
+    # (not with streaming: it would read the whole stream)
+    if not hparams.get("streaming", False):
+        asr_brain.train_para_class_count = [0 for i in range(4)]
+        for t in train_data:
+            for p in t["paraphasia_word_level"]:
+                asr_brain.train_para_class_count[p] += 1
+        asr_brain.train_para_class_count = 1.0 / torch.tensor(
+            asr_brain.train_para_class_count, dtype=torch.float
+        )
+        class_count = asr_brain.train_para_class_count
+        asr_brain.train_para_class_count = class_count / min(class_count)
+        print(asr_brain.train_para_class_count)
     asr_brain.train_para_class_count = torch.tensor([1.0, 2.0, 4.0, 8.0])
     print(asr_brain.train_para_class_count)
 
+    # dynamic batching of the training set by predicted step time
+    if hparams.get("cost_batching", False):
+        hparams["train_dataloader_opts"] = prepare_cost_batching(
+            asr_brain, hparams, train_data
+        )
+
     # with torch.autograd.detect_anomaly():
     if hparams["train_flag"]:
         asr_brain.fit(
@@ -1084,6 +1340,24 @@ if __name__ == "__main__":
         hparams["output_folder"], "para_f1.txt"
     )
 
-    asr_brain.evaluate(
-        test_data, test_loader_kwargs=hparams["test_dataloader_opts"]
-    )
+    # Support for dynamic batching of the test set: utterances of similar
+    # duration are decoded together
+    test_dataloader_opts = hparams["test_dataloader_opts"]
+    if hparams.get("dynamic_batching_test", False):
+        dynamic_hparams = hparams["test_dynamic_batch_sampler"]
+        test_dataloader_opts = {
+            "batch_sampler": DynamicBatchSampler(
+                test_data,
+                dynamic_hparams["max_batch_len"],
+                num_buckets=dynamic_hparams["num_buckets"],
+                length_func=lambda x: x["duration"],
+                shuffle=False,
+                batch_ordering=dynamic_hparams["batch_ordering"],
+            )
+        }
+        if "collate_fn" in hparams["test_dataloader_opts"]:
+            test_dataloader_opts["collate_fn"] = hparams[
+                "test_dataloader_opts"
+            ]["collate_fn"]
+
+    asr_brain.evaluate(test_data, test_loader_kwargs=test_dataloader_opts)
@@ -14,7 +14,6 @@ from collections import Counter
 import pickle
 from scipy import stats
 import re
-import socket
 from tqdm import tqdm
 import jiwer
 import Levenshtein as lev
@@ -22,12 +21,7 @@ import json
 
 sys.path.append("..")
 from helper_scripts.evaluation import *
-
-
-def find_free_port():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(("", 0))
-        return s.getsockname()[1]
+from helper_scripts.fold_scheduler import run_folds
 
 
 TOT_EPOCHS = 100
@@ -126,35 +120,29 @@ if __name__ == "__main__":
     BASE_MODEL = f"<path>/<to>/<pretrained_model>"
     EXP_DIR = f"<new_path>/<to>/<finetuned_model>"
 
+    # CUDA_VISIBLE_DEVICES of each concurrent fold ("" for cpu)
+    SLOTS = ["0"]
+
     if TRAIN_FLAG:
         yaml_src = "hparams/finetune_Scripts_base.yml"
-        yaml_target = "hparams/finetune_Scripts_final.yml"
-
-        start = time.time()
-
-        i = 1
-        count = 0
-        while i <= 12:
-            data_fold_dir = f"{DATA_ROOT}/Fold_{i}"
 
+        def prepare_fold(i):
+            # one yaml per fold, concurrent folds must not share it
+            yaml_target = f"hparams/finetune_Scripts_final-Fold_{i}.yml"
             change_yaml(
                 yaml_src,
                 yaml_target,
-                data_fold_dir,
+                f"{DATA_ROOT}/Fold_{i}",
                 i,
                 OUTPUT_NEURONS,
                 EXP_DIR,
                 BASE_MODEL,
                 FREEZE_ARCH,
             )
+            return yaml_target
 
-            # # launch experiment
-            # multi-gpu
-            env = os.environ.copy()
-            env["CUDA_VISIBLE_DEVICES"] = "0"
-            port = find_free_port()  # Get a free port.
-            print(f"free port: {port}")
-            cmd = [
+        def fold_cmd(yaml_target, port):
+            return [
                 "torchrun",
                 "--nproc_per_node=1",
                 f"--master_port={str(port)}",
@@ -162,22 +150,16 @@ if __name__ == "__main__":
                 f"{yaml_target}",
             ]
 
-            p = subprocess.run(cmd, env=env)
-
-            # p = subprocess.run(cmd)
-            count += 1
-            print(f"p.returncode: {p.returncode} | retry: {count}")
-            if count >= 5:
-                print("Too many retries")
-                exit()
-
-            if p.returncode == 0:
-                i += 1
-                count = 0
-
-        end = time.time()
-        elapsed = end - start
-        print(f"Total Train runtime: {datetime.timedelta(seconds=elapsed)}")
+        run_folds(
+            range(1, 13),
+            prepare_fold,
+            fold_cmd,
+            slots=SLOTS,
+            log_dir=f"{EXP_DIR}/logs",
+            done_marker=lambda i: f"{EXP_DIR}/Fold-{i}/fold_done",
+            on_fold_end=running_fold_metrics(EXP_DIR, "single_seq"),
+            max_retries=5,
+        )
 
     ##  Stat computation
     if EVAL_FLAG:
@@ -0,0 +1,152 @@
+"""
+Paired bootstrap significance test on per-utterance counts
+(wer-err/wer-tot, awer-*-err/tot, TD_*)
+
+The counts of each model are loaded once, every resample is a row of an
+index matrix drawn with NumPy and shared by all the models and metrics,
+so 10k+ iterations run in seconds.
+With speaker-level resampling the cross-validation folds (fold column,
+the folds being speaker-disjoint) are drawn instead of the utterances,
+each with all of its utterances.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+
+
+def align_models(dfs, stats, cluster_key="fold"):
+    """
+    Align the per-utterance dfs of each model on uids
+    return uids, clusters (cluster_key column, None if cluster_key is None)
+    and dict of model -> stat -> (err, tot) arrays
+    stat with <stat>-err/<stat>-tot columns is a rate sum(err)/sum(tot),
+    otherwise (e.g. TD_*) it is a mean over utterances
+    """
+    uids = sorted(set.intersection(*[set(df["uids"]) for df in dfs.values()]))
+    counts = {}
+    clusters = None
+    for model, df in dfs.items():
+        df = df.drop_duplicates("uids").set_index("uids").loc[uids]
+        if cluster_key is not None:
+            if cluster_key not in df:
+                raise ValueError(
+                    f"Per-utterance results of {model} have no {cluster_key} "
+                    "column to resample over"
+                )
+            if clusters is None:
+                clusters = df[cluster_key].values
+            elif (df[cluster_key].values != clusters).any():
+                raise ValueError(
+                    f"Per-utterance results of {model} do not have the same "
+                    f"{cluster_key} as {next(iter(dfs))}"
+                )
+        counts[model] = {}
+        for stat in stats:
+            if f"{stat}-err" in df:
+                err = df[f"{stat}-err"].values.astype(np.float64)
+                tot = df[f"{stat}-tot"].values.astype(np.float64)
+            else:
+                err = df[stat].values.astype(np.float64)
+                tot = np.ones(len(uids))
+            counts[model][stat] = (err, tot)
+    return uids, clusters, counts
+
+
+def _cluster_sums(values, clusters):
+    # sum the values of each cluster, resampling clusters is then the same
+    # as resampling the rows of the summed arrays
+    _, cluster_idx = np.unique(clusters, return_inverse=True)
+    return np.bincount(cluster_idx, weights=values)
+
+
+def resample_indices(num_units, num_samples, seed=1234):
+    """
+    Index matrix (num_samples, num_units) of bootstrap resamples
+    """
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, num_units, size=(num_samples, num_units))
+
+
+def bootstrap_rates(err, tot, indices, chunk_size=1000):
+    """
+    Error rate sum(err)/sum(tot) of each resample (row of indices)
+    """
+    rates = np.empty(len(indices))
+    for start in range(0, len(indices), chunk_size):
+        idx = indices[start : start + chunk_size]
+        rates[start : start + chunk_size] = err[idx].sum(1) / tot[idx].sum(1)
+    return rates
+
+
+def paired_bootstrap(
+    counts, model_1, model_2, stat, indices, clusters=None, alpha=0.05
+):
+    """
+    Paired bootstrap test of model_1 vs model_2 on stat
+    indices must be drawn over the clusters if clusters is given
+    return dict of rates, (1 - alpha) CIs and p-value of the difference
+    """
+    err_1, tot_1 = counts[model_1][stat]
+    err_2, tot_2 = counts[model_2][stat]
+    if clusters is not None:
+        err_1, tot_1, err_2, tot_2 = [
+            _cluster_sums(v, clusters) for v in [err_1, tot_1, err_2, tot_2]
+        ]
+
+    rate_1 = err_1.sum() / tot_1.sum()
+    rate_2 = err_2.sum() / tot_2.sum()
+    boot_1 = bootstrap_rates(err_1, tot_1, indices)
+    boot_2 = bootstrap_rates(err_2, tot_2, indices)
+    boot_diff = boot_2 - boot_1
+
+    q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    ci_1, ci_2, ci_diff = [
+        np.percentile(b, q) for b in [boot_1, boot_2, boot_diff]
+    ]
+    # two-sided: how often the resampled difference crosses zero
+    p_value = min(
+        1.0, 2 * min((boot_diff <= 0).mean(), (boot_diff >= 0).mean())
+    )
+    return {
+        "model_1": model_1,
+        "model_2": model_2,
+        "stat": stat,
+        "rate_1": rate_1,
+        "rate_1_ci_low": ci_1[0],
+        "rate_1_ci_high": ci_1[1],
+        "rate_2": rate_2,
+        "rate_2_ci_low": ci_2[0],
+        "rate_2_ci_high": ci_2[1],
+        "diff": rate_2 - rate_1,
+        "diff_ci_low": ci_diff[0],
+        "diff_ci_high": ci_diff[1],
+        "p_value": p_value,
+    }
+
+
+def bootstrap_model_pairs(
+    dfs, stats, num_samples=10000, speaker_level=True, alpha=0.05, seed=1234,
+):
+    """
+    Paired bootstrap test of every pair of models
+    dfs = dict of model name -> per-utterance df (uids, counts, fold)
+    return df with one row per model pair and stat
+    """
+    cluster_key = "fold" if speaker_level else None
+    uids, clusters, counts = align_models(dfs, stats, cluster_key)
+    if speaker_level:
+        num_units = len(np.unique(clusters))
+    else:
+        num_units = len(uids)
+    # same resamples for every model pair and stat
+    indices = resample_indices(num_units, num_samples, seed)
+
+    results = []
+    for model_1, model_2 in itertools.combinations(dfs, 2):
+        for stat in stats:
+            results.append(
+                paired_bootstrap(
+                    counts, model_1, model_2, stat, indices, clusters, alpha
+                )
+            )
+    return pd.DataFrame(results)
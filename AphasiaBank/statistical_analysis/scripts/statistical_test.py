@@ -7,7 +7,6 @@ import seaborn as sns
 import json
 import pandas as pd
 import statsmodels
-import jiwer
 from statsmodels.stats.anova import AnovaRM
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
 
@@ -15,114 +14,27 @@ sys.path.append("/home/mkperez/scratch/speechbrain/AphasiaBank/helper_scripts")
 from evaluation import *
 
 ## GPT##
-def extract_transcript(wer_path):
-    """
-    Return dict of transcripts
-    """
-    transcripts = {}
-    gt_transcripts = {}
-    switch = 0
-    with open(wer_path, "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            if line.startswith("P") and len(line.split()) == 14 and switch == 0:
-                utt_id = line.split()[0][:-1]
-                switch = 1
-            elif switch == 1:
-                switch = 2
-                words = [w.strip() for w in line.split(";")]
-                gt_transcripts[utt_id] = " ".join(words)
-            elif switch == 2:
-                switch = 3
-            elif switch == 3:
-                # pred
-                words = [w.strip() for w in line.split(";")]
-                transcripts[utt_id] = " ".join(words)
-                switch = 0
-    return transcripts, gt_transcripts
-
-
 def compile_predictions_labels_awer(results_dict, labels_dict):
     """
     compile predictions and labels
     results_dict = json predictions
     """
-
-    PARAPHASIA_KEY = {
-        "non-paraphasic": "c",
-        "phonemic": "p",
-        "semantic": "s",
-        "neologistic": "n",
-    }
+    # remove eps, tot = number of reference words
+    uids, counts = score_awer_views(
+        results_dict, labels_dict, remove_label_eps=True
+    )
+    df = pd.DataFrame({"uids": uids})
+    for view in AWER_VIEWS:
+        df[f"{view}-err"] = counts[f"{view}-err"]
+        df[f"{view}-tot"] = counts[f"{view}-ref"]
 
     y_true_aggregate = []
     y_pred_aggregate = []
-    df_list = []
-    for utt_id, label_aug_para in labels_dict.items():
-        if utt_id not in results_dict:
-            continue
-
-        # remove eps
-        label_aug_para = [l for l in label_aug_para if "<eps>" not in l]
-
-        # WER
-        result_dict = results_dict[utt_id]
-        pred_WER = [
-            f"{k.split('_')[1]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        word_recognition_labels = [
-            l.split("/")[0] for l in label_aug_para if l != "<eps>"
-        ]
-        wer = compute_AWER_lists([word_recognition_labels], [pred_WER])
-
-        # AWER
-        result_dict = results_dict[utt_id]
-        pred_AWER = [
-            f"{k.split('_')[1]}/{PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        awer = compute_AWER_lists([label_aug_para], [pred_AWER])
-
-        # AWER_disj
-        pred_AWER_disj = [
-            f"{k.split('_')[1]} {PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-            if "<eps>" not in k
-        ]
-        label_aug_para_disj = [
-            f"{p.split('/')[0]} {p.split('/')[1]}" for p in label_aug_para
-        ]
-        pred_AWER_disj = " ".join(pred_AWER_disj).split()
-        label_aug_para_disj = " ".join(label_aug_para_disj).split()
-        # exit()
-        awer_disj = compute_AWER_lists([label_aug_para_disj], [pred_AWER_disj])
-
-        # AWER PD
-        pred_AWER_PD = [
-            f"{PARAPHASIA_KEY[v]}"
-            if PARAPHASIA_KEY[v] in ["p", "n"]
-            else f"{k.split('_')[1]} {PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
-        ]
-        pred_AWER_PD = [x for x in pred_AWER_PD if "<eps>" not in x]
-        label_aug_para_PD = [
-            f"{p.split('/')[1]}"
-            if p.split("/")[1] in ["p", "n"]
-            else f"{p.split('/')[0]} {p.split('/')[1]}"
-            for p in label_aug_para
-        ]
-        label_aug_para_PD = [x for x in label_aug_para_PD if "<eps>" not in x]
-        pred_AWER_PD = " ".join(pred_AWER_PD).split()
-        label_aug_para_PD = " ".join(label_aug_para_PD).split()
-        awer_PD = compute_AWER_lists([label_aug_para_PD], [pred_AWER_PD])
-
+    for utt_id in uids:
+        label_aug_para = [l for l in labels_dict[utt_id] if "<eps>" not in l]
         y_pred_para = [
             f"{PARAPHASIA_KEY[v]}"
-            for k, v in result_dict.items()
+            for k, v in results_dict[utt_id].items()
             if "<eps>" not in k
         ]
         y_true_para = [[f"{p.split('/')[1]}" for p in label_aug_para]]
@@ -130,64 +42,9 @@ def compile_predictions_labels_awer(results_dict, labels_dict):
         y_pred_aggregate.append(y_pred_para)
         y_true_aggregate.append(y_true_para)
 
-        df_loc = pd.DataFrame(
-            {
-                "uids": [utt_id],
-                "wer-err": wer["err"],
-                "wer-tot": wer["tot"],
-                "awer-err": awer["err"],
-                "awer-tot": awer["tot"],
-                "awer_disj-err": awer_disj["err"],
-                "awer_disj-tot": awer_disj["tot"],
-                "awer_PD-err": awer_PD["err"],
-                "awer_PD-tot": awer_PD["tot"],
-            }
-        )
-
-        df_list.append(df_loc)
-    df = pd.concat(df_list)
     return y_true_aggregate, y_pred_aggregate, df
 
 
-def extract_labels(label_csv_path, gt_transcript_dict):
-    # map label_csv -> gt_transcript alignment (from wer files)
-    df = pd.read_csv(label_csv_path)
-    labels = {}
-    for i, row in df.iterrows():
-        if row["ID"] not in gt_transcript_dict:
-            continue
-        gt_transcript = gt_transcript_dict[row["ID"]]
-
-        # print(row)
-        gt_para_labels = []
-        aug_para_arr = row["aug_para"].split()
-
-        # go through gt_transcript
-        # print(f"gt_transcript: {gt_transcript}")
-        for word in gt_transcript.split():
-            if word == "<eps>":
-                gt_para_labels.append("<eps>/c")
-            else:
-                # # pop
-                next_valid_word = aug_para_arr.pop(0)
-                gt_para_labels.append(next_valid_word)
-
-        labels[row["ID"]] = gt_para_labels
-
-    return labels
-
-
-def extract_labels_oracle(label_csv_path):
-    # extract labels from asr wer.txt
-
-    df = pd.read_csv(label_csv_path)
-    labels = {}
-    for i, row in df.iterrows():
-        labels[row["ID"]] = row["aug_para"].split()
-
-    return labels
-
-
 def extract_GPT_data_oracle(gpt_dir):
     awer_df_list = []
     y_true_list = []
@@ -218,22 +75,12 @@ def extract_GPT_data_oracle(gpt_dir):
         ) = compile_predictions_labels_awer(results, labels_dict)
 
         # TD
-        TD_per_utt_bin, TD_list_bin = compute_temporal_distance(
-            y_true_fold, y_pred_fold, True
-        )
-        TD_per_utt_multi, TD_list_multi = compute_temporal_distance(
-            y_true_fold, y_pred_fold, False
-        )
-
-        TD_per_utt_p, TD_list_p = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "p"
-        )
-        TD_per_utt_n, TD_list_n = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "n"
-        )
-        TD_per_utt_s, TD_list_s = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "s"
-        )
+        TDs = compute_temporal_distances(y_true_fold, y_pred_fold)
+        TD_per_utt_bin, TD_list_bin = TDs["TD_bin"]
+        TD_per_utt_multi, TD_list_multi = TDs["TD_multi"]
+        TD_per_utt_p, TD_list_p = TDs["TD_p"]
+        TD_per_utt_n, TD_list_n = TDs["TD_n"]
+        TD_per_utt_s, TD_list_s = TDs["TD_s"]
 
         df_loc = pd.DataFrame(
             {
@@ -286,22 +133,12 @@ def extract_GPT_data(gpt_dir):
         ) = compile_predictions_labels_awer(results, labels_dict)
 
         # TD
-        TD_per_utt_bin, TD_list_bin = compute_temporal_distance(
-            y_true_fold, y_pred_fold, True
-        )
-        TD_per_utt_multi, TD_list_multi = compute_temporal_distance(
-            y_true_fold, y_pred_fold, False
-        )
-
-        TD_per_utt_p, TD_list_p = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "p"
-        )
-        TD_per_utt_n, TD_list_n = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "n"
-        )
-        TD_per_utt_s, TD_list_s = compute_temporal_distance_para_sp(
-            y_true_fold, y_pred_fold, "s"
-        )
+        TDs = compute_temporal_distances(y_true_fold, y_pred_fold)
+        TD_per_utt_bin, TD_list_bin = TDs["TD_bin"]
+        TD_per_utt_multi, TD_list_multi = TDs["TD_multi"]
+        TD_per_utt_p, TD_list_p = TDs["TD_p"]
+        TD_per_utt_n, TD_list_n = TDs["TD_n"]
+        TD_per_utt_s, TD_list_s = TDs["TD_s"]
 
         df_loc = pd.DataFrame(
             {
@@ -36,6 +36,9 @@ from hyperpyyaml import resolve_references
 from speechbrain.utils.distributed import run_on_main
 from speechbrain.dataio.dataloader import LoopedLoader
 from speechbrain.dataio.dataloader import SaveableDataLoader
+from speechbrain.dataio.streaming import StreamingDataLoader
+from speechbrain.dataio.dataloader import PrefetchLoader
+from speechbrain.utils.metric_stats import LazyAverage
 from speechbrain.dataio.sampler import DistributedSamplerWrapper
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
 
@@ -281,6 +284,19 @@ def parse_arguments(arg_list=None):
         type=int,
         help="Number of optimizer steps to run. If not passed, all epochs are run.",
     )
+    parser.add_argument(
+        "--lazy_metrics_interval",
+        type=int,
+        help="Number of training steps between host reads of the loss and "
+        "of the non-finite check, which otherwise wait for the device at "
+        "every step. If 0, they are read at every step.",
+    )
+    parser.add_argument(
+        "--prefetch_batches",
+        type=int,
+        help="Number of batches loaded and moved to the device ahead of the "
+        "compute, in a background thread. If 0, batches are not prefetched.",
+    )
     parser.add_argument(
         "--tqdm_colored_bar",
         default=False,
@@ -420,6 +436,17 @@ class Brain:
         ckpt_interval_minutes (float)
             Amount of time between saving intra-epoch checkpoints,
             in minutes, default: ``15.0``. If non-positive, these are not saved.
+        prefetch_batches (int)
+            Number of batches loaded (and, on cuda, copied to the device from
+            pinned memory on a separate stream) ahead of the compute, in a
+            background thread. Default: ``0`` (no prefetching).
+        lazy_metrics_interval (int)
+            If positive, the training loss and the non-finite check stay on
+            the device and are read every ``lazy_metrics_interval`` steps
+            (and at the end of the stage) instead of at every step, see
+            ``check_gradients()``: non-finite steps are then not skipped,
+            only their gradients are zeroed (exact for plain SGD only).
+            Default: ``0``.
 
         Typically in a script this comes from ``speechbrain.parse_args``, which
         has different defaults than Brain. If an option is not defined here
@@ -478,6 +505,8 @@ class Brain:
             "ckpt_interval_minutes": 0,
             "grad_accumulation_factor": 1,
             "optimizer_step_limit": None,
+            "prefetch_batches": 0,
+            "lazy_metrics_interval": 0,
             "tqdm_colored_bar": False,
             "tqdm_barcolor": {
                 "train": "GREEN",
@@ -570,6 +599,10 @@ class Brain:
         # to have your_sampler.set_epoch() called on each epoch.
         self.train_sampler = None
 
+        # Device-side training loss and non-finite losses (lazy metrics)
+        self.train_loss_average = LazyAverage()
+        self.nonfinite_losses = LazyAverage()
+
         # Automatic mixed precision init
         if self.auto_mix_prec:
             self.scaler = torch.cuda.amp.GradScaler()
@@ -745,6 +778,7 @@ class Brain:
             and ckpt_prefix is not None
             and (
                 isinstance(dataloader, SaveableDataLoader)
+                or isinstance(dataloader, StreamingDataLoader)
                 or isinstance(dataloader, LoopedLoader)
             )
         ):
@@ -752,7 +786,9 @@ class Brain:
             self.checkpointer.add_recoverable(ckpt_key, dataloader)
         return dataloader
 
-    def _train_loader_specifics(self, dataset, loader_kwargs):
+    def _train_loader_specifics(
+        self, dataset, loader_kwargs, stage=Stage.TRAIN
+    ):
         sampler = loader_kwargs.get("sampler", None)
         # Shuffling should really only matter for the train stage. Shuffling
         # will also lead to more padding in batches if the order was otherwise
@@ -770,6 +806,13 @@ class Brain:
             # Delete the shuffle flag, since you cannot specify both a sampler and
             # shuffling:
             del loader_kwargs["shuffle"]
+        elif not self.distributed_launch and stage == sb.Stage.TRAIN:
+            # a given (batch) sampler is also told the epoch, see fit()
+            batch_sampler = loader_kwargs.get("batch_sampler")
+            if sampler is not None:
+                self.train_sampler = sampler
+            elif batch_sampler is not None:
+                self.train_sampler = batch_sampler
 
         # Possibly make a DistributedSampler or a wrapper for some other sampler
         if self.distributed_launch and not isinstance(dataset, IterableDataset):
@@ -957,6 +1000,8 @@ class Brain:
                 self.optimizer_step += 1
 
         self.on_fit_batch_end(batch, outputs, loss, should_step)
+        if self.lazy_metrics_interval > 0:
+            return loss.detach()
         return loss.detach().cpu()
 
     def on_fit_batch_end(self, batch, outputs, loss, should_step):
@@ -981,6 +1026,16 @@ class Brain:
 
         Automatically clips large gradients.
 
+        With ``lazy_metrics_interval``, the loss is not read on the host,
+        so a non-finite step cannot be skipped: its gradients are zeroed on
+        the device and the optimizer step is still taken. This leaves the
+        parameters unchanged only for SGD without momentum and weight
+        decay. With momentum, adaptive moments (e.g., Adam, RMSprop) or
+        weight decay (e.g., AdamW) the parameters still move, and a warning
+        is logged when the non-finite losses are read. The patience is
+        checked every ``lazy_metrics_interval`` steps. Use
+        ``lazy_metrics_interval=0`` to skip non-finite steps exactly.
+
         Arguments
         ---------
         loss : tensor
@@ -992,7 +1047,9 @@ class Brain:
         bool
             Whether or not the optimizer step should be carried out.
         """
-        if not torch.isfinite(loss):
+        if self.lazy_metrics_interval > 0:
+            self._mask_nonfinite_gradients(loss)
+        elif not torch.isfinite(loss):
             self.nonfinite_count += 1
 
             # Print helpful debug info
@@ -1021,6 +1078,47 @@ class Brain:
 
         return True
 
+    def _mask_nonfinite_gradients(self, loss):
+        finite = torch.isfinite(loss.detach())
+        for p in self.modules.parameters():
+            if p.grad is not None:
+                p.grad.masked_fill_(~finite, 0.0)
+        self.nonfinite_losses.update(loss)
+
+    def _read_lazy_metrics(self):
+        # one host synchronization for the loss and the non-finite losses
+        self.avg_train_loss = self.train_loss_average.summarize()
+        nonfinite = self.nonfinite_losses.num_nonfinite()
+        self.nonfinite_losses.clear()
+        if nonfinite > 0:
+            self.nonfinite_count += nonfinite
+            logger.warn(
+                f"{nonfinite} non-finite losses, their gradients were zeroed."
+            )
+            if not self._zero_grad_step_is_noop():
+                logger.warn(
+                    "The optimizer steps of the non-finite losses were still "
+                    "taken, which moves the parameters with momentum, "
+                    "adaptive moments or weight decay. Set "
+                    "lazy_metrics_interval to 0 to skip them."
+                )
+            if self.nonfinite_count > self.nonfinite_patience:
+                raise ValueError(
+                    "Loss is not finite and patience is exhausted. "
+                    "To debug, wrap `fit()` with "
+                    "autograd's `detect_anomaly()`, e.g.\n\nwith "
+                    "torch.autograd.detect_anomaly():\n\tbrain.fit(...)"
+                )
+
+    def _zero_grad_step_is_noop(self):
+        # a step with zero gradients leaves the parameters unchanged only for
+        # plain SGD (no momentum, no weight decay)
+        optimizer = getattr(self, "optimizer", None)
+        return isinstance(optimizer, torch.optim.SGD) and all(
+            group["momentum"] == 0 and group["weight_decay"] == 0
+            for group in optimizer.param_groups
+        )
+
     def evaluate_batch(self, batch, stage):
         """Evaluate one batch, override for different procedure than train.
 
@@ -1047,6 +1145,12 @@ class Brain:
         loss = self.compute_objectives(out, batch, stage=stage)
         return loss.detach().cpu()
 
+    def _prefetch(self, dataset):
+        # the next batches are loaded (and copied) during the compute
+        if self.prefetch_batches > 0:
+            return PrefetchLoader(dataset, self.device, self.prefetch_batches)
+        return dataset
+
     def _fit_train(self, train_set, epoch, enable):
         # Training stage
         self.on_stage_start(Stage.TRAIN, epoch)
@@ -1055,6 +1159,9 @@ class Brain:
 
         # Reset nonfinite count to 0 each epoch
         self.nonfinite_count = 0
+        # the loss averaged before an intra-epoch checkpoint is kept
+        self.train_loss_average.restart(self.avg_train_loss, self.step)
+        self.nonfinite_losses.clear()
 
         if self.train_sampler is not None and hasattr(
             self.train_sampler, "set_epoch"
@@ -1064,7 +1171,7 @@ class Brain:
         # Time since last intra-epoch checkpoint
         last_ckpt_time = time.time()
         with tqdm(
-            train_set,
+            self._prefetch(train_set),
             initial=self.step,
             dynamic_ncols=True,
             disable=not enable,
@@ -1076,10 +1183,16 @@ class Brain:
                     break
                 self.step += 1
                 loss = self.fit_batch(batch)
-                self.avg_train_loss = self.update_average(
-                    loss, self.avg_train_loss
-                )
-                t.set_postfix(train_loss=self.avg_train_loss)
+                if self.lazy_metrics_interval > 0:
+                    self.train_loss_average.update(loss)
+                    if self.step % self.lazy_metrics_interval == 0:
+                        self._read_lazy_metrics()
+                        t.set_postfix(train_loss=self.avg_train_loss)
+                else:
+                    self.avg_train_loss = self.update_average(
+                        loss, self.avg_train_loss
+                    )
+                    t.set_postfix(train_loss=self.avg_train_loss)
 
                 # Profile only if desired (steps allow the profiler to know when all is warmed up)
                 if self.profiler is not None:
@@ -1103,9 +1216,15 @@ class Brain:
                     # processes enter this block while others don't,
                     # missing the barrier.
                     if sb.utils.distributed.if_main_process():
+                        if self.lazy_metrics_interval > 0:
+                            # save the average of all the steps so far
+                            self._read_lazy_metrics()
                         self._save_intra_epoch_ckpt()
                     last_ckpt_time = time.time()
 
+        if self.lazy_metrics_interval > 0:
+            self._read_lazy_metrics()
+
         # Run train "on_stage_end" on all processes
         self.zero_grad(set_to_none=True)  # flush gradients
         self.on_stage_end(Stage.TRAIN, self.avg_train_loss, epoch)
@@ -1120,7 +1239,7 @@ class Brain:
             avg_valid_loss = 0.0
             with torch.no_grad():
                 for batch in tqdm(
-                    valid_set,
+                    self._prefetch(valid_set),
                     dynamic_ncols=True,
                     disable=not enable,
                     colour=self.tqdm_barcolor["valid"],
@@ -1342,7 +1461,7 @@ class Brain:
         avg_test_loss = 0.0
         with torch.no_grad():
             for batch in tqdm(
-                test_set,
+                self._prefetch(test_set),
                 dynamic_ncols=True,
                 disable=not progressbar,
                 colour=self.tqdm_barcolor["test"],
@@ -0,0 +1,395 @@
+"""Sharded, memory-mapped audio archive
+
+Reading one small audio file per utterance costs an open/stat per example
+and per epoch, which dominates data loading on network file systems. The
+archive packs the raw samples of many utterances into a few large shard
+files, with an index mapping each utterance id to its samples. Reads are
+slices of a np.memmap of the shard (no file open, no decoding).
+
+An utterance of an archive is referred to as "archive://<archive_dir>#<id>",
+which read_audio accepts like a path (also as the "file" of the dict
+notation, with "start"/"stop").
+"""
+import os
+import json
+import logging
+import contextlib
+import numpy as np
+import torch
+import torchaudio
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "archive://"
+INDEX_FILE = "index.json"
+LOCK_FILE = "lock"
+SHARD_FILE = "shard-{:05d}.bin"
+
+
+def archive_path(archive_dir, utt_id):
+    """Reference to an utterance of an archive, readable by read_audio.
+
+    Example
+    -------
+    >>> archive_path("/data/archive", "utt1")
+    'archive:///data/archive#utt1'
+    """
+    return f"{ARCHIVE_PREFIX}{archive_dir}#{utt_id}"
+
+
+def is_archive_path(path):
+    """True if path refers to an utterance of an archive."""
+    return isinstance(path, str) and path.startswith(ARCHIVE_PREFIX)
+
+
+class AudioArchive:
+    """Append-only archive of raw audio, split into shard files.
+
+    The samples of an utterance are stored contiguously, as (time, channels)
+    in row-major order, in the current shard. A new shard is started when
+    the current one exceeds shard_size bytes. The index (one JSON file) maps
+    each utterance id to [shard, offset, frames, channels], and to the
+    [path, mtime_ns, size] of its source file, if known.
+
+    With the default float32 storage, reads are zero-copy views of the
+    shard memmap (opened copy-on-write: in-place ops on the returned tensor
+    never reach the file). int16 storage halves the size, reads are then
+    converted to float like torchaudio.load does (exact for 16-bit sources).
+
+    Arguments
+    ---------
+    archive_dir : str
+        Directory of the archive.
+    dtype : str
+        Storage dtype, "float32" or "int16" (ignored for an existing archive).
+    shard_size : int
+        Approximate maximum size of a shard, in bytes.
+
+    Example
+    -------
+    >>> tmpdir = getfixture('tmpdir')
+    >>> archive = AudioArchive(tmpdir)
+    >>> archive.add("utt1", torch.rand(16000), 16000)
+    >>> archive.add("utt2", torch.rand(800, 2), 16000)
+    >>> archive.save()
+    >>> archive = AudioArchive(tmpdir)
+    >>> len(archive), archive.sample_rate
+    (2, 16000)
+    >>> archive["utt1"].shape, archive["utt2"].shape
+    (torch.Size([16000]), torch.Size([800, 2]))
+    >>> archive.read("utt1", start=100, stop=200).shape
+    torch.Size([100])
+    """
+
+    def __init__(self, archive_dir, dtype="float32", shard_size=2 ** 30):
+        self.path = archive_dir
+        self.dtype = np.dtype(dtype)
+        if self.dtype.name not in ["float32", "int16"]:
+            raise ValueError(f"Unsupported archive dtype: {dtype}")
+        self.shard_size = shard_size
+        self.load()
+
+    def load(self):
+        """(Re)loads the index, e.g. after another process added audio."""
+        self.items = {}
+        self.sources = {}
+        self.sample_rate = None
+        self.num_shards = 0
+        index_file = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file) as fin:
+                meta = json.load(fin)
+            self.items = meta["items"]
+            self.sources = meta.get("sources", {})
+            self.sample_rate = meta["sample_rate"]
+            self.num_shards = meta["num_shards"]
+            self.dtype = np.dtype(meta["dtype"])
+        # samples of each shard covered by the index
+        self._shard_samples = [0] * self.num_shards
+        for shard, offset, frames, channels in self.items.values():
+            end = offset + frames * channels
+            self._shard_samples[shard] = max(self._shard_samples[shard], end)
+        self._memmaps = {}
+
+    def _drop_unsaved(self):
+        # drop the samples appended after the last save (interrupted run)
+        shard = 0
+        shard_file = os.path.join(self.path, SHARD_FILE.format(shard))
+        while os.path.exists(shard_file):
+            if shard >= self.num_shards:
+                os.remove(shard_file)
+            else:
+                num_bytes = self._shard_samples[shard] * self.dtype.itemsize
+                if os.path.getsize(shard_file) > num_bytes:
+                    os.truncate(shard_file, num_bytes)
+            shard += 1
+            shard_file = os.path.join(self.path, SHARD_FILE.format(shard))
+
+    def save(self):
+        """Writes the index, the audio added so far becomes readable."""
+        meta = {
+            "dtype": self.dtype.name,
+            "sample_rate": self.sample_rate,
+            "num_shards": self.num_shards,
+            "items": self.items,
+            "sources": self.sources,
+        }
+        tmp_file = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_file, "w") as fout:
+            json.dump(meta, fout)
+        os.replace(tmp_file, os.path.join(self.path, INDEX_FILE))
+        self._memmaps = {}
+
+    def add(self, utt_id, audio, sample_rate, source=None):
+        """Appends the audio of an utterance (replacing the previous entry
+        of utt_id, if any: its samples stay in the shard, unused).
+
+        Arguments
+        ---------
+        utt_id : str
+            Utterance id.
+        audio : torch.Tensor
+            Audio as returned by read_audio: (time,) or (time, channels).
+        sample_rate : int
+            Sample rate of the audio (the same for the whole archive).
+        source : str
+            The file the audio was read from, whose modification time and
+            size are stored (see is_current).
+        """
+        if self.sample_rate is None:
+            self.sample_rate = sample_rate
+        elif sample_rate != self.sample_rate:
+            raise ValueError(
+                f"Archive sample rate is {self.sample_rate}, "
+                f"got {sample_rate} for {utt_id}"
+            )
+        channels = 1 if audio.dim() == 1 else audio.shape[1]
+        samples = audio.detach().cpu().reshape(-1)
+        if self.dtype.name == "int16" and samples.is_floating_point():
+            samples = (samples * 32768).round().clamp(-32768, 32767)
+        samples = samples.numpy().astype(self.dtype)
+
+        if (
+            self.num_shards == 0
+            or self._shard_samples[-1] * self.dtype.itemsize >= self.shard_size
+        ):
+            self.num_shards += 1
+            self._shard_samples.append(0)
+        shard = self.num_shards - 1
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, SHARD_FILE.format(shard)), "ab") as f:
+            f.write(samples.tobytes())
+        offset = self._shard_samples[shard]
+        self.items[utt_id] = [shard, offset, len(samples) // channels, channels]
+        self._shard_samples[shard] += len(samples)
+        if source is not None:
+            self.sources[utt_id] = _source_stat(source)
+        else:
+            self.sources.pop(utt_id, None)
+
+    def is_current(self, utt_id, source):
+        """Whether utt_id is in the archive, added from source as it is now
+        (same path, modification time and size)."""
+        return utt_id in self.items and self.sources.get(
+            utt_id
+        ) == _source_stat(source)
+
+    def __contains__(self, utt_id):
+        return utt_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, utt_id):
+        return self.read(utt_id)
+
+    def _shard(self, shard, end):
+        memmap = self._memmaps.get(shard)
+        if memmap is None or end > len(memmap):
+            memmap = np.memmap(
+                os.path.join(self.path, SHARD_FILE.format(shard)),
+                dtype=self.dtype,
+                mode="c",
+                shape=(self._shard_samples[shard],),
+            )
+            self._memmaps[shard] = memmap
+        return memmap
+
+    def read(self, utt_id, start=0, stop=None):
+        """Audio of an utterance, same conventions as read_audio.
+
+        Arguments
+        ---------
+        utt_id : str
+            Utterance id.
+        start : int
+            First frame to read.
+        stop : int
+            Last frame to read (exclusive), None or start reads to the end.
+            A stop past the end returns fewer frames.
+
+        Returns
+        -------
+        torch.Tensor
+            (time,) for 1-channel audio, (time, channels) otherwise.
+        """
+        shard, offset, frames, channels = self.items[utt_id]
+        if stop is None or stop == start:
+            stop = frames
+        stop = min(stop, frames)
+        start = min(start, stop)
+        begin = offset + start * channels
+        end = offset + stop * channels
+        audio = torch.from_numpy(self._shard(shard, end)[begin:end])
+        if self.dtype.name == "int16":
+            audio = audio.float() / 32768
+        if channels > 1:
+            audio = audio.view(-1, channels)
+        return audio
+
+    def __getstate__(self):
+        # memmaps are reopened in each worker process
+        state = self.__dict__.copy()
+        state["_memmaps"] = {}
+        return state
+
+
+def _source_stat(path):
+    """The path, modification time and size of a source file."""
+    stat = os.stat(path)
+    return [path, stat.st_mtime_ns, stat.st_size]
+
+
+@contextlib.contextmanager
+def _locked(lock_file):
+    """Holds an exclusive lock on lock_file (fcntl is POSIX only: elsewhere,
+    e.g. on Windows, the lock is not taken)."""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(lock_file, "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_archives = {}
+
+
+def read_archive_audio(path, start=0, stop=None):
+    """Reads "archive://<archive_dir>#<id>" (see read_audio).
+
+    The archives are opened once per process.
+    """
+    archive_dir, _, utt_id = path[len(ARCHIVE_PREFIX) :].rpartition("#")
+    if archive_dir not in _archives:
+        _archives[archive_dir] = AudioArchive(archive_dir)
+    return _archives[archive_dir].read(utt_id, start, stop)
+
+
+def use_audio_archive(data, archive_dir, wav_key="wav"):
+    """Points the wav_key entries of data to the archive.
+
+    Utterances missing from the archive keep their original path.
+
+    Arguments
+    ---------
+    data : dict
+        Data as loaded by load_data_csv / load_data_json, keyed by id.
+    archive_dir : str
+        Directory of the archive.
+    wav_key : str
+        Key of the audio path in data.
+
+    Returns
+    -------
+    dict
+        data, modified in place.
+    """
+    archive = AudioArchive(archive_dir)
+    missing = 0
+    for utt_id, data_point in data.items():
+        if utt_id in archive:
+            data_point[wav_key] = archive_path(archive_dir, utt_id)
+        else:
+            missing += 1
+    if missing > 0:
+        logger.warning(
+            f"{missing} utterances not in the audio archive {archive_dir}, "
+            "they are read from their files"
+        )
+    return data
+
+
+def create_audio_archive(
+    csv_files,
+    archive_dir,
+    wav_key="wav",
+    replacements={},
+    dtype="float32",
+    shard_size=2 ** 30,
+    save_every=1000,
+):
+    """Adds the audio of the CSV files to an archive (keyed by ID).
+
+    Utterances already in the archive are skipped (unless their source file
+    changed since: modification time or size), so several CSVs sharing
+    utterances (e.g. cross-validation folds) share one archive.
+
+    Arguments
+    ---------
+    csv_files : list
+        SpeechBrain CSV files (with an ID field).
+    archive_dir : str
+        Directory of the archive.
+    wav_key : str
+        Field of the audio path in the CSVs.
+    replacements : dict
+        Replacements of the CSV values (see load_data_csv).
+    dtype : str
+        Storage dtype of a new archive, "float32" or "int16".
+    shard_size : int
+        Approximate maximum size of a shard, in bytes.
+    save_every : int
+        The index is saved every save_every new utterances, so an
+        interrupted run keeps the audio added so far.
+
+    Returns
+    -------
+    AudioArchive
+        The archive.
+    """
+    from speechbrain.dataio.dataio import load_data_csv
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archive = AudioArchive(archive_dir, dtype, shard_size)
+    added = updated = 0
+    # one writer at a time (e.g. folds running concurrently)
+    with _locked(os.path.join(archive_dir, LOCK_FILE)):
+        archive.load()
+        archive._drop_unsaved()
+        for csv_file in csv_files:
+            data = load_data_csv(csv_file, replacements)
+            for utt_id, data_point in data.items():
+                source = data_point[wav_key]
+                if archive.is_current(utt_id, source):
+                    continue
+                updated += utt_id in archive
+                audio, fs = torchaudio.load(source)
+                archive.add(
+                    utt_id, audio.transpose(0, 1).squeeze(1), fs, source
+                )
+                added += 1
+                if added % save_every == 0:
+                    archive.save()
+        archive.save()
+    logger.info(
+        f"Audio archive {archive_dir}: {added} utterances added "
+        f"({updated} of them replacing a changed source)"
+    )
+    return archive
@@ -8,6 +8,7 @@ import torch
 from speechbrain.utils.data_utils import mod_default_collate
 from speechbrain.utils.data_utils import recursive_to
 from speechbrain.utils.data_utils import batch_pad_right
+from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data._utils.collate import default_convert
 from torch.utils.data._utils.pin_memory import (
     pin_memory as recursive_pin_memory,
@@ -48,6 +49,16 @@ class PaddedBatch:
         Whether to apply PyTorch-default_collate-like stacking on values that
         didn't get padded. This stacks if it can, but doesn't error out if it
         cannot. Default:True, usually does the right thing.
+    packed_padding : bool
+        Pads the keys of a same-length family (same length in every example,
+        e.g. tokens_bos and tokens_eos) together: they are padded into one
+        buffer with a single pad_sequence call, and are views of this buffer
+        sharing their lengths tensor. pin_memory() and to() then move one
+        buffer per family. The values are the same as with the default
+        padding. Only for the default padding_func (constant mode).
+    nested_keys : list, None
+        (Optional) These keys are not padded: they are returned as nested
+        tensors (torch.nested), for the modules which support them.
 
     Example
     -------
@@ -95,6 +106,16 @@ class PaddedBatch:
     ...     {"text": ["How", "are", "you?"]}])
     >>> batch.text
     [['Hello'], ['How', 'are', 'you?']]
+    >>> # Same-length keys can be padded together, as views of one buffer:
+    >>> batch = PaddedBatch([
+    ...     {"bos": torch.tensor([0, 5]), "eos": torch.tensor([5, 1])},
+    ...     {"bos": torch.tensor([0, 6, 7]), "eos": torch.tensor([6, 7, 1])}],
+    ...     packed_padding=True)
+    >>> batch.eos
+    PaddedData(data=tensor([[5, 1, 0],
+            [6, 7, 1]]), lengths=tensor([0.6667, 1.0000]))
+    >>> batch.bos.lengths is batch.eos.lengths
+    True
 
     """
 
@@ -107,23 +128,37 @@ class PaddedBatch:
         padding_kwargs={},
         apply_default_convert=True,
         nonpadded_stack=True,
+        packed_padding=False,
+        nested_keys=None,
     ):
         self.__length = len(examples)
         self.__keys = list(examples[0].keys())
         self.__padded_keys = []
         self.__device_prep_keys = []
+        self.__families = []
+        packed_padding = (
+            packed_padding
+            and padding_func is batch_pad_right
+            and padding_kwargs.get("mode", "constant") == "constant"
+        )
+        to_pack = {}
         for key in self.__keys:
             values = [example[key] for example in examples]
             # Default convert usually does the right thing (numpy2torch etc.)
             if apply_default_convert:
                 values = default_convert(values)
-            if (padded_keys is not None and key in padded_keys) or (
+            if nested_keys is not None and key in nested_keys:
+                setattr(self, key, _nested_tensor(values))
+            elif (padded_keys is not None and key in padded_keys) or (
                 padded_keys is None and isinstance(values[0], torch.Tensor)
             ):
                 # Padding and PaddedData
                 self.__padded_keys.append(key)
-                padded = PaddedData(*padding_func(values, **padding_kwargs))
-                setattr(self, key, padded)
+                if packed_padding and _packable(values):
+                    to_pack[key] = values
+                else:
+                    padded = PaddedData(*padding_func(values, **padding_kwargs))
+                    setattr(self, key, padded)
             else:
                 # Default PyTorch collate usually does the right thing
                 # (convert lists of equal sized tensors to batch tensors, etc.)
@@ -134,6 +169,33 @@ class PaddedBatch:
                 device_prep_keys is None and isinstance(values[0], torch.Tensor)
             ):
                 self.__device_prep_keys.append(key)
+        if to_pack:
+            self.__pack(to_pack, padding_kwargs.get("value", 0))
+
+    def __pack(self, to_pack, value):
+        # families: same lengths, dtype, other dims, and device preparation
+        families = {}
+        for key, values in to_pack.items():
+            signature = (
+                tuple(v.shape[0] for v in values),
+                values[0].dtype,
+                values[0].shape[1:],
+                key in self.__device_prep_keys,
+            )
+            families.setdefault(signature, []).append(key)
+        for (lengths, dtype, other_dims, to_device), keys in families.items():
+            max_len = max(lengths)
+            # one padding call for the whole family
+            buffer = pad_sequence(
+                [v for key in keys for v in to_pack[key]],
+                batch_first=True,
+                padding_value=value,
+            ).view(len(keys), len(lengths), max_len, *other_dims)
+            rel_lengths = torch.tensor([length / max_len for length in lengths])
+            for i, key in enumerate(keys):
+                setattr(self, key, PaddedData(buffer[i], rel_lengths))
+            if to_device:
+                self.__families.append((keys, buffer, rel_lengths))
 
     def __len__(self):
         return self.__length
@@ -160,10 +222,12 @@ class PaddedBatch:
 
     def pin_memory(self):
         """In-place, moves relevant elements to pinned memory."""
+        self.__move_families(recursive_pin_memory)
         for key in self.__device_prep_keys:
-            value = getattr(self, key)
-            pinned = recursive_pin_memory(value)
-            setattr(self, key, pinned)
+            if not self.__in_family(key):
+                value = getattr(self, key)
+                pinned = recursive_pin_memory(value)
+                setattr(self, key, pinned)
         return self
 
     def to(self, *args, **kwargs):
@@ -171,12 +235,27 @@ class PaddedBatch:
 
         Passes all arguments to torch.Tensor.to, see its documentation.
         """
+        self.__move_families(lambda x: recursive_to(x, *args, **kwargs))
         for key in self.__device_prep_keys:
-            value = getattr(self, key)
-            moved = recursive_to(value, *args, **kwargs)
-            setattr(self, key, moved)
+            if not self.__in_family(key):
+                value = getattr(self, key)
+                moved = recursive_to(value, *args, **kwargs)
+                setattr(self, key, moved)
         return self
 
+    def __move_families(self, move):
+        # one buffer and one lengths tensor per family
+        families = []
+        for keys, buffer, rel_lengths in self.__families:
+            buffer, rel_lengths = move(buffer), move(rel_lengths)
+            for i, key in enumerate(keys):
+                setattr(self, key, PaddedData(buffer[i], rel_lengths))
+            families.append((keys, buffer, rel_lengths))
+        self.__families = families
+
+    def __in_family(self, key):
+        return any(key in keys for keys, _, _ in self.__families)
+
     def at_position(self, pos):
         """Gets the position."""
         key = self.__keys[pos]
@@ -188,6 +267,26 @@ class PaddedBatch:
         return self.__length
 
 
+def _packable(values):
+    # tensors of at least 1 dim, same dtype and other dims, not all empty
+    first = values[0]
+    return (
+        all(isinstance(v, torch.Tensor) for v in values)
+        and first.ndim > 0
+        and all(
+            v.dtype == first.dtype and v.shape[1:] == first.shape[1:]
+            for v in values
+        )
+        and max(v.shape[0] for v in values) > 0
+    )
+
+
+def _nested_tensor(values):
+    if hasattr(torch, "jagged"):
+        return torch.nested.nested_tensor(values, layout=torch.jagged)
+    return torch.nested.nested_tensor(values)
+
+
 class BatchsizeGuesser:
     """Try to figure out the batchsize, but never error out
 
@@ -23,6 +23,7 @@ import torchaudio
 import json
 import re
 from speechbrain.utils.torch_audio_backend import check_torchaudio_backend
+from speechbrain.dataio.audio_archive import is_archive_path, read_archive_audio
 
 check_torchaudio_backend()
 logger = logging.getLogger(__name__)
@@ -182,9 +183,16 @@ def read_audio(waveforms_obj):
     Which codecs are supported depends on your torchaudio backend.
     Refer to `torchaudio.load` documentation for further details.
 
+    The path can also refer to an utterance of an audio archive,
+    "archive://<archive_dir>#<id>" (see speechbrain.dataio.audio_archive),
+    the audio is then read from the memory-mapped shards of the archive.
+
+    Audio already loaded (a tensor, e.g. from the shards of a
+    StreamingDataset) is returned as is.
+
     Arguments
     ----------
-    waveforms_obj : str, dict
+    waveforms_obj : str, dict, torch.Tensor
         Path to audio or dict with the desired configuration.
 
         Keys for the dict variant:
@@ -213,7 +221,11 @@ def read_audio(waveforms_obj):
     >>> loaded.allclose(dummywav.squeeze(0),atol=1e-4) # replace with eq with sox_io backend
     True
     """
-    if isinstance(waveforms_obj, str):
+    if isinstance(waveforms_obj, torch.Tensor):
+        return waveforms_obj
+    if is_archive_path(waveforms_obj):
+        return read_archive_audio(waveforms_obj)
+    elif isinstance(waveforms_obj, str):
         audio, _ = torchaudio.load(waveforms_obj)
     else:
         path = waveforms_obj["file"]
@@ -236,6 +248,9 @@ def read_audio(waveforms_obj):
                 'Hint: Omit "stop" if you want to read to the end of file.'
             )
 
+        if is_archive_path(path):
+            return read_archive_audio(path, start, stop)
+
         # Requested to load until a specific frame?
         if start != stop:
             num_frames = stop - start
@@ -34,15 +34,24 @@ Example
 Authors:
   * Aku Rouhe 2020
 """
+import torch
 from torch.utils.data import DataLoader
 from torch.utils.data import IterableDataset
 from torch.utils.data.dataloader import _BaseDataLoaderIter
+from torch.utils.data._utils.pin_memory import (
+    pin_memory as recursive_pin_memory,
+)
+import queue
 import logging
 import warnings
 import functools
+import threading
+import collections
 from speechbrain.dataio.batch import PaddedBatch, BatchsizeGuesser
 from speechbrain.dataio.dataset import DynamicItemDataset
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
+from speechbrain.dataio.streaming import StreamingDataset, StreamingDataLoader
+from speechbrain.utils.data_utils import recursive_to
 from speechbrain.utils.checkpoints import (
     register_checkpoint_hooks,
     mark_as_saver,
@@ -76,7 +85,8 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     Shuffling gets implemented by ReproducibleRandomSampler.
 
     If the Dataset is not an IterableDataset, the DataLoader
-    is a SaveableDataLoader.
+    is a SaveableDataLoader. A StreamingDataset gets a StreamingDataLoader
+    (the dataset makes the batches).
 
     If the Dataset is a webdataset.dataset.Composable, set default
     batch_size = None.
@@ -132,7 +142,9 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     ):
         loader_kwargs["batch_size"] = None
     # Create the loader
-    if isinstance(dataset, IterableDataset):
+    if isinstance(dataset, StreamingDataset):
+        dataloader = StreamingDataLoader(dataset, **loader_kwargs)
+    elif isinstance(dataset, IterableDataset):
         dataloader = DataLoader(dataset, **loader_kwargs)
     else:
         dataloader = SaveableDataLoader(dataset, **loader_kwargs)
@@ -217,8 +229,11 @@ class SaveableDataLoader(DataLoader):
             )
         self._speechbrain_recovery_skip_to = None
         self._speechbrain_iterator = None
+        # batches consumed, when iterated ahead (see PrefetchLoader)
+        self._speechbrain_position = None
 
     def __iter__(self):
+        self._speechbrain_position = None
         iterator = super().__iter__()
         # Keep a reference to the iterator,
         # to be able to access the iterator._num_yielded value.
@@ -240,6 +255,8 @@ class SaveableDataLoader(DataLoader):
             )
         if self._speechbrain_iterator is None:
             to_save = None
+        elif self._speechbrain_position is not None:
+            to_save = self._speechbrain_position
         else:
             to_save = self._speechbrain_iterator._num_yielded
         with open(path, "w") as fo:
@@ -345,3 +362,154 @@ class LoopedLoader:
                 # loop has already finished but there is a checkpoint in the
                 # middle of validation.
                 self.step = self.epoch_length
+
+
+class PrefetchLoader:
+    """Prepares the next batches while the current one is processed.
+
+    A background thread takes the batches from the loader (so collation
+    overlaps the compute, also with num_workers=0) and, for a CUDA device,
+    pins them and starts their copy to the device on a separate stream.
+    The compute stream only waits for the copy of the batch it uses, so
+    the copy of the next batches overlaps the compute of the current one.
+    The batches are moved with their ``pin_memory`` and ``to`` methods
+    (e.g. PaddedBatch), or as (nested) tensors.
+
+    The position of a SaveableDataLoader (or StreamingDataLoader) is the
+    number of batches consumed from the prefetcher, not taken from the
+    loader, so intra-epoch checkpoints resume at the right batch.
+
+    Arguments
+    ---------
+    loader : iterable
+        A DataLoader or other iterable of batches.
+    device : str, torch.device
+        Device the batches are moved to.
+    num_prefetch : int
+        Number of batches prepared ahead.
+
+    Example
+    -------
+    >>> dataset = DynamicItemDataset(
+    ...     {f"ex{i}": {"foo": torch.ones(i + 1)} for i in range(5)}
+    ... )
+    >>> dataset.set_output_keys(["foo"])
+    >>> loader = SaveableDataLoader(
+    ...     dataset, batch_size=2, collate_fn=PaddedBatch
+    ... )
+    >>> prefetcher = PrefetchLoader(loader, "cpu")
+    >>> [batch.foo.data.shape for batch in prefetcher]
+    [torch.Size([2, 2]), torch.Size([2, 4]), torch.Size([1, 5])]
+    """
+
+    def __init__(self, loader, device, num_prefetch=2):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        stream = None
+        if self.device.type == "cuda":
+            stream = torch.cuda.Stream(self.device)
+        iterator = iter(self.loader)
+        batches = queue.Queue(self.num_prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce,
+            args=(iterator, batches, stop, stream),
+            daemon=True,
+        )
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is _END_OF_LOADER:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                batch, event, position = item
+                if event is not None:
+                    compute_stream = torch.cuda.current_stream(self.device)
+                    compute_stream.wait_event(event)
+                    # the memory of the batch, allocated on the copy
+                    # stream, is not reused while the compute uses it
+                    _record_stream(batch, compute_stream)
+                if hasattr(self.loader, "_speechbrain_position"):
+                    self.loader._speechbrain_position = position
+                yield batch
+        finally:
+            stop.set()
+            # unblock the producer, waiting for a free slot
+            while producer.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(0.01)
+
+    def _produce(self, iterator, batches, stop, stream):
+        pin = stream is not None and not getattr(
+            self.loader, "pin_memory", False
+        )
+        try:
+            for batch in iterator:
+                position = _position(iterator)
+                event = None
+                if stream is not None:
+                    if pin:
+                        batch = _pin_memory(batch)
+                    with torch.cuda.stream(stream):
+                        batch = _to_device(batch, self.device)
+                        event = stream.record_event()
+                if not self._put(batches, (batch, event, position), stop):
+                    return
+            self._put(batches, _END_OF_LOADER, stop)
+        except BaseException as e:
+            self._put(batches, e, stop)
+
+    @staticmethod
+    def _put(batches, item, stop):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+_END_OF_LOADER = object()
+
+
+def _position(iterator):
+    # after the batch just taken: number of batches of a DataLoader
+    # iterator, epoch and batches per worker of a StreamingDataLoader
+    if hasattr(iterator, "position"):
+        return iterator.position
+    return getattr(iterator, "_num_yielded", None)
+
+
+def _pin_memory(batch):
+    if hasattr(batch, "pin_memory"):
+        return batch.pin_memory()
+    return recursive_pin_memory(batch)
+
+
+def _to_device(batch, device):
+    if hasattr(batch, "to"):
+        return batch.to(device, non_blocking=True)
+    return recursive_to(batch, device, non_blocking=True)
+
+
+def _record_stream(data, stream):
+    if isinstance(data, torch.Tensor):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, collections.abc.Mapping):
+        for value in data.values():
+            _record_stream(value, stream)
+    elif isinstance(data, (PaddedBatch, tuple, list)):
+        for value in data:
+            _record_stream(value, stream)
@@ -11,6 +11,12 @@ from types import MethodType
 from torch.utils.data import Dataset
 from speechbrain.utils.data_pipeline import DataPipeline
 from speechbrain.dataio.dataio import load_data_json, load_data_csv
+from speechbrain.dataio.audio_archive import use_audio_archive
+from speechbrain.dataio.manifest import (
+    ManifestIds,
+    filtered_sorted_rows,
+    load_data_manifest,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -147,7 +153,11 @@ class DynamicItemDataset(Dataset):
         self, data, dynamic_items=[], output_keys=[],
     ):
         self.data = data
-        self.data_ids = list(self.data.keys())
+        data_ids = self.data.keys()
+        # a manifest gives lazy ids (row indices), kept as they are
+        if not isinstance(data_ids, ManifestIds):
+            data_ids = list(data_ids)
+        self.data_ids = data_ids
         static_keys = list(self.data[self.data_ids[0]].keys())
         if "id" in static_keys:
             raise ValueError("The key 'id' is reserved for the data point id.")
@@ -160,8 +170,12 @@ class DynamicItemDataset(Dataset):
         return len(self.data_ids)
 
     def __getitem__(self, index):
-        data_id = self.data_ids[index]
-        data_point = self.data[data_id]
+        if isinstance(self.data_ids, ManifestIds):
+            # by row index, without the id lookup
+            data_id, data_point = self.data_ids.data_point(index)
+        else:
+            data_id = self.data_ids[index]
+            data_point = self.data[data_id]
         return self.pipeline.compute_outputs({"id": data_id, **data_point})
 
     def add_dynamic_item(self, func, takes=None, provides=None):
@@ -298,6 +312,20 @@ class DynamicItemDataset(Dataset):
         select_n=None,
     ):
         """Returns a list of data ids, fulfilling the sorting and filtering."""
+        if isinstance(self.data_ids, ManifestIds):
+            # static numeric keys of a manifest: array ops on the rows
+            rows = filtered_sorted_rows(
+                self.data,
+                self.data_ids.rows,
+                key_min_value,
+                key_max_value,
+                key_test,
+                sort_key,
+                reverse,
+                select_n,
+            )
+            if rows is not None:
+                return ManifestIds(self.data, rows)
 
         def combined_filter(computed):
             """Applies filter."""
@@ -327,10 +355,15 @@ class DynamicItemDataset(Dataset):
         )
         filtered_ids = []
         with self.output_keys_as(temp_keys):
-            for i, data_id in enumerate(self.data_ids):
+            if isinstance(self.data_ids, ManifestIds):
+                data_points = self.data_ids.data_points()
+            else:
+                data_points = (
+                    (data_id, self.data[data_id]) for data_id in self.data_ids
+                )
+            for i, (data_id, data_point) in enumerate(data_points):
                 if select_n is not None and len(filtered_ids) == select_n:
                     break
-                data_point = self.data[data_id]
                 data_point["id"] = data_id
                 computed = self.pipeline.compute_outputs(data_point)
                 if combined_filter(computed):
@@ -359,10 +392,37 @@ class DynamicItemDataset(Dataset):
 
     @classmethod
     def from_csv(
-        cls, csv_path, replacements={}, dynamic_items=[], output_keys=[]
+        cls,
+        csv_path,
+        replacements={},
+        dynamic_items=[],
+        output_keys=[],
+        audio_archive=None,
+        wav_key="wav",
     ):
-        """Load a data prep CSV file and create a Dataset based on it."""
+        """Load a data prep CSV file and create a Dataset based on it.
+
+        With audio_archive (directory of a speechbrain.dataio.audio_archive),
+        the wav_key paths of the utterances in the archive are replaced by
+        references to the archive, so read_audio reads them from its shards.
+        """
         data = load_data_csv(csv_path, replacements)
+        if audio_archive is not None:
+            data = use_audio_archive(data, audio_archive, wav_key)
+        return cls(data, dynamic_items, output_keys)
+
+    @classmethod
+    def from_manifest(
+        cls, manifest_path, replacements={}, dynamic_items=[], output_keys=[]
+    ):
+        """Open a columnar manifest (or a CSV, converted once to a manifest)
+        and create a Dataset based on it.
+
+        The data points are the same as with from_csv, but are decoded on
+        access, and filtering/sorting on "duration" are array operations.
+        See speechbrain.dataio.manifest.
+        """
+        data = load_data_manifest(manifest_path, replacements)
         return cls(data, dynamic_items, output_keys)
 
     @classmethod
@@ -400,7 +460,23 @@ class FilteredSortedDynamicItemDataset(DynamicItemDataset):
 
     @classmethod
     def from_csv(
-        cls, csv_path, replacements={}, dynamic_items=None, output_keys=None
+        cls,
+        csv_path,
+        replacements={},
+        dynamic_items=None,
+        output_keys=None,
+        audio_archive=None,
+        wav_key="wav",
+    ):
+        raise TypeError("Cannot create SubsetDynamicItemDataset directly!")
+
+    @classmethod
+    def from_manifest(
+        cls,
+        manifest_path,
+        replacements={},
+        dynamic_items=None,
+        output_keys=None,
     ):
         raise TypeError("Cannot create SubsetDynamicItemDataset directly!")
 
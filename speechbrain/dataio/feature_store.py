@@ -0,0 +1,224 @@
+"""Memory-mapped store of precomputed features
+
+With a frozen encoder (e.g. a frozen wav2vec2), the encoder output of an
+utterance is the same at every epoch. The store keeps these outputs on disk,
+keyed by utterance id, in one directory per encoder (model hash), so the
+training pipeline can serve them instead of the audio.
+"""
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import torch
+from speechbrain.dataio.audio_archive import _locked
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "features.bin"
+INDEX_FILE = "index.json"
+LOCK_FILE = "lock"
+
+
+def model_hash(module, extra=""):
+    """Hash of the parameters and buffers of a module.
+
+    Two modules with the same hash compute the same features, the hash is
+    used as the key of the store directory.
+
+    Arguments
+    ---------
+    module : torch.nn.Module
+        The (frozen) encoder.
+    extra : str
+        Configuration not held in the state_dict (e.g. output_norm).
+
+    Returns
+    -------
+    str
+        Hex digest (16 characters).
+
+    Example
+    -------
+    >>> lin = torch.nn.Linear(4, 2)
+    >>> model_hash(lin) == model_hash(lin)
+    True
+    >>> model_hash(lin) == model_hash(lin, extra="output_norm")
+    False
+    """
+    digest = hashlib.sha1()
+    digest.update(type(module).__name__.encode())
+    digest.update(extra.encode())
+    for name, tensor in module.state_dict().items():
+        digest.update(name.encode())
+        digest.update(str(tuple(tensor.shape)).encode())
+        digest.update(str(tensor.dtype).encode())
+        data = tensor.detach().cpu().contiguous().view(-1).view(torch.uint8)
+        digest.update(data.numpy())
+    return digest.hexdigest()[:16]
+
+
+class FeatureStore:
+    """Append-only, memory-mapped store of (time, feature) arrays.
+
+    The features are appended to one flat binary file, the index maps each
+    utterance id to its rows. Reads go through a read-only np.memmap opened
+    lazily in each process (so DataLoader workers share the page cache).
+
+    Arguments
+    ---------
+    store_dir : str
+        Root directory of the store.
+    key : str
+        Subdirectory of the features (e.g. model_hash of the encoder).
+    dtype : str
+        Storage dtype of the features.
+
+    Example
+    -------
+    >>> tmpdir = getfixture('tmpdir')
+    >>> store = FeatureStore(tmpdir, "encoder")
+    >>> store.add("utt1", torch.ones(3, 2))
+    >>> store.add("utt2", torch.zeros(5, 2))
+    >>> store.save()
+    >>> store = FeatureStore(tmpdir, "encoder")
+    >>> "utt1" in store, len(store)
+    (True, 2)
+    >>> store["utt2"].shape
+    torch.Size([5, 2])
+    """
+
+    def __init__(self, store_dir, key, dtype="float32"):
+        self.path = os.path.join(store_dir, key)
+        self.dtype = np.dtype(dtype)
+        self.load()
+
+    def load(self):
+        """(Re)loads the index, e.g. after another process added features."""
+        self.index = {}
+        self.feat_dim = None
+        index_file = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file) as fin:
+                meta = json.load(fin)
+            self.index = meta["index"]
+            self.feat_dim = meta["feat_dim"]
+            self.dtype = np.dtype(meta["dtype"])
+        self._num_rows = sum(rows for _, rows in self.index.values())
+        self._memmap = None
+
+    def _drop_unsaved(self):
+        # drop the features appended after the last save (interrupted run)
+        data_file = os.path.join(self.path, DATA_FILE)
+        if os.path.exists(data_file):
+            num_bytes = self._num_rows * (self.feat_dim or 0)
+            num_bytes *= self.dtype.itemsize
+            if os.path.getsize(data_file) > num_bytes:
+                os.truncate(data_file, num_bytes)
+
+    def save(self):
+        """Writes the index, the features added so far become readable."""
+        meta = {
+            "feat_dim": self.feat_dim,
+            "dtype": self.dtype.name,
+            "index": self.index,
+        }
+        tmp_file = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_file, "w") as fout:
+            json.dump(meta, fout)
+        os.replace(tmp_file, os.path.join(self.path, INDEX_FILE))
+        self._memmap = None
+
+    def add(self, utt_id, feats):
+        """Appends the (time, feature) array of an utterance.
+
+        Arguments
+        ---------
+        utt_id : str
+            Utterance id.
+        feats : torch.Tensor
+            Features of the utterance, shape (time, feature).
+        """
+        feats = feats.detach().cpu().numpy().astype(self.dtype, copy=False)
+        if self.feat_dim is None:
+            self.feat_dim = feats.shape[1]
+        elif feats.shape[1] != self.feat_dim:
+            raise ValueError(
+                f"Expected features of dim {self.feat_dim}, got {feats.shape}"
+            )
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, DATA_FILE), "ab") as fout:
+            fout.write(np.ascontiguousarray(feats).tobytes())
+        self.index[utt_id] = [self._num_rows, feats.shape[0]]
+        self._num_rows += feats.shape[0]
+
+    def __contains__(self, utt_id):
+        return utt_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, utt_id):
+        offset, rows = self.index[utt_id]
+        if self._memmap is None or offset + rows > len(self._memmap):
+            self._memmap = np.memmap(
+                os.path.join(self.path, DATA_FILE),
+                dtype=self.dtype,
+                mode="r",
+                shape=(self._num_rows, self.feat_dim),
+            )
+        # copy: the memmap is read-only and shared between the workers
+        return torch.from_numpy(np.array(self._memmap[offset : offset + rows]))
+
+    def __getstate__(self):
+        # memmaps are reopened in each worker process
+        state = self.__dict__.copy()
+        state["_memmap"] = None
+        return state
+
+
+def precompute_features(
+    store, encoder, dataset, device="cpu", input_key="sig", save_every=500
+):
+    """Runs the encoder on every utterance of dataset not yet in store.
+
+    Each utterance is encoded alone (no padding), the features are thus the
+    same as those of an unpadded forward pass.
+
+    Arguments
+    ---------
+    store : FeatureStore
+        Where to add the features.
+    encoder : torch.nn.Module
+        The frozen encoder, called as encoder(wav) with wav (1, time).
+    dataset : DynamicItemDataset
+        Dataset providing "id" and input_key.
+    device : str
+        Device of the encoder.
+    input_key : str
+        Key of the encoder input in dataset.
+    save_every : int
+        The index is saved every save_every new utterances, so an
+        interrupted run keeps the features computed so far.
+    """
+    was_training = encoder.training
+    encoder.eval()
+    added = 0
+    # one writer at a time (e.g. folds running concurrently on one store)
+    os.makedirs(store.path, exist_ok=True)
+    with _locked(os.path.join(store.path, LOCK_FILE)):
+        store.load()
+        store._drop_unsaved()
+        with dataset.output_keys_as(["id", input_key]), torch.no_grad():
+            for data_point in dataset:
+                utt_id = data_point["id"]
+                if utt_id in store:
+                    continue
+                wav = data_point[input_key].unsqueeze(0).to(device)
+                store.add(utt_id, encoder(wav).squeeze(0))
+                added += 1
+                if added % save_every == 0:
+                    store.save()
+        store.save()
+    encoder.train(was_training)
+    logger.info(f"Feature store {store.path}: {added} utterances added")
@@ -0,0 +1,287 @@
+"""Persistent cache of dynamic item outputs
+
+Deterministic dynamic items (e.g. tokenization of the transcript) compute
+the same outputs for a data point at every epoch. An ItemCache keeps these
+outputs: in RAM (LRU, per process) and on disk, in append-only segment
+files read through mmap. Items are marked as cached with
+speechbrain.utils.data_pipeline.cached.
+
+Each writing process (e.g. each DataLoader worker) appends to its own
+segment, so no locking is needed. A process reads the indexes of all the
+segments when it starts using the cache (e.g. each DataLoader worker), and
+reads what the others appended since before computing a missing value, so
+an item is computed once, not once per worker and epoch. The segments are
+merged (without the duplicates) into one when the cache is opened.
+"""
+import os
+import mmap
+import time
+import uuid
+import pickle
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".bin"
+INDEX_SUFFIX = ".idx"
+COMPACT_LOCK = "compact.lock"
+_MISSING = object()
+
+
+def _code_fingerprint(code, digest):
+    # bytecode and constants, recursing into nested functions (the repr of
+    # code objects contains their address)
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _code_fingerprint(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+
+class ItemCache:
+    """Two-tier (RAM LRU + disk) cache of dynamic item outputs.
+
+    Values are keyed by the data point id plus a hash of the function (its
+    bytecode), of version, and of the function inputs. The state a function
+    uses without taking it as input (e.g. a tokenizer in a closure) is not
+    hashed: put its identity in version.
+
+    Values served from the cache are shared, they must not be modified in
+    place.
+
+    Arguments
+    ---------
+    cache_dir : str
+        Directory of the segment files.
+    version : str
+        Identity of the state used by the cached functions.
+    max_ram_items : int
+        Number of values kept in RAM (least recently used are evicted).
+    refresh_interval : float
+        Minimum time (in seconds) between two reads of the segments written
+        by the other processes, on cache misses.
+    compact : bool
+        Whether to merge the segments into one when the cache is opened.
+        No other process should be writing to the cache then.
+
+    Example
+    -------
+    >>> cache = ItemCache(getfixture('tmpdir'), max_ram_items=1)
+    >>> calls = []
+    >>> def double(x):
+    ...     calls.append(x)
+    ...     return 2 * x
+    >>> key = cache.make_key(double, (3,), "utt1")
+    >>> cache.get_or_compute(key, lambda: double(3))
+    6
+    >>> cache.get_or_compute(key, lambda: double(3))
+    6
+    >>> calls
+    [3]
+    >>> cache = ItemCache(getfixture('tmpdir'))  # e.g. the next epoch
+    >>> cache.get_or_compute(key, lambda: double(3)), calls
+    (6, [3])
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        version="",
+        max_ram_items=100000,
+        refresh_interval=1.0,
+        compact=True,
+    ):
+        self.path = cache_dir
+        self.version = version
+        self.max_ram_items = max_ram_items
+        self.refresh_interval = refresh_interval
+        self._fingerprints = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        if compact:
+            self.compact()
+        self.reload()
+
+    def reload(self):
+        """Reads the indexes of all the segments, from scratch."""
+        self.index = {}
+        self._index_sizes = {}
+        self.ram = OrderedDict()
+        self._maps = {}
+        self._writer = None
+        self._pid = os.getpid()
+        self.refresh()
+
+    def refresh(self):
+        """Reads what was appended to the indexes of the segments since the
+        last read (e.g. by other processes). The keys already indexed keep
+        their entry."""
+        self._last_refresh = time.monotonic()
+        for filename in os.listdir(self.path):
+            if filename.endswith(INDEX_SUFFIX):
+                segment = filename[: -len(INDEX_SUFFIX)]
+                self._read_index(segment)
+
+    def _read_index(self, segment):
+        size = self._index_sizes.get(segment, 0)
+        try:
+            with open(os.path.join(self.path, segment + INDEX_SUFFIX)) as fin:
+                fin.seek(size)
+                lines = fin.read()
+        except FileNotFoundError:  # compacted meanwhile
+            return
+        # an interrupted (or ongoing) write leaves a partial last line
+        lines = lines[: lines.rfind("\n") + 1]
+        self._index_sizes[segment] = size + len(lines.encode())
+        for line in lines.splitlines():
+            fields = line.split("\t")
+            if len(fields) != 3:
+                continue
+            key, offset, length = fields
+            if key not in self.index:
+                self.index[key] = (segment, int(offset), int(length))
+
+    def make_key(self, func, args, data_id=None):
+        """Key of the output of func(*args) for data point data_id."""
+        if func not in self._fingerprints:
+            digest = hashlib.sha1(self.version.encode())
+            digest.update(getattr(func, "__qualname__", "").encode())
+            code = getattr(func, "__code__", None)
+            if code is not None:
+                _code_fingerprint(code, digest)
+            self._fingerprints[func] = digest.digest()
+        digest = hashlib.sha1(self._fingerprints[func])
+        digest.update(pickle.dumps(args, protocol=pickle.HIGHEST_PROTOCOL))
+        if data_id is None:
+            return digest.hexdigest()
+        return f"{data_id}/{digest.hexdigest()}"
+
+    def get_or_compute(self, key, compute):
+        """Cached value of key, computed with compute() and stored if missing.
+        """
+        self._check_process()
+        if key in self.ram:
+            self.ram.move_to_end(key)
+            return self.ram[key]
+        if (
+            key not in self.index
+            and time.monotonic() - self._last_refresh >= self.refresh_interval
+        ):
+            self.refresh()
+        value = self._load(key)
+        if value is _MISSING:
+            value = compute()
+            self._write(key, value)
+        self.ram[key] = value
+        if len(self.ram) > self.max_ram_items:
+            self.ram.popitem(last=False)
+        return value
+
+    def _check_process(self):
+        # a new process (e.g. DataLoader worker): the parent's files are not
+        # reused, and the index is read again from disk
+        if os.getpid() != self._pid:
+            self.reload()
+
+    def _load(self, key):
+        # the stored value, _MISSING if not stored
+        if key not in self.index:
+            return _MISSING
+        try:
+            data = self._read(*self.index[key])
+        except FileNotFoundError:
+            # the segment was compacted away: its entries moved
+            self.reload()
+            if key not in self.index:
+                return _MISSING
+            data = self._read(*self.index[key])
+        return pickle.loads(data)
+
+    def _read(self, segment, offset, length):
+        segment_map = self._maps.get(segment)
+        if segment_map is None or offset + length > len(segment_map):
+            with open(os.path.join(self.path, segment + SEGMENT_SUFFIX)) as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map[offset : offset + length]
+
+    def _write(self, key, value):
+        if key in self.index:
+            return
+        if self._writer is None:
+            segment = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+            self._writer = (
+                segment,
+                open(os.path.join(self.path, segment + SEGMENT_SUFFIX), "ab"),
+                open(os.path.join(self.path, segment + INDEX_SUFFIX), "a"),
+            )
+        segment, data_file, index_file = self._writer
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = data_file.tell()
+        data_file.write(data)
+        data_file.flush()
+        # the index line is written once the data is in the file
+        index_file.write(f"{key}\t{offset}\t{len(data)}\n")
+        index_file.flush()
+        self.index[key] = (segment, offset, len(data))
+
+    def compact(self):
+        """Merges all the segments into one, without the duplicate keys
+        (e.g. computed by two workers before they saw each other's
+        segments). Skipped if another process is compacting the cache."""
+        lock = os.path.join(self.path, COMPACT_LOCK)
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return
+        try:
+            self.reload()
+            segments = set(self._index_sizes)
+            if len(segments) <= 1:
+                return
+            segment = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            path = os.path.join(self.path, segment)
+            index_lines = []
+            with open(path + SEGMENT_SUFFIX, "wb") as data_file:
+                for key, entry in self.index.items():
+                    data = self._read(*entry)
+                    index_lines.append(
+                        f"{key}\t{data_file.tell()}\t{len(data)}\n"
+                    )
+                    data_file.write(data)
+            # the index appears once the data is in the file
+            with open(path + INDEX_SUFFIX + ".tmp", "w") as index_file:
+                index_file.writelines(index_lines)
+            os.replace(path + INDEX_SUFFIX + ".tmp", path + INDEX_SUFFIX)
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps = {}
+            for old_segment in segments:
+                for suffix in (INDEX_SUFFIX, SEGMENT_SUFFIX):
+                    old_path = os.path.join(self.path, old_segment + suffix)
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+            logger.info(
+                f"Compacted {len(segments)} item cache segments "
+                f"({len(self.index)} items)"
+            )
+        finally:
+            os.remove(lock)
+
+    def __getstate__(self):
+        # files and maps are reopened in each worker process
+        state = self.__dict__.copy()
+        state["index"] = {}
+        state["_index_sizes"] = {}
+        state["ram"] = OrderedDict()
+        state["_maps"] = {}
+        state["_writer"] = None
+        state["_fingerprints"] = {}
+        return state
+
+    def __deepcopy__(self, memo):
+        # datasets sharing a pipeline (filtered_sorted) share the cache
+        return self
@@ -0,0 +1,356 @@
+"""Columnar, memory-mapped manifests
+
+load_data_csv builds one dict per data point at start-up, and filtering and
+sorting then go through these dicts. For large datasets, a manifest stores
+the same CSV data column by column in .npy files opened with mmap: opening
+it reads a small JSON header, the data points are decoded on access, and
+filtering/sorting by the numeric "duration" column are array operations.
+
+A manifest gives exactly the data points of load_data_csv (same keys, same
+values, $-replacements applied on access).
+"""
+import os
+import re
+import csv
+import json
+import logging
+import numpy as np
+from collections.abc import Mapping, Sequence
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "manifest.json"
+NUMERIC_COLUMNS = ["duration"]
+VARIABLE_FINDER = re.compile(r"\$([\w.]+)")
+
+
+def csv_to_manifest(csv_path, manifest_dir):
+    """Converts a SpeechBrain CSV (see load_data_csv) to a manifest.
+
+    String columns are stored as one buffer of UTF-8 bytes with row offsets,
+    "duration" as float64. The ids are also stored sorted (fixed-width
+    bytes) for the id -> row lookup. $-variables are kept unresolved.
+
+    Arguments
+    ---------
+    csv_path : str
+        Path to the CSV file (with an 'ID' field).
+    manifest_dir : str
+        Directory of the manifest.
+
+    Example
+    -------
+    >>> csv_spec = '''ID,duration,wav_path
+    ... utt1,1.45,$data_folder/utt1.wav
+    ... utt2,2.0,$data_folder/utt2.wav
+    ... '''
+    >>> tmpdir = getfixture("tmpdir")
+    >>> with open(tmpdir / "test.csv", "w") as fo:
+    ...     _ = fo.write(csv_spec)
+    >>> csv_to_manifest(tmpdir / "test.csv", tmpdir / "manifest")
+    >>> data = ColumnarManifest(tmpdir / "manifest", {"data_folder": "/home"})
+    >>> data["utt1"]
+    {'duration': 1.45, 'wav_path': '/home/utt1.wav'}
+    """
+    with open(csv_path, newline="") as csvfile:
+        reader = csv.reader(csvfile, skipinitialspace=True)
+        fieldnames = next(reader)
+        columns = [[] for _ in fieldnames]
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(fieldnames):
+                raise ValueError(
+                    f"Row with {len(row)} fields in {csv_path}, "
+                    f"expected {len(fieldnames)}: {row}"
+                )
+            for column, value in zip(columns, row):
+                column.append(value)
+    if "ID" not in fieldnames:
+        raise KeyError(
+            "CSV has to have an 'ID' field, with unique ids"
+            " for all data points"
+        )
+    columns = dict(zip(fieldnames, columns))
+    ids = columns.pop("ID")
+    if len(set(ids)) != len(ids):
+        seen = set()
+        for data_id in ids:
+            if data_id in seen:
+                raise ValueError(f"Duplicate id: {data_id}")
+            seen.add(data_id)
+
+    os.makedirs(manifest_dir, exist_ok=True)
+    variables = {}
+    for name, values in columns.items():
+        if name in NUMERIC_COLUMNS:
+            np.save(
+                os.path.join(manifest_dir, f"{name}.npy"),
+                np.array([float(v) for v in values], dtype=np.float64),
+            )
+        else:
+            _save_strings(manifest_dir, name, values)
+            variables[name] = sorted(
+                set(m for v in values for m in VARIABLE_FINDER.findall(v))
+            )
+    _save_strings(manifest_dir, "ID", ids)
+    encoded_ids = np.array([i.encode() for i in ids])
+    order = np.argsort(encoded_ids, kind="stable")
+    np.save(os.path.join(manifest_dir, "ID.sorted.npy"), encoded_ids[order])
+    np.save(os.path.join(manifest_dir, "ID.order.npy"), order)
+
+    meta = {
+        "num_rows": len(ids),
+        "columns": list(columns.keys()),
+        "variables": variables,
+    }
+    with open(os.path.join(manifest_dir, META_FILE), "w") as fout:
+        json.dump(meta, fout)
+
+
+def _save_strings(manifest_dir, name, values):
+    encoded = [v.encode() for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    np.save(os.path.join(manifest_dir, f"{name}.data.npy"), data)
+    np.save(os.path.join(manifest_dir, f"{name}.offsets.npy"), offsets)
+
+
+class StringColumn:
+    """Memory-mapped column of strings (UTF-8 buffer + row offsets)."""
+
+    def __init__(self, manifest_dir, name):
+        # plain views of the memmaps (np.memmap indexing is slow)
+        data = _load(manifest_dir, f"{name}.data.npy")
+        self.buffer = memoryview(data) if len(data) > 0 else b""
+        self.offsets = _load(manifest_dir, f"{name}.offsets.npy")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return str(self.buffer[start:end], "utf-8")
+
+
+def _load(manifest_dir, filename):
+    array = np.load(os.path.join(manifest_dir, filename), mmap_mode="r")
+    return array.view(np.ndarray)
+
+
+class ColumnarManifest(Mapping):
+    """Read-only mapping data id -> data point over a manifest.
+
+    Can be used as the data of DynamicItemDataset (see
+    DynamicItemDataset.from_manifest). Data points are decoded on access,
+    with the $-replacements applied as in load_data_csv.
+
+    Arguments
+    ---------
+    manifest_dir : str
+        Directory written by csv_to_manifest.
+    replacements : dict
+        (Optional dict), e.g., {"data_folder": "/home/speechbrain/data"}
+    """
+
+    def __init__(self, manifest_dir, replacements={}):
+        self.path = manifest_dir
+        self.replacements = replacements
+        with open(os.path.join(manifest_dir, META_FILE)) as fin:
+            meta = json.load(fin)
+        self.num_rows = meta["num_rows"]
+        self.column_names = meta["columns"]
+        self.variables = meta["variables"]
+        # fail at start-up, like load_data_csv, on missing replacements
+        for name, variables in self.variables.items():
+            missing = [v for v in variables if v not in replacements]
+            if missing:
+                raise KeyError(
+                    f"The column {name} requires replacements "
+                    f"{missing} which were not supplied."
+                )
+        self._open()
+
+    def _open(self):
+        self.ids = StringColumn(self.path, "ID")
+        self.sorted_ids = _load(self.path, "ID.sorted.npy")
+        self.id_order = _load(self.path, "ID.order.npy")
+        self.columns = {}
+        for name in self.column_names:
+            if name in NUMERIC_COLUMNS:
+                self.columns[name] = _load(self.path, f"{name}.npy")
+            else:
+                self.columns[name] = StringColumn(self.path, name)
+        # (name, column, kind) in CSV order, for row()
+        self._column_kinds = []
+        for name in self.column_names:
+            kind = "string"
+            if name in NUMERIC_COLUMNS:
+                kind = "numeric"
+            elif self.variables[name]:
+                kind = "variables"
+            self._column_kinds.append((name, self.columns[name], kind))
+
+    def __getstate__(self):
+        # memmaps are reopened in each worker process
+        state = self.__dict__.copy()
+        for key in [
+            "ids",
+            "sorted_ids",
+            "id_order",
+            "columns",
+            "_column_kinds",
+        ]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def row_of(self, data_id):
+        """Row index of a data id (KeyError if missing)."""
+        key = data_id.encode()
+        pos = np.searchsorted(self.sorted_ids, key)
+        if pos == len(self.sorted_ids) or self.sorted_ids[pos] != key:
+            raise KeyError(data_id)
+        return int(self.id_order[pos])
+
+    def row(self, row):
+        """Data point at a row index."""
+        data_point = {}
+        for name, column, kind in self._column_kinds:
+            value = column[row]
+            if kind == "numeric":
+                value = float(value)
+            elif kind == "variables" and "$" in value:
+                value = VARIABLE_FINDER.sub(self._replace, value)
+            data_point[name] = value
+        return data_point
+
+    def _replace(self, match):
+        return str(self.replacements[match[1]])
+
+    def __getitem__(self, data_id):
+        return self.row(self.row_of(data_id))
+
+    def __contains__(self, data_id):
+        try:
+            self.row_of(data_id)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return self.num_rows
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """Data ids, in CSV order (ManifestIds)."""
+        return ManifestIds(self, np.arange(self.num_rows))
+
+    def is_numeric(self, name):
+        """True for the array-backed (float) columns."""
+        return name in NUMERIC_COLUMNS and name in self.columns
+
+
+class ManifestIds(Sequence):
+    """Lazy sequence of the data ids of some rows of a manifest.
+
+    Used as data_ids of a DynamicItemDataset over a ColumnarManifest, so
+    that filtering and sorting can work on the row indices.
+    """
+
+    def __init__(self, manifest, rows):
+        self.manifest = manifest
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ManifestIds(self.manifest, self.rows[index])
+        return self.manifest.ids[self.rows[index]]
+
+    def data_point(self, index):
+        """(data id, data point) at index."""
+        row = self.rows[index]
+        return self.manifest.ids[row], self.manifest.row(row)
+
+    def data_points(self):
+        """Iterates over the (data id, data point) pairs."""
+        for row in self.rows:
+            yield self.manifest.ids[row], self.manifest.row(row)
+
+
+def load_data_manifest(manifest_path, replacements={}):
+    """Opens a manifest, converting a CSV first if given one.
+
+    The manifest of "<name>.csv" is "<name>.csv.manifest", (re)built when
+    older than the CSV.
+
+    Arguments
+    ---------
+    manifest_path : str
+        Manifest directory, or CSV file.
+    replacements : dict
+        (Optional dict), e.g., {"data_folder": "/home/speechbrain/data"}
+
+    Returns
+    -------
+    ColumnarManifest
+    """
+    manifest_path = str(manifest_path)
+    if manifest_path.endswith(".csv"):
+        csv_path = manifest_path
+        manifest_path = csv_path + ".manifest"
+        meta_file = os.path.join(manifest_path, META_FILE)
+        if not os.path.exists(meta_file) or os.path.getmtime(
+            meta_file
+        ) < os.path.getmtime(csv_path):
+            logger.info(f"Converting {csv_path} to {manifest_path}")
+            csv_to_manifest(csv_path, manifest_path)
+    return ColumnarManifest(manifest_path, replacements)
+
+
+def filtered_sorted_rows(
+    manifest,
+    rows,
+    key_min_value={},
+    key_max_value={},
+    key_test={},
+    sort_key=None,
+    reverse=False,
+    select_n=None,
+):
+    """Vectorized DynamicItemDataset._filtered_sorted_ids on manifest rows.
+
+    Only for numeric columns of the manifest and no key_test: returns None
+    otherwise (the caller then uses the data point path). The order is the
+    same as the data point path (stable sort, ties in reverse order when
+    reverse=True).
+    """
+    keys = set(key_min_value) | set(key_max_value)
+    if sort_key is not None:
+        keys.add(sort_key)
+    if key_test or not all(manifest.is_numeric(k) for k in keys):
+        return None
+    rows = np.asarray(rows)
+    keep = np.ones(len(rows), dtype=bool)
+    for key, limit in key_min_value.items():
+        keep &= manifest.columns[key][rows] >= limit
+    for key, limit in key_max_value.items():
+        keep &= manifest.columns[key][rows] <= limit
+    rows = rows[keep]
+    if select_n is not None:
+        rows = rows[:select_n]
+    if sort_key is not None:
+        order = np.argsort(manifest.columns[sort_key][rows], kind="stable")
+        if reverse:
+            order = order[::-1]
+        rows = rows[order]
+    return rows
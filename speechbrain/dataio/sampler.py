@@ -9,6 +9,8 @@ Authors:
   * Artem Ploujnikov 2021
   * Andreas Nautsch 2021
 """
+import json
+import time
 import torch
 import logging
 from operator import itemgetter
@@ -21,8 +23,10 @@ from torch.utils.data import (
 import numpy as np
 from typing import List
 from speechbrain.dataio.dataset import DynamicItemDataset
+from speechbrain.dataio.batch import PaddedBatch
 from collections import Counter
 from scipy.stats import lognorm
+from scipy.optimize import nnls
 
 logger = logging.getLogger(__name__)
 
@@ -702,6 +706,455 @@ class DynamicBatchSampler(Sampler):
         return len(self._batches)
 
 
+# Terms of the cost of one padded example, functions of the padded lengths
+# (shape (..., num_dims)): dimension 0 is the input length (e.g. frames or
+# seconds of audio), dimension 1 the output length (e.g. tokens).
+COST_TERMS = {
+    "frames": lambda lengths: lengths[..., 0],
+    "frames^2": lambda lengths: lengths[..., 0] ** 2,
+    "tokens": lambda lengths: lengths[..., 1],
+    "tokens^2": lambda lengths: lengths[..., 1] ** 2,
+    "frames*tokens": lambda lengths: lengths[..., 0] * lengths[..., 1],
+}
+
+
+class BatchCostModel:
+    """Predicted cost (step time or memory) of a padded batch.
+
+    The examples of a batch are padded to the longest one, so a batch costs
+    about batch_size times the cost of one example of the padded lengths:
+
+        cost = batch_size * sum_k(weight_k * term_k(padded lengths)) + bias
+
+    The terms follow the compute of the model: e.g. "frames" for the
+    convolutions and feed-forward layers, "frames^2" for the encoder
+    self-attention, "frames*tokens" for the decoder cross-attention. The
+    weights are fitted on the costs measured on a few batches (see
+    CostBatchSampler.calibrate), and can be saved for the next runs.
+
+    Arguments
+    ---------
+    terms : tuple
+        Names of COST_TERMS, or functions of the padded lengths.
+    weights : list
+        Weight of each term. By default, only the first term counts (for
+        "frames", the padded length, as in DynamicBatchSampler).
+    bias : float
+        Cost of a batch independent of its size.
+
+    Example
+    -------
+    >>> model = BatchCostModel(["frames", "frames^2"], weights=[1.0, 0.1])
+    >>> model.batch_cost(4, np.array([10.0]))
+    80.0
+    >>> samples = [
+    ...     (b, np.array([t]), b * (2 * t + 0.5 * t ** 2) + 1)
+    ...     for b in [1, 2, 8] for t in [5.0, 10.0, 20.0]
+    ... ]
+    >>> model.fit(samples)
+    >>> np.round(model.weights, 3).tolist(), round(model.bias, 3)
+    ([2.0, 0.5], 1.0)
+    """
+
+    def __init__(self, terms=("frames",), weights=None, bias=0.0):
+        self.terms = list(terms)
+        self._term_funcs = [
+            COST_TERMS[t] if isinstance(t, str) else t for t in self.terms
+        ]
+        if weights is None:
+            weights = [1.0] + [0.0] * (len(self.terms) - 1)
+        if len(weights) != len(self.terms):
+            raise ValueError(
+                f"Got {len(weights)} weights for {len(self.terms)} terms"
+            )
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+
+    def features(self, lengths):
+        """Terms of the padded lengths, shape (..., num_terms)."""
+        lengths = np.asarray(lengths, dtype=np.float64)
+        return np.stack([f(lengths) for f in self._term_funcs], axis=-1)
+
+    def batch_cost(self, batch_size, lengths):
+        """Predicted cost of batch_size examples padded to lengths."""
+        cost = batch_size * self.features(lengths) @ self.weights + self.bias
+        return float(cost) if np.ndim(cost) == 0 else cost
+
+    def fit(self, samples):
+        """Fits the weights (non-negative) on measured batch costs.
+
+        Arguments
+        ---------
+        samples : list
+            (batch_size, padded lengths, measured cost) of each batch.
+        """
+        batch_sizes = np.array([s[0] for s in samples], dtype=np.float64)
+        features = self.features(np.stack([s[1] for s in samples]))
+        costs = np.array([s[2] for s in samples], dtype=np.float64)
+        design = np.concatenate(
+            [batch_sizes[:, None] * features, np.ones((len(samples), 1))], 1
+        )
+        # relative errors: small and large batches count the same, and
+        # columns scaled to unit norm (the terms differ by orders of
+        # magnitude)
+        design = design / costs[:, None]
+        scale = np.linalg.norm(design, axis=0)
+        scale[scale == 0] = 1.0
+        solution, _ = nnls(design / scale, np.ones(len(samples)))
+        solution = solution / scale
+        self.weights, self.bias = solution[:-1], float(solution[-1])
+        errors = np.abs(design @ solution - 1)
+        logger.info(
+            "BatchCostModel: fitted {} on {} batches, mean relative error "
+            "{:.1f}%, max {:.1f}%".format(
+                dict(zip(map(str, self.terms), self.weights.round(6))),
+                len(samples),
+                errors.mean() * 100,
+                errors.max() * 100,
+            )
+        )
+
+    def save(self, path):
+        """Saves the terms (names only) and the weights as JSON."""
+        if not all(isinstance(t, str) for t in self.terms):
+            raise ValueError("Only named terms (COST_TERMS) can be saved")
+        with open(path, "w") as fout:
+            json.dump(
+                {
+                    "terms": self.terms,
+                    "weights": self.weights.tolist(),
+                    "bias": self.bias,
+                },
+                fout,
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model saved with save."""
+        with open(path) as fin:
+            return cls(**json.load(fin))
+
+
+class CostBatchSampler(Sampler):
+    """Dynamic batching by the predicted cost of the padded batches.
+
+    DynamicBatchSampler bounds the total length of a batch, but the step
+    time and memory of a model are not linear in the lengths (e.g. the
+    self-attention is quadratic in the input length, the decoder grows with
+    the transcript length): a length budget is then either too small for
+    the short examples or too large for the long ones. Here, the examples
+    are packed in batches as long as the predicted cost of the padded batch
+    (BatchCostModel) stays under the budget.
+
+    The examples are shuffled (with seed + epoch), sorted by length within
+    windows of sort_window examples (so that a batch has little padding),
+    packed, and the batches are permuted (batch_ordering). The batches only
+    depend on the seed, the epoch and the cost model: after a restart, a
+    SaveableDataLoader recovered from a checkpoint resumes at the same
+    batch (given the same cost model, e.g. loaded from the file saved by
+    the first run). The Brain class calls set_epoch at each epoch.
+
+    Arguments
+    ---------
+    dataset : torch.utils.data.Dataset
+        Pytorch Dataset from which elements will be sampled.
+    cost_model : BatchCostModel
+        Predicts the cost of a batch from its size and padded lengths.
+    max_batch_cost : float
+        Budget of a batch, in the unit of the cost model.
+    reference_batch_size : int
+        Instead of max_batch_cost, the budget is the predicted cost of
+        reference_batch_size examples padded to the longest lengths of the
+        dataset, i.e. the largest batch of a fixed batch size (known to
+        fit). The budget then follows the cost model when it is fitted.
+    length_func : callable
+        Lengths of an example of a DynamicItemDataset: a number, or a tuple
+        (e.g. (duration, number of tokens)) for the terms of the cost model.
+    lengths_list : list
+        Overrides length_func by passing the lengths of each example (e.g.
+        for a plain Pytorch Dataset).
+    shuffle : bool
+        Whether or not shuffle examples between each epoch.
+    sort_window : int
+        Number of examples sorted together, None for the whole dataset.
+    batch_ordering : string
+        If ``random``, batches are randomly permuted; otherwise
+        ``ascending`` or ``descending`` sorted by predicted cost.
+    max_batch_ex : int
+        If set, limits the number of examples in a batch.
+    seed : int
+        Base seed of the shuffling.
+    epoch : int
+        The epoch to start at.
+    drop_last : bool
+        If ``True``, the last (partial) batch of each window is dropped.
+
+    Example
+    -------
+    >>> from speechbrain.dataio.dataloader import SaveableDataLoader
+    >>> lengths = [np.random.randint(10, 100) for x in range(50)]
+    >>> dataset = DynamicItemDataset(
+    ...     {f"ex_{i}": {"wav": torch.randn(x)} for i, x in enumerate(lengths)}
+    ... )
+    >>> dataset.set_output_keys(["wav"])
+    >>> cost_model = BatchCostModel(["frames", "frames^2"], [1.0, 0.01])
+    >>> bsampler = CostBatchSampler(
+    ...     dataset, cost_model, max_batch_cost=500, lengths_list=lengths
+    ... )
+    >>> for batch in bsampler:
+    ...     padded = max(lengths[i] for i in batch)
+    ...     cost = cost_model.batch_cost(len(batch), np.array([padded]))
+    ...     assert cost <= 500 or len(batch) == 1
+    >>> batches = list(bsampler)
+    >>> bsampler.set_epoch(1)
+    >>> bsampler.set_epoch(0)
+    >>> assert list(bsampler) == batches
+    >>> dataloader = SaveableDataLoader(
+    ...     dataset, batch_sampler=bsampler, collate_fn=PaddedBatch
+    ... )
+    >>> len(dataloader) == len(batches)
+    True
+    """
+
+    def __init__(
+        self,
+        dataset,
+        cost_model,
+        max_batch_cost: float = None,
+        reference_batch_size: int = None,
+        length_func=lambda x: x["duration"],
+        lengths_list: List = None,
+        shuffle: bool = True,
+        sort_window: int = 1000,
+        batch_ordering: str = "random",
+        max_batch_ex: int = None,
+        seed: int = 42,
+        epoch: int = 0,
+        drop_last: bool = False,
+    ):
+        if (max_batch_cost is None) == (reference_batch_size is None):
+            raise ValueError(
+                "Specify either max_batch_cost or reference_batch_size"
+            )
+        if batch_ordering not in ["random", "ascending", "descending"]:
+            raise ValueError(f"Unknown batch_ordering: {batch_ordering}")
+        self._dataset = dataset
+        if lengths_list is None:
+            if not isinstance(dataset, DynamicItemDataset):
+                raise NotImplementedError(
+                    "Dataset should be a Speechbrain DynamicItemDataset when using length function"
+                )
+            ex_ids = dataset.data_ids
+            lengths_list = [
+                length_func(dataset.data[ex_ids[i]])
+                for i in range(len(dataset))
+            ]
+        lengths = np.asarray(lengths_list, dtype=np.float64)
+        # (num_examples, num_dims)
+        self._ex_lengths = lengths.reshape(len(lengths), -1)
+        self.cost_model = cost_model
+        self._max_batch_cost = max_batch_cost
+        self._reference_batch_size = reference_batch_size
+        self._shuffle_ex = shuffle
+        self._sort_window = sort_window
+        self._batch_ordering = batch_ordering
+        self._max_batch_ex = max_batch_ex or np.inf
+        self._seed = seed
+        self._epoch = epoch
+        self._drop_last = drop_last
+        self._generate_batches()
+
+    @property
+    def max_batch_cost(self):
+        """Budget of a batch, in the unit of the cost model."""
+        if self._max_batch_cost is not None:
+            return self._max_batch_cost
+        return self.cost_model.batch_cost(
+            self._reference_batch_size, self._ex_lengths.max(0)
+        )
+
+    def _generate_batches(self):
+        num_examples = len(self._ex_lengths)
+        if self._shuffle_ex:
+            # deterministically shuffle based on epoch and seed
+            g = torch.Generator()
+            g.manual_seed(self._seed + self._epoch)
+            order = torch.randperm(num_examples, generator=g).numpy()
+        else:
+            order = np.arange(num_examples)
+
+        budget = self.max_batch_cost
+        window = self._sort_window or num_examples
+        self._batches = []
+        for start in range(0, num_examples, window):
+            indices = order[start : start + window]
+            # by the first length (the other ones break ties)
+            indices = indices[np.lexsort(self._ex_lengths[indices].T[::-1])]
+            self._pack(indices, budget)
+
+        self._batch_costs = [
+            self.cost_model.batch_cost(
+                len(batch), self._ex_lengths[batch].max(0)
+            )
+            for batch in self._batches
+        ]
+        self._permute_batches()
+
+        if self._epoch == 0:  # only log at first epoch
+            padded = sum(
+                len(b) * self._ex_lengths[b, 0].max() for b in self._batches
+            )
+            logger.info(
+                "CostBatchSampler: {} batches of {:.1f} examples on average, "
+                "predicted cost {:.1f}% of the budget {:.4g}, padding "
+                "{:.1f}%".format(
+                    len(self._batches),
+                    num_examples / max(len(self._batches), 1),
+                    np.mean(self._batch_costs) / budget * 100,
+                    budget,
+                    (1 - self._ex_lengths[:, 0].sum() / max(padded, 1e-9))
+                    * 100,
+                )
+            )
+
+    def _pack(self, indices, budget):
+        # greedy: the batch is closed when the next example exceeds the
+        # budget (an example over the budget on its own is a batch)
+        batch = []
+        padded = None
+        for idx in indices:
+            lengths = self._ex_lengths[idx]
+            if batch:
+                new_padded = np.maximum(padded, lengths)
+                if (
+                    len(batch) >= self._max_batch_ex
+                    or self.cost_model.batch_cost(len(batch) + 1, new_padded)
+                    > budget
+                ):
+                    self._batches.append(batch)
+                    batch = []
+                    new_padded = lengths
+            else:
+                new_padded = lengths
+            batch.append(int(idx))
+            padded = new_padded
+        if batch and not self._drop_last:
+            self._batches.append(batch)
+
+    def _permute_batches(self):
+        if self._batch_ordering == "random":
+            # deterministically shuffle based on epoch and seed
+            g = torch.Generator()
+            g.manual_seed(self._seed + self._epoch)
+            order = torch.randperm(len(self._batches), generator=g).tolist()
+        else:
+            order = np.argsort(self._batch_costs, kind="stable").tolist()
+            if self._batch_ordering == "descending":
+                order = order[::-1]
+        self._batches = [self._batches[i] for i in order]
+        self._batch_costs = [self._batch_costs[i] for i in order]
+
+    def calibrate(
+        self,
+        step_fn,
+        batch_sizes=(1, 2, 4, 8),
+        quantiles=(0.1, 0.5, 0.9),
+        repeats=3,
+        measure="time",
+        collate_fn=PaddedBatch,
+    ):
+        """Fits the cost model on the costs measured on a few batches.
+
+        For each quantile of the lengths and each batch size, the examples
+        around that quantile are collated and step_fn(batch) is run; its
+        step time (seconds, median of repeats after a warm-up run) or its
+        peak GPU memory (bytes) is measured. The batches are then generated
+        again with the fitted model.
+
+        Arguments
+        ---------
+        step_fn : callable
+            Runs a training step on a batch, e.g. forward and backward
+            without the parameter update.
+        batch_sizes : tuple
+            Sizes of the measured batches.
+        quantiles : tuple
+            Quantiles of the lengths of the measured batches.
+        repeats : int
+            Number of timed runs of each batch.
+        measure : str
+            "time" or "memory" (CUDA only).
+        collate_fn : callable
+            Collates a list of examples of the dataset.
+
+        Returns
+        -------
+        list
+            The measured (batch_size, padded lengths, cost).
+        """
+        if measure not in ["time", "memory"]:
+            raise ValueError(f"Unknown measure: {measure}")
+        if measure == "memory" and not torch.cuda.is_available():
+            raise ValueError("Measuring the memory requires a CUDA device")
+        sorted_ids = np.lexsort(self._ex_lengths.T[::-1])
+        num_examples = len(sorted_ids)
+        samples = []
+        for quantile in quantiles:
+            center = int(quantile * (num_examples - 1))
+            for batch_size in batch_sizes:
+                batch_size = min(batch_size, num_examples)
+                start = min(
+                    max(0, center - batch_size // 2), num_examples - batch_size
+                )
+                indices = sorted_ids[start : start + batch_size]
+                batch = collate_fn([self._dataset[int(i)] for i in indices])
+                cost = _measure_step(step_fn, batch, repeats, measure)
+                samples.append(
+                    (batch_size, self._ex_lengths[indices].max(0), cost)
+                )
+        self.cost_model.fit(samples)
+        self._generate_batches()
+        return samples
+
+    def __iter__(self):
+        return iter(self._batches)
+
+    def set_epoch(self, epoch):
+        """
+        You can also just access self.epoch, but we maintain this interface
+        to mirror torch.utils.data.distributed.DistributedSampler
+        """
+        self._epoch = epoch
+        self._generate_batches()
+
+    def __len__(self):
+        return len(self._batches)
+
+
+def _measure_step(step_fn, batch, repeats, measure):
+    # CUDA kernels run asynchronously: synchronize around the step
+    cuda = torch.cuda.is_available()
+    if measure == "memory":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        allocated = torch.cuda.memory_allocated()
+        step_fn(batch)
+        torch.cuda.synchronize()
+        return float(torch.cuda.max_memory_allocated() - allocated)
+    # warm-up (allocator, cudnn benchmark)
+    step_fn(batch)
+    times = []
+    for _ in range(repeats):
+        if cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        step_fn(batch)
+        if cuda:
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
 # Heavily inspired by Catalyst, which is under Apache 2.0 licence.
 # https://github.com/catalyst-team/catalyst/blob/51428d7756e62b9b8ee5379f38e9fd576eeb36e5/catalyst/data/sampler.py#L522
 class DistributedSamplerWrapper(DistributedSampler):
@@ -0,0 +1,660 @@
+"""Streaming datasets of tar shards
+
+A DynamicItemDataset needs its data on a local, randomly accessible file
+system. A StreamingDataset reads the data points sequentially from tar
+shards (webdataset layout: the files of a data point share a key, e.g.
+"000000012.json" and "000000012.wav.npy"), from local files, URLs or the
+output of a command ("pipe:aws s3 cp s3://bucket/shard-000000.tar -"), so
+the data does not need to fit on the local disk.
+
+The data points are shuffled in a bounded buffer, go through the same
+dynamic items as a DynamicItemDataset (takes/provides), and are batched on
+the fly, with a fixed batch size or in length buckets as DynamicBatchSampler
+does. The StreamingDataLoader saves the position in the stream with the
+Checkpointer, so an interrupted epoch resumes at the next batch.
+
+Example
+-------
+>>> data = {
+...     f"utt{i}": {"wav": torch.rand(100 * (i + 1)), "duration": i + 1.0}
+...     for i in range(10)
+... }
+>>> shards = write_shards(data, getfixture("tmpdir"), maxcount=4)
+>>> dataset = StreamingDataset(shards, batch_size=3, shuffle_shards=False)
+>>> dataset.add_dynamic_item(lambda wav: wav.shape[0], "wav", "samples")
+>>> dataset.set_output_keys(["id", "samples"])
+>>> loader = StreamingDataLoader(dataset)
+>>> [batch.samples.tolist() for batch in loader]
+[[100, 200, 300], [400, 500, 600], [700, 800, 900], [1000]]
+"""
+import io
+import os
+import re
+import json
+import bisect
+import random
+import tarfile
+import logging
+import contextlib
+import subprocess
+import urllib.request
+import numpy as np
+import torch
+import torchaudio
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+from speechbrain.dataio.batch import PaddedBatch
+from speechbrain.dataio.dataio import read_audio
+from speechbrain.dataio.sampler import DynamicBatchSampler
+from speechbrain.utils.data_pipeline import DataPipeline
+from speechbrain.utils.checkpoints import (
+    register_checkpoint_hooks,
+    mark_as_saver,
+    mark_as_loader,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARD_LIST = "shards.json"
+SHARD_FILE = "shard-{:06d}.tar"
+BRACES = re.compile(r"\{(\d+)\.\.(\d+)\}")
+AUDIO_SUFFIXES = ["wav", "flac", "ogg", "mp3"]
+TEXT_SUFFIXES = ["txt", "text", "wrd"]
+
+
+def write_shards(data, shard_dir, audio_key="wav", maxcount=1000, seed=None):
+    """Writes data points and their audio to tar shards.
+
+    Each data point is stored as "<key>.json" (the id and the other fields)
+    and "<key>.<audio_key>.npy" (the audio as read by read_audio), where key
+    is the position of the data point. The shard list is written last (see
+    expand_shards), a shard directory without it is incomplete.
+
+    Arguments
+    ---------
+    data : dict
+        Data as loaded by load_data_csv / load_data_json, keyed by id.
+    shard_dir : str
+        Directory of the shards.
+    audio_key : str
+        Field of the audio (anything read_audio reads).
+    maxcount : int
+        Number of data points per shard.
+    seed : int, None
+        If given, the data points are written in a random order (the
+        StreamingDataset only shuffles within its buffer).
+
+    Returns
+    -------
+    list
+        Paths of the shards.
+    """
+    data_ids = list(data.keys())
+    if seed is not None:
+        random.Random(seed).shuffle(data_ids)
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    tar = None
+    for index, data_id in enumerate(data_ids):
+        if index % maxcount == 0:
+            if tar is not None:
+                _close_shard(tar, shards[-1])
+            shards.append(
+                os.path.join(shard_dir, SHARD_FILE.format(len(shards)))
+            )
+            tar = tarfile.open(shards[-1] + ".tmp", "w")
+        data_point = data[data_id]
+        metadata = {"id": data_id}
+        metadata.update(
+            (key, value)
+            for key, value in data_point.items()
+            if key != audio_key
+        )
+        audio = io.BytesIO()
+        np.save(audio, read_audio(data_point[audio_key]).numpy())
+        key = f"{index:09d}"
+        _add_member(tar, f"{key}.json", json.dumps(metadata).encode())
+        _add_member(tar, f"{key}.{audio_key}.npy", audio.getvalue())
+    if tar is not None:
+        _close_shard(tar, shards[-1])
+    with open(os.path.join(shard_dir, SHARD_LIST), "w") as fout:
+        json.dump([os.path.basename(shard) for shard in shards], fout)
+    return shards
+
+
+def _add_member(tar, name, value):
+    info = tarfile.TarInfo(name)
+    info.size = len(value)
+    tar.addfile(info, io.BytesIO(value))
+
+
+def _close_shard(tar, path):
+    tar.close()
+    os.replace(path + ".tmp", path)
+
+
+def expand_shards(shards):
+    """Expands the shard specifications to a list of shards.
+
+    A specification is a path, URL or "pipe:<command>" with optional
+    "{first..last}" ranges (as in webdataset), or the directory of
+    write_shards.
+
+    Example
+    -------
+    >>> expand_shards("s3/shard-{00..02}.tar")
+    ['s3/shard-00.tar', 's3/shard-01.tar', 's3/shard-02.tar']
+    """
+    if isinstance(shards, str):
+        shards = [shards]
+    expanded = []
+    for spec in shards:
+        spec = str(spec)
+        match = BRACES.search(spec)
+        if match is not None:
+            first, last = match.groups()
+            for i in range(int(first), int(last) + 1):
+                expanded.extend(
+                    expand_shards(
+                        spec[: match.start()]
+                        + str(i).zfill(len(first))
+                        + spec[match.end() :]
+                    )
+                )
+        elif os.path.isdir(spec):
+            with open(os.path.join(spec, SHARD_LIST)) as fin:
+                expanded.extend(
+                    os.path.join(spec, name) for name in json.load(fin)
+                )
+        else:
+            expanded.append(spec)
+    return expanded
+
+
+@contextlib.contextmanager
+def open_shard(url):
+    """Opens a shard as a stream: path, URL, or "pipe:<command>"."""
+    if url.startswith("pipe:"):
+        process = subprocess.Popen(url[5:], shell=True, stdout=subprocess.PIPE)
+        try:
+            yield process.stdout
+            # rest of the stream (tar padding), so that the command ends
+            while process.stdout.read(2 ** 16):
+                pass
+        except BaseException:
+            # stopped early, the command may fail on the broken pipe
+            process.stdout.close()
+            process.wait()
+            raise
+        process.stdout.close()
+        status = process.wait()
+        if status != 0:
+            raise IOError(f"Command of {url} failed with status {status}")
+    elif re.match(r"^[a-z0-9]+://", url):
+        with urllib.request.urlopen(url) as stream:
+            yield stream
+    else:
+        with open(url, "rb") as stream:
+            yield stream
+
+
+def read_shard(url):
+    """Yields the samples of a shard: dicts of the file contents by field.
+
+    The files of a sample are consecutive in the shard, the field is the
+    file name after the key ("<key>.<field>"); "__key__" is the key.
+    """
+    with open_shard(url) as stream:
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            sample = None
+            for member in tar:
+                if not member.isfile():
+                    continue
+                dirname, _, basename = member.name.rpartition("/")
+                key, _, field = basename.partition(".")
+                key = f"{dirname}/{key}" if dirname else key
+                if sample is None or sample["__key__"] != key:
+                    if sample is not None:
+                        yield sample
+                    sample = {"__key__": key}
+                sample[field] = tar.extractfile(member).read()
+            if sample is not None:
+                yield sample
+
+
+def _field_name(field):
+    # "wav.npy" -> "wav" (decoded by suffix), "flac" -> "flac"
+    name, _, suffix = field.rpartition(".")
+    return name or suffix
+
+
+def decode_field(field, value):
+    """Decodes the content of a file of a sample, by its suffix.
+
+    .npy files are loaded as tensors, audio files as read_audio does, text
+    files as str; other suffixes are kept as bytes.
+    """
+    suffix = field.rpartition(".")[2]
+    if suffix == "npy":
+        return torch.from_numpy(np.load(io.BytesIO(value)))
+    if suffix in AUDIO_SUFFIXES:
+        audio, _ = torchaudio.load(io.BytesIO(value))
+        return audio.transpose(0, 1).squeeze(1)
+    if suffix in TEXT_SUFFIXES:
+        return value.decode("utf-8")
+    return value
+
+
+def _split_sample(sample):
+    # metadata now (used for the batching), the other files decoded
+    # when their batch is used
+    data_point = {"id": sample["__key__"]}
+    encoded = {}
+    for field, value in sample.items():
+        if field == "json":
+            data_point.update(json.loads(value))
+        elif field != "__key__":
+            encoded[field] = value
+    return data_point, encoded
+
+
+def _rank_and_world_size():
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return 0, 1
+
+
+def _worker_and_num_workers():
+    info = get_worker_info()
+    if info is None:
+        return 0, 1
+    return info.id, info.num_workers
+
+
+class StreamingDataset(IterableDataset):
+    """Dataset of batches read sequentially from tar shards.
+
+    The shards are split between the processes (DDP) and the DataLoader
+    workers; each reads its shards in turn, shuffles the data points in a
+    buffer of shuffle_buffer data points, and batches them. The shard order
+    and the buffer are seeded by seed and the epoch, so the stream of
+    batches of a worker is the same when an epoch is read again (see
+    StreamingDataLoader, which resumes an epoch).
+
+    The data points are the "json" files of the samples (with "id"), plus
+    their other files decoded (see decode_field), available to the dynamic
+    items as e.g. "wav" for "<key>.wav.npy" or "<key>.wav".
+
+    Batching is either by batch_size, or by length like DynamicBatchSampler
+    when max_batch_length is given: a data point goes to the bucket of its
+    length (length_func), and a bucket is emitted when it holds
+    max_batch_length // bucket boundary data points (at most max_batch_ex).
+
+    NOTE
+    ----
+    The number of batches of each process depends on its shards: with DDP,
+    use shards of equal sizes, in a multiple of the number of processes, or
+    a LoopedLoader with a nominal epoch length.
+
+    Arguments
+    ---------
+    shards : str, list
+        Shard specifications, see expand_shards.
+    dynamic_items : list
+        Configuration for the dynamic items produced when fetching an example,
+        as for DynamicItemDataset.
+    output_keys : dict, list
+        List of keys (or a mapping) in the data points of the batches.
+    batch_size : int
+        Number of data points per batch (when max_batch_length is None).
+    max_batch_length : float, None
+        Maximum padded length of a batch, in the units of length_func.
+    num_buckets : int
+        Number of length buckets (if bucket_boundaries is not given).
+    bucket_boundaries : list
+        Upper length of each bucket, ascending.
+    length_func : callable
+        Length of a data point (its json metadata).
+    max_batch_ex : int, None
+        Maximum number of data points in a batch.
+    shuffle_buffer : int
+        Number of data points shuffled together (0 to keep the order).
+    shuffle_shards : bool
+        Whether to shuffle the order of the shards at each epoch.
+    collate_fn : callable
+        Makes a batch from the list of data points.
+    drop_last : bool
+        Whether to drop the incomplete batches at the end of the stream.
+    seed : int
+        Seed of the shuffling.
+    """
+
+    def __init__(
+        self,
+        shards,
+        dynamic_items=[],
+        output_keys=[],
+        batch_size=1,
+        max_batch_length=None,
+        num_buckets=None,
+        bucket_boundaries=[],
+        length_func=lambda x: x["duration"],
+        max_batch_ex=None,
+        shuffle_buffer=0,
+        shuffle_shards=True,
+        collate_fn=PaddedBatch,
+        drop_last=False,
+        seed=42,
+    ):
+        self.shards = expand_shards(shards)
+        self.dynamic_items = list(dynamic_items)
+        self.output_keys = output_keys
+        self.pipeline = None
+        self.batch_size = batch_size
+        self.max_batch_length = max_batch_length
+        self.length_func = length_func
+        self.shuffle_buffer = shuffle_buffer
+        self.shuffle_shards = shuffle_shards
+        self.collate_fn = collate_fn
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        if max_batch_length is not None:
+            if num_buckets is None and len(bucket_boundaries) == 0:
+                raise ValueError(
+                    "Please specify either num_buckets or bucket boundaries."
+                )
+            if len(bucket_boundaries) == 0:
+                bucket_boundaries = DynamicBatchSampler._get_boundaries_through_warping(
+                    self, max_batch_length, num_buckets
+                )
+            if list(bucket_boundaries) != sorted(bucket_boundaries):
+                raise ValueError("bucket_boundaries should be ascending")
+            self.bucket_boundaries = list(bucket_boundaries)
+            if max_batch_ex is None:
+                max_batch_ex = float("inf")
+            # data points of a full bucket, the last one has no upper length
+            self.bucket_lens = [
+                int(min(max(1, max_batch_length // boundary), max_batch_ex))
+                for boundary in self.bucket_boundaries
+            ] + [1]
+
+    def add_dynamic_item(self, func, takes=None, provides=None):
+        """Makes a new dynamic item available on the dataset.
+
+        See DynamicItemDataset.add_dynamic_item.
+        """
+        self.dynamic_items.append(
+            {"func": func, "takes": takes, "provides": provides}
+        )
+        self.pipeline = None
+
+    def set_output_keys(self, keys):
+        """Use this to change the output keys.
+
+        See DynamicItemDataset.set_output_keys.
+        """
+        self.output_keys = keys
+        if self.pipeline is not None:
+            self.pipeline.set_output_keys(keys)
+
+    def set_epoch(self, epoch):
+        """Sets the epoch of the shuffling (when iterated directly)."""
+        self.epoch = epoch
+
+    def __iter__(self):
+        return self.iter_batches(self.epoch)
+
+    def iter_batches(self, epoch, skip=0, worker=None):
+        """Iterates over the batches of this worker (and process).
+
+        Arguments
+        ---------
+        epoch : int
+            Epoch of the shuffling.
+        skip : int
+            Number of batches skipped (neither decoded nor collated), e.g.
+            already used before an interruption.
+        worker : int, None
+            Part of the shards read (default: that of the DataLoader worker).
+        """
+        rank, world_size = _rank_and_world_size()
+        worker_id, num_workers = _worker_and_num_workers()
+        if worker is None:
+            worker = worker_id
+        slot = rank * num_workers + worker
+        shards = list(self.shards)
+        if self.shuffle_shards:
+            random.Random(f"{self.seed}/{epoch}").shuffle(shards)
+        shards = shards[slot :: world_size * num_workers]
+        if not shards:
+            logger.warning(
+                f"No shard for worker {worker} of process {rank}: use at least "
+                f"{world_size * num_workers} shards"
+            )
+        samples = self._read(shards)
+        if self.shuffle_buffer > 1:
+            rng = random.Random(f"{self.seed}/{epoch}/{slot}")
+            samples = _shuffled(samples, self.shuffle_buffer, rng)
+        for index, batch in enumerate(self._group(samples)):
+            if index >= skip:
+                yield self._collate(batch)
+
+    def _read(self, shards):
+        for shard in shards:
+            for sample in read_shard(shard):
+                yield _split_sample(sample)
+
+    def _group(self, samples):
+        if self.max_batch_length is None:
+            batch = []
+            for sample in samples:
+                batch.append(sample)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+            buckets = [batch]
+        else:
+            buckets = [[] for _ in self.bucket_lens]
+            for sample in samples:
+                length = self.length_func(sample[0])
+                i = bisect.bisect_left(self.bucket_boundaries, length)
+                buckets[i].append(sample)
+                if len(buckets[i]) == self.bucket_lens[i]:
+                    yield buckets[i]
+                    buckets[i] = []
+        if not self.drop_last:
+            for batch in buckets:
+                if batch:
+                    yield batch
+
+    def _collate(self, batch):
+        examples = []
+        for data_point, encoded in batch:
+            for field, value in encoded.items():
+                data_point[_field_name(field)] = decode_field(field, value)
+            if self.pipeline is None:
+                self.pipeline = DataPipeline(
+                    list(data_point), self.dynamic_items, self.output_keys
+                )
+            examples.append(self.pipeline.compute_outputs(data_point))
+        return self.collate_fn(examples)
+
+
+def _shuffled(samples, buffer_size, rng):
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class _WorkerStream(IterableDataset):
+    # batches of a StreamingDataset, tagged with the part of the shards
+    # (worker) they come from. The DataLoader takes the batches of its
+    # workers in turn from the first one: a resumed epoch starts with
+    # the part following the last batch taken, in its first worker.
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.epoch = 0
+        self.skip = [0]
+        self.first_worker = 0
+
+    def __iter__(self):
+        worker_id, num_workers = _worker_and_num_workers()
+        worker = (self.first_worker + worker_id) % num_workers
+        batches = self.dataset.iter_batches(
+            self.epoch, self.skip[worker], worker
+        )
+        for batch in batches:
+            yield worker, batch
+
+
+@register_checkpoint_hooks
+class StreamingDataLoader(DataLoader):
+    """DataLoader of a StreamingDataset, saveable with the Checkpointer.
+
+    The batches are made by the dataset (batch_size=None). The loader
+    counts the epochs (a new one starts after a complete iteration) and the
+    batches taken from each worker: a DataLoader takes the batches of the
+    workers in turn, so this position is exact and a recovered loader
+    resumes the epoch at the next batch (each worker skips the batches it
+    made, the worker of the next batch comes first). The number of workers
+    must be the same when resuming.
+
+    Arguments
+    ---------
+    dataset : StreamingDataset
+        The stream of batches.
+    **kwargs : dict
+        Keyword args to DataLoader, e.g. num_workers, pin_memory.
+
+    Example
+    -------
+    >>> from speechbrain.utils.checkpoints import Checkpointer
+    >>> data = {f"utt{i}": {"wav": torch.ones(i + 1)} for i in range(6)}
+    >>> shards = write_shards(data, getfixture("tmpdir") / "shards", maxcount=2)
+    >>> dataset = StreamingDataset(shards, shuffle_buffer=4)
+    >>> dataset.set_output_keys(["id"])
+    >>> loader = StreamingDataLoader(dataset)
+    >>> checkpointer = Checkpointer(getfixture("tmpdir") / "ckpt", {"loader": loader})
+    >>> ids = []
+    >>> for i, batch in enumerate(loader):
+    ...     ids.append(batch.id[0])
+    ...     if i == 2:
+    ...         _ = checkpointer.save_checkpoint(end_of_epoch=False)
+    >>> loader = StreamingDataLoader(dataset)
+    >>> checkpointer = Checkpointer(getfixture("tmpdir") / "ckpt", {"loader": loader})
+    >>> _ = checkpointer.recover_if_possible()
+    >>> [batch.id[0] for batch in loader] == ids[3:]
+    True
+    """
+
+    def __init__(self, dataset, **kwargs):
+        for option in ["sampler", "batch_sampler", "shuffle"]:
+            if kwargs.get(option):
+                raise ValueError(
+                    f"{option} is not supported by a StreamingDataLoader, "
+                    "the StreamingDataset shuffles its stream"
+                )
+        if kwargs.get("batch_size") is not None:
+            raise ValueError(
+                "A StreamingDataset makes its own batches, "
+                "use the batch_size of the StreamingDataset"
+            )
+        if kwargs.get("persistent_workers", False):
+            raise ValueError(
+                "persistent_workers would not see the epoch and position"
+            )
+        kwargs["batch_size"] = None
+        super().__init__(_WorkerStream(dataset), **kwargs)
+        # epoch of the next complete iteration
+        self.epoch = 0
+        self._speechbrain_recovery_skip_to = None
+        self._speechbrain_iterator = None
+        # position of the batches consumed, when iterated ahead
+        # (see PrefetchLoader)
+        self._speechbrain_position = None
+
+    def __iter__(self):
+        self._speechbrain_position = None
+        num_workers = max(1, self.num_workers)
+        epoch, skip, first_worker = self.epoch, [0] * num_workers, 0
+        if self._speechbrain_recovery_skip_to is not None:
+            epoch, consumed, first_worker = self._speechbrain_recovery_skip_to
+            self._speechbrain_recovery_skip_to = None
+            if len(consumed) == num_workers:
+                skip = list(consumed)
+            else:
+                first_worker = 0
+                logger.warning(
+                    f"Checkpoint of the StreamingDataLoader has {len(consumed)}"
+                    f" workers, not {num_workers}: restarting epoch {epoch}"
+                )
+        self.dataset.epoch = epoch
+        self.dataset.skip = skip
+        self.dataset.first_worker = first_worker
+        iterator = _StreamingIterator(
+            super().__iter__(), self, epoch, list(skip), first_worker
+        )
+        self._speechbrain_iterator = iterator
+        return iterator
+
+    @mark_as_saver
+    def _speechbrain_save(self, path):
+        position = self._speechbrain_position
+        iterator = self._speechbrain_iterator
+        if position is None and iterator is not None and not iterator.finished:
+            position = iterator.position
+        with open(path, "w") as fo:
+            json.dump({"epoch": self.epoch, "position": position}, fo)
+
+    @mark_as_loader
+    def _speechbrain_load(self, path, end_of_epoch, device=None):
+        del device  # Unused here
+        if self._speechbrain_iterator is not None:
+            logger.debug(
+                "StreamingDataLoader was requested to load a checkpoint, "
+                "but it has already been iterated. Ignoring the checkpoint."
+            )
+            return
+        with open(path) as fi:
+            saved = json.load(fi)
+        self.epoch = saved["epoch"]
+        if not end_of_epoch and saved["position"] is not None:
+            self._speechbrain_recovery_skip_to = saved["position"]
+
+
+class _StreamingIterator:
+    # counts the batches of each worker, the epoch ends after the last one
+    def __init__(self, iterator, loader, epoch, consumed, next_worker):
+        self.iterator = iterator
+        self.loader = loader
+        self.epoch = epoch
+        self.consumed = consumed
+        self.next_worker = next_worker
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            worker, batch = next(self.iterator)
+        except StopIteration:
+            if not self.finished:
+                self.finished = True
+                self.loader.epoch = self.epoch + 1
+            raise
+        self.consumed[worker] += 1
+        self.next_worker = (worker + 1) % len(self.consumed)
+        return batch
+
+    @property
+    def position(self):
+        """Epoch, batches taken from each worker and next worker."""
+        return [self.epoch, list(self.consumed), self.next_worker]
@@ -31,6 +31,8 @@ class CTCPrefixScorer:
         The index of the end-of-sequence (eos) token.
     ctc_window_size: int
         Compute the ctc scores over the time frames using windowing based on attention peaks.
+        The window of each utterance spans the attention peaks of its beams
+        (at the last decoded step), plus ctc_window_size frames on each side.
         If 0, no windowing applied.
     """
 
@@ -80,11 +82,18 @@ class CTCPrefixScorer:
         self.cand_offset = (
             torch.arange(batch_size, device=self.device) * self.vocab_size
         )
+        # The buffers of forward_step, reused from one step to the next
+        self.buffers = {}
 
     def forward_step(self, g, state, candidates=None, attn=None):
         """This method if one step of forwarding operation
         for the prefix ctc scorer.
 
+        All the beams are scored at once: only the last token of each prefix
+        is read from g, and the forward probabilities are computed from the
+        first frame where a prefix of this length can end (|g|) onwards, in
+        buffers reused from one step to the next.
+
         Arguments
         ---------
         g : torch.Tensor
@@ -95,9 +104,14 @@ class CTCPrefixScorer:
             (batch_size * beam_size, ctc_beam_size), The topk candidates for rescoring.
             The ctc_beam_size is set as 2 * beam_size. If given, performing partial ctc scoring.
         """
-
+        num_beams = self.batch_size * self.beam_size
         prefix_length = g.size(1)
-        last_char = [gi[-1] for gi in g] if prefix_length > 0 else [0] * len(g)
+        if prefix_length > 0:
+            last_char = g[:, -1]
+        else:
+            last_char = torch.zeros(
+                num_beams, dtype=torch.long, device=self.device
+            )
         self.num_candidates = (
             self.vocab_size if candidates is None else candidates.size(-1)
         )
@@ -120,18 +134,17 @@ class CTCPrefixScorer:
 
         # for partial search
         if candidates is not None:
-            scoring_table = torch.full(
-                (self.batch_size * self.beam_size, self.vocab_size),
-                -1,
-                dtype=torch.long,
-                device=self.device,
+            scoring_table = self._buffer(
+                "scoring_table", (num_beams, self.vocab_size), torch.long
             )
+            scoring_table.fill_(-1)
             # Assign indices of candidates to their positions in the table
-            col_index = torch.arange(
-                self.batch_size * self.beam_size, device=self.device
-            ).unsqueeze(1)
-            scoring_table[col_index, candidates] = torch.arange(
-                self.num_candidates, device=self.device
+            scoring_table.scatter_(
+                1,
+                candidates,
+                torch.arange(self.num_candidates, device=self.device).expand(
+                    num_beams, -1
+                ),
             )
             # Select candidates indices for scoring
             scoring_index = (
@@ -140,108 +153,150 @@ class CTCPrefixScorer:
                 .repeat(1, self.beam_size)
                 .view(-1, 1)
             ).view(-1)
+            # (2, L, batch_size, beam_size, num_candidates)
             x_inflate = torch.index_select(
                 self.x.view(2, -1, self.batch_size * self.vocab_size),
                 2,
                 scoring_index,
-            ).view(2, -1, self.batch_size * self.beam_size, self.num_candidates)
+            ).view(2, -1, self.batch_size, self.beam_size, self.num_candidates)
+            tokens = candidates
         # for full search
         else:
             scoring_table = None
-            x_inflate = (
-                self.x.unsqueeze(3)
-                .repeat(1, 1, 1, self.beam_size, 1)
-                .view(
-                    2, -1, self.batch_size * self.beam_size, self.num_candidates
-                )
-            )
-
-        # Prepare forward probs
-        r = torch.full(
-            (
-                self.max_enc_len,
-                2,
-                self.batch_size * self.beam_size,
-                self.num_candidates,
-            ),
-            self.minus_inf,
-            device=self.device,
+            # (2, L, batch_size, 1, vocab_size), shared by the beams
+            x_inflate = self.x.unsqueeze(3)
+            tokens = torch.arange(self.vocab_size, device=self.device)
+
+        # phi and the forward probs of each frame, (L, 3, batch_size *
+        # beam_size, num_candidates) as (phi, r^nb, r^b): the two sums of the
+        # recursion read the overlapping pairs (phi, r^nb) and (r^nb, r^b).
+        forward = self._buffer(
+            "forward", (self.max_enc_len, 3, num_beams, self.num_candidates)
         )
-        r.fill_(self.minus_inf)
+        phi, r = forward[:, 0], forward[:, 1:]
 
-        # (Alg.2-6)
-        if prefix_length == 0:
-            r[0, 0] = x_inflate[0, 0]
         # (Alg.2-10): phi = prev_nonblank + prev_blank = r_t-1^nb(g) + r_t-1^b(g)
         r_sum = torch.logsumexp(r_prev, 1)
-        phi = r_sum.unsqueeze(2).repeat(1, 1, self.num_candidates)
-
         # (Alg.2-10): if last token of prefix g in candidates, phi = prev_b + 0
-        if candidates is not None:
-            for i in range(self.batch_size * self.beam_size):
-                pos = scoring_table[i, last_char[i]]
-                if pos != -1:
-                    phi[:, i, pos] = r_prev[:, 1, i]
-        else:
-            for i in range(self.batch_size * self.beam_size):
-                phi[:, i, last_char[i]] = r_prev[:, 1, i]
+        is_last = tokens == last_char.unsqueeze(1)
+        torch.where(
+            is_last, r_prev[:, 1].unsqueeze(2), r_sum.unsqueeze(2), out=phi
+        )
 
         # Start, end frames for scoring (|g| < |h|).
-        # Scoring based on attn peak if ctc_window_size > 0
-        if self.ctc_window_size == 0 or attn is None:
-            start = max(1, prefix_length)
-            end = self.max_enc_len
-        else:
-            _, attn_peak = torch.max(attn, dim=1)
-            max_frame = torch.max(attn_peak).item() + self.ctc_window_size
-            min_frame = torch.min(attn_peak).item() - self.ctc_window_size
-            start = max(max(1, prefix_length), int(min_frame))
-            end = min(self.max_enc_len, int(max_frame))
+        start = max(1, prefix_length)
+        end = self.max_enc_len
+        outside = None
+        # Scoring based on attn peak if ctc_window_size > 0: the window of
+        # each utterance spans the attention peaks of its beams
+        if self.ctc_window_size > 0 and attn is not None:
+            if attn.dim() == 3:
+                # the attention of every decoded step, only the last is used
+                attn = attn[:, -1]
+            attn_peak = attn.argmax(dim=-1).view(
+                self.batch_size, self.beam_size
+            )
+            starts = attn_peak.min(dim=-1)[0] - self.ctc_window_size
+            ends = attn_peak.max(dim=-1)[0] + self.ctc_window_size
+            starts = starts.clamp(min=start).repeat_interleave(self.beam_size)
+            ends = ends.clamp(max=end).repeat_interleave(self.beam_size)
+            frames = torch.arange(self.max_enc_len, device=self.device)
+            # (L, batch_size * beam_size, 1), the frames out of the windows
+            outside = (
+                (frames.unsqueeze(1) < starts) | (frames.unsqueeze(1) >= ends)
+            ).unsqueeze(2)
+            start, end = torch.stack([starts.min(), ends.max()]).tolist()
+            end = max(start, end)
+
+        # Prepare forward probs, the frames out of [start, end) are -inf
+        r[:start].fill_(self.minus_inf)
+        r[end:].fill_(self.minus_inf)
+        r_beams = r.view(
+            -1, 2, self.batch_size, self.beam_size, self.num_candidates
+        )
+
+        # (Alg.2-6)
+        if prefix_length == 0:
+            r_beams[0, 0] = x_inflate[0, 0]
 
         # Compute forward prob log(r_t^nb(h)) and log(r_t^b(h)):
+        frame_size = num_beams * self.num_candidates
         for t in range(start, end):
             # (Alg.2-11): dim=0, p(h|cur step is nonblank) = [p(prev step=y) + phi] * p(c)
-            rnb_prev = r[t - 1, 0]
             # (Alg.2-12): dim=1, p(h|cur step is blank) = [p(prev step is blank) + p(prev step is nonblank)] * p(blank)
-            rb_prev = r[t - 1, 1]
-            r_ = torch.stack([rnb_prev, phi[t - 1], rnb_prev, rb_prev]).view(
-                2, 2, self.batch_size * self.beam_size, self.num_candidates
+            r_ = forward[t - 1].as_strided(
+                (2, 2, num_beams, self.num_candidates),
+                (frame_size, frame_size, self.num_candidates, 1),
             )
-            r[t] = torch.logsumexp(r_, 1) + x_inflate[:, t]
+            torch.logsumexp(r_, 1, out=r[t])
+            r_beams[t] += x_inflate[:, t]
+            if outside is not None:
+                r[t].masked_fill_(outside[t], self.minus_inf)
 
         # Compute the predix prob, psi
-        psi_init = r[start - 1, 0].unsqueeze(0)
         # phi is prob at t-1 step, shift one frame and add it to the current prob p(c)
-        phix = torch.cat((phi[0].unsqueeze(0), phi[:-1]), dim=0) + x_inflate[0]
+        num_frames = max(end - start, 0)
+        phix = self._buffer(
+            "phix", (self.max_enc_len + 1, num_beams, self.num_candidates)
+        )[: num_frames + 1]
+        torch.add(
+            phi[start - 1 : start - 1 + num_frames].view(
+                num_frames,
+                self.batch_size,
+                self.beam_size,
+                self.num_candidates,
+            ),
+            x_inflate[0, start : start + num_frames],
+            out=phix[:num_frames].view(
+                num_frames,
+                self.batch_size,
+                self.beam_size,
+                self.num_candidates,
+            ),
+        )
+        if outside is None:
+            phix[num_frames] = r[start - 1, 0]
+        else:
+            phix[:num_frames].masked_fill_(
+                outside[start : start + num_frames], self.minus_inf
+            )
+            # r^nb of the frame before the window of each utterance
+            phix[num_frames] = r[
+                starts - 1, 0, torch.arange(num_beams, device=self.device)
+            ]
         # (Alg.2-13): psi = psi + phi * p(c)
+        psi = torch.logsumexp(phix, dim=0)
         if candidates is not None:
+            # only assign prob to candidates
             psi = torch.full(
-                (self.batch_size * self.beam_size, self.vocab_size),
+                (num_beams, self.vocab_size),
                 self.minus_inf,
                 device=self.device,
-            )
-            psi_ = torch.logsumexp(
-                torch.cat((phix[start:end], psi_init), dim=0), dim=0
-            )
-            # only assign prob to candidates
-            for i in range(self.batch_size * self.beam_size):
-                psi[i, candidates[i]] = psi_[i]
-        else:
-            psi = torch.logsumexp(
-                torch.cat((phix[start:end], psi_init), dim=0), dim=0
-            )
+            ).scatter_(1, candidates, psi)
 
         # (Alg.2-3): if c = <eos>, psi = log(r_T^n(g) + r_T^b(g)), where T is the length of max frames
-        for i in range(self.batch_size * self.beam_size):
-            psi[i, self.eos_index] = r_sum[
-                self.last_frame_index[i // self.beam_size], i
-            ]
+        last_frames = torch.repeat_interleave(
+            self.last_frame_index.long(), self.beam_size
+        )
+        psi[:, self.eos_index] = r_sum[
+            last_frames, torch.arange(num_beams, device=self.device)
+        ]
 
         # Exclude blank probs for joint scoring
         psi[:, self.blank_index] = self.minus_inf
 
         return psi - psi_prev, (r, psi, scoring_table)
 
+    def _buffer(self, name, shape, dtype=None):
+        """Returns the buffer of this name and shape, reused from one step
+        to the next (reallocated if the shape changed, e.g., when some
+        utterances were dropped). Its content is left as it is."""
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = torch.empty(shape, dtype=dtype, device=self.device)
+            self.buffers[name] = buffer
+        return buffer
+
     def permute_mem(self, memory, index):
         """This method permutes the CTC model memory
         to synchronize the memory index with the current output.
@@ -264,13 +319,9 @@ class CTCPrefixScorer:
             index
             + (self.beam_offset.unsqueeze(1).expand_as(index) * self.vocab_size)
         ).view(-1)
-        # synchronize forward prob
+        # synchronize forward prob (the same for every candidate)
         psi = torch.index_select(psi.view(-1), dim=0, index=best_index)
-        psi = (
-            psi.view(-1, 1)
-            .repeat(1, self.vocab_size)
-            .view(self.batch_size * self.beam_size, self.vocab_size)
-        )
+        psi = psi.view(self.batch_size * self.beam_size, 1)
 
         # synchronize ctc states
         if scoring_table is not None:
@@ -293,6 +344,43 @@ class CTCPrefixScorer:
 
         return r, psi
 
+    def select_utterances(self, memory, index):
+        """This method keeps some of the utterances only (e.g., when the
+        decoding of the other ones is over), with the CTC memory of
+        their beams.
+
+        Arguments
+        ---------
+        memory : No limit
+            The memory variable of all the beams (None at the first step).
+        index : torch.Tensor
+            The index of the utterances to keep.
+
+        Return
+        ------
+        The memory variable of the beams of the utterances kept.
+        """
+        self.x = torch.index_select(self.x, dim=2, index=index)
+        self.last_frame_index = self.last_frame_index[index]
+        self.batch_size = index.size(0)
+        self.beam_offset = (
+            torch.arange(self.batch_size, device=self.device) * self.beam_size
+        )
+        self.cand_offset = (
+            torch.arange(self.batch_size, device=self.device) * self.vocab_size
+        )
+        if memory is None:
+            return memory
+
+        r, psi = memory
+        beams = (
+            index.unsqueeze(1) * self.beam_size
+            + torch.arange(self.beam_size, device=self.device)
+        ).view(-1)
+        r = torch.index_select(r, dim=2, index=beams)
+        psi = torch.index_select(psi, dim=0, index=beams)
+        return r, psi
+
 
 def filter_ctc_output(string_pred, blank_id=-1):
     """Apply CTC output merge and filter rules.
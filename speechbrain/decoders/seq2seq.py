@@ -7,6 +7,7 @@ Authors
  * Mirco Ravanelli 2020
  * Sung-Lin Yeh 2020
 """
+import math
 import torch
 
 import speechbrain as sb
@@ -376,6 +377,247 @@ class S2SRNNGreedySearcher(S2SGreedySearcher):
         return log_probs, (hs, c), w
 
 
+class _BeamBuffers:
+    """Preallocated tensors of a beam search: the histories of the beams
+    and the pools of finished hypotheses of every utterance.
+
+    The tokens, log-probabilities (and other fields) of the beams and the
+    beams they come from are written in place at each step, in
+    (max_steps, batch_size * beam_size) buffers. Nothing is copied when the
+    beams are reordered: the history of a beam is gathered back from its
+    last step through its predecessors, once, when the search is over.
+    The beams reaching eos are scattered to the free slots of the pool of
+    their utterance (as their last step and beam), on the device, so the
+    host only reads the pools at the end of the search.
+
+    The utterances whose decoding is over can be dropped (see drop()): the
+    search then goes on with the beams of the other utterances only (the
+    active beams), the buffers keep the rows of the whole batch.
+
+    Arguments
+    ---------
+    batch_size : int
+        The number of utterances.
+    beam_size : int
+        The width of beam, also the number of hypotheses of each pool.
+    max_steps : int
+        The maximum number of decoding steps.
+    device : torch.device
+        The device of the buffers.
+    fields : tuple
+        The names of the other histories to keep, besides "tokens" and
+        "log_probs" (as floats).
+    keep_prefixes : bool
+        Whether to also keep the token sequence of every alive beam, for
+        the scorers reading the whole prefix (e.g., CTCPrefixScorer). It
+        is reordered at each step, by gathering the rows of the
+        predecessors into a second buffer.
+    """
+
+    def __init__(
+        self,
+        batch_size,
+        beam_size,
+        max_steps,
+        device,
+        fields=(),
+        keep_prefixes=False,
+    ):
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.step = 0
+        num_beams = batch_size * beam_size
+
+        self.predecessors = torch.zeros(
+            max_steps, num_beams, dtype=torch.long, device=device
+        )
+        self.histories = {
+            name: torch.zeros(
+                max_steps,
+                num_beams,
+                dtype=torch.long if name == "tokens" else None,
+                device=device,
+            )
+            for name in ("tokens", "log_probs") + tuple(fields)
+        }
+        self.prefixes = None
+        if keep_prefixes:
+            self.prefixes, self.spare_prefixes = [
+                torch.zeros_like(self.histories["tokens"]) for _ in range(2)
+            ]
+
+        # The finished hypotheses of each utterance, as their score, length
+        # and last beam. The pools have an extra last slot, which receives
+        # (and drops) the beams reaching eos once their pool is full.
+        shape = (batch_size, beam_size + 1)
+        self.num_finished = torch.zeros(
+            batch_size, dtype=torch.long, device=device
+        )
+        self.pools = {
+            "scores": torch.full(shape, float("-inf"), device=device),
+            "lengths": torch.zeros(shape, dtype=torch.long, device=device),
+            "beams": torch.zeros(shape, dtype=torch.long, device=device),
+        }
+        self.beams = torch.arange(num_beams, device=device)
+
+        # The active utterances and the rows of their beams in the buffers
+        self.utterances = torch.arange(batch_size, device=device)
+        self.rows = self.beams
+
+    def prefix(self):
+        """Returns the token sequences of the active beams,
+        (active beams, step) (a view of the buffer)."""
+        return self.prefixes[: self.step].t()
+
+    def append(self, predecessors, **values):
+        """Appends the step of the active beams: the beams they come from
+        (predecessors, among the active beams) and their values."""
+        step = self.step
+        self.predecessors[step].index_copy_(
+            0, self.rows, self.rows[predecessors]
+        )
+        for name, value in values.items():
+            history = self.histories[name]
+            history[step].index_copy_(
+                0, self.rows, value.detach().to(history.dtype)
+            )
+        if self.prefixes is not None:
+            if step > 0:
+                torch.index_select(
+                    self.prefixes[:step],
+                    dim=1,
+                    index=predecessors,
+                    out=self.spare_prefixes[:step],
+                )
+            self.spare_prefixes[step] = values["tokens"]
+            self.prefixes, self.spare_prefixes = (
+                self.spare_prefixes,
+                self.prefixes,
+            )
+        self.step += 1
+
+    def add_finished(self, is_eos, scores):
+        """Adds the beams that reached eos to the pools of their utterance,
+        in beam order, until the pool is full.
+
+        Arguments
+        ---------
+        is_eos : torch.BoolTensor
+            (active beams), the beams to add.
+        scores : torch.Tensor
+            (active beams), their final scores.
+        """
+        batch_size, beam_size = self.batch_size, self.beam_size
+        is_eos = is_eos.new_zeros(self.beams.shape).index_copy_(
+            0, self.rows, is_eos
+        )
+        scores = scores.new_zeros(self.beams.shape).index_copy_(
+            0, self.rows, scores
+        )
+        is_eos = is_eos.view(batch_size, beam_size)
+        slots = self.num_finished.unsqueeze(1) + is_eos.cumsum(dim=1) - 1
+        slots = slots.masked_fill(~is_eos | (slots >= beam_size), beam_size)
+        self.num_finished = torch.clamp(
+            self.num_finished + is_eos.sum(dim=1), max=beam_size
+        )
+        self.pools["scores"].scatter_(
+            1, slots, scores.view(batch_size, beam_size)
+        )
+        self.pools["lengths"].scatter_(
+            1, slots, torch.full_like(slots, self.step)
+        )
+        self.pools["beams"].scatter_(
+            1, slots, self.beams.view(batch_size, beam_size)
+        )
+
+    def best_finished(self):
+        """Returns the best score of the finished hypotheses of each active
+        utterance (-inf if none)."""
+        return self.pools["scores"][self.utterances, : self.beam_size].amax(
+            dim=1
+        )
+
+    def is_full(self):
+        """Whether the pools of all the utterances are full
+        (reads num_finished on the host)."""
+        return bool((self.num_finished == self.beam_size).all())
+
+    def full_utterances(self):
+        """Returns whether the pool of each active utterance is full,
+        as a list (reads num_finished on the host)."""
+        is_full = self.num_finished[self.utterances] == self.beam_size
+        return is_full.tolist()
+
+    def drop(self, is_over):
+        """Drops some of the active utterances.
+
+        Arguments
+        ---------
+        is_over : list
+            Whether to drop each active utterance.
+
+        Returns
+        -------
+        utterances : torch.Tensor
+            The indices of the kept utterances among the active ones.
+        beams : torch.Tensor
+            The indices of their beams among the active beams.
+        """
+        device = self.utterances.device
+        utterances = torch.tensor(
+            [i for i, over in enumerate(is_over) if not over], device=device,
+        )
+        beams = (
+            utterances.unsqueeze(1) * self.beam_size
+            + torch.arange(self.beam_size, device=device)
+        ).view(-1)
+        self.utterances = self.utterances[utterances]
+        self.rows = self.rows[beams]
+        if self.prefixes is not None:
+            self.prefixes = self.prefixes[:, beams]
+            self.spare_prefixes = torch.empty_like(self.prefixes)
+        return utterances, beams
+
+    def finished(self):
+        """Returns the scores, lengths and last beams of the finished
+        hypotheses, (batch_size, beam_size) each."""
+        return [
+            self.pools[name][:, : self.beam_size]
+            for name in ("scores", "lengths", "beams")
+        ]
+
+    def backtrack(self, name, beams, lengths, max_length, padding_value=0):
+        """Gathers the history of some beams from their last step.
+
+        Arguments
+        ---------
+        name : str
+            The history to gather ("tokens", "log_probs", ...).
+        beams : torch.Tensor
+            (num_hyps), the beam of each hypothesis at its last step.
+        lengths : torch.Tensor
+            (num_hyps), the number of steps of each hypothesis.
+        max_length : int
+            The length of the output, at least lengths.max().
+        padding_value : int
+            The value after the end of each hypothesis.
+
+        Returns
+        -------
+        torch.Tensor
+            (num_hyps, max_length), the history of each hypothesis.
+        """
+        history = self.histories[name]
+        hyps = history.new_full((beams.shape[0], max_length), padding_value)
+        for step in reversed(range(max_length)):
+            in_hyp = step < lengths
+            hyps[:, step] = torch.where(
+                in_hyp, history[step, beams], hyps[:, step]
+            )
+            beams = torch.where(in_hyp, self.predecessors[step, beams], beams)
+        return hyps
+
+
 class S2SBeamSearcher(S2SBaseSearcher):
     """This class implements the beam-search algorithm for the seq2seq model.
     See also S2SBaseSearcher().
@@ -424,6 +666,8 @@ class S2SBeamSearcher(S2SBaseSearcher):
     ctc_window_size: int
         Default: 0
         Compute the ctc scores over the time frames using windowing based on attention peaks.
+        The window of each utterance spans the attention peaks of its beams
+        (at the last decoded step), plus ctc_window_size frames on each side.
         If 0, no windowing applied.
     using_max_attn_shift: bool
         Whether using the max_attn_shift constraint. (default: False)
@@ -435,6 +679,18 @@ class S2SBeamSearcher(S2SBaseSearcher):
         DefaultL -1e20
         The value of minus infinity to block some path
         of the search.
+    prune_margin : float
+        Default: None
+        The accuracy/speed trade-off of the search. If given, the beams
+        whose score is lower than the best finished hypothesis of their
+        utterance by more than prune_margin are dropped, and the decoding
+        of an utterance is over once all its beams are dropped (they are
+        finished as they are). The smaller the margin, the earlier the
+        search ends (0 keeps only the beams that can still beat the best
+        hypothesis, which is exact without length normalization and
+        rewarding, as the scores can only decrease). If None, an utterance
+        is over when beam_size hypotheses reached eos, or at the maximum
+        length.
     """
 
     def __init__(
@@ -460,6 +716,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
         using_max_attn_shift=False,
         max_attn_shift=60,
         minus_inf=-1e20,
+        prune_margin=None,
     ):
         super(S2SBeamSearcher, self).__init__(
             bos_index, eos_index, min_decode_ratio, max_decode_ratio,
@@ -503,29 +760,24 @@ class S2SBeamSearcher(S2SBaseSearcher):
         self.minus_inf = minus_inf
         self.ctc_score_mode = ctc_score_mode
         self.ctc_window_size = ctc_window_size
+        self.prune_margin = prune_margin
 
-    def _check_full_beams(self, hyps, beam_size):
-        """This method checks whether hyps has been full.
+    def _check_full_beams(self, buffers):
+        """This method checks whether the finished hypotheses of every
+        utterance have been full. It is the only read of the beam search
+        state on the host before the end of the search.
 
         Arguments
         ---------
-        hyps : List
-            This list contains batch_size number.
-            Each inside list contains a list stores all the hypothesis for this sentence.
-        beam_size : int
-            The number of beam_size.
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
 
         Returns
         -------
         bool
             Whether the hyps has been full.
         """
-        hyps_len = [len(lst) for lst in hyps]
-        beam_size = [self.beam_size for _ in range(len(hyps_len))]
-        if hyps_len == beam_size:
-            return True
-        else:
-            return False
+        return buffers.is_full()
 
     def _check_attn_shift(self, attn, prev_attn_peak):
         """This method checks whether attention shift is more than attn_shift.
@@ -574,13 +826,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
         return cond
 
     def _update_hyp_and_scores(
-        self,
-        inp_tokens,
-        alived_seq,
-        alived_log_probs,
-        hyps_and_scores,
-        scores,
-        timesteps,
+        self, inp_tokens, buffers, scores, timesteps,
     ):
         """This method will update hyps and scores if inp_tokens are eos.
 
@@ -588,12 +834,9 @@ class S2SBeamSearcher(S2SBaseSearcher):
         ---------
         inp_tokens : torch.Tensor
             The current output.
-        alived_seq : torch.Tensor
-            The tensor to store the alived_seq.
-        alived_log_probs : torch.Tensor
-            The tensor to store the alived_log_probs.
-        hyps_and_scores : list
-            To store generated hypotheses and scores.
+        buffers : _BeamBuffers
+            The histories of the beams, where the hypotheses reaching eos
+            are stored with their scores.
         scores : torch.Tensor
             The final scores of beam search.
         timesteps : float
@@ -605,35 +848,23 @@ class S2SBeamSearcher(S2SBaseSearcher):
             Each element represents whether the token is eos.
         """
         is_eos = inp_tokens.eq(self.eos_index)
-        (eos_indices,) = torch.nonzero(is_eos, as_tuple=True)
 
         # Store the hypothesis and their scores when reaching eos.
-        if eos_indices.shape[0] > 0:
-            for index in eos_indices:
-                # convert to int
-                index = index.item()
-                batch_id = torch.div(
-                    index, self.beam_size, rounding_mode="floor"
-                )
-                if len(hyps_and_scores[batch_id]) == self.beam_size:
-                    continue
-                hyp = alived_seq[index, :]
-                log_probs = alived_log_probs[index, :]
-                final_scores = scores[index] + self.length_rewarding * (
-                    timesteps + 1
-                )
-                hyps_and_scores[batch_id].append((hyp, log_probs, final_scores))
+        final_scores = scores + self.length_rewarding * (timesteps + 1)
+        buffers.add_finished(is_eos, final_scores)
         return is_eos
 
-    def _get_top_score_prediction(self, hyps_and_scores, topk):
+    def _get_top_score_prediction(self, buffers, topk, padding_value=0):
         """This method sorts the scores and return corresponding hypothesis and log probs.
 
         Arguments
         ---------
-        hyps_and_scores : list
-            To store generated hypotheses and scores.
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
         topk : int
             Number of hypothesis to return.
+        padding_value : int
+            The token padding the hypotheses shorter than the longest one.
 
         Returns
         -------
@@ -645,37 +876,115 @@ class S2SBeamSearcher(S2SBaseSearcher):
             This tensor contains the final scores of topk hypotheses.
         topk_log_probs : list
             The log probabilities of each hypotheses.
+        indices : torch.Tensor (batch * topk)
+            The indices of the topk hypotheses among the finished ones.
         """
-        top_hyps, top_log_probs, top_scores, top_lengths = [], [], [], []
-        batch_size = len(hyps_and_scores)
-
-        # Collect hypotheses
-        for i in range(len(hyps_and_scores)):
-            hyps, log_probs, scores = zip(*hyps_and_scores[i])
-            top_hyps += hyps
-            top_scores += scores
-            top_log_probs += log_probs
-            top_lengths += [len(hyp) for hyp in hyps]
-        top_hyps = torch.nn.utils.rnn.pad_sequence(
-            top_hyps, batch_first=True, padding_value=0
-        )
-        top_scores = torch.stack((top_scores), dim=0).view(batch_size, -1)
-        top_lengths = torch.tensor(
-            top_lengths, dtype=torch.int, device=top_scores.device
-        )
+        top_scores, top_lengths, top_beams = buffers.finished()
+        batch_size = top_scores.shape[0]
+        # the hypotheses are padded to the longest one
+        max_length = int(top_lengths.max())
+
         # Get topk indices
         topk_scores, indices = top_scores.topk(self.topk, dim=-1)
-        indices = (indices + self.beam_offset.unsqueeze(1)).view(
+        offsets = torch.arange(batch_size, device=indices.device)
+        indices = (indices + offsets.unsqueeze(1) * self.beam_size).view(
             batch_size * self.topk
         )
         # Select topk hypotheses
-        topk_hyps = torch.index_select(top_hyps, dim=0, index=indices,)
+        topk_lengths = torch.index_select(
+            top_lengths.reshape(-1), dim=0, index=indices
+        )
+        topk_beams = torch.index_select(
+            top_beams.reshape(-1), dim=0, index=indices
+        )
+        topk_hyps = buffers.backtrack(
+            "tokens", topk_beams, topk_lengths, max_length, padding_value
+        )
         topk_hyps = topk_hyps.view(batch_size, self.topk, -1)
-        topk_lengths = torch.index_select(top_lengths, dim=0, index=indices,)
-        topk_lengths = topk_lengths.view(batch_size, self.topk)
-        topk_log_probs = [top_log_probs[index.item()] for index in indices]
+        topk_log_probs = buffers.backtrack(
+            "log_probs", topk_beams, topk_lengths, max_length
+        )
+        topk_log_probs = [
+            log_probs[:length]
+            for log_probs, length in zip(topk_log_probs, topk_lengths.tolist())
+        ]
+        topk_lengths = topk_lengths.int().view(batch_size, self.topk)
+
+        return topk_hyps, topk_scores, topk_lengths, topk_log_probs, indices
+
+    def _prune_beams(self, buffers, scores, is_eos, timesteps):
+        """This method finds the beams whose score is lower than the best
+        finished hypothesis of their utterance by more than prune_margin.
+        The utterances whose beams are all pruned are over: their beams
+        (but those reaching eos) are finished as they are.
+
+        Arguments
+        ---------
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
+        scores : torch.Tensor
+            The scores of the beams at the current step.
+        is_eos : torch.BoolTensor
+            Whether the beams reached eos at the current step.
+        timesteps : float
+            The current timesteps. This is for length rewarding.
+
+        Returns
+        -------
+        pruned : torch.BoolTensor
+            Each element represents whether the beam is pruned.
+        """
+        final_scores = scores + self.length_rewarding * (timesteps + 1)
+        threshold = buffers.best_finished() - self.prune_margin
+        pruned = final_scores < inflate_tensor(
+            threshold, times=self.beam_size, dim=0
+        )
+        is_over = (pruned | is_eos).view(-1, self.beam_size).all(dim=1)
+        finished = inflate_tensor(is_over, times=self.beam_size, dim=0)
+        eos = torch.full_like(is_eos, -1, dtype=torch.long)
+        eos.masked_fill_(finished & ~is_eos, self.eos_index)
+        _ = self._update_hyp_and_scores(eos, buffers, scores, timesteps)
+        return pruned
+
+    def _drop_utterances(
+        self,
+        utterances,
+        beams,
+        memory,
+        lm_memory=None,
+        ctc_scorer=None,
+        ctc_memory=None,
+    ):
+        """This method keeps the states of the beams of some utterances
+        only, when the decoding of the other ones is over.
 
-        return topk_hyps, topk_scores, topk_lengths, topk_log_probs
+        Arguments
+        ---------
+        utterances : torch.Tensor
+            The indices of the kept utterances among the decoded ones.
+        beams : torch.Tensor
+            The indices of their beams among the decoded ones.
+        memory : No limit
+            The memory of the seq2seq model.
+        lm_memory : No limit
+            The memory of the language model.
+        ctc_scorer : CTCPrefixScorer
+            The CTC prefix scorer.
+        ctc_memory : No limit
+            The memory of the CTC prefix scorer.
+
+        Returns
+        -------
+        The memory variables of the beams kept.
+        """
+        memory = self.select_mem(memory, beams)
+        if lm_memory is not None:
+            lm_memory = self.permute_lm_mem(lm_memory, beams)
+        if ctc_scorer is not None:
+            ctc_memory = ctc_scorer.select_utterances(ctc_memory, utterances)
+        if self.coverage is not None:
+            self.coverage = torch.index_select(self.coverage, 0, beams)
+        return memory, lm_memory, ctc_memory
 
     def forward(self, enc_states, wav_len):  # noqa: C901
         """Applies beamsearch and returns the predicted tokens."""
@@ -685,6 +994,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
 
         memory = self.reset_mem(batch_size * self.beam_size, device=device)
 
+        lm_memory = ctc_scorer = ctc_memory = None
         if self.lm_weight > 0:
             lm_memory = self.reset_lm_mem(batch_size * self.beam_size, device)
 
@@ -727,19 +1037,6 @@ class S2SBeamSearcher(S2SBaseSearcher):
         # keep only the first to make sure no redundancy.
         sequence_scores.index_fill_(0, self.beam_offset, 0.0)
 
-        # keep the hypothesis that reaches eos and their corresponding score and log_probs.
-        hyps_and_scores = [[] for _ in range(batch_size)]
-
-        # keep the sequences that still not reaches eos.
-        alived_seq = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        ).long()
-
-        # Keep the log-probabilities of alived sequences.
-        alived_log_probs = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        )
-
         min_decode_steps = int(enc_states.shape[1] * self.min_decode_ratio)
         max_decode_steps = int(enc_states.shape[1] * self.max_decode_ratio)
 
@@ -748,15 +1045,56 @@ class S2SBeamSearcher(S2SBaseSearcher):
             min_decode_steps, max_decode_steps
         )
 
+        # keep the sequences that still not reaches eos, their
+        # log-probabilities, and the hypothesis that reaches eos with their
+        # corresponding score and log_probs.
+        buffers = _BeamBuffers(
+            batch_size,
+            self.beam_size,
+            max_decode_steps,
+            device,
+            keep_prefixes=self.ctc_weight > 0,
+        )
+
         # Initialize the previous attention peak to zero
         # This variable will be used when using_max_attn_shift=True
         prev_attn_peak = torch.zeros(batch_size * self.beam_size, device=device)
+        scores = sequence_scores
+        self.coverage = None
 
         for t in range(max_decode_steps):
             # terminate condition
-            if self._check_full_beams(hyps_and_scores, self.beam_size):
+            is_over = buffers.full_utterances()
+            if all(is_over):
                 break
 
+            # Only the utterances whose hypotheses are not full are decoded
+            if any(is_over):
+                utterances, beams = buffers.drop(is_over)
+                batch_size = len(utterances)
+                self.beam_offset = (
+                    torch.arange(batch_size, device=device) * self.beam_size
+                )
+                (
+                    inp_tokens,
+                    sequence_scores,
+                    enc_states,
+                    enc_lens,
+                    prev_attn_peak,
+                ) = [
+                    torch.index_select(x, dim=0, index=beams)
+                    for x in (
+                        inp_tokens,
+                        sequence_scores,
+                        enc_states,
+                        enc_lens,
+                        prev_attn_peak,
+                    )
+                ]
+                memory, lm_memory, ctc_memory = self._drop_utterances(
+                    utterances, beams, memory, lm_memory, ctc_scorer, ctc_memory
+                )
+
             log_probs, memory, attn = self.forward_step(
                 inp_tokens, memory, enc_states, enc_lens
             )
@@ -796,7 +1134,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
 
             # adding CTC scores to log_prob if ctc_weight > 0
             if self.ctc_weight > 0:
-                g = alived_seq
+                g = buffers.prefix()
                 # block blank token
                 log_probs[:, self.blank_index] = self.minus_inf
                 if self.ctc_weight != 1.0 and self.ctc_score_mode == "partial":
@@ -886,63 +1224,41 @@ class S2SBeamSearcher(S2SBaseSearcher):
                 )
                 scores = scores - penalty * self.coverage_penalty
 
-            # Update alived_seq
-            alived_seq = torch.cat(
-                [
-                    torch.index_select(alived_seq, dim=0, index=predecessors),
-                    inp_tokens.unsqueeze(1),
-                ],
-                dim=-1,
+            # Update the tokens and log-probabilities of the beams
+            beam_log_probs = log_probs_clone.gather(1, candidates).view(
+                batch_size * self.beam_size
             )
-
-            # Takes the log-probabilities
-            beam_log_probs = log_probs_clone[
-                torch.arange(batch_size).unsqueeze(1), candidates
-            ].reshape(batch_size * self.beam_size)
-            alived_log_probs = torch.cat(
-                [
-                    torch.index_select(
-                        alived_log_probs, dim=0, index=predecessors
-                    ),
-                    beam_log_probs.unsqueeze(1),
-                ],
-                dim=-1,
+            buffers.append(
+                predecessors, tokens=inp_tokens, log_probs=beam_log_probs
             )
 
             is_eos = self._update_hyp_and_scores(
-                inp_tokens,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=t,
+                inp_tokens, buffers, scores, timesteps=t,
             )
 
-            # Block the paths that have reached eos.
+            # Block the paths that have reached eos, and the pruned ones.
+            if self.prune_margin is not None:
+                pruned = self._prune_beams(buffers, scores, is_eos, t)
+                sequence_scores.masked_fill_(pruned, float("-inf"))
             sequence_scores.masked_fill_(is_eos, float("-inf"))
 
-        if not self._check_full_beams(hyps_and_scores, self.beam_size):
-            # Using all eos to fill-up the hyps.
-            eos = (
-                torch.zeros(batch_size * self.beam_size, device=device)
-                .fill_(self.eos_index)
-                .long()
-            )
-            _ = self._update_hyp_and_scores(
-                eos,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=max_decode_steps,
-            )
+        # Using all eos to fill-up the hyps (if not full).
+        eos = (
+            torch.zeros(batch_size * self.beam_size, device=device)
+            .fill_(self.eos_index)
+            .long()
+        )
+        _ = self._update_hyp_and_scores(
+            eos, buffers, scores, timesteps=max_decode_steps,
+        )
 
         (
             topk_hyps,
             topk_scores,
             topk_lengths,
             log_probs,
-        ) = self._get_top_score_prediction(hyps_and_scores, topk=self.topk,)
+            _,
+        ) = self._get_top_score_prediction(buffers, topk=self.topk,)
         # pick the best hyp
         predictions = topk_hyps[:, 0, :]
         predictions = batch_filter_seq2seq_output(
@@ -978,6 +1294,24 @@ class S2SBeamSearcher(S2SBaseSearcher):
         """
         raise NotImplementedError
 
+    def select_mem(self, memory, index):
+        """This method selects the seq2seq model memory of some of the
+        beams, when the decoding of the other utterances is over. By
+        default, the memory is permuted with the index of the beams kept.
+
+        Arguments
+        ---------
+        memory : No limit
+            The memory variable to be selected.
+        index : torch.Tensor
+            The index of the beams kept.
+
+        Return
+        ------
+        The memory of the beams kept.
+        """
+        return self.permute_mem(memory, index)
+
     def permute_lm_mem(self, memory, index):
         """This method permutes the language model memory
         to synchronize the memory index with the current output.
@@ -1103,6 +1437,16 @@ class S2SRNNBeamSearcher(S2SBeamSearcher):
             )
         return (hs, c)
 
+    def select_mem(self, memory, index):
+        """Memory selection, with the encoder states cached
+        by the attention."""
+        attn = self.dec.attn
+        for name in ("precomputed_enc_h", "enc_len", "mask", "keys", "values"):
+            cached = getattr(attn, name, None)
+            if isinstance(cached, torch.Tensor):
+                setattr(attn, name, torch.index_select(cached, 0, index))
+        return self.permute_mem(memory, index)
+
 
 class S2SRNNBeamSearchLM(S2SRNNBeamSearcher):
     """This class implements the beam search decoding
@@ -1287,6 +1631,86 @@ class S2SRNNBeamSearchTransformerLM(S2SRNNBeamSearcher):
         return None
 
 
+class S2SRNNBeamSearchNgramLM(S2SRNNBeamSearcher):
+    r"""This class implements the beam search decoding
+    for AttentionalRNNDecoder (speechbrain/nnet/RNN.py) with an N-gram LM
+    compiled by speechbrain.lm.arpa.compile_arpa (the token_list given to
+    compile_arpa being the output tokens of the decoder).
+    See also S2SBaseSearcher(), S2SBeamSearcher(), S2SRNNBeamSearcher().
+
+    Arguments
+    ---------
+    embedding : torch.nn.Module
+        An embedding layer.
+    decoder : torch.nn.Module
+        Attentional RNN decoder.
+    linear : torch.nn.Module
+        A linear output layer.
+    language_model : speechbrain.lm.ngram.CompiledNgramLM
+        An N-gram language model.
+    **kwargs
+        Arguments to pass to S2SBeamSearcher.
+
+    Example
+    -------
+    >>> import io, os, tempfile
+    >>> from speechbrain.lm.arpa import compile_arpa
+    >>> from speechbrain.lm.ngram import CompiledNgramLM
+    >>> path = os.path.join(tempfile.mkdtemp(), "lm.bin")
+    >>> with io.StringIO() as f:
+    ...     print("\\data\\\nngram 1=5\n\n\\1-grams:", file=f)
+    ...     for token in ["<unk>", "a", "b", "c", "</s>"]:
+    ...         print(f"-0.699 {token}", file=f)
+    ...     print("\n\\end\\", file=f)
+    ...     _ = f.seek(0)
+    ...     _ = compile_arpa(f, path, ["<unk>", "a", "b", "c", "</s>"])
+    >>> emb = torch.nn.Embedding(5, 3)
+    >>> dec = sb.nnet.RNN.AttentionalRNNDecoder(
+    ...     "gru", "content", 3, 3, 1, enc_dim=7, input_size=3
+    ... )
+    >>> lin = sb.nnet.linear.Linear(n_neurons=5, input_size=3)
+    >>> searcher = S2SRNNBeamSearchNgramLM(
+    ...     embedding=emb,
+    ...     decoder=dec,
+    ...     linear=lin,
+    ...     language_model=CompiledNgramLM(path),
+    ...     bos_index=4,
+    ...     eos_index=4,
+    ...     blank_index=4,
+    ...     min_decode_ratio=0,
+    ...     max_decode_ratio=1,
+    ...     beam_size=2,
+    ...     lm_weight=0.5,
+    ... )
+    >>> enc = torch.rand([2, 6, 7])
+    >>> wav_len = torch.rand([2])
+    >>> hyps, scores = searcher(enc, wav_len)
+    """
+
+    def __init__(
+        self, embedding, decoder, linear, language_model, **kwargs,
+    ):
+        super(S2SRNNBeamSearchNgramLM, self).__init__(
+            embedding, decoder, linear, **kwargs
+        )
+
+        self.lm = language_model
+
+    def lm_forward_step(self, inp_tokens, memory):
+        """Applies a step to the N-gram LM during beamsearch."""
+        return _ngram_lm_forward_step(self.lm, inp_tokens, memory)
+
+    def permute_lm_mem(self, memory, index):
+        """Permutes the N-gram LM states during beamsearch."""
+        memory = torch.index_select(memory, dim=0, index=index)
+        return memory
+
+    def reset_lm_mem(self, batch_size, device):
+        """Needed to reset the LM memory during beamsearch."""
+        # The states of the prefixes <s> are set at the first step.
+        return None
+
+
 class S2STransformerBeamSearch(S2SBeamSearcher):
     """This class implements the beam search decoding
     for Transformer.
@@ -1354,6 +1778,78 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
         return log_probs[:, -1, :], memory
 
 
+class S2STransformerBeamSearchNgramLM(S2STransformerBeamSearch):
+    r"""This class implements the beam search decoding
+    for Transformer with an N-gram LM compiled by
+    speechbrain.lm.arpa.compile_arpa (the token_list given to compile_arpa
+    being the output tokens of the model).
+    See also S2SBaseSearcher(), S2SBeamSearcher(), S2STransformerBeamSearch().
+
+    Arguments
+    ---------
+    modules : list
+        The model, linear output layer and CTC output layer, as for
+        S2STransformerBeamSearch.
+    language_model : speechbrain.lm.ngram.CompiledNgramLM
+        An N-gram language model.
+    **kwargs
+        Arguments to pass to S2STransformerBeamSearch.
+
+    Example:
+    --------
+    >>> import io, os, tempfile
+    >>> from speechbrain.lm.arpa import compile_arpa
+    >>> from speechbrain.lm.ngram import CompiledNgramLM
+    >>> from speechbrain.lobes.models.transformer.TransformerASR import (
+    ...     TransformerASR,
+    ... )
+    >>> path = os.path.join(tempfile.mkdtemp(), "lm.bin")
+    >>> with io.StringIO() as f:
+    ...     print("\\data\\\nngram 1=5\nngram 2=1\n\n\\1-grams:", file=f)
+    ...     for token in ["<unk>", "a", "b", "c", "</s>"]:
+    ...         print(f"-0.699 {token}", file=f)
+    ...     print("\n\\2-grams:\n-0.097 a b\n\n\\end\\", file=f)
+    ...     _ = f.seek(0)
+    ...     _ = compile_arpa(f, path, ["<unk>", "a", "b", "c", "</s>"])
+    >>> net = TransformerASR(
+    ...     5, 7, d_model=8, nhead=2, num_encoder_layers=1,
+    ...     num_decoder_layers=1, d_ffn=16,
+    ... )
+    >>> lin = sb.nnet.linear.Linear(n_neurons=5, input_size=8)
+    >>> searcher = S2STransformerBeamSearchNgramLM(
+    ...     modules=[net, lin, None],
+    ...     language_model=CompiledNgramLM(path),
+    ...     bos_index=4,
+    ...     eos_index=4,
+    ...     blank_index=4,
+    ...     min_decode_ratio=0,
+    ...     max_decode_ratio=1,
+    ...     beam_size=2,
+    ...     lm_weight=0.5,
+    ... )
+    >>> # LM probabilities of the tokens after <s> a and <s> b
+    >>> bos, tokens = torch.tensor([4, 4]), torch.tensor([1, 2])
+    >>> log_probs, memory = searcher.lm_forward_step(bos, None)
+    >>> log_probs, memory = searcher.lm_forward_step(tokens, memory)
+    >>> log_probs.exp().round(decimals=1)
+    tensor([[0.2000, 0.2000, 0.8000, 0.2000, 0.2000],
+            [0.2000, 0.2000, 0.2000, 0.2000, 0.2000]])
+    >>> enc, _ = net.encode(torch.rand([2, 6, 7]), torch.ones(2))
+    >>> hyps, scores = searcher(enc, torch.ones(2))
+    >>> len(hyps), scores.shape
+    (2, torch.Size([2, 1]))
+    """
+
+    def __init__(self, modules, language_model, **kwargs):
+        super(S2STransformerBeamSearchNgramLM, self).__init__(modules, **kwargs)
+
+        self.lm = language_model
+
+    def lm_forward_step(self, inp_tokens, memory):
+        """Performs a step in the N-gram LM."""
+        return _ngram_lm_forward_step(self.lm, inp_tokens, memory)
+
+
 class S2SWhisperBeamSearch(S2SBeamSearcher):
     """This class implements the beam search decoding
     for Whisper neural nets made by OpenAI in
@@ -1652,17 +2148,58 @@ def _update_mem(inp_tokens, memory):
     return torch.cat([memory, inp_tokens.unsqueeze(1)], dim=-1)
 
 
+def _ngram_lm_forward_step(language_model, inp_tokens, memory):
+    """This function performs a step of an N-gram LM (see
+    speechbrain.lm.ngram.CompiledNgramLM) for all the beams at once: the
+    states of the prefixes are moved on by the predicted token of the
+    previous step, and all the output tokens are scored after them.
+
+    Arguments:
+    -----------
+    language_model : speechbrain.lm.ngram.CompiledNgramLM
+        The N-gram LM.
+    inp_tokens : tensor
+        Predicted token of the previous decoding step.
+    memory : tensor
+        The states of the prefixes, None at the first step.
+    """
+    if memory is None:
+        memory = language_model.initial_states(
+            inp_tokens.size(0), inp_tokens.device
+        )
+    else:
+        memory = language_model.advance(memory, inp_tokens)
+    candidates = torch.arange(language_model.num_tokens)
+    # ARPA log probabilities are in base 10
+    log_probs = language_model.score(memory, candidates) * math.log(10)
+    return log_probs, memory
+
+
 class S2STransformerBeamSearchPara(S2SBeamSearcher):
     """This class implements the beam search decoding
-    for Transformer.
+    for Transformer, with a paraphasia label for every decoded token.
     See also S2SBaseSearcher(), S2SBeamSearcher().
 
+    The utterances of a padded batch are decoded independently: the
+    decoder does not attend the padded encoder states, and the decoding
+    length limits and the returned paraphasia labels are those of each
+    utterance, so that a batch gives the same outputs as its utterances
+    decoded one at a time.
+
     Arguments
     ---------
     model : torch.nn.Module
         The model to use for decoding.
     linear : torch.nn.Module
         A linear output layer.
+    use_kv_cache : bool
+        Whether to decode incrementally (default: False). The self-attention
+        keys and values of every decoder layer are cached across steps and
+        the cross-attention keys and values of enc_states are computed once,
+        so each step only runs the newest token through the decoder and the
+        paraphasia head. Requires a model with a decode_step() method
+        (e.g., TransformerDecoderASR) whose decoder uses regularMHA
+        attention.
     **kwargs
         Arguments to pass to S2SBeamSearcher
 
@@ -1672,7 +2209,12 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
     """
 
     def __init__(
-        self, modules, temperature=1.0, temperature_lm=1.0, **kwargs,
+        self,
+        modules,
+        temperature=1.0,
+        temperature_lm=1.0,
+        use_kv_cache=False,
+        **kwargs,
     ):
         super(S2STransformerBeamSearchPara, self).__init__(**kwargs)
 
@@ -1685,6 +2227,24 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
         self.temperature = temperature
         self.temperature_lm = temperature_lm
 
+        self.use_kv_cache = use_kv_cache
+        if self.use_kv_cache and not hasattr(self.model, "decode_step"):
+            raise ValueError(
+                "use_kv_cache requires a model with a decode_step() method."
+            )
+        if self.use_kv_cache and not self.model.decoder.supports_kv_cache():
+            raise ValueError(
+                "use_kv_cache requires a decoder with regularMHA attention "
+                "(RelPosMHAXL does not support the key/value cache), "
+                "set use_kv_cache to False."
+            )
+
+        # The attention of the whole prefix is only needed by the
+        # attention-based constraints, otherwise only the last step is kept.
+        self.keep_attn_history = (
+            self.using_max_attn_shift or self.coverage_penalty > 0
+        )
+
     def reset_mem(self, batch_size, device):
         """Needed to reset the memory during beamsearch."""
         return None
@@ -1695,9 +2255,48 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
 
     def permute_mem(self, memory, index):
         """Permutes the memory."""
+        if self.use_kv_cache:
+            return self._permute_kv_cache(memory, index)
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
+    def _permute_kv_cache(self, memory, index):
+        """Permutes the self-attention caches (and the attention history).
+        The cross-attention keys and values are shared by the beams of an
+        utterance, so they never need to be permuted."""
+        (step, self_kvs, memory_kvs, mask), attn = memory
+        self_kvs = [
+            (
+                torch.index_select(key, dim=0, index=index),
+                torch.index_select(value, dim=0, index=index),
+            )
+            for key, value in self_kvs
+        ]
+        if attn is not None:
+            attn = torch.index_select(attn, dim=0, index=index)
+        return (step, self_kvs, memory_kvs, mask), attn
+
+    def select_mem(self, memory, index):
+        """Selects the memory of some beams, with the cross-attention keys
+        and values of the key/value cache."""
+        if memory is None:
+            return memory
+        if not self.use_kv_cache:
+            return self.permute_mem(memory, index)
+        (step, self_kvs, memory_kvs, mask), attn = self._permute_kv_cache(
+            memory, index
+        )
+        memory_kvs = [
+            (
+                torch.index_select(key, dim=0, index=index),
+                torch.index_select(value, dim=0, index=index),
+            )
+            for key, value in memory_kvs
+        ]
+        if mask is not None:
+            mask = torch.index_select(mask, dim=0, index=index)
+        return (step, self_kvs, memory_kvs, mask), attn
+
     def permute_lm_mem(self, memory, index):
         """Permutes the memory of the language model."""
         memory = torch.index_select(memory, dim=0, index=index)
@@ -1705,13 +2304,38 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
 
     def forward_step(self, inp_tokens, memory, enc_states, enc_lens):
         """Performs a step in the implemented beamsearcher."""
+        if self.use_kv_cache:
+            return self._cached_forward_step(
+                inp_tokens, memory, enc_states, enc_lens
+            )
+
         memory = _update_mem(inp_tokens, memory)
-        pred, attn = self.model.decode(memory, enc_states)
+        pred, attn = self.model.decode(memory, enc_states, enc_lens)
         fc_out = self.fc(pred)
         para_out = self.fc_para(pred)
         prob_dist = self.softmax(fc_out / self.temperature)
         return prob_dist[:, -1, :], memory, attn, para_out[:, -1, :]
 
+    def _cached_forward_step(self, inp_tokens, memory, enc_states, enc_lens):
+        """Performs an incremental step using the key/value cache."""
+        cache, attn_history = (None, None) if memory is None else memory
+        pred, attn, cache = self.model.decode_step(
+            inp_tokens, enc_states, cache, enc_lens
+        )
+        if self.keep_attn_history:
+            if attn_history is not None:
+                attn = torch.cat([attn_history, attn], dim=1)
+            attn_history = attn
+        fc_out = self.fc(pred)
+        para_out = self.fc_para(pred)
+        prob_dist = self.softmax(fc_out / self.temperature)
+        return (
+            prob_dist[:, -1, :],
+            (cache, attn_history),
+            attn,
+            para_out[:, -1, :],
+        )
+
     def lm_forward_step(self, inp_tokens, memory):
         """Performs a step in the implemented LM module."""
         memory = _update_mem(inp_tokens, memory)
@@ -1721,15 +2345,17 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
         log_probs = self.softmax(logits / self.temperature_lm)
         return log_probs[:, -1, :], memory
 
-    def _get_top_score_prediction(self, hyps_and_scores, topk, para_seqs):
+    def _get_top_score_prediction(self, buffers, topk, para_seqs):
         """This method sorts the scores and return corresponding hypothesis and log probs.
 
         Arguments
         ---------
-        hyps_and_scores : list
-            To store generated hypotheses and scores.
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
         topk : int
             Number of hypothesis to return.
+        para_seqs : torch.Tensor (batch * beam_size, max length)
+            The paraphasia labels of the beams of each utterance.
 
         Returns
         -------
@@ -1741,35 +2367,21 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
             This tensor contains the final scores of topk hypotheses.
         topk_log_probs : list
             The log probabilities of each hypotheses.
+        topk_para_seq : torch.Tensor (batch, topk, max length)
+            The paraphasia labels of the topk hypotheses.
         """
-        top_hyps, top_log_probs, top_scores, top_lengths = [], [], [], []
-        batch_size = len(hyps_and_scores)
-
-        # Collect hypotheses
-        for i in range(len(hyps_and_scores)):
-            hyps, log_probs, scores = zip(*hyps_and_scores[i])
-            top_hyps += hyps
-            top_scores += scores
-            top_log_probs += log_probs
-            top_lengths += [len(hyp) for hyp in hyps]
-        top_hyps = torch.nn.utils.rnn.pad_sequence(
-            top_hyps, batch_first=True, padding_value=0
-        )
-        top_scores = torch.stack((top_scores), dim=0).view(batch_size, -1)
-        top_lengths = torch.tensor(
-            top_lengths, dtype=torch.int, device=top_scores.device
-        )
-        # Get topk indices
-        topk_scores, indices = top_scores.topk(self.topk, dim=-1)
-        indices = (indices + self.beam_offset.unsqueeze(1)).view(
-            batch_size * self.topk
+        # Padding with eos, as the hypotheses filled up at the maximum
+        # decoding length of a short utterance do not end with eos.
+        (
+            topk_hyps,
+            topk_scores,
+            topk_lengths,
+            topk_log_probs,
+            indices,
+        ) = super()._get_top_score_prediction(
+            buffers, topk, padding_value=self.eos_index
         )
-        # Select topk hypotheses
-        topk_hyps = torch.index_select(top_hyps, dim=0, index=indices,)
-        topk_hyps = topk_hyps.view(batch_size, self.topk, -1)
-        topk_lengths = torch.index_select(top_lengths, dim=0, index=indices,)
-        topk_lengths = topk_lengths.view(batch_size, self.topk)
-        topk_log_probs = [top_log_probs[index.item()] for index in indices]
+        batch_size = topk_scores.shape[0]
 
         # Select corresponding topk para_seq
         topk_para_seq = torch.index_select(
@@ -1785,14 +2397,79 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
             topk_para_seq,
         )
 
+    def _get_decoding_lengths(self, enc_lens):
+        """Returns the minimum and maximum decoding steps of each utterance."""
+        min_decode_steps, max_decode_steps = [], []
+        for enc_len in enc_lens.tolist():
+            # the decoding steps can be based on the max number of tokens that a decoder can process (e.g., 448 for Whisper).
+            min_steps, max_steps = self.change_max_decoding_length(
+                int(enc_len * self.min_decode_ratio),
+                int(enc_len * self.max_decode_ratio),
+            )
+            min_decode_steps.append(min_steps)
+            max_decode_steps.append(max_steps)
+        return min_decode_steps, max_decode_steps
+
+    def _close_finished_utterances(
+        self, t, max_decode_steps, buffers, scores, final_lengths,
+    ):
+        """Fills up with eos the hypotheses of the utterances that reached
+        their maximum decoding length, and keeps the para_seq of every
+        utterance whose hypotheses are full, as it is at step t. Each
+        utterance thus ends exactly where it would when decoded alone.
+
+        Arguments
+        ---------
+        t : int
+            The current step.
+        max_decode_steps : torch.Tensor (batch)
+            The maximum decoding steps of each utterance.
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
+        scores : torch.Tensor
+            The scores of the beams at the previous step.
+        final_lengths : torch.Tensor (batch)
+            The length of para_seq of each utterance when its decoding is
+            over (-1 until then), set at the step where it is over.
+
+        Returns
+        -------
+        list
+            Whether the decoding of each active utterance is over.
+        """
+        # Using all eos to fill-up the hyps of the utterances at their
+        # maximum length (no change for those which are full already).
+        at_max_length = inflate_tensor(
+            max_decode_steps[buffers.utterances] <= t,
+            times=self.beam_size,
+            dim=0,
+        )
+        eos = torch.full_like(at_max_length, -1, dtype=torch.long)
+        eos.masked_fill_(at_max_length, self.eos_index)
+        _ = self._update_hyp_and_scores(eos, buffers, scores, timesteps=t)
+
+        is_full = buffers.num_finished == self.beam_size
+        final_lengths.masked_fill_(is_full & (final_lengths < 0), buffers.step)
+        return buffers.full_utterances()
+
     def forward(self, enc_states, wav_len):  # noqa: C901
         """Applies beamsearch and returns the predicted tokens."""
         enc_lens = torch.round(enc_states.shape[1] * wav_len).int()
         device = enc_states.device
         batch_size = enc_states.shape[0]
 
+        # The decoder only masks the encoder states of padded batches.
+        if (enc_lens < enc_states.shape[1]).any():
+            dec_lens = inflate_tensor(enc_lens, times=self.beam_size, dim=0)
+        else:
+            dec_lens = None
+        min_decode_steps, max_decode_steps = self._get_decoding_lengths(
+            enc_lens
+        )
+
         memory = self.reset_mem(batch_size * self.beam_size, device=device)
 
+        lm_memory = ctc_scorer = ctc_memory = None
         if self.lm_weight > 0:
             lm_memory = self.reset_lm_mem(batch_size * self.beam_size, device)
 
@@ -1835,43 +2512,77 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
         # keep only the first to make sure no redundancy.
         sequence_scores.index_fill_(0, self.beam_offset, 0.0)
 
-        # keep the hypothesis that reaches eos and their corresponding score and log_probs.
-        hyps_and_scores = [[] for _ in range(batch_size)]
-
-        # keep the sequences that still not reaches eos.
-        alived_seq = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        ).long()
-
-        # Keep the log-probabilities of alived sequences.
-        alived_log_probs = torch.empty(
-            batch_size * self.beam_size, 0, device=device
+        # keep the sequences that still not reaches eos, their
+        # log-probabilities and para_seq, and the hypothesis that reaches eos
+        # with their corresponding score and log_probs.
+        max_steps = max(max_decode_steps)
+        buffers = _BeamBuffers(
+            batch_size,
+            self.beam_size,
+            max_steps,
+            device,
+            fields=("para",),
+            keep_prefixes=self.ctc_weight > 0,
         )
 
-        min_decode_steps = int(enc_states.shape[1] * self.min_decode_ratio)
-        max_decode_steps = int(enc_states.shape[1] * self.max_decode_ratio)
-
-        # the decoding steps can be based on the max number of tokens that a decoder can process (e.g., 448 for Whisper).
-        min_decode_steps, max_decode_steps = self.change_max_decoding_length(
-            min_decode_steps, max_decode_steps
+        # eos is blocked beam-wise while an utterance is under its minimum
+        min_decode_rows = inflate_tensor(
+            torch.tensor(min_decode_steps, device=device),
+            times=self.beam_size,
+            dim=0,
         )
 
         # Initialize the previous attention peak to zero
         # This variable will be used when using_max_attn_shift=True
         prev_attn_peak = torch.zeros(batch_size * self.beam_size, device=device)
 
-        para_seq = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        )  # Initialize para_seq
+        # length of para_seq of each utterance when its decoding is over
+        final_lengths = torch.full(
+            (batch_size,), -1, dtype=torch.long, device=device
+        )
+        max_decode_steps = torch.tensor(max_decode_steps, device=device)
+        scores = sequence_scores
+        self.coverage = None
 
-        # print(f"max_decode_steps: {max_decode_steps}")
-        for t in range(max_decode_steps):
+        for t in range(max_steps):
             # terminate condition
-            if self._check_full_beams(hyps_and_scores, self.beam_size):
+            is_over = self._close_finished_utterances(
+                t, max_decode_steps, buffers, scores, final_lengths
+            )
+            if all(is_over):
                 break
 
+            # Only the utterances whose hypotheses are not full are decoded
+            if any(is_over):
+                utterances, beams = buffers.drop(is_over)
+                batch_size = len(utterances)
+                self.beam_offset = (
+                    torch.arange(batch_size, device=device) * self.beam_size
+                )
+                (
+                    inp_tokens,
+                    sequence_scores,
+                    enc_states,
+                    min_decode_rows,
+                    prev_attn_peak,
+                ) = [
+                    torch.index_select(x, dim=0, index=beams)
+                    for x in (
+                        inp_tokens,
+                        sequence_scores,
+                        enc_states,
+                        min_decode_rows,
+                        prev_attn_peak,
+                    )
+                ]
+                if dec_lens is not None:
+                    dec_lens = torch.index_select(dec_lens, dim=0, index=beams)
+                memory, lm_memory, ctc_memory = self._drop_utterances(
+                    utterances, beams, memory, lm_memory, ctc_scorer, ctc_memory
+                )
+
             log_probs, memory, attn, para_out = self.forward_step(
-                inp_tokens, memory, enc_states, enc_lens
+                inp_tokens, memory, enc_states, dec_lens
             )
 
             log_probs = self.att_weight * log_probs
@@ -1889,8 +2600,10 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
                 prev_attn_peak = attn_peak
 
             # Set eos to minus_inf when less than minimum steps.
-            if t < min_decode_steps:
-                log_probs[:, self.eos_index] = self.minus_inf
+            if t < max(min_decode_steps):
+                log_probs[:, self.eos_index] = log_probs[
+                    :, self.eos_index
+                ].masked_fill(t < min_decode_rows, self.minus_inf)
 
             # Set the eos prob to minus_inf when it doesn't exceed threshold.
             if self.using_eos_threshold:
@@ -1910,7 +2623,7 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
 
             # adding CTC scores to log_prob if ctc_weight > 0
             if self.ctc_weight > 0:
-                g = alived_seq
+                g = buffers.prefix()
                 # block blank token
                 log_probs[:, self.blank_index] = self.minus_inf
                 if self.ctc_weight != 1.0 and self.ctc_score_mode == "partial":
@@ -2000,66 +2713,36 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
                 )
                 scores = scores - penalty * self.coverage_penalty
 
-            # Update alived_seq
-            alived_seq = torch.cat(
-                [
-                    torch.index_select(alived_seq, dim=0, index=predecessors),
-                    inp_tokens.unsqueeze(1),
-                ],
-                dim=-1,
+            # Update the tokens, log-probabilities and para_seq of the beams
+            beam_log_probs = log_probs_clone.gather(1, candidates).view(
+                batch_size * self.beam_size
             )
-
-            # Takes the log-probabilities
-            beam_log_probs = log_probs_clone[
-                torch.arange(batch_size).unsqueeze(1), candidates
-            ].reshape(batch_size * self.beam_size)
-
-            alived_log_probs = torch.cat(
-                [
-                    torch.index_select(
-                        alived_log_probs, dim=0, index=predecessors
-                    ),
-                    beam_log_probs.unsqueeze(1),
-                ],
-                dim=-1,
-            )
-
-            # para seq
-            para_seq = torch.cat(
-                [
-                    torch.index_select(para_seq, dim=0, index=predecessors),
-                    torch.argmax(para_out, dim=-1).unsqueeze(1),
-                ],
-                dim=-1,
+            buffers.append(
+                predecessors,
+                tokens=inp_tokens,
+                log_probs=beam_log_probs,
+                para=torch.argmax(para_out, dim=-1),
             )
 
             is_eos = self._update_hyp_and_scores(
-                inp_tokens,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=t,
+                inp_tokens, buffers, scores, timesteps=t,
             )
 
-            # Block the paths that have reached eos.
+            # Block the paths that have reached eos, and the pruned ones.
+            if self.prune_margin is not None:
+                pruned = self._prune_beams(buffers, scores, is_eos, t)
+                sequence_scores.masked_fill_(pruned, float("-inf"))
             sequence_scores.masked_fill_(is_eos, float("-inf"))
 
-        if not self._check_full_beams(hyps_and_scores, self.beam_size):
-            # Using all eos to fill-up the hyps.
-            eos = (
-                torch.zeros(batch_size * self.beam_size, device=device)
-                .fill_(self.eos_index)
-                .long()
-            )
-            _ = self._update_hyp_and_scores(
-                eos,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=max_decode_steps,
-            )
+        self._close_finished_utterances(
+            max_steps, max_decode_steps, buffers, scores, final_lengths
+        )
+        para_seq = buffers.backtrack(
+            "para",
+            buffers.beams,
+            inflate_tensor(final_lengths, times=self.beam_size, dim=0),
+            int(final_lengths.max()),
+        )
 
         (
             topk_hyps,
@@ -2068,7 +2751,7 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
             log_probs,
             topk_para_seq,
         ) = self._get_top_score_prediction(
-            hyps_and_scores, topk=self.topk, para_seqs=para_seq
+            buffers, topk=self.topk, para_seqs=para_seq
         )
         # pick the best hyp
         predictions = topk_hyps[:, 0, :]
@@ -2076,7 +2759,7 @@ class S2STransformerBeamSearchPara(S2SBeamSearcher):
         # Get top1 para_seq for each batch
         top1_para_seq_indices = topk_scores.argmax(dim=-1)  # get top1 indices
         top1_para_seq = topk_para_seq[
-            torch.arange(batch_size), top1_para_seq_indices
+            torch.arange(topk_scores.shape[0]), top1_para_seq_indices
         ]
 
         # filter para and pred using eos
@@ -2120,6 +2803,7 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
 
         memory = self.reset_mem(batch_size * self.beam_size, device=device)
 
+        lm_memory = ctc_scorer = ctc_memory = None
         if self.lm_weight > 0:
             lm_memory = self.reset_lm_mem(batch_size * self.beam_size, device)
 
@@ -2162,19 +2846,6 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
         # keep only the first to make sure no redundancy.
         sequence_scores.index_fill_(0, self.beam_offset, 0.0)
 
-        # keep the hypothesis that reaches eos and their corresponding score and log_probs.
-        hyps_and_scores = [[] for _ in range(batch_size)]
-
-        # keep the sequences that still not reaches eos.
-        alived_seq = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        ).long()
-
-        # Keep the log-probabilities of alived sequences.
-        alived_log_probs = torch.empty(
-            batch_size * self.beam_size, 0, device=device
-        )
-
         min_decode_steps = int(enc_states.shape[1] * self.min_decode_ratio)
         max_decode_steps = int(enc_states.shape[1] * self.max_decode_ratio)
 
@@ -2183,6 +2854,17 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
             min_decode_steps, max_decode_steps
         )
 
+        # keep the sequences that still not reaches eos, their
+        # log-probabilities, and the hypothesis that reaches eos with their
+        # corresponding score and log_probs.
+        buffers = _BeamBuffers(
+            batch_size,
+            self.beam_size,
+            max_decode_steps,
+            device,
+            keep_prefixes=self.ctc_weight > 0,
+        )
+
         # Initialize the previous attention peak to zero
         # This variable will be used when using_max_attn_shift=True
         prev_attn_peak = torch.zeros(batch_size * self.beam_size, device=device)
@@ -2192,7 +2874,7 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
 
         for t in range(max_decode_steps):
             # terminate condition
-            if self._check_full_beams(hyps_and_scores, self.beam_size):
+            if self._check_full_beams(buffers):
                 break
 
             log_probs, memory, attn = self.forward_step(
@@ -2234,7 +2916,7 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
 
             # adding CTC scores to log_prob if ctc_weight > 0
             if self.ctc_weight > 0:
-                g = alived_seq
+                g = buffers.prefix()
                 # block blank token
                 log_probs[:, self.blank_index] = self.minus_inf
                 if self.ctc_weight != 1.0 and self.ctc_score_mode == "partial":
@@ -2324,56 +3006,33 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
                 )
                 scores = scores - penalty * self.coverage_penalty
 
-            # Update alived_seq
-            alived_seq = torch.cat(
-                [
-                    torch.index_select(alived_seq, dim=0, index=predecessors),
-                    inp_tokens.unsqueeze(1),
-                ],
-                dim=-1,
+            # Update the tokens and log-probabilities of the beams
+            beam_log_probs = log_probs_clone.gather(1, candidates).view(
+                batch_size * self.beam_size
             )
-
-            # Takes the log-probabilities
-            beam_log_probs = log_probs_clone[
-                torch.arange(batch_size).unsqueeze(1), candidates
-            ].reshape(batch_size * self.beam_size)
-            alived_log_probs = torch.cat(
-                [
-                    torch.index_select(
-                        alived_log_probs, dim=0, index=predecessors
-                    ),
-                    beam_log_probs.unsqueeze(1),
-                ],
-                dim=-1,
+            buffers.append(
+                predecessors, tokens=inp_tokens, log_probs=beam_log_probs
             )
 
             is_eos = self._update_hyp_and_scores(
-                inp_tokens,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=t,
+                inp_tokens, buffers, scores, timesteps=t,
             )
 
-            # Block the paths that have reached eos.
+            # Block the paths that have reached eos, and the pruned ones.
+            if self.prune_margin is not None:
+                pruned = self._prune_beams(buffers, scores, is_eos, t)
+                sequence_scores.masked_fill_(pruned, float("-inf"))
             sequence_scores.masked_fill_(is_eos, float("-inf"))
 
-        if not self._check_full_beams(hyps_and_scores, self.beam_size):
-            # Using all eos to fill-up the hyps.
-            eos = (
-                torch.zeros(batch_size * self.beam_size, device=device)
-                .fill_(self.eos_index)
-                .long()
-            )
-            _ = self._update_hyp_and_scores(
-                eos,
-                alived_seq,
-                alived_log_probs,
-                hyps_and_scores,
-                scores,
-                timesteps=max_decode_steps,
-            )
+        # Using all eos to fill-up the hyps (if not full).
+        eos = (
+            torch.zeros(batch_size * self.beam_size, device=device)
+            .fill_(self.eos_index)
+            .long()
+        )
+        _ = self._update_hyp_and_scores(
+            eos, buffers, scores, timesteps=max_decode_steps,
+        )
 
         # use the last decoding step as the attention
         attention_weights = attn
@@ -2391,7 +3050,7 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
             log_probs,
             topk_attention_weights,
         ) = self._get_top_score_prediction(
-            hyps_and_scores, topk=self.topk, attention_weights=attn
+            buffers, topk=self.topk, attention_weights=attn
         )
         # pick the best hyp
         predictions = topk_hyps[:, 0, :]
@@ -2405,15 +3064,13 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
         else:
             return predictions, topk_scores, topk_attention_weights
 
-    def _get_top_score_prediction(
-        self, hyps_and_scores, topk, attention_weights
-    ):
+    def _get_top_score_prediction(self, buffers, topk, attention_weights):
         """This method sorts the scores and return corresponding hypothesis and log probs.
 
         Arguments
         ---------
-        hyps_and_scores : list
-            To store generated hypotheses and scores.
+        buffers : _BeamBuffers
+            The histories of the beams and the finished hypotheses.
         topk : int
             Number of hypothesis to return.
 
@@ -2432,42 +3089,14 @@ class S2STransformerBeamSearchAttention(S2STransformerBeamSearch):
         topk_log_probs : list
             The log probabilities of each hypotheses.
         """
-        top_hyps, top_log_probs, top_scores, top_lengths, top_att_weights = (
-            [],
-            [],
-            [],
-            [],
-            [],
-        )
-        batch_size = len(hyps_and_scores)
-
-        # Collect hypotheses
-        for i in range(len(hyps_and_scores)):
-            hyps, log_probs, scores = zip(*hyps_and_scores[i])
-            top_hyps += hyps
-            top_scores += scores
-            top_log_probs += log_probs
-            top_lengths += [len(hyp) for hyp in hyps]
-            # top_att_weights += [all_attention_weights[j] for j in range(len(hyps))]
-
-        top_hyps = torch.nn.utils.rnn.pad_sequence(
-            top_hyps, batch_first=True, padding_value=0
-        )
-        top_scores = torch.stack((top_scores), dim=0).view(batch_size, -1)
-        top_lengths = torch.tensor(
-            top_lengths, dtype=torch.int, device=top_scores.device
-        )
-        # Get topk indices
-        topk_scores, indices = top_scores.topk(self.topk, dim=-1)
-        indices = (indices + self.beam_offset.unsqueeze(1)).view(
-            batch_size * self.topk
-        )
-        # Select topk hypotheses
-        topk_hyps = torch.index_select(top_hyps, dim=0, index=indices,)
-        topk_hyps = topk_hyps.view(batch_size, self.topk, -1)
-        topk_lengths = torch.index_select(top_lengths, dim=0, index=indices,)
-        topk_lengths = topk_lengths.view(batch_size, self.topk)
-        topk_log_probs = [top_log_probs[index.item()] for index in indices]
+        (
+            topk_hyps,
+            topk_scores,
+            topk_lengths,
+            topk_log_probs,
+            indices,
+        ) = super()._get_top_score_prediction(buffers, topk)
+        batch_size = topk_scores.shape[0]
 
         topk_attention_weights = attention_weights.index_select(
             0, indices.view(-1) // attention_weights.shape[1]
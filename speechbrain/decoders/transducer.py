@@ -41,6 +41,13 @@ class TransducerBeamSearcher(torch.nn.Module):
         that are added in A (process_hyp).
         Reference: https://arxiv.org/pdf/1911.01629.pdf
         Reference: https://github.com/kaldi-asr/kaldi/blob/master/src/decoder/simple-decoder.cc (See PruneToks)
+    batched_search : bool
+        Whether to use the batched, time-synchronous beam search
+        (transducer_batched_beam_search_decode) instead of the search over
+        each utterance (default: False).
+    max_symbols_per_frame : int
+        The maximum number of tokens emitted at each frame by the batched
+        search (default: 2).
 
     Example
     -------
@@ -82,6 +89,19 @@ class TransducerBeamSearcher(torch.nn.Module):
     ... )
     >>> enc = torch.rand([1, 20, 10])
     >>> hyps, scores, _, _ = searcher(enc)
+    >>> searcher = TransducerBeamSearcher(
+    ...     decode_network_lst=[emb, dec],
+    ...     tjoint=tjoint,
+    ...     classifier_network=[lin],
+    ...     blank_id=0,
+    ...     beam_size=4,
+    ...     nbest=2,
+    ...     batched_search=True,
+    ... )
+    >>> enc = torch.rand([3, 20, 10])
+    >>> hyps, scores, nbest_hyps, nbest_scores = searcher(enc)
+    >>> len(hyps), len(nbest_hyps[0])
+    (3, 2)
     """
 
     def __init__(
@@ -96,6 +116,8 @@ class TransducerBeamSearcher(torch.nn.Module):
         lm_weight=0.0,
         state_beam=2.3,
         expand_beam=2.3,
+        batched_search=False,
+        max_symbols_per_frame=2,
     ):
         super(TransducerBeamSearcher, self).__init__()
         self.decode_network_lst = decode_network_lst
@@ -112,10 +134,13 @@ class TransducerBeamSearcher(torch.nn.Module):
 
         self.state_beam = state_beam
         self.expand_beam = expand_beam
+        self.max_symbols_per_frame = max_symbols_per_frame
         self.softmax = torch.nn.LogSoftmax(dim=-1)
 
         if self.beam_size <= 1:
             self.searcher = self.transducer_greedy_decode
+        elif batched_search:
+            self.searcher = self.transducer_batched_beam_search_decode
         else:
             self.searcher = self.transducer_beam_search_decode
 
@@ -372,6 +397,284 @@ class TransducerBeamSearcher(torch.nn.Module):
             nbest_batch_score,
         )
 
+    def transducer_batched_beam_search_decode(self, tn_output):
+        """Transducer batched beam search decoder is a time-synchronous beam
+        search over the whole batch (Reference: https://arxiv.org/pdf/1911.01629.pdf):
+            1- the beam_size hypotheses of every utterance are kept in tensors
+            2- for each time step in the Transcription Network (TN) output:
+                -> Do forward on Joint network for all the hypotheses at once
+                -> The hypotheses extended by blank end the time step
+                -> The others are extended by their topK <= beam tokens
+                   (do forward on PN for all of them at once), and so on,
+                   up to max_symbols_per_frame tokens
+                -> Keep the topK hypotheses ending the time step, the
+                   identical prefixes being merged
+
+        The PN output and hiddens of a hypothesis are computed once, when
+        its last token is added, and kept with its prefix for the next time
+        steps.
+
+        Arguments
+        ----------
+        tn_output : torch.tensor
+            Output from transcription network with shape
+            [batch, time_len, hiddens].
+
+        Returns
+        -------
+        torch.tensor
+            Outputs a logits tensor [B,T,1,Output_Dim]; padding
+            has not been removed.
+        """
+        batch_size = tn_output.size(0)
+        num_beams = batch_size * self.beam_size
+        device = tn_output.device
+        beam_offset = (
+            torch.arange(batch_size, device=device) * self.beam_size
+        ).unsqueeze(1)
+
+        # The hypotheses: tokens (padded with -1), number of tokens and
+        # score. Only the first hypothesis of each utterance is alive.
+        tokens = torch.full((num_beams, 0), -1, dtype=torch.long, device=device)
+        lengths = torch.zeros(num_beams, dtype=torch.long, device=device)
+        scores = torch.full(
+            (batch_size, self.beam_size), float("-inf"), device=device
+        )
+        scores[:, 0] = 0.0
+
+        # prepare BOS = Blank for the Prediction Network (PN)
+        input_PN = (
+            torch.ones((num_beams, 1), device=device, dtype=torch.int32)
+            * self.blank_id
+        )
+        # First forward-pass on PN (and LM)
+        out_PN, hidden = self._forward_PN(input_PN, self.decode_network_lst)
+        log_probs_lm = hidden_lm = None
+        if self.lm_weight > 0:
+            log_probs_lm, hidden_lm = self._lm_forward_step(input_PN, None)
+        hyps = (
+            scores.view(-1),
+            tokens,
+            lengths,
+            out_PN,
+            hidden,
+            log_probs_lm,
+            hidden_lm,
+        )
+
+        # For each time step
+        for t_step in range(tn_output.size(1)):
+            # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
+            tn_step = torch.repeat_interleave(
+                tn_output[:, t_step], self.beam_size, dim=0
+            )[:, None, None]
+            ended_hyps = []
+            for num_symbols in range(self.max_symbols_per_frame + 1):
+                log_probs = self._joint_forward_step(
+                    tn_step, hyps[3].unsqueeze(1)
+                ).view(num_beams, -1)
+                ended_hyps.append(
+                    (hyps[0] + log_probs[:, self.blank_id],) + hyps[1:]
+                )
+                if num_symbols == self.max_symbols_per_frame:
+                    break
+                hyps = self._extend_hyps(
+                    hyps, log_probs, ended_hyps, beam_offset
+                )
+                if not torch.isfinite(hyps[0]).any():
+                    break
+            hyps = self._select_ended_hyps(ended_hyps, beam_offset)
+
+        # Add norm score
+        scores, tokens, lengths = hyps[:3]
+        norm_scores = (scores / (lengths + 1)).view(batch_size, -1)
+        norm_scores, order = norm_scores.sort(dim=-1, descending=True)
+        nbest = min(self.nbest, self.beam_size)
+        rows = (order[:, :nbest] + beam_offset).view(-1)
+        all_tokens = tokens[rows].tolist()
+        all_lengths = lengths[rows].tolist()
+        norm_scores = norm_scores[:, :nbest].tolist()
+        nbest_batch = []
+        nbest_batch_score = []
+        for i_batch in range(batch_size):
+            all_predictions = []
+            all_scores = []
+            for j in range(nbest):
+                score = norm_scores[i_batch][j]
+                if score == float("-inf") and all_predictions:
+                    break
+                row = i_batch * nbest + j
+                all_predictions.append(all_tokens[row][: all_lengths[row]])
+                all_scores.append(score)
+            nbest_batch.append(all_predictions)
+            nbest_batch_score.append(all_scores)
+        return (
+            [nbest_utt[0] for nbest_utt in nbest_batch],
+            torch.Tensor(
+                [nbest_utt_score[0] for nbest_utt_score in nbest_batch_score]
+            )
+            .exp()
+            .mean(),
+            nbest_batch,
+            nbest_batch_score,
+        )
+
+    def _extend_hyps(self, hyps, log_probs, ended_hyps, beam_offset):
+        """Extend the hypotheses by their best non-blank tokens, keeping
+        beam_size of them for each utterance, and do forward on PN (and LM)
+        for the new tokens.
+
+        Arguments
+        ----------
+        hyps : tuple
+            Scores, tokens, lengths, PN output, PN hiddens, LM log-probs and
+            LM hiddens of the hypotheses.
+        log_probs : torch.tensor
+            Output of the joint network for the hypotheses [B*beam, V].
+        ended_hyps : list
+            The hypotheses that ended the time step so far.
+        beam_offset : torch.tensor
+            The first hypothesis of each utterance [B, 1].
+
+        Returns
+        -------
+        tuple
+            The extended hypotheses.
+        """
+        scores, tokens, lengths, _, hidden, log_probs_lm, hidden_lm = hyps
+        batch_size = beam_offset.size(0)
+        vocab_size = log_probs.size(-1)
+
+        # Extend by the tokens within expand_beam of the best non-blank one
+        log_probs[:, self.blank_id] = float("-inf")
+        best_logp = log_probs.max(dim=-1, keepdim=True)[0]
+        log_probs.masked_fill_(
+            log_probs < best_logp - self.expand_beam, float("-inf")
+        )
+        topk_scores = scores.unsqueeze(1) + log_probs
+        if self.lm_weight > 0:
+            topk_scores = topk_scores + self.lm_weight * log_probs_lm.view(
+                topk_scores.shape
+            )
+        topk_scores, positions = topk_scores.view(batch_size, -1).topk(
+            self.beam_size, dim=-1
+        )
+
+        # Stop if best_hyp extended is worse by more than state_beam than
+        # best_hyp that ended the time step
+        best_ended = torch.cat(
+            [ended[0].view(batch_size, -1) for ended in ended_hyps], dim=1
+        ).max(dim=-1)[0]
+        stop = best_ended >= self.state_beam + topk_scores[:, 0]
+        topk_scores.masked_fill_(stop.unsqueeze(1), float("-inf"))
+
+        # Append the new tokens
+        selected = (
+            torch.div(positions, vocab_size, rounding_mode="floor")
+            + beam_offset
+        ).view(-1)
+        new_tokens = (positions % vocab_size).view(-1)
+        lengths = lengths[selected]
+        tokens = torch.nn.functional.pad(tokens[selected], (0, 1), value=-1)
+        tokens.scatter_(1, lengths.unsqueeze(1), new_tokens.unsqueeze(1))
+
+        # forward PN (and LM) once for all the new tokens
+        input_PN = new_tokens.int().unsqueeze(1)
+        out_PN, hidden = self._forward_PN(
+            input_PN,
+            self.decode_network_lst,
+            self._select_hiddens(hidden, selected),
+        )
+        if self.lm_weight > 0:
+            log_probs_lm, hidden_lm = self._lm_forward_step(
+                input_PN, self._select_hiddens(hidden_lm, selected)
+            )
+        return (
+            topk_scores.view(-1),
+            tokens,
+            lengths + 1,
+            out_PN,
+            hidden,
+            log_probs_lm,
+            hidden_lm,
+        )
+
+    def _select_ended_hyps(self, ended_hyps, beam_offset):
+        """Select the beam_size best hypotheses (by normalized score) of
+        each utterance among those that ended the time step. The
+        identical prefixes (ended with a different number of tokens in the
+        time step) are merged into the first one, with their summed
+        probabilities.
+
+        Arguments
+        ----------
+        ended_hyps : list
+            The hypotheses that ended the time step, after each number of
+            tokens emitted in it.
+        beam_offset : torch.tensor
+            The first hypothesis of each utterance [B, 1].
+
+        Returns
+        -------
+        tuple
+            The hypotheses for the next time step.
+        """
+        batch_size = beam_offset.size(0)
+        num_beams = batch_size * self.beam_size
+        width = max(ended[1].size(1) for ended in ended_hyps)
+        scores = torch.cat(
+            [ended[0].view(batch_size, -1) for ended in ended_hyps], dim=1
+        )
+        tokens = torch.cat(
+            [
+                torch.nn.functional.pad(
+                    ended[1], (0, width - ended[1].size(1)), value=-1
+                ).view(batch_size, self.beam_size, width)
+                for ended in ended_hyps
+            ],
+            dim=1,
+        )
+        lengths = torch.cat(
+            [ended[2].view(batch_size, -1) for ended in ended_hyps], dim=1
+        )
+
+        # Merge the identical prefixes
+        same = (tokens.unsqueeze(2) == tokens.unsqueeze(1)).all(dim=-1)
+        scores = torch.logsumexp(
+            scores.unsqueeze(1).masked_fill(~same, float("-inf")), dim=-1
+        )
+        earlier = torch.ones_like(same[0]).tril(diagonal=-1)
+        scores.masked_fill_((same & earlier).any(dim=-1), float("-inf"))
+
+        # Keep the topK by normalized score
+        _, best = (scores / (lengths + 1)).topk(self.beam_size, dim=-1)
+        scores = scores.gather(1, best).view(-1)
+        lengths = lengths.gather(1, best).view(-1)
+        tokens = tokens.gather(1, best.unsqueeze(2).expand(-1, -1, width)).view(
+            num_beams, width
+        )
+        tokens = tokens[:, : int(lengths.max())]
+        rows = (
+            torch.div(best, self.beam_size, rounding_mode="floor") * num_beams
+            + beam_offset
+            + best % self.beam_size
+        ).view(-1)
+        out_PN = torch.cat([ended[3] for ended in ended_hyps]).index_select(
+            0, rows
+        )
+        hidden = self._select_hiddens(
+            self._cat_hiddens([ended[4] for ended in ended_hyps]), rows
+        )
+        log_probs_lm = hidden_lm = None
+        if self.lm_weight > 0:
+            log_probs_lm = torch.cat(
+                [ended[5] for ended in ended_hyps]
+            ).index_select(0, rows)
+            hidden_lm = self._select_hiddens(
+                self._cat_hiddens([ended[6] for ended in ended_hyps]), rows
+            )
+        return scores, tokens, lengths, out_PN, hidden, log_probs_lm, hidden_lm
+
     def _joint_forward_step(self, h_i, out_PN):
         """Join predictions (TN & PN)."""
 
@@ -501,6 +804,47 @@ class TransducerBeamSearcher(torch.nn.Module):
                 out_PN = layer(out_PN)
         return out_PN, hidden
 
+    def _select_hiddens(self, hidden, index):
+        """Select the hiddens of some hypotheses (the recurrent layers
+        hiddens have the hypotheses on their second dimension).
+
+        Arguments
+        ----------
+        hidden : torch.tensor
+            Hidden tensor (or tuple for LSTM), None without recurrent layer.
+        index : torch.tensor
+            Indexes of the hypotheses.
+
+        Returns
+        -------
+        torch.tensor
+            Selected hiddens.
+        """
+        if hidden is None:
+            return None
+        if isinstance(hidden, tuple):
+            return tuple(h.index_select(1, index) for h in hidden)
+        return hidden.index_select(1, index)
+
+    def _cat_hiddens(self, hiddens):
+        """Concatenate the hiddens of several sets of hypotheses.
+
+        Arguments
+        ----------
+        hiddens : list
+            Hidden tensors (or tuples for LSTM, or None).
+
+        Returns
+        -------
+        torch.tensor
+            Concatenated hiddens.
+        """
+        if hiddens[0] is None:
+            return None
+        if isinstance(hiddens[0], tuple):
+            return tuple(torch.cat(h, dim=1) for h in zip(*hiddens))
+        return torch.cat(hiddens, dim=1)
+
     def _forward_after_joint(self, out, classifier_network):
         """Compute forward-pass through a list of classifier neural network.
 
@@ -60,10 +60,16 @@ Authors
  * Aku Rouhe 2020
 """
 import collections
+import json
 import logging
+import struct
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Starts the files written by compile_arpa
+COMPILED_MAGIC = b"SBNGRAM1"
+
 
 def read_arpa(fstream):
     r"""
@@ -185,6 +191,121 @@ def read_arpa(fstream):
     return num_ngrams, ngrams_by_order, backoffs_by_order
 
 
+def compile_arpa(fstream, path, token_list=None):
+    r"""
+    Compiles an ARPA format N-gram language model into the binary format read
+    (memory-mapped) by `speechbrain.lm.ngram.CompiledNgramLM`
+
+    The tokens are mapped to integer ids. The unigram log probabilities and
+    backoff weights are stored in arrays indexed by token id. The N-grams of
+    each higher order are stored sorted by their key, context_id * V + token,
+    where V is the vocabulary size and context_id is the position of the
+    context (N-1)-gram in the arrays of the order below. The context of any
+    N-gram can thus be found with a binary search, order by order.
+
+    Arguments
+    ---------
+    fstream : TextIO
+        Text file stream to read the ARPA model from.
+    path : str
+        Where to write the compiled model.
+    token_list : list
+        The tokens (as written in the ARPA file), in the order of their ids,
+        e.g. the output tokens of an acoustic model. Tokens of the ARPA file
+        that are not in token_list (e.g. <s>) get the next ids. Tokens of
+        token_list that are not in the ARPA file get the <unk> log probability
+        (if the ARPA file has one). Default: the tokens of the ARPA file, in
+        the order of the unigrams.
+
+    Returns
+    -------
+    dict
+        Maps N-gram orders to the number ngrams of that order.
+
+    Raises
+    ------
+    ValueError
+        If no LM is found or the file is badly formatted.
+    """
+    num_ngrams, ngrams_by_order, backoffs_by_order = read_arpa(fstream)
+    vocab = list(token_list) if token_list is not None else []
+    token_ids = {token: token_id for token_id, token in enumerate(vocab)}
+    for token in ngrams_by_order[1][tuple()]:
+        if token not in token_ids:
+            token_ids[token] = len(vocab)
+            vocab.append(token)
+    vocab_size = len(vocab)
+    top_order = max(ngrams_by_order)
+
+    arrays = {}
+    unigrams = ngrams_by_order[1][tuple()]
+    unk_logprob = unigrams.get("<unk>", float("-inf"))
+    arrays["logprobs_1"] = np.array(
+        [unigrams.get(token, unk_logprob) for token in vocab], dtype=np.float32,
+    )
+    if top_order > 1:
+        backoffs = backoffs_by_order.get(1, {})
+        arrays["backoffs_1"] = np.array(
+            [backoffs.get((token,), 0.0) for token in vocab], dtype=np.float32,
+        )
+    # Position of each context in the arrays of its order
+    context_ids = {(token,): token_ids[token] for token in vocab}
+    for order in range(2, top_order + 1):
+        keys, logprobs, ngram_tuples = [], [], []
+        for context, probs in ngrams_by_order[order].items():
+            if context not in context_ids:
+                logger.warning(
+                    f"Skipping the {order}-grams of unknown context {context}"
+                )
+                continue
+            offset = context_ids[context] * vocab_size
+            for token, prob in probs.items():
+                keys.append(offset + token_ids[token])
+                logprobs.append(prob)
+                ngram_tuples.append(context + (token,))
+        keys = np.array(keys, dtype=np.int64)
+        sort_order = np.argsort(keys, kind="stable")
+        arrays[f"keys_{order}"] = keys[sort_order]
+        arrays[f"logprobs_{order}"] = np.array(logprobs, dtype=np.float32)[
+            sort_order
+        ]
+        if order < top_order:
+            backoffs = backoffs_by_order.get(order, {})
+            ngram_tuples = [ngram_tuples[i] for i in sort_order]
+            arrays[f"backoffs_{order}"] = np.array(
+                [backoffs.get(ngram, 0.0) for ngram in ngram_tuples],
+                dtype=np.float32,
+            )
+            context_ids = {ngram: i for i, ngram in enumerate(ngram_tuples)}
+
+    header = {
+        "order": top_order,
+        "vocab": vocab,
+        "num_tokens": len(token_list) if token_list is not None else vocab_size,
+        "bos_id": token_ids.get("<s>"),
+        "eos_id": token_ids.get("</s>"),
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": array.shape,
+            "offset": offset,
+        }
+        offset += -(-array.nbytes // 8) * 8
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(len(COMPILED_MAGIC) + 8 + len(header)) % 8)
+    with open(path, "wb") as fo:
+        fo.write(COMPILED_MAGIC)
+        fo.write(struct.pack("<Q", len(header)))
+        fo.write(header)
+        for array in arrays.values():
+            fo.write(array.tobytes())
+            fo.write(b"\0" * (-array.nbytes % 8))
+    return num_ngrams
+
+
 def _find_data_section(fstream):
     r"""
     Reads (lines) from the stream until the \data\ header is found.
@@ -5,6 +5,11 @@ Authors
  * Aku Rouhe 2020
 """
 import collections
+import json
+import struct
+import numpy as np
+import torch
+from speechbrain.lm.arpa import COMPILED_MAGIC
 
 NEGINFINITY = float("-inf")
 
@@ -106,6 +111,202 @@ class BackoffNgramLM:
         return lp + backoff_log_weight
 
 
+class CompiledNgramLM:
+    r"""
+    Batched query interface for backoff N-gram language models compiled with
+    `speechbrain.lm.arpa.compile_arpa`
+
+    The N-gram arrays are memory-mapped from the compiled file, so loading is
+    instant and only the pages that are queried are read. Tokens are integer
+    ids (see the token_list argument of compile_arpa).
+
+    The state of a prefix is the position, in the arrays of each order, of
+    its last 1, 2, ..., N-1 tokens (-1 if the model does not have them), so
+    a batch of states is a LongTensor [batch, N-1]. Scoring a token, or
+    moving the state on by one token, is a binary search per order for the
+    whole batch.
+
+    Arguments
+    ---------
+    path : str
+        The compiled model file.
+
+    Example
+    -------
+    >>> import io, math, os, tempfile
+    >>> from speechbrain.lm.arpa import compile_arpa
+    >>> path = os.path.join(tempfile.mkdtemp(), "lm.bin")
+    >>> with io.StringIO() as f:
+    ...     print("\\data\\", file=f)
+    ...     print("ngram 1=2", file=f)
+    ...     print("ngram 2=3", file=f)
+    ...     print("", file=f)
+    ...     print("\\1-grams:", file=f)
+    ...     print("-0.6931 a", file=f)
+    ...     print("-0.6931 b 0.", file=f)
+    ...     print("", file=f)
+    ...     print("\\2-grams:", file=f)
+    ...     print("-0.6931 a a", file=f)
+    ...     print("-0.6931 a b", file=f)
+    ...     print("-0.6931 b a", file=f)
+    ...     print("", file=f)
+    ...     print("\\end\\", file=f)
+    ...     _ = f.seek(0)
+    ...     num_grams = compile_arpa(f, path, token_list=["b", "a"])
+    >>> lm = CompiledNgramLM(path)
+    >>> round(math.exp(lm.logprob("b", ("b",))), 1)
+    0.5
+    >>> states = lm.advance(lm.initial_states(2), torch.tensor([0, 1]))
+    >>> lm.score(states, torch.tensor([0, 1])).exp().round(decimals=1)
+    tensor([[0.5000, 0.5000],
+            [0.5000, 0.5000]])
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as fi:
+            if fi.read(len(COMPILED_MAGIC)) != COMPILED_MAGIC:
+                raise ValueError(f"{path} is not a compiled N-gram LM")
+            (header_length,) = struct.unpack("<Q", fi.read(8))
+            header = json.loads(fi.read(header_length).decode("utf-8"))
+            data_offset = fi.tell()
+        self.top_order = header["order"]
+        self.vocab = header["vocab"]
+        self.token_ids = {token: i for i, token in enumerate(self.vocab)}
+        self.vocab_size = len(self.vocab)
+        # The ids shared with the token_list given to compile_arpa
+        self.num_tokens = header["num_tokens"]
+        self.bos_id = header["bos_id"]
+        self.eos_id = header["eos_id"]
+        arrays = {}
+        for name, info in header["arrays"].items():
+            shape = tuple(info["shape"])
+            if not all(shape):
+                arrays[name] = np.zeros(shape, dtype=info["dtype"])
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=info["dtype"],
+                mode="r",
+                offset=data_offset + info["offset"],
+                shape=shape,
+            )
+        # Indexed by order, the first being the unigrams (no keys)
+        self.keys = [None, None]
+        self.logprobs = [None]
+        self.backoffs = [None]
+        for order in range(1, self.top_order + 1):
+            self.keys.append(arrays.get(f"keys_{order}"))
+            self.logprobs.append(arrays[f"logprobs_{order}"])
+            self.backoffs.append(arrays.get(f"backoffs_{order}"))
+        self.keys = self.keys[1:]
+
+    def initial_states(self, batch_size, device="cpu"):
+        """Returns the states of batch_size prefixes made of <s> (or empty
+        if the model has no <s>)."""
+        states = torch.full(
+            (batch_size, self.top_order - 1), -1, dtype=torch.long
+        )
+        if self.bos_id is not None:
+            states = self.advance(
+                states, torch.full((batch_size,), self.bos_id)
+            )
+        return states.to(device)
+
+    def advance(self, prefix_states, tokens):
+        """Returns the states of the prefixes extended by one token.
+
+        Arguments
+        ---------
+        prefix_states : torch.Tensor
+            The states of the prefixes [batch, N-1].
+        tokens : torch.Tensor
+            The token added to each prefix [batch].
+
+        Returns
+        -------
+        torch.Tensor
+            The states of the extended prefixes [batch, N-1].
+        """
+        states = prefix_states.cpu().numpy()
+        tokens = tokens.cpu().numpy().astype(np.int64)
+        new_states = np.full_like(states, -1)
+        if self.top_order > 1:
+            new_states[:, 0] = tokens
+        for order in range(2, self.top_order):
+            new_states[:, order - 1] = self._find(
+                order, states[:, order - 2], tokens
+            )
+        return torch.from_numpy(new_states).to(prefix_states.device)
+
+    def score(self, prefix_states, candidate_tokens):
+        """Computes the log probabilities of candidate tokens following each
+        prefix, backing off to lower orders as needed.
+
+        Arguments
+        ---------
+        prefix_states : torch.Tensor
+            The states of the prefixes [batch, N-1].
+        candidate_tokens : torch.Tensor
+            The tokens to score, either the same for all the prefixes
+            [num_candidates], or for each prefix [batch, num_candidates].
+
+        Returns
+        -------
+        torch.Tensor
+            The log probabilities (in the base of the ARPA file)
+            [batch, num_candidates].
+        """
+        states = prefix_states.cpu().numpy()
+        tokens = candidate_tokens.cpu().numpy().astype(np.int64)
+        tokens = np.broadcast_to(tokens, (states.shape[0], tokens.shape[-1]))
+        # Unigrams, then the higher orders replace them where they are
+        # found, or add the backoff weight of their context otherwise.
+        log_probs = np.where(
+            tokens >= 0,
+            self.logprobs[1][np.maximum(tokens, 0)],
+            np.float32(NEGINFINITY),
+        )
+        for order in range(2, self.top_order + 1):
+            contexts = states[:, order - 2]
+            backoffs = np.where(
+                contexts >= 0,
+                self.backoffs[order - 1][np.maximum(contexts, 0)],
+                np.float32(0.0),
+            )
+            positions = self._find(order, contexts[:, None], tokens)
+            log_probs = np.where(
+                positions >= 0,
+                self.logprobs[order][np.maximum(positions, 0)],
+                log_probs + backoffs[:, None],
+            )
+        return torch.from_numpy(log_probs).to(prefix_states.device)
+
+    def logprob(self, token, context=tuple()):
+        """Computes the log probability of a token (string) given its
+        context (tuple of strings), as BackoffNgramLM.logprob."""
+        if token not in self.token_ids:
+            return NEGINFINITY
+        states = torch.full((1, self.top_order - 1), -1, dtype=torch.long)
+        # Only the last N-1 tokens of the context can be used
+        context = context[max(len(context) - self.top_order + 1, 0) :]
+        for context_token in context:
+            context_id = self.token_ids.get(context_token, -1)
+            states = self.advance(states, torch.tensor([context_id]))
+        token_id = torch.tensor([self.token_ids[token]])
+        return self.score(states, token_id).item()
+
+    def _find(self, order, contexts, tokens):
+        """Binary search of the N-grams (context, token) of the given order:
+        returns their positions, or -1 where they are not in the model."""
+        keys = self.keys[order]
+        queries = contexts * self.vocab_size + tokens
+        if len(keys) == 0:
+            return np.full_like(queries, -1)
+        positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        found = (contexts >= 0) & (tokens >= 0) & (keys[positions] == queries)
+        return np.where(found, positions, -1)
+
+
 def ngram_evaluation_details(data, LM):
     """
     Evaluates the N-gram LM on each sentence in data
@@ -89,6 +89,11 @@ class HuggingFaceWav2Vec2(nn.Module):
         For example wav2vec2-base has 12 transformer layers and the output is of shape (13, B, T, C),
         where a projection of the CNN output is added to the beginning.
         If False, the forward function outputs the hidden states only from the last transformer layer.
+    masked_norm : bool (default: False)
+        If True and wav_lens are given to forward(), the input and output
+        normalisations are computed over the non-padded part of each sequence
+        only. A padded batch then gets the same features as its sequences
+        encoded one at a time.
 
     Example
     -------
@@ -108,6 +113,7 @@ class HuggingFaceWav2Vec2(nn.Module):
         freeze_feature_extractor=False,
         apply_spec_augment=False,
         output_all_hiddens=False,
+        masked_norm=False,
     ):
         super().__init__()
 
@@ -141,6 +147,7 @@ class HuggingFaceWav2Vec2(nn.Module):
         self.freeze = freeze
         self.freeze_feature_extractor = freeze_feature_extractor
         self.output_norm = output_norm
+        self.masked_norm = masked_norm
         if self.freeze:
             logger.warning(
                 "speechbrain.lobes.models.huggingface_wav2vec - wav2vec 2.0 is frozen."
@@ -326,8 +333,15 @@ class HuggingFaceWav2Vec2(nn.Module):
 
         padding_mask = self.make_masks(wav, wav_len=wav_lens)
 
+        abs_lens = None
+        if self.masked_norm and wav_lens is not None:
+            abs_lens = torch.round(wav_lens * wav.shape[1]).long()
+
         if self.normalize_wav:
-            wav = F.layer_norm(wav, wav.shape[1:])
+            if abs_lens is not None:
+                wav = _masked_layer_norm(wav, abs_lens)
+            else:
+                wav = F.layer_norm(wav, wav.shape[1:])
 
         # Extract wav2vec output
         out = self.model(
@@ -345,10 +359,32 @@ class HuggingFaceWav2Vec2(nn.Module):
 
         # We normalize the output if required
         if self.output_norm:
-            out = F.layer_norm(out, norm_shape[1:])
+            if abs_lens is not None:
+                out_lens = self.model._get_feat_extract_output_lengths(abs_lens)
+                out = _masked_layer_norm(out, out_lens, feature_dims=1)
+            else:
+                out = F.layer_norm(out, norm_shape[1:])
 
         return out
 
+    def relative_output_lens(self, wav, wav_lens, out_len):
+        """Converts the relative lengths of the waveforms into relative
+        lengths of the output frames, such that round(lens * out_len) is
+        exactly the number of frames the model computes for each waveform.
+
+        Arguments
+        ---------
+        wav : torch.Tensor (signal)
+            A batch of audio signals.
+        wav_lens : tensor
+            The relative length of the wav given in SpeechBrain format.
+        out_len : int
+            The number of output frames of the batch.
+        """
+        abs_lens = torch.round(wav_lens * wav.shape[1]).long()
+        out_lens = self.model._get_feat_extract_output_lengths(abs_lens)
+        return out_lens.float() / out_len
+
     def make_masks(self, src, wav_len=None, pad_idx=0):
         """This method generates the padding masks.
         Arguments
@@ -368,6 +404,31 @@ class HuggingFaceWav2Vec2(nn.Module):
         return src_key_padding_mask
 
 
+def _masked_layer_norm(x, lens, feature_dims=0):
+    """Layer-normalises each sequence of a padded batch over its first
+    lens[i] time steps only, without affine parameters. Padded steps are set
+    to zero.
+
+    Arguments
+    ---------
+    x : torch.Tensor
+        Batch of shape [..., batch, time] if feature_dims is 0, or
+        [..., batch, time, fea] if feature_dims is 1.
+    lens : torch.Tensor
+        Absolute length of each sequence.
+    feature_dims : int
+        Number of trailing feature dimensions normalised with the time axis.
+    """
+    batch_dim = -2 - feature_dims
+    out = torch.zeros_like(x)
+    for i, length in enumerate(lens.tolist()):
+        seq = x.select(batch_dim, i).narrow(-1 - feature_dims, 0, length)
+        out.select(batch_dim, i).narrow(-1 - feature_dims, 0, length).copy_(
+            F.layer_norm(seq, seq.shape[-1 - feature_dims :])
+        )
+    return out
+
+
 class HuggingFaceWav2Vec2Pretrain(nn.Module):
     """This lobe enables the integration of HuggingFace
      wav2vec2.0 models to be pretrained.
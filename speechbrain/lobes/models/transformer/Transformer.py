@@ -665,6 +665,89 @@ class TransformerDecoderLayer(nn.Module):
 
         return tgt, self_attn, multihead_attention
 
+    def forward_step(
+        self, tgt, memory_kv, self_kv=None, memory_key_padding_mask=None,
+    ):
+        """Runs the layer on the newest target position only. The keys and
+        values of the previous positions (self_kv) and of the encoder states
+        (memory_kv) are taken from the cache instead of being recomputed.
+        Only available with regularMHA.
+
+        Arguments
+        ----------
+        tgt: tensor
+            The newest position of the sequence to the decoder layer,
+            (batch, 1, d_model).
+        memory_kv: tuple
+            The projected keys and values of the encoder states, as
+            returned by self.mutihead_attn.project_kv().
+        self_kv: tuple
+            The projected keys and values of the previous target positions,
+            None at the first step.
+        memory_key_padding_mask: tensor
+            The mask for the memory keys per batch (optional).
+
+        Example
+        -------
+        >>> src = torch.rand((8, 60, 512))
+        >>> tgt = torch.rand((8, 1, 512))
+        >>> net = TransformerDecoderLayer(1024, 8, d_model=512)
+        >>> memory_kv = net.mutihead_attn.project_kv(src, src)
+        >>> output, self_kv, attn = net.forward_step(tgt, memory_kv)
+        >>> output.shape
+        torch.Size([8, 1, 512])
+        >>> self_kv[0].shape
+        torch.Size([8, 8, 1, 64])
+        """
+        if self.normalize_before:
+            tgt1 = self.norm1(tgt)
+        else:
+            tgt1 = tgt
+
+        # self-attention over the cached target sequence
+        key, value = self.self_attn.project_kv(tgt1, tgt1)
+        if self_kv is not None:
+            key = torch.cat([self_kv[0], key], dim=2)
+            value = torch.cat([self_kv[1], value], dim=2)
+        tgt2, _ = self.self_attn.attend(tgt1, key, value)
+
+        # add & norm
+        tgt = tgt + self.dropout1(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm1(tgt)
+
+        if self.normalize_before:
+            tgt1 = self.norm2(tgt)
+        else:
+            tgt1 = tgt
+
+        # multi-head attention over the cached encoder states
+        tgt2, multihead_attention = self.mutihead_attn.attend(
+            tgt1,
+            memory_kv[0],
+            memory_kv[1],
+            key_padding_mask=memory_key_padding_mask,
+        )
+
+        # add & norm
+        tgt = tgt + self.dropout2(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm2(tgt)
+
+        if self.normalize_before:
+            tgt1 = self.norm3(tgt)
+        else:
+            tgt1 = tgt
+
+        tgt2 = self.pos_ffn(tgt1)
+
+        # add & norm
+        tgt = tgt + self.dropout3(tgt2)
+        if not self.normalize_before:
+            tgt = self.norm3(tgt)
+
+        return tgt, (key, value), multihead_attention
+
 
 class TransformerDecoder(nn.Module):
     """This class implements the Transformer decoder.
@@ -783,6 +866,88 @@ class TransformerDecoder(nn.Module):
 
         return output, self_attns, multihead_attns
 
+    def supports_kv_cache(self):
+        """Whether every layer can be decoded incrementally (forward_step),
+        which needs the projections of MultiheadAttention (regularMHA)."""
+        return all(
+            isinstance(layer.self_attn, sb.nnet.attention.MultiheadAttention)
+            and isinstance(
+                layer.mutihead_attn, sb.nnet.attention.MultiheadAttention
+            )
+            for layer in self.layers
+        )
+
+    def project_memory(self, memory):
+        """Projects the encoder states into the keys and values of the
+        cross-attention of every layer. This is done once per utterance
+        when decoding incrementally (see forward_step).
+
+        Arguments
+        ----------
+        memory : tensor
+            The sequence from the last layer of the encoder (required).
+        """
+        return [
+            dec_layer.mutihead_attn.project_kv(memory, memory)
+            for dec_layer in self.layers
+        ]
+
+    def forward_step(
+        self, tgt, memory_kvs, self_kvs=None, memory_key_padding_mask=None,
+    ):
+        """Decodes the newest target position using the keys and values
+        cached at the previous steps. It gives the same output as the last
+        position of forward() with a lookahead mask.
+
+        Arguments
+        ----------
+        tgt : tensor
+            The newest position of the sequence to the decoder,
+            (batch, 1, d_model).
+        memory_kvs : list
+            The per-layer cross-attention keys and values, as returned by
+            project_memory().
+        self_kvs : list
+            The per-layer self-attention keys and values of the previous
+            positions, None at the first step.
+        memory_key_padding_mask : tensor
+            The mask for the memory keys per batch (optional).
+
+        Example
+        -------
+        >>> src = torch.rand((8, 60, 512))
+        >>> tgt = torch.rand((8, 3, 512))
+        >>> net = TransformerDecoder(1, 8, 1024, d_model=512).eval()
+        >>> mask = torch.triu(torch.full((3, 3), float("-inf")), diagonal=1)
+        >>> full_out, _, _ = net(tgt, src, tgt_mask=mask)
+        >>> memory_kvs = net.project_memory(src)
+        >>> self_kvs = None
+        >>> for t in range(3):
+        ...     out, self_kvs, _ = net.forward_step(
+        ...         tgt[:, t : t + 1], memory_kvs, self_kvs
+        ...     )
+        >>> torch.allclose(out[:, 0], full_out[:, -1], atol=1e-5)
+        True
+        """
+        if self_kvs is None:
+            self_kvs = [None] * len(self.layers)
+
+        output = tgt
+        new_self_kvs = []
+        for dec_layer, memory_kv, self_kv in zip(
+            self.layers, memory_kvs, self_kvs
+        ):
+            output, self_kv, multihead_attn = dec_layer.forward_step(
+                output,
+                memory_kv,
+                self_kv=self_kv,
+                memory_key_padding_mask=memory_key_padding_mask,
+            )
+            new_self_kvs.append(self_kv)
+        output = self.norm(output)
+
+        return output, new_self_kvs, multihead_attn
+
 
 class NormalizedEmbedding(nn.Module):
     """This class implements the normalized embedding layer for the transformer.
@@ -249,7 +249,9 @@ class TransformerASR(TransformerInterface):
         tgt_mask = get_lookahead_mask(tgt)
         src_key_padding_mask = None
         if enc_len is not None:
-            src_key_padding_mask = (1 - length_to_mask(enc_len)).bool()
+            src_key_padding_mask = (
+                1 - length_to_mask(enc_len, max_len=encoder_out.shape[1])
+            ).bool()
 
         tgt = self.custom_tgt_module(tgt)
         if self.attention_type == "RelPosMHAXL":
@@ -577,7 +579,9 @@ class TransformerDecoderASR(TransformerInterface):
         tgt_mask = get_lookahead_mask(tgt)
         src_key_padding_mask = None
         if enc_len is not None:
-            src_key_padding_mask = (1 - length_to_mask(enc_len)).bool()
+            src_key_padding_mask = (
+                1 - length_to_mask(enc_len, max_len=encoder_out.shape[1])
+            ).bool()
 
         tgt = self.custom_tgt_module(tgt)
         if self.attention_type == "RelPosMHAXL":
@@ -604,6 +608,89 @@ class TransformerDecoderASR(TransformerInterface):
         )
         return prediction, multihead_attns[-1]
 
+    @torch.no_grad()
+    def decode_step(self, tgt, encoder_out, cache=None, enc_len=None):
+        """This method implements an incremental decoding step. Only the
+        newest token goes through the decoder; the self-attention keys and
+        values of the previous tokens and the cross-attention keys and
+        values of encoder_out are read from the cache. The result matches
+        the last position of decode() on the whole prefix.
+
+        Arguments
+        ---------
+        tgt : torch.Tensor
+            The newest token of each sequence, (batch,).
+        encoder_out : torch.Tensor
+            Hidden output of the encoder.
+        cache : tuple
+            The cache returned by the previous call, None at the first step.
+        enc_len : torch.LongTensor
+            The actual length of encoder states.
+
+        Returns
+        -------
+        prediction : torch.Tensor
+            The decoder output of the newest token, (batch, 1, d_model).
+        attn : torch.Tensor
+            The cross-attention weights of the last layer, (batch, 1, src).
+        cache : tuple
+            The updated cache, to be given at the next step.
+
+        Example
+        -------
+        >>> src = torch.rand([2, 20, 32])
+        >>> tgt = torch.randint(0, 10, [2, 4])
+        >>> net = TransformerDecoderASR(
+        ...     10, 32, 32, 2, 0, 1, 64, attention_type="RelPosMHAXL"
+        ... ).eval()
+        >>> full_out, _ = net.decode(tgt, src)
+        >>> cache = None
+        >>> for t in range(4):
+        ...     out, _, cache = net.decode_step(tgt[:, t], src, cache)
+        >>> torch.allclose(out[:, 0], full_out[:, -1], atol=1e-5)
+        True
+        """
+        if cache is None:
+            if not self.decoder.supports_kv_cache():
+                raise ValueError(
+                    "decode_step requires a decoder with regularMHA attention."
+                )
+            # attention_type is that of the encoder, the decoder layers use
+            # regularMHA with fixed positional encodings (see decode)
+            if self.attention_type == "RelPosMHAXL":
+                encoder_out = encoder_out + self.positional_encoding_decoder(
+                    encoder_out
+                )
+            src_key_padding_mask = None
+            if enc_len is not None:
+                src_key_padding_mask = (
+                    1 - length_to_mask(enc_len, max_len=encoder_out.shape[1])
+                ).bool()
+            step = 0
+            self_kvs = None
+            memory_kvs = self.decoder.project_memory(encoder_out)
+        else:
+            step, self_kvs, memory_kvs, src_key_padding_mask = cache
+
+        tgt = self.custom_tgt_module(tgt.unsqueeze(1))
+        if self.attention_type == "RelPosMHAXL":
+            pe = self.positional_encoding_decoder.pe
+            tgt = tgt + pe[:, step : step + 1]
+        elif self.positional_encoding_type == "fixed_abs_sine":
+            tgt = tgt + self.positional_encoding.pe[:, step : step + 1]
+
+        prediction, self_kvs, attn = self.decoder.forward_step(
+            tgt,
+            memory_kvs,
+            self_kvs=self_kvs,
+            memory_key_padding_mask=src_key_padding_mask,
+        )
+        return (
+            prediction,
+            attn,
+            (step + 1, self_kvs, memory_kvs, src_key_padding_mask),
+        )
+
     def _init_params(self):
         for p in self.parameters():
             if p.dim() > 1:
@@ -762,7 +849,9 @@ class TransformerScriptParaDecoder(TransformerInterface):
         tgt_mask = get_lookahead_mask(tgt)
         src_key_padding_mask = None
         if enc_len is not None:
-            src_key_padding_mask = (1 - length_to_mask(enc_len)).bool()
+            src_key_padding_mask = (
+                1 - length_to_mask(enc_len, max_len=encoder_out.shape[1])
+            ).bool()
 
         tgt = self.custom_tgt_module(tgt)
         if self.attention_type == "RelPosMHAXL":
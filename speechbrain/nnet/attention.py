@@ -777,6 +777,131 @@ class MultiheadAttention(nn.Module):
             output = output.permute(1, 0, 2)
             return output
 
+    def _in_projection(self, x, index):
+        """Applies the query (0), key (1) or value (2) input projection
+        of the wrapped torch.nn.MultiheadAttention to x (B, L, E)."""
+        if self.att.bias_k is not None or self.att.add_zero_attn:
+            raise ValueError(
+                "add_bias_kv and add_zero_attn are not supported when "
+                "attending over cached keys and values."
+            )
+        embed_dim = self.att.embed_dim
+        if self.att._qkv_same_embed_dim:
+            weight = self.att.in_proj_weight[
+                index * embed_dim : (index + 1) * embed_dim
+            ]
+        else:
+            weight = (
+                self.att.q_proj_weight,
+                self.att.k_proj_weight,
+                self.att.v_proj_weight,
+            )[index]
+        bias = None
+        if self.att.in_proj_bias is not None:
+            bias = self.att.in_proj_bias[
+                index * embed_dim : (index + 1) * embed_dim
+            ]
+        return F.linear(x, weight, bias)
+
+    def project_kv(self, key, value):
+        """Projects keys and values into the per-head space so that they
+        can be cached and reused by attend() across decoding steps.
+
+        Arguments
+        ----------
+        key : torch.Tensor
+            (B, S, E) where S is the source sequence length.
+        value : torch.Tensor
+            (B, S, E) where S is the source sequence length.
+
+        Outputs
+        -------
+        key : torch.Tensor
+            (B, H, S, E // H) where H is the number of heads.
+        value : torch.Tensor
+            (B, H, S, E // H) where H is the number of heads.
+
+        Example
+        -------
+        >>> inputs = torch.rand([8, 60, 512])
+        >>> net = MultiheadAttention(nhead=8, d_model=inputs.shape[-1])
+        >>> key, value = net.project_kv(inputs, inputs)
+        >>> key.shape
+        torch.Size([8, 8, 60, 64])
+        """
+        bsz, src_len, _ = key.shape
+        nhead = self.att.num_heads
+        head_dim = self.att.head_dim
+        key = self._in_projection(key, 1)
+        value = self._in_projection(value, 2)
+        key = key.view(bsz, src_len, nhead, head_dim).transpose(1, 2)
+        value = value.view(bsz, src_len, nhead, head_dim).transpose(1, 2)
+        return key.contiguous(), value.contiguous()
+
+    def attend(self, query, key, value, key_padding_mask=None):
+        """Attends with query over keys and values already projected by
+        project_kv(). It follows the same computation as forward() and
+        is used for incremental decoding, where only the newest query is
+        computed at each step.
+
+        Arguments
+        ----------
+        query : torch.Tensor
+            (B, L, E) where L is the target sequence length.
+        key : torch.Tensor
+            (B, H, S, E // H) projected keys.
+        value : torch.Tensor
+            (B, H, S, E // H) projected values.
+        key_padding_mask : torch.Tensor, optional
+            (B, S) BoolTensor, the positions with the value of True
+            will be ignored.
+
+        Outputs
+        -------
+        attn_output : torch.Tensor
+            (B, L, E) where L is the target sequence length.
+        attn_output_weights : torch.Tensor
+            (B, L, S), averaged over the heads.
+
+        Example
+        -------
+        >>> inputs = torch.rand([8, 60, 512])
+        >>> net = MultiheadAttention(nhead=8, d_model=inputs.shape[-1])
+        >>> key, value = net.project_kv(inputs, inputs)
+        >>> outputs, attn = net.attend(inputs[:, -1:], key, value)
+        >>> outputs.shape
+        torch.Size([8, 1, 512])
+        """
+        bsz, tgt_len, embed_dim = query.shape
+        nhead, src_len, head_dim = key.shape[1:]
+
+        query = self._in_projection(query, 0)
+        query = query.view(bsz, tgt_len, nhead, head_dim).transpose(1, 2)
+        query = query.reshape(bsz * nhead, tgt_len, head_dim)
+        query = query * math.sqrt(1.0 / float(head_dim))
+
+        key = key.reshape(bsz * nhead, src_len, head_dim)
+        value = value.reshape(bsz * nhead, src_len, head_dim)
+
+        attn_weights = torch.bmm(query, key.transpose(-2, -1))
+        if key_padding_mask is not None:
+            attn_weights = attn_weights.view(bsz, nhead, tgt_len, src_len)
+            attn_weights = attn_weights.masked_fill(
+                key_padding_mask.view(bsz, 1, 1, src_len), float("-inf")
+            )
+            attn_weights = attn_weights.view(bsz * nhead, tgt_len, src_len)
+        attn_weights = F.softmax(attn_weights, dim=-1)
+        if self.att.dropout > 0.0 and self.training:
+            attn_weights = F.dropout(attn_weights, p=self.att.dropout)
+
+        output = torch.bmm(attn_weights, value)
+        output = output.view(bsz, nhead, tgt_len, head_dim).transpose(1, 2)
+        output = output.reshape(bsz, tgt_len, embed_dim)
+        output = self.att.out_proj(output)
+
+        attn_weights = attn_weights.view(bsz, nhead, tgt_len, src_len)
+        return output, attn_weights.mean(dim=1)
+
 
 class PositionalwiseFeedForward(nn.Module):
     """The class implements the positional-wise feed forward module in
@@ -508,6 +508,115 @@ class SpeedPerturb(torch.nn.Module):
         return perturbed_waveform
 
 
+class BatchSpeedPerturb(torch.nn.Module):
+    """Speed perturbation of a padded batch, with a speed per waveform.
+
+    Unlike SpeedPerturb (one speed for the whole batch), each waveform gets
+    its own speed, like applying SpeedPerturb to each waveform before
+    batching, but the batch is processed on its device: the waveforms are
+    grouped by speed and each group is resampled in one call, with
+    resampling kernels computed once per speed. The padding stays zero and
+    the relative lengths are updated.
+
+    Arguments
+    ---------
+    orig_freq : int
+        The frequency of the original signal.
+    speeds : list
+        The speeds that the signal should be changed to, as a percentage of the
+        original signal (i.e. `speeds` is divided by 100 to get a ratio).
+    perturb_prob : float
+        The chance that a waveform will be speed-perturbed. By default,
+        every waveform is perturbed.
+
+    Example
+    -------
+    >>> perturbator = BatchSpeedPerturb(orig_freq=16000, speeds=[90])
+    >>> waveforms = torch.rand(2, 16000)
+    >>> lengths = torch.tensor([0.5, 1.0])
+    >>> perturbed, perturbed_lens = perturbator(waveforms, lengths)
+    >>> perturbed.shape
+    torch.Size([2, 14400])
+    >>> perturbed_lens
+    tensor([0.5000, 1.0000])
+    """
+
+    def __init__(
+        self, orig_freq, speeds=[90, 100, 110], perturb_prob=1.0,
+    ):
+        super().__init__()
+        self.orig_freq = orig_freq
+        self.speeds = list(speeds)
+        self.perturb_prob = perturb_prob
+
+        self.resamplers = torch.nn.ModuleList()
+        for speed in self.speeds:
+            resampler = Resample(orig_freq, orig_freq * speed // 100)
+            # kernels computed once (first_indices stay on the cpu, so the
+            # resampling loop does not sync with the device)
+            resampler._indices_and_weights(torch.empty(0))
+            self.resamplers.append(resampler)
+
+    def forward(self, waveforms, lengths):
+        """
+        Arguments
+        ---------
+        waveforms : tensor
+            Shape should be `[batch, time]` or `[batch, time, channels]`.
+        lengths : tensor
+            Shape should be a single dimension, `[batch]`.
+
+        Returns
+        -------
+        Tensor of shape `[batch, time]` or `[batch, time, channels]`, and the
+        new relative lengths, shape `[batch]`.
+        """
+        batch_size, max_len = waveforms.shape[:2]
+        abs_lens = torch.round(lengths.cpu() * max_len).long()
+        speed_idx = torch.randint(len(self.speeds), (batch_size,))
+        # Don't perturb 1-`perturb_prob` portion of the waveforms
+        perturbed = torch.rand(batch_size) <= self.perturb_prob
+
+        out_lens = abs_lens.clone()
+        groups = []
+        for i, resampler in enumerate(self.resamplers):
+            idx = torch.nonzero(perturbed & (speed_idx == i)).squeeze(1)
+            if len(idx) == 0:
+                continue
+            group_len = int(abs_lens[idx].max())
+            resampled = resampler(
+                waveforms[idx.to(waveforms.device), :group_len]
+            )
+            out_lens[idx] = torch.tensor(
+                [resampler._output_samples(int(n)) for n in abs_lens[idx]]
+            )
+            groups.append((idx, resampled))
+
+        new_max_len = int(out_lens.max())
+        perturbed_waveforms = waveforms.new_zeros(
+            (batch_size, new_max_len) + waveforms.shape[2:]
+        )
+        kept = torch.nonzero(~perturbed).squeeze(1)
+        if len(kept) > 0:
+            num_samp = min(max_len, new_max_len)
+            kept = kept.to(waveforms.device)
+            perturbed_waveforms[kept, :num_samp] = waveforms[kept, :num_samp]
+        for idx, resampled in groups:
+            num_samp = min(resampled.shape[1], new_max_len)
+            idx = idx.to(waveforms.device)
+            perturbed_waveforms[idx, :num_samp] = resampled[:, :num_samp]
+
+        # zero the filter tails past the end of each waveform
+        mask = torch.arange(new_max_len) < out_lens.unsqueeze(1)
+        mask = mask.to(waveforms.device, waveforms.dtype)
+        if waveforms.dim() == 3:
+            mask = mask.unsqueeze(2)
+        perturbed_waveforms = perturbed_waveforms * mask
+
+        new_lengths = (out_lens.float() / new_max_len).to(lengths.device)
+        return perturbed_waveforms, new_lengths
+
+
 class Resample(torch.nn.Module):
     """This class resamples an audio signal using sinc-based interpolation.
 
@@ -63,6 +63,9 @@ class DynamicItem:
         The keys that this provides.
     """
 
+    # ItemCache of the outputs, see the cached decorator
+    cache = None
+
     def __init__(self, takes=[], func=None, provides=[]):
         self.takes = takes
         self.func = func
@@ -71,6 +74,11 @@ class DynamicItem:
     def __call__(self, *args):
         return self.func(*args)
 
+    def cached_call(self, data_id, *args):
+        """Like __call__, with the output served from / stored in the cache."""
+        key = self.cache.make_key(self.func, args, data_id)
+        return self.cache.get_or_compute(key, lambda: self.func(*args))
+
     # The next methods are more about supporting GeneratorDynamicItems
     def next_takes(self):
         """The next argkeys to provide to this, when called."""
@@ -144,6 +152,7 @@ class GeneratorDynamicItem(DynamicItem):
         # generator:
         self.current_generator = None
         self.num_provided_items = 0
+        self.cached_values = None
 
     def __call__(self, *args):
         if self.num_provided_items == len(self.provides):
@@ -155,9 +164,26 @@ class GeneratorDynamicItem(DynamicItem):
         self.num_provided_items += 1
         return out
 
+    def cached_call(self, data_id, *args):
+        """Like __call__, with the outputs served from / stored in the cache.
+
+        On a miss, the generator is run to the end at the first call, and all
+        its outputs are stored.
+        """
+        if self.num_provided_items == len(self.provides):
+            raise RuntimeError("DynamicItemPipeline called too many times!")
+        if self.cached_values is None:
+            key = self.cache.make_key(self.func, args, data_id)
+            self.cached_values = self.cache.get_or_compute(
+                key, lambda: list(self.func(*args))
+            )
+        out = self.cached_values[self.num_provided_items]
+        self.num_provided_items += 1
+        return out
+
     def next_takes(self):
         """The next argkeys to provide to this, when called."""
-        if not self.current_generator:
+        if not self.current_generator and self.cached_values is None:
             return self.takes
         else:
             return []
@@ -193,6 +219,7 @@ class GeneratorDynamicItem(DynamicItem):
             self.current_generator.close()
         self.current_generator = None
         self.num_provided_items = 0
+        self.cached_values = None
 
 
 def takes(*argkeys):
@@ -292,6 +319,47 @@ def provides(*output_keys):
 provides_decorator = provides  # Just for DataPipeline.add_dynamic_item
 
 
+def cached(cache):
+    """Decorator which marks a DynamicItem as cacheable.
+
+    The outputs are stored in cache (e.g. a
+    speechbrain.dataio.item_cache.ItemCache), keyed by the data point id (if
+    the data has an "id") and a hash of the function and its inputs. Only
+    for deterministic items: the function is not called again for the same
+    inputs. A cached generator is run to the end at its first call, so its
+    later steps must not depend on state set from its first outputs.
+
+    Can be placed before or after @takes / @provides.
+
+    Example
+    -------
+    >>> from speechbrain.dataio.item_cache import ItemCache
+    >>> cache = ItemCache(getfixture('tmpdir'))
+    >>> @cached(cache)
+    ... @takes("text")
+    ... @provides("tokenized")
+    ... def tokenize(text):
+    ...     return text.strip().lower().split()
+    >>> pipeline = DataPipeline(["id", "text"], [tokenize], ["tokenized"])
+    >>> pipeline({"id": "utt1", "text": "Cached Example"})
+    {'tokenized': ['cached', 'example']}
+    >>> len(cache.index)
+    1
+    """
+
+    def decorator(obj):
+        """Decorator definition."""
+        if not isinstance(obj, DynamicItem):
+            if inspect.isgeneratorfunction(obj):
+                obj = GeneratorDynamicItem(func=obj)
+            else:
+                obj = DynamicItem(func=obj)
+        obj.cache = cache
+        return obj
+
+    return decorator
+
+
 class DataPipeline:
     """Organises data transformations into a pipeline.
 
@@ -493,7 +561,10 @@ class DataPipeline:
             ]
             # This needs to be called BEFORE the dynamic item is called.
             provided_keys = item.next_provides()
-            values = item(*args)  # Call the DynamicItem to produce output
+            if item.cache is not None:
+                values = item.cached_call(data.get("id"), *args)
+            else:
+                values = item(*args)  # Call the DynamicItem to produce output
             # If there is just one output value, wrap in a list so that
             # it can be zipped as well:
             if len(provided_keys) == 1:
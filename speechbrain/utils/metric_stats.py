@@ -928,3 +928,80 @@ class ClassificationStats(MetricStats):
         else:
             label = key
         return label
+
+
+class LazyAverage:
+    """Average of the finite values of scalar tensors, kept on their device.
+
+    Reading a loss on the host (float(loss), loss.cpu()) waits for the
+    device to finish the step. The values are summed on the device
+    instead, and copied to the host (a single synchronization) only when
+    summarize() is called.
+
+    Example
+    -------
+    >>> average = LazyAverage()
+    >>> for loss in [1.0, 2.0, float("nan"), 6.0]:
+    ...     average.update(torch.tensor(loss))
+    >>> average.summarize()
+    3.0
+    >>> average.num_nonfinite()
+    1
+    >>> average.restart(3.0, count=3)
+    >>> average.update(torch.tensor(7.0))
+    >>> average.summarize()
+    4.0
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drops the accumulated values."""
+        self.total = None
+        self.count = None
+        self.nonfinite = None
+        self.initial_total = 0.0
+        self.initial_count = 0
+
+    def restart(self, average, count):
+        """Drops the accumulated values and starts from the average of count
+        values read before (e.g., restored from a checkpoint)."""
+        self.clear()
+        self.initial_total = average * count
+        self.initial_count = count
+
+    def update(self, value):
+        """Adds a scalar tensor (non-finite values are only counted)."""
+        value = value.detach()
+        finite = torch.isfinite(value)
+        value = torch.where(finite, value, 0.0).double()
+        if self.total is None:
+            self.total = value
+            self.count = finite.long()
+            self.nonfinite = (~finite).long()
+        else:
+            self.total += value
+            self.count += finite
+            self.nonfinite += ~finite
+
+    def _read(self):
+        if self.total is None:
+            return self.initial_total, self.initial_count, 0
+        total, count, nonfinite = torch.stack(
+            [self.total, self.count.double(), self.nonfinite.double()]
+        ).tolist()
+        return (
+            self.initial_total + total,
+            self.initial_count + int(count),
+            int(nonfinite),
+        )
+
+    def summarize(self):
+        """Average of the finite values (0.0 if there is none)."""
+        total, count, _ = self._read()
+        return total / count if count > 0 else 0.0
+
+    def num_nonfinite(self):
+        """Number of non-finite values."""
+        return self._read()[2]
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import torch
+
+
+def _write_sources(tmpdir, lengths, seed=0):
+    """Audio files (as .npy) and the CSV listing them."""
+    rng = np.random.default_rng(seed)
+    lines = ["ID,duration,wav"]
+    for i, length in enumerate(lengths):
+        path = os.path.join(tmpdir, f"utt{i}.npy")
+        np.save(path, rng.random(length, dtype=np.float32))
+        lines.append(f"utt{i},{length / 16000},$data_root/utt{i}.npy")
+    csv_file = os.path.join(tmpdir, "data.csv")
+    with open(csv_file, "w") as fout:
+        fout.write("\n".join(lines) + "\n")
+    return csv_file
+
+
+def _fake_load(loaded):
+    # torchaudio.load of the .npy sources, recording the files read
+    def load(path):
+        loaded.append(os.path.basename(path))
+        return torch.from_numpy(np.load(path)).unsqueeze(0), 16000
+
+    return load
+
+
+def test_audio_archive_stale_sources(tmpdir, monkeypatch):
+    from speechbrain.dataio import audio_archive
+    from speechbrain.dataio.audio_archive import (
+        AudioArchive,
+        create_audio_archive,
+    )
+
+    loaded = []
+    monkeypatch.setattr(audio_archive.torchaudio, "load", _fake_load(loaded))
+    src_dir = tmpdir.mkdir("src")
+    csv_file = _write_sources(src_dir, [800, 1200, 400])
+    archive_dir = os.path.join(tmpdir, "archive")
+    replacements = {"data_root": str(src_dir)}
+
+    archive = create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    assert sorted(loaded) == ["utt0.npy", "utt1.npy", "utt2.npy"]
+    for i in range(3):
+        expected = np.load(os.path.join(src_dir, f"utt{i}.npy"))
+        assert np.array_equal(archive[f"utt{i}"].numpy(), expected)
+
+    # unchanged sources are not read again
+    loaded.clear()
+    create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    assert loaded == []
+
+    # a changed source replaces its utterance
+    new_audio = np.full(600, 0.5, dtype=np.float32)
+    source = os.path.join(src_dir, "utt1.npy")
+    np.save(source, new_audio)
+    archive = AudioArchive(archive_dir)
+    assert not archive.is_current("utt1", source)
+    assert archive.is_current("utt0", os.path.join(src_dir, "utt0.npy"))
+    archive = create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    assert loaded == ["utt1.npy"]
+    assert np.array_equal(archive["utt1"].numpy(), new_audio)
+    archive = AudioArchive(archive_dir)
+    assert len(archive) == 3
+    assert np.array_equal(archive["utt1"].numpy(), new_audio)
+    assert archive.is_current("utt1", source)
+
+    # same size, other modification time
+    loaded.clear()
+    np.save(source, new_audio * 2)
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    archive = create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    assert loaded == ["utt1.npy"]
+    assert np.array_equal(archive["utt1"].numpy(), new_audio * 2)
+
+
+def test_audio_archive_drops_unsaved(tmpdir, monkeypatch):
+    from speechbrain.dataio import audio_archive
+    from speechbrain.dataio.audio_archive import (
+        SHARD_FILE,
+        AudioArchive,
+        create_audio_archive,
+    )
+
+    loaded = []
+    monkeypatch.setattr(audio_archive.torchaudio, "load", _fake_load(loaded))
+    src_dir = tmpdir.mkdir("src")
+    csv_file = _write_sources(src_dir, [800, 1200])
+    archive_dir = os.path.join(tmpdir, "archive")
+    replacements = {"data_root": str(src_dir)}
+    create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    shard_file = os.path.join(archive_dir, SHARD_FILE.format(0))
+    size = os.path.getsize(shard_file)
+
+    # audio appended without saving the index (interrupted run)
+    archive = AudioArchive(archive_dir)
+    archive.add("extra", torch.ones(100), 16000)
+    assert os.path.getsize(shard_file) == size + 100 * 4
+    archive = create_audio_archive([csv_file], archive_dir, "wav", replacements)
+    assert "extra" not in archive
+    assert os.path.getsize(shard_file) == size
@@ -0,0 +1,116 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__),
+        "../../AphasiaBank/statistical_analysis/scripts",
+    )
+)
+
+
+def _results(err, fold, tot=1):
+    """Per-utterance results of a model, as in wer_utt_stat_sig.csv."""
+    return pd.DataFrame(
+        {
+            "uids": [f"utt{i}" for i in range(len(err))],
+            "wer-err": err,
+            "wer-tot": tot,
+            "fold": fold,
+        }
+    )
+
+
+@pytest.mark.parametrize("speaker_level", [True, False])
+def test_bootstrap_ci_and_p_value(speaker_level):
+    from bootstrap import bootstrap_model_pairs
+
+    rng = np.random.default_rng(0)
+    err = rng.integers(0, 2, 600)
+    fold = np.arange(600) % 12
+    # b makes one more error on a third of the utterances
+    worse = err + (np.arange(600) % 3 == 0)
+    dfs = {
+        "a": _results(err, fold),
+        "b": _results(worse, fold, tot=2),
+        "same": _results(err, fold),
+    }
+    df = bootstrap_model_pairs(
+        dfs, ["wer"], num_samples=2000, speaker_level=speaker_level
+    ).set_index(["model_1", "model_2"])
+
+    row = df.loc[("a", "b")]
+    assert row["rate_1"] == pytest.approx(err.sum() / 600)
+    assert row["rate_2"] == pytest.approx(worse.sum() / 1200)
+    assert row["diff"] == pytest.approx(row["rate_2"] - row["rate_1"])
+    for rate in ["rate_1", "rate_2", "diff"]:
+        assert row[f"{rate}_ci_low"] <= row[rate] <= row[f"{rate}_ci_high"]
+
+    row = df.loc[("a", "same")]
+    assert row["diff"] == 0.0
+    assert row["diff_ci_low"] == row["diff_ci_high"] == 0.0
+    assert row["p_value"] == 1.0
+
+
+def test_bootstrap_utterance_level_ci_width():
+    from bootstrap import bootstrap_model_pairs
+
+    # independent 0/1 errors: the CI is about rate +- 1.96 * std error
+    rng = np.random.default_rng(0)
+    err = (rng.random(2000) < 0.3).astype(int)
+    dfs = {
+        "a": _results(err, np.arange(2000) % 12),
+        "b": _results(1 - err, np.arange(2000) % 12),
+    }
+    row = bootstrap_model_pairs(
+        dfs, ["wer"], num_samples=4000, speaker_level=False
+    ).iloc[0]
+    rate = err.mean()
+    expected = 2 * 1.96 * np.sqrt(rate * (1 - rate) / 2000)
+    width = row["rate_1_ci_high"] - row["rate_1_ci_low"]
+    assert width == pytest.approx(expected, rel=0.15)
+    # b is clearly worse
+    assert row["diff_ci_low"] > 0
+    assert row["p_value"] < 0.001
+
+
+def test_bootstrap_fold_level_resampling():
+    from bootstrap import bootstrap_model_pairs
+
+    # the difference between the models depends on the fold only: it is
+    # significant over the utterances, not over the 12 folds
+    rng = np.random.default_rng(0)
+    fold = np.repeat(np.arange(12), 50)
+    err = rng.integers(0, 3, 600)
+    shift = np.where(fold < 7, 1, -1)
+    dfs = {
+        "a": _results(err, fold, tot=3),
+        "b": _results(np.clip(err + shift, 0, 3), fold, tot=3),
+    }
+    folds = bootstrap_model_pairs(dfs, ["wer"], 2000, speaker_level=True)
+    utts = bootstrap_model_pairs(dfs, ["wer"], 2000, speaker_level=False)
+    assert folds["diff"][0] == utts["diff"][0]
+
+    def width(df):
+        return df["diff_ci_high"][0] - df["diff_ci_low"][0]
+
+    assert width(folds) > 3 * width(utts)
+    assert utts["p_value"][0] < 0.01
+    assert folds["p_value"][0] > 0.05
+
+
+def test_bootstrap_requires_folds():
+    from bootstrap import bootstrap_model_pairs
+
+    err = np.arange(10) % 2
+    dfs = {
+        "a": _results(err, 0).drop(columns="fold"),
+        "b": _results(err, 0).drop(columns="fold"),
+    }
+    with pytest.raises(ValueError, match="fold"):
+        bootstrap_model_pairs(dfs, ["wer"], 10, speaker_level=True)
+    # the folds are only needed to resample them
+    bootstrap_model_pairs(dfs, ["wer"], 10, speaker_level=False)
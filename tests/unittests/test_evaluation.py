@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../AphasiaBank/helper_scripts")
+)
+
+
+def _write_result_file(path, hyp_words):
+    """Alignment file as written by speechbrain's wer_summary."""
+    lines = ["=" * 80, "ALIGNMENTS", ""]
+    for i, hyp in enumerate(hyp_words):
+        lines += [
+            "=" * 80,
+            f"P1-utt{i}, %WER 0.00 [ 0 / 2, 0 ins, 0 del, 0 sub ]",
+            "the/C ; cat/P",
+            "=     ; =    ",
+            f"the/C ; {hyp}/P",
+        ]
+    lines += ["=" * 80, ""]
+    with open(path, "w") as fout:
+        fout.write("\n".join(lines))
+
+
+def test_alignment_table_cache(tmpdir):
+    import evaluation
+
+    result_file = os.path.join(tmpdir, "awer_para.txt")
+    _write_result_file(result_file, ["cat", "dog"])
+    table = evaluation.load_alignment_table(result_file)
+    assert table["uids"].tolist() == ["P1-utt0", "P1-utt1"]
+    assert table["hyp"][1] == ["the/C", "dog/P"]
+    assert os.path.exists(f"{result_file}.{evaluation.TABLE_FORMAT}")
+
+    # the disk cache is used while the result file is unchanged
+    evaluation._alignment_tables.clear()
+    assert evaluation.load_alignment_table(result_file).equals(table)
+
+    # a rewritten result file with the same mtime is parsed again
+    stat = os.stat(result_file)
+    _write_result_file(result_file, ["cat", "dog", "cow"])
+    os.utime(result_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    table = evaluation.load_alignment_table(result_file)
+    assert table["hyp"].tolist()[2] == ["the/C", "cow/P"]
+    evaluation._alignment_tables.clear()
+    assert len(evaluation.load_alignment_table(result_file)) == 3
+
+    # so is a result file older than its cache (restored from a backup)
+    _write_result_file(result_file, ["cow"])
+    os.utime(result_file, ns=(0, 0))
+    evaluation._alignment_tables.clear()
+    assert evaluation.load_alignment_table(result_file)["hyp"].tolist() == [
+        ["the/C", "cow/P"]
+    ]
+
+
+def test_temporal_distances_match_loops():
+    import random
+    from benchmark_TD import loop_TDs, synthetic_fold
+    from evaluation import (
+        compute_temporal_distance,
+        compute_temporal_distance_para_sp,
+        compute_temporal_distances,
+    )
+
+    rng = random.Random(0)
+    for para_rate in [0.0, 0.15, 0.8]:
+        y_true, y_pred = synthetic_fold(200, 20, para_rate, rng)
+        # empty predictions too
+        y_pred[0] = []
+        TDs = loop_TDs(y_true, y_pred)
+        assert compute_temporal_distances(y_true, y_pred) == TDs
+        assert compute_temporal_distance(y_true, y_pred, True) == TDs["TD_bin"]
+        assert (
+            compute_temporal_distance(y_true, y_pred, False) == TDs["TD_multi"]
+        )
+        assert (
+            compute_temporal_distance_para_sp(y_true, y_pred, "s")
+            == TDs["TD_s"]
+        )
@@ -0,0 +1,89 @@
+import os
+import torch
+
+
+class _Encoder(torch.nn.Module):
+    """Frame-wise linear encoder counting its calls."""
+
+    def __init__(self):
+        super().__init__()
+        self.lin = torch.nn.Linear(4, 3)
+        self.calls = 0
+
+    def forward(self, wav):
+        self.calls += 1
+        return self.lin(wav.view(wav.size(0), -1, 4))
+
+
+def _dataset():
+    from speechbrain.dataio.dataset import DynamicItemDataset
+
+    torch.manual_seed(0)
+    data = {f"utt{i}": {"sig": torch.rand(4 * (i + 2))} for i in range(6)}
+    return DynamicItemDataset(data, output_keys=["id", "sig"])
+
+
+def test_feature_store_precompute(tmpdir):
+    from speechbrain.dataio.feature_store import (
+        FeatureStore,
+        model_hash,
+        precompute_features,
+    )
+
+    dataset = _dataset()
+    encoder = _Encoder()
+    store = FeatureStore(tmpdir, model_hash(encoder))
+    precompute_features(store, encoder, dataset, save_every=4)
+    assert encoder.calls == 6
+    # the stored features are those of each utterance alone
+    with dataset.output_keys_as(["id", "sig"]):
+        for data_point in dataset:
+            feats = encoder(data_point["sig"].unsqueeze(0)).squeeze(0)
+            assert torch.allclose(store[data_point["id"]], feats)
+
+    # another process (e.g. another fold) reuses them
+    encoder.calls = 0
+    store = FeatureStore(tmpdir, model_hash(encoder))
+    assert len(store) == 6
+    precompute_features(store, encoder, dataset)
+    assert encoder.calls == 0
+
+
+def test_feature_store_stale(tmpdir):
+    from speechbrain.dataio.feature_store import (
+        DATA_FILE,
+        FeatureStore,
+        model_hash,
+        precompute_features,
+    )
+
+    dataset = _dataset()
+    encoder = _Encoder()
+    key = model_hash(encoder)
+    precompute_features(FeatureStore(tmpdir, key), encoder, dataset)
+
+    # a changed encoder gets another store, its features are recomputed
+    with torch.no_grad():
+        encoder.lin.weight.add_(1.0)
+    assert model_hash(encoder) != key
+    encoder.calls = 0
+    store = FeatureStore(tmpdir, model_hash(encoder))
+    assert len(store) == 0
+    precompute_features(store, encoder, dataset)
+    assert encoder.calls == 6
+    wav = dataset[0]["sig"].unsqueeze(0)
+    with torch.no_grad():
+        assert torch.allclose(store["utt0"], encoder(wav).squeeze(0))
+        assert not torch.allclose(
+            FeatureStore(tmpdir, key)["utt0"], encoder(wav).squeeze(0)
+        )
+
+    # the features appended after the last save (interrupted run) are
+    # dropped, not served
+    store.add("extra", torch.ones(2, 3))
+    data_file = os.path.join(store.path, DATA_FILE)
+    size = os.path.getsize(data_file)
+    store = FeatureStore(tmpdir, model_hash(encoder))
+    assert "extra" not in store
+    precompute_features(store, encoder, dataset)
+    assert os.path.getsize(data_file) == size - 2 * 3 * 4
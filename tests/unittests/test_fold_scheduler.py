@@ -0,0 +1,82 @@
+import os
+import sys
+import pytest
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../AphasiaBank/helper_scripts")
+)
+
+
+def _flaky_cmd(tmpdir, failures):
+    """Command of a fold failing its first failures[fold] runs."""
+
+    def fold_cmd(yaml, port):
+        fold = int(yaml)
+        runs = os.path.join(tmpdir, f"runs-{fold}")
+        script = (
+            "import sys\n"
+            f"with open({runs!r}, 'a') as f: f.write('x')\n"
+            f"n = len(open({runs!r}).read())\n"
+            f"print('run', n)\n"
+            f"sys.exit(1 if n <= {failures.get(fold, 0)} else 0)\n"
+        )
+        return [sys.executable, "-c", script]
+
+    return fold_cmd
+
+
+def test_run_folds_retries(tmpdir):
+    from fold_scheduler import run_folds
+
+    ended = []
+    returncodes = run_folds(
+        [1, 2, 3],
+        prepare_fold=str,
+        fold_cmd=_flaky_cmd(tmpdir, {2: 2}),
+        slots=("", ""),
+        log_dir=os.path.join(tmpdir, "logs"),
+        done_marker=lambda fold: os.path.join(tmpdir, f"done-{fold}"),
+        on_fold_end=ended.append,
+        max_retries=2,
+        poll_interval=0.05,
+    )
+    assert returncodes == {1: 0, 2: 0, 3: 0}
+    assert sorted(ended) == [1, 2, 3]
+    assert open(os.path.join(tmpdir, "runs-2")).read() == "xxx"
+    with open(os.path.join(tmpdir, "logs", "Fold-2.log")) as log:
+        assert log.read().split("\n")[:3] == ["run 1", "run 2", "run 3"]
+
+    # done folds are skipped
+    os.remove(os.path.join(tmpdir, "done-3"))
+    assert run_folds(
+        [1, 2, 3],
+        prepare_fold=str,
+        fold_cmd=_flaky_cmd(tmpdir, {}),
+        log_dir=os.path.join(tmpdir, "logs"),
+        done_marker=lambda fold: os.path.join(tmpdir, f"done-{fold}"),
+        poll_interval=0.05,
+    ) == {3: 0}
+
+
+def test_run_folds_failure(tmpdir):
+    from fold_scheduler import run_folds
+
+    def on_fold_end(fold):
+        ended.append(fold)
+        raise ValueError("metrics failed")
+
+    ended = []
+    with pytest.raises(RuntimeError, match=r"Folds \[2\] failed"):
+        run_folds(
+            [1, 2, 3],
+            prepare_fold=str,
+            fold_cmd=_flaky_cmd(tmpdir, {2: 5}),
+            slots=("",),
+            log_dir=os.path.join(tmpdir, "logs"),
+            on_fold_end=on_fold_end,
+            max_retries=1,
+            poll_interval=0.05,
+        )
+    # the other folds ran to the end despite the failures
+    assert sorted(ended) == [1, 3]
+    assert open(os.path.join(tmpdir, "runs-2")).read() == "xx"
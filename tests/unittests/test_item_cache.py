@@ -0,0 +1,69 @@
+import os
+import uuid
+import pytest
+import torch
+
+
+def _dataloader_epochs(tmpdir, num_workers, num_epochs, **loader_kwargs):
+    """Iterates a DataLoader over a dataset with a cached dynamic item and
+    returns the number of calls of the cached function."""
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.item_cache import ItemCache
+    from speechbrain.utils.data_pipeline import cached, takes, provides
+
+    calls_dir = os.path.join(tmpdir, "calls")
+    os.makedirs(calls_dir, exist_ok=True)
+    cache = ItemCache(os.path.join(tmpdir, "cache"), refresh_interval=0.0)
+
+    @cached(cache)
+    @takes("text")
+    @provides("tokens")
+    def tokenize(text):
+        # calls are counted across the worker processes
+        open(os.path.join(calls_dir, uuid.uuid4().hex), "w").close()
+        return text.split()
+
+    data = {f"utt{i}": {"text": f"this is item {i}"} for i in range(20)}
+    dataset = DynamicItemDataset(data, [tokenize], ["id", "tokens"])
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=None, num_workers=num_workers, **loader_kwargs,
+    )
+    for _ in range(num_epochs):
+        outputs = {item["id"]: item["tokens"] for item in loader}
+        assert outputs["utt3"] == ["this", "is", "item", "3"]
+    return len(os.listdir(calls_dir))
+
+
+@pytest.mark.parametrize("persistent_workers", [False, True])
+def test_item_cache_workers(tmpdir, persistent_workers):
+    num_calls = _dataloader_epochs(
+        tmpdir, 2, 3, persistent_workers=persistent_workers
+    )
+    assert num_calls == 20
+
+    # a new run (e.g. after a restart) only reads the cache, and the
+    # segments of the workers are merged into one
+    assert _dataloader_epochs(tmpdir, 2, 1) == 20
+    segments = [
+        name
+        for name in os.listdir(os.path.join(tmpdir, "cache"))
+        if name.endswith(".idx")
+    ]
+    assert len(segments) == 1
+
+
+def test_item_cache_compact(tmpdir):
+    from speechbrain.dataio.item_cache import ItemCache
+
+    # two processes computing the same item before seeing each other
+    for _ in range(2):
+        cache = ItemCache(tmpdir, compact=False, refresh_interval=1e9)
+        cache.index = {}
+        cache._write("utt1/key", [1, 2])
+        cache._write("utt2/key", None)
+    assert len(os.listdir(tmpdir)) == 4
+
+    cache = ItemCache(tmpdir)
+    assert len(os.listdir(tmpdir)) == 2
+    assert cache.get_or_compute("utt1/key", lambda: 0) == [1, 2]
+    assert cache.get_or_compute("utt2/key", lambda: 0) is None
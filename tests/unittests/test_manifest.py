@@ -0,0 +1,55 @@
+import pytest
+
+
+def _write_csv(path, num_rows=50):
+    lines = ["ID,duration,wav,spk_id"]
+    for i in range(num_rows):
+        # durations with ties
+        duration = round(0.5 * ((i * 7) % 13), 1)
+        lines.append(f"utt{i},{duration},$data_root/utt{i}.wav,spk{i % 4}")
+    with open(path, "w") as fout:
+        fout.write("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"sort_key": "duration"},
+        {"sort_key": "duration", "reverse": True},
+        {"key_min_value": {"duration": 1.0}, "key_max_value": {"duration": 4}},
+        {
+            "key_max_value": {"duration": 5.0},
+            "sort_key": "duration",
+            "reverse": True,
+            "select_n": 20,
+        },
+        # non-numeric keys go through the data points
+        {"key_test": {"spk_id": lambda spk: spk != "spk1"}},
+        {"sort_key": "spk_id", "key_min_value": {"duration": 2.0}},
+    ],
+)
+def test_manifest_filtered_sorted(tmpdir, kwargs):
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.manifest import ManifestIds
+
+    csv_path = tmpdir / "data.csv"
+    _write_csv(csv_path)
+    replacements = {"data_root": "/data"}
+    from_csv = DynamicItemDataset.from_csv(
+        csv_path, replacements, output_keys=["id", "wav", "duration"]
+    )
+    from_manifest = DynamicItemDataset.from_manifest(
+        csv_path, replacements, output_keys=["id", "wav", "duration"]
+    )
+    assert isinstance(from_manifest.data_ids, ManifestIds)
+    assert len(from_manifest) == len(from_csv)
+
+    expected = from_csv.filtered_sorted(**kwargs)
+    filtered = from_manifest.filtered_sorted(**kwargs)
+    assert list(filtered.data_ids) == list(expected.data_ids)
+    assert list(filtered) == list(expected)
+    # and again on the filtered dataset
+    assert list(filtered.filtered_sorted(sort_key="duration")) == list(
+        expected.filtered_sorted(sort_key="duration")
+    )
@@ -0,0 +1,84 @@
+import time
+import torch
+import pytest
+
+
+def _dataset(num_examples=20):
+    from speechbrain.dataio.dataset import DynamicItemDataset
+
+    dataset = DynamicItemDataset(
+        {f"ex{i}": {"foo": torch.ones(i + 1)} for i in range(num_examples)}
+    )
+    dataset.set_output_keys(["id", "foo"])
+    return dataset
+
+
+def _consume(prefetcher, checkpointer, stop):
+    """Ids of the batches, a checkpoint is saved after the batch stop."""
+    ids = []
+    for i, batch in enumerate(prefetcher):
+        ids.append(batch.id)
+        if i == stop:
+            # the prefetcher is ahead of the batches consumed
+            time.sleep(0.1)
+            checkpointer.save_checkpoint(end_of_epoch=False)
+    return ids
+
+
+@pytest.mark.parametrize("stop", [0, 3, 8])
+def test_prefetch_loader_resume(tmpdir, stop):
+    from speechbrain.dataio.batch import PaddedBatch
+    from speechbrain.dataio.dataloader import (
+        PrefetchLoader,
+        SaveableDataLoader,
+    )
+    from speechbrain.utils.checkpoints import Checkpointer
+
+    dataset = _dataset()
+
+    def prefetcher_and_checkpointer():
+        loader = SaveableDataLoader(
+            dataset, batch_size=2, shuffle=False, collate_fn=PaddedBatch
+        )
+        checkpointer = Checkpointer(tmpdir, {"loader": loader})
+        return PrefetchLoader(loader, "cpu", num_prefetch=4), checkpointer
+
+    prefetcher, checkpointer = prefetcher_and_checkpointer()
+    ids = _consume(prefetcher, checkpointer, stop)
+    assert len(ids) == 10
+
+    # the recovered loader resumes at the batch after the last one consumed
+    prefetcher, checkpointer = prefetcher_and_checkpointer()
+    checkpointer.recover_if_possible()
+    assert [batch.id for batch in prefetcher] == ids[stop + 1 :]
+    # then runs whole epochs
+    assert [batch.id for batch in prefetcher] == ids
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_prefetch_streaming_loader_resume(tmpdir, num_workers):
+    from speechbrain.dataio.dataloader import PrefetchLoader
+    from speechbrain.dataio.streaming import (
+        StreamingDataLoader,
+        StreamingDataset,
+        write_shards,
+    )
+    from speechbrain.utils.checkpoints import Checkpointer
+
+    data = {f"utt{i}": {"wav": torch.ones(i + 1)} for i in range(12)}
+    shards = write_shards(data, tmpdir / "shards", maxcount=2)
+    dataset = StreamingDataset(shards, shuffle_buffer=4, seed=1)
+    dataset.set_output_keys(["id"])
+
+    def prefetcher_and_checkpointer():
+        loader = StreamingDataLoader(dataset, num_workers=num_workers)
+        checkpointer = Checkpointer(tmpdir / "ckpt", {"loader": loader})
+        return PrefetchLoader(loader, "cpu", num_prefetch=4), checkpointer
+
+    prefetcher, checkpointer = prefetcher_and_checkpointer()
+    ids = _consume(prefetcher, checkpointer, 4)
+    assert len(ids) == 12
+
+    prefetcher, checkpointer = prefetcher_and_checkpointer()
+    checkpointer.recover_if_possible()
+    assert [batch.id for batch in prefetcher] == ids[5:]
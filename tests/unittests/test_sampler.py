@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+
+def _lengths(num_examples=300):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(10, 400, num_examples)
+    tokens = frames // 8 + rng.integers(0, 10, num_examples)
+    return [(float(f), float(t)) for f, t in zip(frames, tokens)]
+
+
+@pytest.mark.parametrize("sort_window", [None, 64])
+@pytest.mark.parametrize("max_batch_ex", [None, 6])
+def test_cost_batch_sampler_bounds(sort_window, max_batch_ex):
+    from speechbrain.dataio.sampler import BatchCostModel, CostBatchSampler
+
+    lengths = _lengths()
+    cost_model = BatchCostModel(
+        ["frames", "frames^2", "frames*tokens"], weights=[1.0, 0.01, 0.05]
+    )
+    max_batch_cost = 20000
+    sampler = CostBatchSampler(
+        list(range(len(lengths))),
+        cost_model,
+        max_batch_cost=max_batch_cost,
+        lengths_list=lengths,
+        shuffle=False,
+        sort_window=sort_window,
+        max_batch_ex=max_batch_ex,
+        batch_ordering="ascending",
+    )
+    batches = list(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(
+        range(len(lengths))
+    )
+
+    def cost(batch):
+        padded = np.max([lengths[i] for i in batch], axis=0)
+        return cost_model.batch_cost(len(batch), padded)
+
+    costs = [cost(batch) for batch in batches]
+    assert costs == sorted(costs)
+    for batch, batch_cost in zip(batches, costs):
+        # only an example over the budget on its own exceeds it
+        assert batch_cost <= max_batch_cost or len(batch) == 1
+        if max_batch_ex is not None:
+            assert len(batch) <= max_batch_ex
+
+    # the batches are full: each window of examples is packed in order of
+    # length, a batch ends where the next example goes over the budget
+    window = sort_window or len(lengths)
+    packed = []
+    for start in range(0, len(lengths), window):
+        ids = range(start, min(start + window, len(lengths)))
+        packed.extend(sorted(ids, key=lengths.__getitem__))
+    position = {i: pos for pos, i in enumerate(packed)}
+    for batch in batches:
+        first = min(position[i] for i in batch)
+        last = max(position[i] for i in batch)
+        assert last - first + 1 == len(batch)
+        assert first // window == last // window
+        following = last + 1
+        if (
+            following == len(packed)
+            or following // window != last // window
+            or len(batch) == max_batch_ex
+        ):
+            continue
+        assert cost(batch + [packed[following]]) > max_batch_cost
+
+
+def test_cost_batch_sampler_reference_batch_size():
+    from speechbrain.dataio.sampler import BatchCostModel, CostBatchSampler
+
+    lengths = _lengths()
+    cost_model = BatchCostModel(["frames", "frames^2"], weights=[1.0, 0.01])
+    sampler = CostBatchSampler(
+        list(range(len(lengths))),
+        cost_model,
+        reference_batch_size=4,
+        lengths_list=[frames for frames, _ in lengths],
+        sort_window=None,
+    )
+    # the budget is the largest batch of 4 examples
+    longest = max(frames for frames, _ in lengths)
+    assert sampler.max_batch_cost == 4 * (longest + 0.01 * longest ** 2)
+    # any 4 examples fit, only the last batch packed can be smaller
+    assert sum(len(batch) < 4 for batch in sampler) <= 1
+    # it follows the cost model
+    cost_model.weights = np.array([1.0, 0.0])
+    assert sampler.max_batch_cost == 4 * longest
+
+
+def test_cost_batch_sampler_epochs():
+    from speechbrain.dataio.sampler import BatchCostModel, CostBatchSampler
+
+    lengths = [frames for frames, _ in _lengths()]
+    sampler = CostBatchSampler(
+        list(range(len(lengths))),
+        BatchCostModel(),
+        max_batch_cost=2000,
+        lengths_list=lengths,
+    )
+    first = list(sampler)
+    sampler.set_epoch(1)
+    assert list(sampler) != first
+    # the batches only depend on the seed and the epoch
+    sampler.set_epoch(0)
+    assert list(sampler) == first
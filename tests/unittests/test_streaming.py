@@ -0,0 +1,68 @@
+import torch
+import pytest
+
+
+def _shards(tmpdir):
+    from speechbrain.dataio.streaming import write_shards
+
+    data = {f"utt{i}": {"wav": torch.ones(i + 1)} for i in range(12)}
+    return write_shards(data, tmpdir / "shards", maxcount=2)
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+@pytest.mark.parametrize("stop", [0, 4, 10])
+def test_streaming_loader_resume(tmpdir, num_workers, stop):
+    from speechbrain.dataio.streaming import (
+        StreamingDataLoader,
+        StreamingDataset,
+    )
+    from speechbrain.utils.checkpoints import Checkpointer
+
+    dataset = StreamingDataset(_shards(tmpdir), shuffle_buffer=4, seed=1)
+    dataset.set_output_keys(["id"])
+
+    def loader_and_checkpointer():
+        loader = StreamingDataLoader(dataset, num_workers=num_workers)
+        checkpointer = Checkpointer(tmpdir / "ckpt", {"loader": loader})
+        return loader, checkpointer
+
+    loader, checkpointer = loader_and_checkpointer()
+    ids = []
+    for i, batch in enumerate(loader):
+        ids.append(batch.id[0])
+        if i == stop:
+            checkpointer.save_checkpoint(end_of_epoch=False)
+    assert sorted(ids) == sorted(f"utt{i}" for i in range(12))
+
+    # the recovered loader resumes the epoch at the next batch, then
+    # starts the next epoch
+    loader, checkpointer = loader_and_checkpointer()
+    checkpointer.recover_if_possible()
+    assert [batch.id[0] for batch in loader] == ids[stop + 1 :]
+    assert loader.epoch == 1
+    next_epoch = [batch.id[0] for batch in loader]
+    assert sorted(next_epoch) == sorted(ids)
+
+
+def test_streaming_loader_resume_other_workers(tmpdir):
+    from speechbrain.dataio.streaming import (
+        StreamingDataLoader,
+        StreamingDataset,
+    )
+    from speechbrain.utils.checkpoints import Checkpointer
+
+    dataset = StreamingDataset(_shards(tmpdir), shuffle_buffer=4, seed=1)
+    dataset.set_output_keys(["id"])
+    loader = StreamingDataLoader(dataset, num_workers=2)
+    checkpointer = Checkpointer(tmpdir / "ckpt", {"loader": loader})
+    ids = []
+    for i, batch in enumerate(loader):
+        ids.append(batch.id[0])
+        if i == 3:
+            checkpointer.save_checkpoint(end_of_epoch=False)
+
+    # another number of workers restarts the epoch
+    loader = StreamingDataLoader(dataset, num_workers=3)
+    checkpointer = Checkpointer(tmpdir / "ckpt", {"loader": loader})
+    checkpointer.recover_if_possible()
+    assert sorted(batch.id[0] for batch in loader) == sorted(ids)
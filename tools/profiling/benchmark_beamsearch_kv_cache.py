@@ -0,0 +1,119 @@
+"""Benchmark of the incremental (key/value cached) decoding of
+S2STransformerBeamSearchPara against the full-prefix decoding.
+
+A randomly initialised TransformerDecoderASR with paraphasia head is decoded
+on random encoder states of increasing length. Both modes must produce the
+same hypotheses and paraphasia labels; the script reports the wall-clock time
+of each mode and the speed-up.
+
+Usage:
+`python benchmark_beamsearch_kv_cache.py --enc_lens 100 250 500 --beam_size 3`
+"""
+import argparse
+import time
+import torch
+from speechbrain.decoders.seq2seq import S2STransformerBeamSearchPara
+from speechbrain.lobes.models.transformer.TransformerASR import (
+    TransformerDecoderASR,
+)
+from speechbrain.nnet.linear import Linear
+
+
+def build_searchers(args):
+    """Builds the two searchers sharing the same randomly initialised model."""
+    torch.manual_seed(args.seed)
+    model = TransformerDecoderASR(
+        tgt_vocab=args.vocab_size,
+        input_size=args.d_model,
+        d_model=args.d_model,
+        nhead=args.nhead,
+        num_encoder_layers=0,
+        num_decoder_layers=args.num_decoder_layers,
+        d_ffn=args.d_ffn,
+        dropout=0.0,
+        activation=torch.nn.GELU,
+        normalize_before=True,
+        causal=False,
+    )
+    seq_lin = Linear(input_size=args.d_model, n_neurons=args.vocab_size)
+    para_lin = Linear(input_size=args.d_model, n_neurons=args.para_classes)
+    ctc_lin = Linear(input_size=args.d_model, n_neurons=args.vocab_size)
+    modules = [model, seq_lin, para_lin, ctc_lin]
+    for module in modules:
+        module.eval()
+
+    searchers = {}
+    for use_kv_cache in (False, True):
+        searchers[use_kv_cache] = S2STransformerBeamSearchPara(
+            modules=modules,
+            bos_index=1,
+            eos_index=2,
+            blank_index=0,
+            min_decode_ratio=0.0,
+            max_decode_ratio=args.max_decode_ratio,
+            beam_size=args.beam_size,
+            ctc_weight=args.ctc_weight,
+            using_eos_threshold=False,
+            length_normalization=True,
+            use_kv_cache=use_kv_cache,
+        )
+    return searchers
+
+
+def run(searcher, enc_states, wav_lens, repeats):
+    """Decodes `repeats` times and returns the outputs and the best time."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = searcher(enc_states, wav_lens)
+        best = min(best, time.perf_counter() - start)
+    return outputs, best
+
+
+def main():
+    """Runs the benchmark over the requested encoder lengths."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--enc_lens", type=int, nargs="+", default=[50, 100])
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--beam_size", type=int, default=3)
+    parser.add_argument("--vocab_size", type=int, default=500)
+    parser.add_argument("--para_classes", type=int, default=4)
+    parser.add_argument("--d_model", type=int, default=256)
+    parser.add_argument("--nhead", type=int, default=4)
+    parser.add_argument("--d_ffn", type=int, default=1024)
+    parser.add_argument("--num_decoder_layers", type=int, default=6)
+    parser.add_argument("--max_decode_ratio", type=float, default=1.0)
+    parser.add_argument("--ctc_weight", type=float, default=0.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    searchers = build_searchers(args)
+    for searcher in searchers.values():
+        searcher.to(args.device)
+
+    print("enc_len\tfull (s)\tcached (s)\tspeed-up\tidentical")
+    for enc_len in args.enc_lens:
+        enc_states = torch.rand(
+            args.batch_size, enc_len, args.d_model, device=args.device
+        )
+        wav_lens = torch.ones(args.batch_size, device=args.device)
+        full_out, full_time = run(
+            searchers[False], enc_states, wav_lens, args.repeats
+        )
+        cached_out, cached_time = run(
+            searchers[True], enc_states, wav_lens, args.repeats
+        )
+        identical = (
+            full_out[0] == cached_out[0] and full_out[2] == cached_out[2]
+        )
+        print(
+            f"{enc_len}\t{full_time:.3f}\t\t{cached_time:.3f}\t\t"
+            f"{full_time / cached_time:.2f}x\t\t{identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Benchmark of the tensorized CTCPrefixScorer against the previous
+implementation (Python loops over the beams, full-length buffers allocated
+at every step), kept below as LoopCTCPrefixScorer.
+
+Random CTC posteriors are scored for a number of label-synchronous steps,
+the beams being reordered between the steps as in a beam search. Both
+scorers must give the same scores; the script reports the time of each over
+a sweep of beam sizes, vocabulary sizes and utterance lengths.
+
+Usage:
+`python benchmark_ctc_prefix_scorer.py --beam_sizes 3 10 --vocab_sizes 100 1000 --enc_lens 100 400`
+"""
+import argparse
+import itertools
+import time
+import torch
+from speechbrain.decoders.ctc import CTCPrefixScorer
+
+
+class LoopCTCPrefixScorer(CTCPrefixScorer):
+    """The previous implementation of forward_step and permute_mem."""
+
+    def forward_step(self, g, state, candidates=None, attn=None):
+        """One step of the prefix scorer, a beam at a time."""
+        prefix_length = g.size(1)
+        last_char = [gi[-1] for gi in g] if prefix_length > 0 else [0] * len(g)
+        self.num_candidates = (
+            self.vocab_size if candidates is None else candidates.size(-1)
+        )
+        if state is None:
+            r_prev = torch.full(
+                (self.max_enc_len, 2, self.batch_size, self.beam_size),
+                self.minus_inf,
+                device=self.device,
+            )
+            r_prev[:, 1] = torch.cumsum(
+                self.x[0, :, :, self.blank_index], 0
+            ).unsqueeze(2)
+            r_prev = r_prev.view(-1, 2, self.batch_size * self.beam_size)
+            psi_prev = 0.0
+        else:
+            r_prev, psi_prev = state
+
+        if candidates is not None:
+            scoring_table = torch.full(
+                (self.batch_size * self.beam_size, self.vocab_size),
+                -1,
+                dtype=torch.long,
+                device=self.device,
+            )
+            col_index = torch.arange(
+                self.batch_size * self.beam_size, device=self.device
+            ).unsqueeze(1)
+            scoring_table[col_index, candidates] = torch.arange(
+                self.num_candidates, device=self.device
+            )
+            scoring_index = (
+                candidates
+                + self.cand_offset.unsqueeze(1)
+                .repeat(1, self.beam_size)
+                .view(-1, 1)
+            ).view(-1)
+            x_inflate = torch.index_select(
+                self.x.view(2, -1, self.batch_size * self.vocab_size),
+                2,
+                scoring_index,
+            ).view(2, -1, self.batch_size * self.beam_size, self.num_candidates)
+        else:
+            scoring_table = None
+            x_inflate = (
+                self.x.unsqueeze(3)
+                .repeat(1, 1, 1, self.beam_size, 1)
+                .view(
+                    2, -1, self.batch_size * self.beam_size, self.num_candidates
+                )
+            )
+
+        r = torch.full(
+            (
+                self.max_enc_len,
+                2,
+                self.batch_size * self.beam_size,
+                self.num_candidates,
+            ),
+            self.minus_inf,
+            device=self.device,
+        )
+        if prefix_length == 0:
+            r[0, 0] = x_inflate[0, 0]
+        r_sum = torch.logsumexp(r_prev, 1)
+        phi = r_sum.unsqueeze(2).repeat(1, 1, self.num_candidates)
+        if candidates is not None:
+            for i in range(self.batch_size * self.beam_size):
+                pos = scoring_table[i, last_char[i]]
+                if pos != -1:
+                    phi[:, i, pos] = r_prev[:, 1, i]
+        else:
+            for i in range(self.batch_size * self.beam_size):
+                phi[:, i, last_char[i]] = r_prev[:, 1, i]
+
+        start = max(1, prefix_length)
+        end = self.max_enc_len
+        for t in range(start, end):
+            rnb_prev = r[t - 1, 0]
+            rb_prev = r[t - 1, 1]
+            r_ = torch.stack([rnb_prev, phi[t - 1], rnb_prev, rb_prev]).view(
+                2, 2, self.batch_size * self.beam_size, self.num_candidates
+            )
+            r[t] = torch.logsumexp(r_, 1) + x_inflate[:, t]
+
+        psi_init = r[start - 1, 0].unsqueeze(0)
+        phix = torch.cat((phi[0].unsqueeze(0), phi[:-1]), dim=0) + x_inflate[0]
+        if candidates is not None:
+            psi = torch.full(
+                (self.batch_size * self.beam_size, self.vocab_size),
+                self.minus_inf,
+                device=self.device,
+            )
+            psi_ = torch.logsumexp(
+                torch.cat((phix[start:end], psi_init), dim=0), dim=0
+            )
+            for i in range(self.batch_size * self.beam_size):
+                psi[i, candidates[i]] = psi_[i]
+        else:
+            psi = torch.logsumexp(
+                torch.cat((phix[start:end], psi_init), dim=0), dim=0
+            )
+        for i in range(self.batch_size * self.beam_size):
+            psi[i, self.eos_index] = r_sum[
+                self.last_frame_index[i // self.beam_size], i
+            ]
+        psi[:, self.blank_index] = self.minus_inf
+        return psi - psi_prev, (r, psi, scoring_table)
+
+    def permute_mem(self, memory, index):
+        """Reorders the memory, with psi repeated over the vocabulary."""
+        r, psi = super().permute_mem(memory, index)
+        return r, psi.repeat(1, self.vocab_size)
+
+
+def score(scorer_class, posteriors, enc_lens, args, beam_size, partial):
+    """Scores num_steps steps and returns the scores and the time taken."""
+    batch_size, _, vocab_size = posteriors.shape
+    num_beams = batch_size * beam_size
+    scorer = scorer_class(
+        posteriors.clone(), enc_lens, batch_size, beam_size, 0, 2
+    )
+    generator = torch.Generator(device=posteriors.device)
+    generator.manual_seed(args.seed)
+    prefixes = torch.zeros(
+        num_beams, 0, dtype=torch.long, device=posteriors.device
+    )
+    memory, outputs = None, []
+    start = time.perf_counter()
+    for _ in range(args.num_steps):
+        # random attention scores, for the candidates and the reordering
+        logits = torch.randn(
+            num_beams, vocab_size, generator=generator, device=prefixes.device
+        )
+        candidates = logits.topk(2 * beam_size, dim=-1)[1] if partial else None
+        psi, memory = scorer.forward_step(prefixes, memory, candidates)
+        outputs.append(psi)
+        best = (psi + logits).view(batch_size, -1).topk(beam_size, dim=-1)[1]
+        memory = scorer.permute_mem(memory, best)
+        predecessors = (
+            torch.div(best, vocab_size, rounding_mode="floor")
+            + torch.arange(batch_size, device=best.device).unsqueeze(1)
+            * beam_size
+        ).view(-1)
+        prefixes = torch.cat(
+            [prefixes[predecessors], (best % vocab_size).view(-1, 1)], dim=1
+        )
+    elapsed = time.perf_counter() - start
+    return outputs, elapsed
+
+
+def main():
+    """Runs the benchmark over the requested sweep."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--beam_sizes", type=int, nargs="+", default=[3, 10])
+    parser.add_argument(
+        "--vocab_sizes", type=int, nargs="+", default=[100, 1000]
+    )
+    parser.add_argument("--enc_lens", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--num_steps", type=int, default=20)
+    parser.add_argument("--partial", action="store_true")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    print("beam\tvocab\tenc_len\tloop (s)\ttensor (s)\tspeed-up\tidentical")
+    for beam_size, vocab_size, enc_len in itertools.product(
+        args.beam_sizes, args.vocab_sizes, args.enc_lens
+    ):
+        torch.manual_seed(args.seed)
+        posteriors = torch.randn(
+            args.batch_size, enc_len, vocab_size, device=args.device
+        ).log_softmax(dim=-1)
+        enc_lens = torch.full(
+            (args.batch_size,), enc_len, dtype=torch.long, device=args.device
+        )
+        loop_out, loop_time = score(
+            LoopCTCPrefixScorer,
+            posteriors,
+            enc_lens,
+            args,
+            beam_size,
+            args.partial,
+        )
+        tensor_out, tensor_time = score(
+            CTCPrefixScorer, posteriors, enc_lens, args, beam_size, args.partial
+        )
+        identical = all(torch.equal(a, b) for a, b in zip(loop_out, tensor_out))
+        print(
+            f"{beam_size}\t{vocab_size}\t{enc_len}\t{loop_time:.3f}\t\t"
+            f"{tensor_time:.3f}\t\t{loop_time / tensor_time:.2f}x\t\t"
+            f"{identical}"
+        )
+
+
+if __name__ == "__main__":
+    main()
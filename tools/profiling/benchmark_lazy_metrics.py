@@ -0,0 +1,114 @@
+"""Benchmark of the lazy training metrics of the Brain class
+(``lazy_metrics_interval``) against reading the loss at every step.
+
+A small Transformer encoder is trained on random batches, once with the
+loss and the non-finite check read on the host at every step (each read
+waits for the device), and once with them kept on the device and read
+every ``--interval`` steps. Both runs start from the same weights and see
+the same batches, so they must end with the same parameters and average
+loss; the script reports the training steps per second of each mode.
+
+The gain comes from the device running ahead of the host: expect it on
+cuda, not on cpu (where every operation is synchronous anyway).
+
+Usage:
+`python benchmark_lazy_metrics.py --device cuda --steps 200 --interval 50`
+"""
+import argparse
+import copy
+import time
+import torch
+import speechbrain as sb
+from torch.utils.data import DataLoader, TensorDataset
+
+
+class RegressionBrain(sb.Brain):
+    """Fits the encoder outputs to random targets."""
+
+    def compute_forward(self, batch, stage):
+        """Encodes the inputs."""
+        inputs, _ = batch
+        return self.modules.model(inputs.to(self.device))
+
+    def compute_objectives(self, predictions, batch, stage):
+        """Mean squared error to the targets."""
+        _, targets = batch
+        return torch.nn.functional.mse_loss(
+            predictions, targets.to(self.device)
+        )
+
+    def on_stage_end(self, stage, stage_loss, epoch=None):
+        """Keeps the average training loss."""
+        self.train_loss = stage_loss
+
+
+def train(model, loader, warmup_loader, args, lazy_metrics_interval):
+    """Trains a copy of model for one epoch, returns it and the time."""
+    brain = RegressionBrain(
+        modules={"model": copy.deepcopy(model)},
+        opt_class=lambda params: torch.optim.Adam(params, 1e-4),
+        run_opts={
+            "device": args.device,
+            "noprogressbar": True,
+            "lazy_metrics_interval": lazy_metrics_interval,
+        },
+    )
+    # warm-up step (allocator, kernel selection)
+    brain.fit(range(1), warmup_loader)
+    brain.modules.model.load_state_dict(model.state_dict())
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    brain.fit(range(1), loader)
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    return brain, time.perf_counter() - start
+
+
+def main():
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--interval", type=int, default=50)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--seq_len", type=int, default=100)
+    parser.add_argument("--d_model", type=int, default=256)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    model = torch.nn.TransformerEncoder(
+        torch.nn.TransformerEncoderLayer(
+            args.d_model, nhead=4, dropout=0.0, batch_first=True
+        ),
+        args.num_layers,
+    )
+    num_examples = args.steps * args.batch_size
+    data = TensorDataset(
+        torch.randn(num_examples, args.seq_len, args.d_model),
+        torch.randn(num_examples, args.seq_len, args.d_model),
+    )
+    loader = DataLoader(data, batch_size=args.batch_size, pin_memory=True)
+    warmup_loader = DataLoader(
+        TensorDataset(*data[: args.batch_size]), batch_size=args.batch_size
+    )
+
+    eager, eager_time = train(model, loader, warmup_loader, args, 0)
+    lazy, lazy_time = train(model, loader, warmup_loader, args, args.interval)
+    identical = all(
+        torch.allclose(p, q)
+        for p, q in zip(eager.modules.parameters(), lazy.modules.parameters())
+    )
+
+    print("mode\tsteps/s\t\tavg loss")
+    print(f"eager\t{args.steps / eager_time:.1f}\t\t{eager.train_loss:.6f}")
+    print(f"lazy\t{args.steps / lazy_time:.1f}\t\t{lazy.train_loss:.6f}")
+    print(
+        f"speed-up: {eager_time / lazy_time:.2f}x, same parameters: {identical}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark of CompiledNgramLM (sorted arrays memory-mapped from the file
+written by compile_arpa) against BackoffNgramLM (nested dicts from
+read_arpa).
+
+A random ARPA model is written first: its N-grams are those of random
+sentences over a vocabulary of the requested size. The script reports the
+time to load each model, and to score every token of the vocabulary after
+a batch of random prefixes (as in a beam search step), which must give the
+same log probabilities.
+
+Usage:
+`python benchmark_ngram_lm.py --vocab_size 1000 --order 4 --num_sentences 20000`
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import torch
+from speechbrain.lm.arpa import compile_arpa, read_arpa
+from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+
+
+def write_random_arpa(path, args):
+    """Writes an ARPA model with the N-grams of random sentences."""
+    words = [f"w{i}" for i in range(args.vocab_size)]
+    ngrams = {order: set() for order in range(1, args.order + 1)}
+    ngrams[1].update((token,) for token in words + ["<s>", "</s>", "<unk>"])
+    for _ in range(args.num_sentences):
+        sentence = ["<s>"] + random.choices(words, k=20) + ["</s>"]
+        for order in range(2, args.order + 1):
+            for i in range(len(sentence) - order + 1):
+                ngrams[order].add(tuple(sentence[i : i + order]))
+    with open(path, "w") as fo:
+        print("\\data\\", file=fo)
+        for order in ngrams:
+            print(f"ngram {order}={len(ngrams[order])}", file=fo)
+        for order in ngrams:
+            print(f"\n\\{order}-grams:", file=fo)
+            for ngram in ngrams[order]:
+                logprob = random.uniform(-5.0, -0.1)
+                if order < args.order:
+                    backoff = random.uniform(-1.0, 0.0)
+                    print(
+                        f"{logprob:.4f} {' '.join(ngram)} {backoff:.4f}",
+                        file=fo,
+                    )
+                else:
+                    print(f"{logprob:.4f} {' '.join(ngram)}", file=fo)
+        print("\n\\end\\", file=fo)
+    return words
+
+
+def main():
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vocab_size", type=int, default=1000)
+    parser.add_argument("--order", type=int, default=4)
+    parser.add_argument("--num_sentences", type=int, default=20000)
+    parser.add_argument("--num_prefixes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        arpa_path = os.path.join(tmpdir, "lm.arpa")
+        compiled_path = os.path.join(tmpdir, "lm.bin")
+        words = write_random_arpa(arpa_path, args)
+
+        start = time.perf_counter()
+        with open(arpa_path) as fi:
+            _, ngrams, backoffs = read_arpa(fi)
+        dict_lm = BackoffNgramLM(ngrams, backoffs)
+        print(f"read_arpa:\t\t{time.perf_counter() - start:.3f} s")
+        start = time.perf_counter()
+        with open(arpa_path) as fi:
+            compile_arpa(fi, compiled_path, token_list=words)
+        print(f"compile_arpa (once):\t{time.perf_counter() - start:.3f} s")
+        start = time.perf_counter()
+        compiled_lm = CompiledNgramLM(compiled_path)
+        print(f"CompiledNgramLM:\t{time.perf_counter() - start:.3f} s")
+
+        prefixes = [
+            ["<s>"] + random.choices(words, k=args.order)
+            for _ in range(args.num_prefixes)
+        ]
+        start = time.perf_counter()
+        dict_scores = [
+            [dict_lm.logprob(token, tuple(prefix)) for token in words]
+            for prefix in prefixes
+        ]
+        dict_time = time.perf_counter() - start
+        start = time.perf_counter()
+        states = compiled_lm.initial_states(args.num_prefixes)
+        for i in range(1, args.order + 1):
+            tokens = [compiled_lm.token_ids[prefix[i]] for prefix in prefixes]
+            states = compiled_lm.advance(states, torch.tensor(tokens))
+        compiled_scores = compiled_lm.score(
+            states, torch.arange(compiled_lm.num_tokens)
+        )
+        compiled_time = time.perf_counter() - start
+        max_diff = (compiled_scores - torch.tensor(dict_scores)).abs().max()
+        print(
+            f"scoring {args.num_prefixes} x {args.vocab_size}:\t"
+            f"dicts {dict_time:.3f} s\tarrays {compiled_time:.3f} s\t"
+            f"speed-up {dict_time / compiled_time:.1f}x\t"
+            f"max diff {max_diff:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()